@@ -151,6 +151,7 @@ else:
     # Checkpointing
     # -----------------------------
     from anuga.shallow_water.checkpoint import load_checkpoint_file
+    from anuga.shallow_water.checkpoint import save_checkpoint_file
 
     # -----------------------------
     # SwW Standard Boundaries
@@ -269,6 +270,8 @@ else:
     from anuga.operators.erosion_operators import Flat_slice_erosion_operator
     from anuga.operators.erosion_operators import Flat_fill_slice_erosion_operator
 
+    from anuga.operators.gauge_operator import Gauge_operator
+
     # ---------------------------
     # Structure Operators
     # ---------------------------
@@ -87,6 +87,64 @@ class Boundary:
                 Q.boundary_values[i] = q_evol[j]
 
 
+    def set_segment_values(self, domain, segment_edges, q_bdry):
+        """Set boundary values at the edges segment_edges from the array
+        q_bdry, which has one row for each edge and one column for each
+        conserved or evolved quantity, i.e. row k holds the values
+        evaluate would return for edge segment_edges[k].
+
+        This is the array version of the update done in evaluate_segment.
+        """
+
+        ids = segment_edges
+        q_bdry = num.asarray(q_bdry, num.float)
+
+        if q_bdry.shape[1] == len(domain.evolved_quantities):
+            # conserved and evolved quantities are the same
+            quantities = domain.evolved_quantities
+        elif q_bdry.shape[1] == len(domain.conserved_quantities):
+            # boundary just returns conserved quantities
+            # Need to calculate all the evolved quantities
+            # Use default conversion, one edge at a time
+            for k, i in enumerate(ids):
+                vol_id  = domain.boundary_cells[i]
+                edge_id = domain.boundary_edges[i]
+
+                q_evol = domain.get_evolved_quantities(vol_id, edge = edge_id)
+                q_evol = domain.conserved_values_to_evolved_values \
+                                                        (q_bdry[k], q_evol)
+
+                for j, name in enumerate(domain.evolved_quantities):
+                    Q = domain.quantities[name]
+                    Q.boundary_values[i] = q_evol[j]
+            return
+        else:
+            msg = 'Boundary must return array of either conserved'
+            msg += ' or evolved quantities'
+            raise Exception(msg)
+
+        for j, name in enumerate(quantities):
+            Q = domain.quantities[name]
+            Q.boundary_values[ids] = q_bdry[:,j]
+
+
+    def get_segment_edge_values(self, domain, segment_edges):
+        """Return the interior edge values of the conserved quantities at
+        the edges segment_edges, one row per edge (the array version of
+        domain.get_conserved_quantities(vol_id, edge=edge_id))
+        """
+
+        vol_ids  = domain.boundary_cells[segment_edges]
+        edge_ids = domain.boundary_edges[segment_edges]
+
+        q = num.zeros((len(vol_ids), len(domain.conserved_quantities)), num.float)
+        for j, name in enumerate(domain.conserved_quantities):
+            Q = domain.quantities[name]
+            q[:,j] = Q.edge_values[vol_ids, edge_ids]
+
+        return q
+
+
     def get_time(self):
 
         return self.domain.get_time()
@@ -586,6 +644,11 @@ class File_boundary(Boundary):
             # Register index of this boundary edge for use with evaluate
             self.boundary_indices[(vol_id, edge_id)] = i
 
+        # Index of the point for each boundary segment of the domain,
+        # for use with evaluate_segment
+        self.boundary_point_ids = \
+            num.array([self.boundary_indices[(vol_id, edge_id)] for vol_id, edge_id
+                       in zip(domain.boundary_cells, domain.boundary_edges)], num.int)
             
             
         if verbose: log.critical('Initialise file_function')
@@ -686,27 +749,7 @@ class File_boundary(Boundary):
                         self.default_boundary_invoked = True
             
             if num.any(res == NAN):
-                x,y=self.midpoint_coordinates[i,:]
-                msg = 'NAN value found in file_boundary at '
-                msg += 'point id #%d: (%.2f, %.2f).\n' %(i, x, y)
-
-                if hasattr(self.F, 'indices_outside_mesh') and\
-                       len(self.F.indices_outside_mesh) > 0:
-                    # Check if NAN point is due it being outside
-                    # boundary defined in sww file.
-
-                    if i in self.F.indices_outside_mesh:
-                        msg += 'This point refers to one outside the '
-                        msg += 'mesh defined by the file %s.\n'\
-                               %self.F.filename
-                        msg += 'Make sure that the file covers '
-                        msg += 'the boundary segment it is assigned to '
-                        msg += 'in set_boundary.'
-                    else:
-                        msg += 'This point is inside the mesh defined '
-                        msg += 'the file %s.\n' %self.F.filename
-                        msg += 'Check this file for NANs.'
-                raise Exception(msg)
+                raise Exception(self.nan_message(i))
             
             return res 
         else:
@@ -714,6 +757,97 @@ class File_boundary(Boundary):
             msg += 'vol_id=%s, edge_id=%s' %(str(vol_id), str(edge_id))
             raise Exception(msg)
 
+
+    def evaluate_segment(self, domain, segment_edges):
+        """Set boundary values at all the edges segment_edges in one go
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        q_bdry = self.get_segment_values(domain, segment_edges)
+
+        self.set_segment_values(domain, segment_edges, q_bdry)
+
+
+    def get_segment_values(self, domain, segment_edges):
+        """Return linearly interpolated values based on domain.time at
+        the midpoints of the edges segment_edges, one row per edge
+        """
+
+        # FIXME (Ole): I think this should be get_time(), see ticket:306
+        t = self.domain.time
+
+        point_ids = self.boundary_point_ids[segment_edges]
+
+        try:
+            res = self.F.evaluate_points(t, point_ids)
+        except Modeltime_too_early, e:
+            raise Modeltime_too_early(e)
+        except Modeltime_too_late, e:
+            if self.default_boundary is None:
+                raise Exception(e) # Reraise exception
+            else:
+                # Pass control to default boundary and read back
+                # the values it sets
+                self.default_boundary.evaluate_segment(domain, segment_edges)
+
+                res = num.zeros((len(point_ids),
+                                 len(domain.conserved_quantities)), num.float)
+                for j, name in enumerate(domain.conserved_quantities):
+                    Q = domain.quantities[name]
+                    res[:,j] = Q.boundary_values[segment_edges]
+
+                if self.default_boundary_invoked is False:
+                    # Issue warning the first time
+                    if self.verbose:
+                        msg = '%s' %str(e)
+                        msg += 'Instead I will use the default boundary: %s\n'\
+                            %str(self.default_boundary) 
+                        msg += 'Note: Further warnings will be supressed'
+                        log.critical(msg)
+
+                    self.default_boundary_invoked = True
+
+                return res
+
+        nan_rows = num.any(res == NAN, axis=1)
+        if num.any(nan_rows):
+            i = point_ids[num.nonzero(nan_rows)[0][0]]
+            raise Exception(self.nan_message(i))
+
+        return res
+
+
+    def nan_message(self, i):
+        """Error message for a NAN value at point i
+        """
+
+        x,y=self.midpoint_coordinates[i,:]
+        msg = 'NAN value found in file_boundary at '
+        msg += 'point id #%d: (%.2f, %.2f).\n' %(i, x, y)
+
+        if hasattr(self.F, 'indices_outside_mesh') and\
+               len(self.F.indices_outside_mesh) > 0:
+            # Check if NAN point is due it being outside
+            # boundary defined in sww file.
+
+            if i in self.F.indices_outside_mesh:
+                msg += 'This point refers to one outside the '
+                msg += 'mesh defined by the file %s.\n'\
+                       %self.F.filename
+                msg += 'Make sure that the file covers '
+                msg += 'the boundary segment it is assigned to '
+                msg += 'in set_boundary.'
+            else:
+                msg += 'This point is inside the mesh defined '
+                msg += 'the file %s.\n' %self.F.filename
+                msg += 'Check this file for NANs.'
+
+        return msg
+
 class AWI_boundary(Boundary):
     """The AWI_boundary reads values for the conserved
     quantities (only STAGE) from an sww NetCDF file, and returns interpolated values
@@ -787,6 +921,12 @@ class AWI_boundary(Boundary):
             # Register index of this boundary edge for use with evaluate
             self.boundary_indices[(vol_id, edge_id)] = i
 
+        # Index of the point for each boundary segment of the domain,
+        # for use with evaluate_segment
+        self.boundary_point_ids = \
+            num.array([self.boundary_indices[(vol_id, edge_id)] for vol_id, edge_id
+                       in zip(domain.boundary_cells, domain.boundary_edges)], num.int)
+
 
         if verbose: log.critical('Initialise file_function')
         self.F = file_function(filename, domain,
@@ -841,7 +981,7 @@ class AWI_boundary(Boundary):
             i = self.boundary_indices[vol_id, edge_id]
             res = self.F(t, point_id=i)
 
-            if res == NAN:
+            if res[0] == NAN:
                 x,y = self.midpoint_coordinates[i,:]
                 msg = 'NAN value found in file_boundary at '
                 msg += 'point id #%d: (%.2f, %.2f).\n' % (i, x, y)
@@ -872,4 +1012,33 @@ class AWI_boundary(Boundary):
             return self.F(t)
 
 
+    def evaluate_segment(self, domain, segment_edges):
+        """Set boundary values at all the edges segment_edges in one go
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        t = self.domain.time
+
+        point_ids = self.boundary_point_ids[segment_edges]
+        res = self.F.evaluate_points(t, point_ids)
+
+        nan_points = res[:,0] == NAN
+        if num.any(nan_points):
+            i = point_ids[num.nonzero(nan_points)[0][0]]
+            x,y = self.midpoint_coordinates[i,:]
+            msg = 'NAN value found in file_boundary at '
+            msg += 'point id #%d: (%.2f, %.2f).\n' % (i, x, y)
+            raise Exception(msg)
+
+        # Take stage, leave momentum alone
+        q = self.get_segment_edge_values(domain, segment_edges)
+        q[:,0] = res[:,0]
+
+        self.set_segment_values(domain, segment_edges, q)
+
+
 
@@ -355,6 +355,9 @@ class Generic_Domain:
         # This is used for diagnostics only (reset at every yieldstep)
         self.max_speed = num.zeros(N, num.float)
 
+        # Compiled state of the domain used by the kernels during evolve
+        self.domain_handle = None
+
         if mesh_filename is not None:
             # If the mesh file passed any quantity values,
             # initialise with these values.
@@ -431,6 +434,9 @@ class Generic_Domain:
     def get_triangles_and_vertices_per_node(self, *args, **kwargs):
         return self.mesh.get_triangles_and_vertices_per_node(*args, **kwargs)
 
+    def get_centroid_index(self, *args, **kwargs):
+        return self.mesh.get_centroid_index(*args, **kwargs)
+
     def get_interpolation_object(self, *args, **kwargs):
         return self.mesh.get_interpolation_object(*args, **kwargs)
 
@@ -1514,6 +1520,28 @@ class Generic_Domain:
 # Main components of evolve
 ################################################################################
 
+    def create_domain_handle(self):
+        """Return the compiled state of the domain passed to the kernels
+
+        The handle is built at the start of each yieldstep of evolve and
+        dropped before control returns to the caller, so it must not be
+        kept across changes to the domain. Domains without compiled
+        kernels return None.
+        """
+
+        return None
+
+    def evolve_to_yieldtime(self, yieldstep, finaltime):
+        """Take all timesteps up to the next yield time or finaltime
+        with compiled code
+
+        Returns False if this is not supported, in which case evolve
+        takes the steps one at a time in python.
+        """
+
+        return False
+
+
     def evolve(self, yieldstep=None,
                      finaltime=None,
                      duration=None,
@@ -1681,44 +1709,15 @@ class Generic_Domain:
             yield(self.get_time())      # Yield initial values
             
             
+        self.domain_handle = self.create_domain_handle()
 
         while True:
 
-            initial_time = self.get_time()
-            
-            #==========================================
-            # Apply fluid flow fractional step
-            #==========================================
-            if self.get_timestepping_method() == 'euler':
-                self.evolve_one_euler_step(yieldstep, self.finaltime)
-
-            elif self.get_timestepping_method() == 'rk2':
-                self.evolve_one_rk2_step(yieldstep, self.finaltime)
-
-            elif self.get_timestepping_method() == 'rk3':
-                self.evolve_one_rk3_step(yieldstep, self.finaltime)
-
-            #==========================================
-            # Apply other fractional steps
-            #==========================================
-            self.apply_fractional_steps()
-
-            #==========================================
-            # Centroid Values of variables should be ok,
-            #==========================================
-
-            # Update time
-            self.set_time(initial_time + self.timestep)
-
-            self.update_ghosts()
-
-            # Update extrema (only uses centroid values)
-            self.update_extrema()            
-
-            self.number_of_steps += 1
+            # Take all steps to the next yield time in compiled code
+            # if possible, otherwise one step at a time
+            if not self.evolve_to_yieldtime(yieldstep, self.finaltime):
+                self.evolve_one_step(yieldstep)
 
-            if self._order_ == 1:
-                self.number_of_first_order_steps += 1
 
 
             # Yield results
@@ -1736,6 +1735,7 @@ class Generic_Domain:
                 self.distribute_to_vertices_and_edges()
                 self.update_boundary()
                 self.log_operator_timestepping_statistics()
+                self.domain_handle = None
                 yield(self.get_time())
                 break
 
@@ -1750,6 +1750,7 @@ class Generic_Domain:
                 self.distribute_to_vertices_and_edges()
                 self.update_boundary()
                 self.log_operator_timestepping_statistics()
+                self.domain_handle = None
                 yield(self.get_time())
 
                 # Reinitialise
@@ -1760,6 +1761,49 @@ class Generic_Domain:
                 self.number_of_first_order_steps = 0
                 self.max_speed = num.zeros(N, num.float)
 
+                self.domain_handle = self.create_domain_handle()
+
+
+    def evolve_one_step(self, yieldstep):
+        """Take one timestep of the evolve loop, including the other
+        fractional steps and the bookkeeping
+        """
+
+        initial_time = self.get_time()
+
+        #==========================================
+        # Apply fluid flow fractional step
+        #==========================================
+        if self.get_timestepping_method() == 'euler':
+            self.evolve_one_euler_step(yieldstep, self.finaltime)
+
+        elif self.get_timestepping_method() == 'rk2':
+            self.evolve_one_rk2_step(yieldstep, self.finaltime)
+
+        elif self.get_timestepping_method() == 'rk3':
+            self.evolve_one_rk3_step(yieldstep, self.finaltime)
+
+        #==========================================
+        # Apply other fractional steps
+        #==========================================
+        self.apply_fractional_steps()
+
+        #==========================================
+        # Centroid Values of variables should be ok,
+        #==========================================
+
+        # Update time
+        self.set_time(initial_time + self.timestep)
+
+        self.update_ghosts()
+
+        # Update extrema (only uses centroid values)
+        self.update_extrema()
+
+        self.number_of_steps += 1
+
+        if self._order_ == 1:
+            self.number_of_first_order_steps += 1
 
     def evolve_one_euler_step(self, yieldstep, finaltime):
         """One Euler Time Step
@@ -1868,6 +1912,12 @@ class Generic_Domain:
         # Combine steps
         self.saxpy_conserved_quantities(0.5, 0.5)
 
+        if self.max_flux_update_frequency is not 1:
+            # Update flux_update_frequency using the timestep of this
+            # step. Both substeps must update the same fluxes, so this
+            # is only done once the step is complete.
+            self.compute_flux_update_frequency()
+
         # Update special conditions
         #self.update_special_conditions()
 
@@ -1213,6 +1213,33 @@ class Mesh(General_mesh):
             return []
 
 
+    def get_centroid_index(self):
+        """Get Point_index of the absolute centroid coordinates
+
+        The index is built once for the mesh and allows fast searches for
+        the triangles inside polygons and circles or near lines. Its extent
+        is the largest distance from a centroid to a vertex of its triangle.
+        """
+
+        if hasattr(self, 'centroid_index'):
+            index = self.centroid_index
+        else:
+            from anuga.geometry.point_index import Point_index
+
+            C = self.get_centroid_coordinates(absolute=True)
+            V = self.get_vertex_coordinates(absolute=True)
+            V = V.reshape((-1, 3, 2))
+
+            extent = 0.0
+            if len(C) > 0:
+                d = V - C[:, num.newaxis, :]
+                extent = num.sqrt(num.max(num.sum(d*d, axis=2)))
+
+            index = Point_index(C, extent=extent)
+            self.centroid_index = index
+
+        return index
+
     def get_interpolation_object(self):
         """Get object I that will allow linear interpolation using this mesh
 
@@ -15,6 +15,7 @@
 
 //Shared code snippets
 #include "util_ext.h"
+#include "quantity_update.h"
 
 typedef long keyint;
 
@@ -770,57 +771,6 @@ int _saxpy_centroid_values(keyint N,
 }
 
 
-int _update(keyint N,
-	    double timestep,
-	    double* centroid_values,
-	    double* explicit_update,
-	    double* semi_implicit_update) {
-	// Update centroid values based on values stored in
-	// explicit_update and semi_implicit_update as well as given timestep
-
-
-	keyint k;
-	double denominator, x;
-
-
-	// Divide semi_implicit update by conserved quantity
-	for (k=0; k<N; k++) {
-		x = centroid_values[k];
-		if (x == 0.0) {
-			semi_implicit_update[k] = 0.0;
-		} else {
-			semi_implicit_update[k] /= x;
-		}
-	}
-
-
-	// Explicit updates
-	for (k=0; k<N; k++) {
-		centroid_values[k] += timestep*explicit_update[k];
-	}
-
-
-
-	// Semi implicit updates
-	for (k=0; k<N; k++) {
-		denominator = 1.0 - timestep*semi_implicit_update[k];
-		if (denominator <= 0.0) {
-			return -1;
-		} else {
-			//Update conserved_quantities from semi implicit updates
-			centroid_values[k] /= denominator;
-		}
-	}
-
-
-
-	// Reset semi_implicit_update here ready for next time step
-	memset(semi_implicit_update, 0, N*sizeof(double));
-
-	return 0;
-}
-
-
 int _average_vertex_values(keyint N,
 			   long* vertex_value_indices,
 			   long* number_of_triangles_per_node,
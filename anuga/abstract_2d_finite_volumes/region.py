@@ -13,7 +13,7 @@ import numpy as num
 from pprint import pprint
 
 
-from anuga.geometry.polygon import inside_polygon, line_intersect
+from anuga.geometry.polygon import line_intersect
 
 from anuga.utilities.function_utils import determine_function_type
 
@@ -191,25 +191,16 @@ class Region(object):
     def setup_indices_circle(self):
 
         # Determine indices in circular region
-        N = self.domain.get_number_of_triangles()
-        points = self.domain.get_centroid_coordinates(absolute=True)
-
-        indices = []
+        index = self.domain.get_centroid_index()
 
         c = self.center
         r = self.radius
 
-
-        intersect = False
-        for k in range(N):
-            x, y = points[k,:]    # Centroid
-
-            if ((x-c[0])**2+(y-c[1])**2) < r**2:
-                intersect = True
-                indices.append(k)
+        indices = index.inside_circle(c, r)
+        intersect = len(indices) > 0
 
         if len(indices) is 0:
-            self.indices = indices
+            self.indices = []
         else:
             self.indices = num.asarray(indices)
 
@@ -221,16 +212,15 @@ class Region(object):
     def setup_indices_polygon(self):
 
         # Determine indices for polygonal region
-        points = self.domain.get_centroid_coordinates(absolute=True)
-        vertex_coordinates = self.domain.get_vertex_coordinates(absolute=True)
-        
-        indices = inside_polygon(points, self.polygon)
+        index = self.domain.get_centroid_index()
+
+        indices = index.inside_polygon(self.polygon)
 
         if self.expand_polygon :
             n = len(self.polygon)
             for j in range(n):
-                tris_0 = line_intersect(vertex_coordinates,
-                                        [self.polygon[j],self.polygon[(j+1)%n]])
+                tris_0 = self._line_intersect([self.polygon[j],
+                                               self.polygon[(j+1)%n]])
                 indices = num.union1d(tris_0, indices)            
 
         if len(indices) is 0:
@@ -252,9 +242,7 @@ class Region(object):
 
         # Determine indices for triangles intersecting a line  region
         
-        vertex_coordinates = self.domain.get_vertex_coordinates(absolute=True)
-        
-        indices = line_intersect(vertex_coordinates, self.line) 
+        indices = self._line_intersect(self.line)
         
         if len(indices) is 0:
             self.indices = indices
@@ -266,6 +254,32 @@ class Region(object):
             if len(indices) is 0: raise Exception(msg)
 
 
+    def _line_intersect(self, line):
+        """Return indices of triangles intersecting line
+
+        Only the triangles with centroids near the line are tested
+        """
+
+        line = ensure_numeric(line, num.float)
+
+        index = self.domain.get_centroid_index()
+        xmin, ymin = line.min(axis=0)
+        xmax, ymax = line.max(axis=0)
+        candidates = index.get_points_in_box(xmin, ymin, xmax, ymax,
+                                             expand=True)
+        if len(candidates) == 0:
+            return candidates
+
+        # Only make the vertex coordinates of the candidates absolute
+        vertex_coordinates = self.domain.get_vertex_coordinates()
+        triangles = vertex_coordinates.reshape((-1, 3, 2))[candidates]
+        triangles = triangles.reshape((-1, 2))
+        if not self.domain.geo_reference.is_absolute():
+            triangles = self.domain.geo_reference.get_absolute(triangles)
+
+        return candidates[line_intersect(triangles, line)]
+
+
     def get_indices(self, full_only=True):
 
         if full_only:
@@ -89,6 +89,49 @@ class Test_region(unittest.TestCase):
         expected_indices = [0,1,2,3]
         assert num.allclose(region.indices, expected_indices)
 
+
+    def test_region_centroid_index(self):
+        """regions found with the centroid index match brute force."""
+
+        from anuga.geometry.polygon import inside_polygon, line_intersect
+        from anuga.coordinate_transforms.geo_reference import Geo_reference
+
+        #Create basic mesh
+        points, vertices, boundary = rectangular(20, 15, len1=20, len2=15)
+
+        #Create shallow water domain
+        domain = Domain(points, vertices, boundary,
+                        geo_reference=Geo_reference(56, 1000.0, 2000.0))
+
+        index = domain.get_centroid_index()
+        assert domain.get_centroid_index() is index
+
+        C = domain.get_centroid_coordinates(absolute=True)
+        V = domain.get_vertex_coordinates(absolute=True)
+
+        poly = [[1003.0,2002.0], [1011.5,2002.0], [1013.0,2010.0],
+                [1004.0,2008.5]]
+        region = Region(domain, polygon=poly)
+        assert num.alltrue(region.indices == inside_polygon(C, poly))
+
+        region = Region(domain, polygon=poly, expand_polygon=True)
+        expected_indices = inside_polygon(C, poly)
+        for j in range(len(poly)):
+            expected_indices = num.union1d(expected_indices,
+                line_intersect(V, [poly[j], poly[(j+1)%len(poly)]]))
+        assert num.alltrue(region.indices == expected_indices)
+
+        line = [[1001.0,2001.0], [1017.0,2012.5]]
+        region = Region(domain, line=line)
+        assert num.alltrue(region.indices == line_intersect(V, line))
+
+        center = [1010.0,2007.5]
+        radius = 3.0
+        region = Region(domain, center=center, radius=radius)
+        expected_indices = [k for k in range(len(C))
+                            if num.sum((C[k]-center)**2) < radius**2]
+        assert num.alltrue(region.indices == expected_indices)
+
         
                   
 #-------------------------------------------------------------
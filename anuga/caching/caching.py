@@ -94,8 +94,14 @@ options = {
   'bin': True,           # Use binary format (more efficient)
   'compression': True,   # Use zlib compression
   'bytecode': True,      # Recompute if bytecode has changed
-  'expire': False        # Automatically remove files that have been accessed
+  'expire': False,       # Automatically remove files that have been accessed
                          # least recently
+  'maxsize': None,       # Maximum total size of cached files in bytes.
+                         # Least recently used results are removed first.
+                         # None means no limit.
+  'mmap_threshold': 2**20 # Arrays in results of this size (bytes) or larger
+                         # are stored uncompressed and memory mapped when
+                         # loaded. None disables this.
 }
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -264,6 +270,17 @@ def cache(my_F,
     New form of clear:
       cache(my_F,(arg1,...,argn), clear=True)
     clears cached data for particular combination my_F and args 
+
+  Limiting the cache size:
+    The call
+      set_option('maxsize', <bytes>)
+    limits the total size of the cache directory. Least recently used results
+    are removed when a new result is saved.
+
+  Large arrays:
+    Arrays of at least options['mmap_threshold'] bytes in results are stored
+    uncompressed in .npy files and memory mapped (copy on write) when
+    retrieved, so they are not read or copied until used.
       
   """
 
@@ -323,19 +340,14 @@ def cache(my_F,
     return(FN)
 
   if clear:
-    for file_type in file_types:
-      file_name = CD+FN+'_'+file_type
-      for fn in [file_name, file_name + '.z']:
-        if os.access(fn, os.F_OK):              
-          if unix:
-            os.remove(fn)
-          else:
-            # FIXME: os.remove doesn't work under windows        
-            os.system('del '+fn)
-          if verbose is True:
-            log.critical('MESSAGE (caching): File %s deleted' % fn)
-        ##else:
-        ##  log.critical('%s was not accessed' % fn)
+    for fn in get_cache_files(CD, FN):
+      if unix:
+        os.remove(fn)
+      else:
+        # FIXME: os.remove doesn't work under windows        
+        os.system('del '+fn)
+      if verbose is True:
+        log.critical('MESSAGE (caching): File %s deleted' % fn)
     return None
 
 
@@ -388,6 +400,10 @@ def cache(my_F,
         msg3(loadtime, CD, FN, deps, compression)
       compressed = compression
 
+      # Keep the cache within its size limit
+      if options['maxsize'] is not None:
+        evict_cache_files(CD, options['maxsize'], keep=FN, verbose=verbose)
+
   if options['savestat'] and (not test or Retrieved):
   ##if options['savestat']:
     addstatsline(CD,funcname,FN,Retrieved,reason,comptime,loadtime,compressed)
@@ -421,10 +437,13 @@ def cachestat(sortidx=4, period=-1, showuser=None, cachedir=None):
     --------------------------------------------------------------------------
     Function Name   Hits   Exec(s)  Cache(s)  Saved(s)   Gain(%)      Size
     --------------------------------------------------------------------------
+
+    The totals are also returned as a dictionary with keys 'hits', 'misses',
+    'loadtime' (total seconds spent loading cached results) and 'comptime'
+    (total seconds spent computing results that were not cached).
   """
 
-  __cachestat(sortidx, period, showuser, cachedir)
-  return
+  return __cachestat(sortidx, period, showuser, cachedir)
 
 # -----------------------------------------------------------------------------
 
@@ -1143,9 +1162,15 @@ def save_results_to_cache(T, CD, FN, my_F, deps, comptime, funcname,
         log.critical('ERROR: Could not open %s' % admfile.name)
     raise IOError
 
+  # Remove arrays stored with a previous result. They may still be memory
+  # mapped by another process so they are not overwritten in place.
+  for fn in get_array_files(datafile.name):
+    os.remove(fn)
+
   t0 = time.time()
 
-  mysave(T,datafile,compression)  # Save data to cache
+  # Save data to cache
+  mysave(T,datafile,compression,mmap_threshold=options['mmap_threshold'])
   datafile.close()
   #savetime = round(time.time()-t0,2)
   savetime = time.time()-t0  
@@ -1187,6 +1212,14 @@ def load_from_cache(CD, FN, compression):
   loadtime = time.time()-t0
   datafile.close() 
 
+  # Mark result as recently used
+  if reason == 0:
+    for fn in get_cache_files(CD, FN):
+      try:
+        os.utime(fn, None)
+      except:
+        pass
+
   return T, loadtime, compressed, reason
 
 # -----------------------------------------------------------------------------
@@ -1290,15 +1323,24 @@ def myload(file, compressed):
       
       
       del RsC  # Free up some space
-      R = pickler.loads(Rs)
+      from cStringIO import StringIO
+      unpickler = pickler.Unpickler(StringIO(Rs))
     else:
-      try:
-        R = pickler.load(file)
-      #except EOFError, e:
-      except:
-        #Catch e.g., file with 0 length or corrupted
-        reason = 6  # Unreadable file
-        return None, reason
+      unpickler = pickler.Unpickler(file)
+
+    # Arrays stored separately by mysave are memory mapped
+    unpickler.persistent_load = lambda pid: \
+        load_array(os.path.join(os.path.dirname(file.name), pid))
+
+    try:
+      R = unpickler.load()
+    except MemoryError:
+      raise
+    #except EOFError, e:
+    except:
+      #Catch e.g., file with 0 length, corrupted or missing arrays
+      reason = 6  # Unreadable file
+      return None, reason
       
   except MemoryError:
     import sys
@@ -1314,16 +1356,24 @@ def myload(file, compressed):
 
 # -----------------------------------------------------------------------------
 
-def mysave(T, file, compression):
+def mysave(T, file, compression, mmap_threshold=None):
   """Save data T to file
 
   USAGE:
-    mysave(T, file, compression)
+    mysave(T, file, compression, mmap_threshold)
 
+  DESCRIPTION:
+    If mmap_threshold is given, arrays in T of at least that many bytes are
+    saved uncompressed next to file (see get_array_files) so they can be
+    memory mapped when loaded.
   """
 
   bin = options['bin']
 
+  if mmap_threshold is not None:
+    _mysave_arrays(T, file, compression, mmap_threshold)
+    return
+
   if compression:
     try:
       import zlib
@@ -1385,6 +1435,174 @@ def mysave(T, file, compression):
 
 # -----------------------------------------------------------------------------
 
+def _mysave_arrays(T, file, compression, mmap_threshold):
+  """Pickle T to file storing large arrays in separate .npy files
+  """
+
+  from cStringIO import StringIO
+
+  basename = get_array_basename(file.name)
+  arrays = []
+
+  def persistent_id(obj):
+    if isinstance(obj, num.ndarray) and not obj.dtype.hasobject and \
+       obj.nbytes > 0 and obj.nbytes >= mmap_threshold:
+      filename = basename + '_%d.npy' % len(arrays)
+      num.save(filename, obj)
+      arrays.append(filename)
+      return os.path.basename(filename)
+    return None
+
+  if compression:
+    import zlib
+
+    buf = StringIO()
+    p = pickler.Pickler(buf, options['bin'])
+    p.persistent_id = persistent_id
+    p.dump(T)
+    file.write(zlib.compress(buf.getvalue(), comp_level))
+  else:
+    p = pickler.Pickler(file, options['bin'])
+    p.persistent_id = persistent_id
+    p.dump(T)
+
+# -----------------------------------------------------------------------------
+
+def load_array(filename):
+  """Memory map array stored by mysave.
+
+  Pages are copied on write, so the cached array is never modified.
+  """
+
+  return num.load(filename, mmap_mode='c').view(num.ndarray)
+
+# -----------------------------------------------------------------------------
+
+def get_array_basename(FN):
+  """Base name of arrays stored with the cache file FN
+  """
+
+  if FN.endswith('.z'):
+    FN = FN[:-2]
+  return FN
+
+def get_array_files(FN):
+  """List existing array files stored with the cache file FN
+  """
+
+  basename = get_array_basename(FN)
+
+  files = []
+  while os.access(basename + '_%d.npy' % len(files), os.F_OK):
+    files.append(basename + '_%d.npy' % len(files))
+
+  return files
+
+def get_cache_files(CD, FN):
+  """List existing files making up the cache entry FN in directory CD
+  """
+
+  files = []
+  for file_type in file_types:
+    file_name = CD+FN+'_'+file_type
+    for fn in [file_name, file_name + '.z']:
+      if os.access(fn, os.F_OK):
+        files.append(fn)
+
+    if file_type == file_types[0]:
+      files += get_array_files(file_name)
+
+  return files
+
+# -----------------------------------------------------------------------------
+
+def evict_cache_files(CD, maxsize, keep=None, verbose=None):
+  """Remove least recently used cached results until the total size of
+  the cache directory is at most maxsize bytes.
+
+  USAGE:
+    evict_cache_files(CD, maxsize, keep, verbose)
+
+  ARGUMENTS:
+    CD --       Caching directory
+    maxsize --  Maximum total size in bytes
+    keep --     Cache entry which must not be removed (default: None)
+    verbose --  Flag verbose output (default: options['verbose'])
+
+  DESCRIPTION:
+    All files belonging to one cache entry (result, arguments, admin info
+    and stored arrays) are removed together. Entries are used when they are
+    saved or retrieved, so the one with the oldest modification time is
+    removed first. Statistics files are not counted.
+  """
+
+  import re
+
+  if verbose is None:
+    verbose = options['verbose']
+
+  pattern = re.compile(r'^(.*)_(%s)(\.z|_\d+\.npy)?$' % '|'.join(file_types))
+
+  entries = {}
+  total = 0
+  for file_name in os.listdir(CD):
+    match = pattern.match(file_name)
+    if match is None:
+      continue
+
+    stats = os.stat(CD+file_name)
+    total += stats.st_size
+
+    FN = match.group(1)
+    size, last_used, files = entries.get(FN, (0, 0, []))
+    files.append(CD+file_name)
+    entries[FN] = (size + stats.st_size, max(last_used, stats.st_mtime), files)
+
+  if total <= maxsize:
+    return
+
+  lru = [(last_used, FN) for FN, (size, last_used, files) in entries.items()
+         if FN != keep]
+  lru.sort()
+
+  for last_used, FN in lru:
+    if total <= maxsize:
+      break
+
+    size, last_used, files = entries[FN]
+    if verbose:
+      log.critical('Caching: Removing least recently used %s (%d bytes)'
+                   % (FN, size))
+    for fn in files:
+      os.remove(fn)
+    total -= size
+
+# -----------------------------------------------------------------------------
+
+def _hash_array(T, ids=None):
+  """Hash contents of array T with a digest of its data buffer, read in
+  blocks so that non-contiguous arrays are never copied in full
+  """
+
+  import hashlib
+
+  if T.dtype.hasobject:
+    return myhash(T.tolist(), ids)
+
+  digest = hashlib.sha1(T.dtype.str + `T.shape`)
+
+  if T.flags.c_contiguous:
+    digest.update(T.data)
+  else:
+    blocksize = 2**20  # Bytes per block
+    rows = max(1, blocksize/max(1, T[0].nbytes))
+    for i in range(0, T.shape[0], rows):
+      digest.update(num.ascontiguousarray(T[i:i+rows]).data)
+
+  return int(digest.hexdigest()[:15], 16)
+
+# -----------------------------------------------------------------------------
+
     
 def myhash(T, ids=None):
   """Compute hashed integer from a range of inputs.
@@ -1439,10 +1657,8 @@ def myhash(T, ids=None):
       I.sort()    
       val = myhash(I, ids)
   elif isinstance(T, num.ndarray):
-      T = num.array(T) # Ensure array is contiguous
-
-      # Use mean value for efficiency
-      val = hash(num.average(T.flat))
+      # Use the contents so that different arrays don't collide
+      val = _hash_array(T, ids)
   elif type(T) == InstanceType:
       # Use the attribute values 
       val = myhash(T.__dict__, ids)
@@ -1867,17 +2083,16 @@ def addstatsline(CD, funcname, FN, Retrieved, reason, comptime, loadtime,
     else:
       hit = '0'
 
-    # Get size of result file
+    # Get size of result file including arrays stored with it
     #    
     if compression:
-      stats = os.stat(CD+FN+'_'+file_types[0]+'.z')
-    else:
-      stats = os.stat(CD+FN+'_'+file_types[0])
-  
-    if stats: 
-      size = stats[6]
+      result_file = CD+FN+'_'+file_types[0]+'.z'
     else:
-      size = -1  # Error condition, but don't crash. This is just statistics  
+      result_file = CD+FN+'_'+file_types[0]
+
+    size = 0
+    for fn in [result_file] + get_array_files(result_file):
+      size += os.stat(fn)[6]
 
     # Build entry
     #  
@@ -1932,7 +2147,8 @@ def __cachestat(sortidx=4, period=-1, showuser=None, cachedir=None):
   Dictnames = ['Function', 'User']
 
   if not cachedir:
-    cachedir = checkdir(options['cachedir'])
+    cachedir = options['cachedir']
+  cachedir = checkdir(cachedir)
 
   SD = os.path.expanduser(cachedir)  # Expand ~ or ~user in pathname
 
@@ -1940,7 +2156,7 @@ def __cachestat(sortidx=4, period=-1, showuser=None, cachedir=None):
     SFILENAME = statsfile
   else:  # Only stats from current month  
        # MAKE THIS MORE GENERAL SO period > 0 counts several months backwards!
-    TimeTuple = localtime(time())
+    TimeTuple = localtime(time.time())
     extension = strftime('%b%Y',TimeTuple)
     SFILENAME = statsfile+'.'+extension
 
@@ -1953,6 +2169,9 @@ def __cachestat(sortidx=4, period=-1, showuser=None, cachedir=None):
   blocksize = 15000000
   total_read = 0
   total_hits = 0
+  total_misses = 0
+  total_loadtime = 0.0
+  total_comptime = 0.0
   total_discarded = 0
   firstday = mktime(strptime('2030','%Y'))
              # FIXME: strptime don't exist in WINDOWS ?
@@ -2026,8 +2245,11 @@ def __cachestat(sortidx=4, period=-1, showuser=None, cachedir=None):
 
             UpdateDict(UserDict,user,info)
             UpdateDict(FuncDict,my_F,info)
+
+            total_loadtime = total_loadtime + loadtime
           else:
-            pass #Stats on recomputations and their reasons could go in here
+            total_misses = total_misses + 1
+            total_comptime = total_comptime + cputime
               
         else:
           total_discarded = total_discarded + 1
@@ -2037,11 +2259,16 @@ def __cachestat(sortidx=4, period=-1, showuser=None, cachedir=None):
   # Compute averages of all sums and write list
   #
 
+  totals = {'hits': total_hits,
+            'misses': total_misses,
+            'loadtime': total_loadtime,
+            'comptime': total_comptime}
+
   if total_read == 0:
     printline(Widths,'=')
     log.critical('CACHING STATISTICS: No valid records read')
     printline(Widths,'=')
-    return
+    return totals
 
   log.critical()
   printline(Widths,'=')
@@ -2050,6 +2277,13 @@ def __cachestat(sortidx=4, period=-1, showuser=None, cachedir=None):
   log.critical('  Total number of valid records %d' % total_read)
   log.critical('  Total number of discarded records %d' % total_discarded)
   log.critical('  Total number of hits %d' % total_hits)
+  log.critical('  Total number of misses %d' % total_misses)
+  if total_hits + total_misses > 0:
+    log.critical('  Hit ratio %.2f%%'
+                 % (100.0*total_hits/(total_hits + total_misses)))
+  log.critical('  Total time loading cached results %.2f s' % total_loadtime)
+  log.critical('  Total time computing uncached results %.2f s'
+               % total_comptime)
   log.critical()
 
   log.critical('  Fields %s are averaged over number of hits' % Fields[2:])
@@ -2103,11 +2337,13 @@ def __cachestat(sortidx=4, period=-1, showuser=None, cachedir=None):
       n += 1
       for val in rec:
         #exec "print '%" + str(Widths[n]) + Types[n]+"'%val,"; n=n+1
-        log.critical('%*s' % (Widths[n], str(key)))
+        log.critical('%*s' % (Widths[n], str(val)))
         n += 1
       log.critical()
     log.critical()
 
+  return totals
+
 #==============================================================================
 # Auxiliary stats functions
 #==============================================================================
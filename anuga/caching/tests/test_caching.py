@@ -7,6 +7,7 @@ from anuga.caching import *
 from anuga.caching.dummy_classes_for_testing import Dummy, Dummy_memorytest
 
 import numpy as num
+import os
 
 
 # Define a test function to be cached
@@ -166,12 +167,15 @@ class Test_Caching(unittest.TestCase):
         
         # Make test input arguments
         A0 = num.arange(5) * 1.0
-        B = ('x', 15)
         
-        # Create different A that hashes to the same address (having the same average)
+        # Arrays with the same average no longer hash to the same address
         A1 = num.array([2.0, 2.0, 2.0, 2.0, 2.0])        
-        
-        assert myhash(A0) == myhash(A1)
+        assert myhash(A0) != myhash(A1)
+
+        # but -1 and -2 do
+        B0 = -1
+        B1 = -2
+        assert myhash((A0, B0)) == myhash((A0, B1))
             
             
         # Test caching
@@ -179,31 +183,134 @@ class Test_Caching(unittest.TestCase):
         for comp in range(comprange):
         
             # Clear
-            cache(f_numeric, (A0, A0), clear=1,
+            cache(f_numeric, (A0, B0), clear=1,
                   compression=comp, verbose=verbose)        
-            cache(f_numeric, (A1, A1), clear=1,
+            cache(f_numeric, (A0, B1), clear=1,
                   compression=comp, verbose=verbose)                          
   
   
             # Evaluate and store
-            T1 = cache(f_numeric, (A0, A0), evaluate=1,
+            T1 = cache(f_numeric, (A0, B0), evaluate=1,
                        compression=comp, verbose=verbose)
 
             
-            # Check that A1 doesn't trigger retrieval of the previous result 
+            # Check that B1 doesn't trigger retrieval of the previous result 
             # even though it hashes to the same address
-            T2 = cache(f_numeric, (A1, A1),
+            T2 = cache(f_numeric, (A0, B1),
                        compression=comp, verbose=verbose) 
            
-            T1_ref = f_numeric(A0, A0)
-            T2_ref = f_numeric(A1, A1)
-            T1_ref = f_numeric(A0, A0)
-            T2_ref = f_numeric(A1, A1)
+            T1_ref = f_numeric(A0, B0)
+            T2_ref = f_numeric(A0, B1)
 
             assert num.alltrue(T1 == T1_ref)
             assert num.alltrue(T2 == T2_ref)
 
 
+    def test_hash_of_arrays(self):
+        """Arrays are hashed by their contents, shape and type"""
+
+        A = num.arange(12.0).reshape(3, 4)
+
+        assert myhash(A) == myhash(A.copy())
+        assert myhash(A.T) == myhash(num.ascontiguousarray(A.T))
+        assert myhash(A[:,::2]) == myhash(A[:,::2].copy())
+
+        B = A.copy()
+        B[1,2] += 1.0e-12
+        assert myhash(A) != myhash(B)
+        assert myhash(A) != myhash(A.reshape(4, 3))
+        assert myhash(A) != myhash(A.astype(num.float32))
+
+        # Same mean
+        assert myhash(num.array([0.0, 2.0])) != myhash(num.array([1.0, 1.0]))
+
+
+    def test_caching_of_large_arrays(self):
+        """Large arrays in results are memory mapped"""
+
+        verbose = False
+
+        threshold = options['mmap_threshold']
+        set_option('mmap_threshold', 1000)
+
+        A = num.arange(1000.0)
+        B = num.arange(10.0)
+
+        try:
+            for comp in range(2):
+                cache(f_generic, ((A, B),), clear=1, compression=comp,
+                      verbose=verbose)
+
+                T1 = cache(f_generic, ((A, B),), compression=comp,
+                           verbose=verbose)
+                T2 = cache(f_generic, ((A, B),), compression=comp,
+                           verbose=verbose)
+
+                FN = cache(f_generic, ((A, B),), return_filename=True)
+                CD = checkdir(options['cachedir'])
+                files = get_cache_files(CD, FN)
+                assert CD+FN+'_Result_0.npy' in files
+                assert CD+FN+'_Result_1.npy' not in files
+
+                assert isinstance(T2[0].base, num.memmap)
+                assert num.allclose(T2[0], A)
+                assert num.allclose(T2[1], B)
+
+                # Copy on write
+                T2[0][0] = 7.0
+                T3 = cache(f_generic, ((A, B),), compression=comp,
+                           verbose=verbose)
+                assert T3[0][0] == 0.0
+
+                cache(f_generic, ((A, B),), clear=1, compression=comp,
+                      verbose=verbose)
+                assert get_cache_files(CD, FN) == []
+        finally:
+            set_option('mmap_threshold', threshold)
+
+
+    def test_cache_size_limit(self):
+        """Least recently used results are removed when the cache is full"""
+
+        import tempfile, shutil, time
+
+        verbose = False
+
+        cachedir = tempfile.mkdtemp()
+        CD = checkdir(cachedir)
+
+        try:
+            FN = []
+            for i in range(3):
+                cache(f_numeric, (num.zeros(1000) + i, 1),
+                      cachedir=cachedir, verbose=verbose)
+                FN.append(cache(f_numeric, (num.zeros(1000) + i, 1),
+                                return_filename=True))
+
+                # Make the modification times distinct
+                for fn in get_cache_files(CD, FN[i]):
+                    os.utime(fn, (i, i))
+
+            size = sum([os.stat(fn).st_size for fn in get_cache_files(CD, FN[0])])
+
+            # Use result 0 so 1 is least recently used
+            cache(f_numeric, (num.zeros(1000), 1), cachedir=cachedir,
+                  test=1, verbose=verbose)
+
+            evict_cache_files(CD, 2*size + size/2, verbose=verbose)
+
+            assert get_cache_files(CD, FN[0]) != []
+            assert get_cache_files(CD, FN[1]) == []
+            assert get_cache_files(CD, FN[2]) != []
+
+            # Hits and misses are logged
+            totals = cachestat(cachedir=cachedir)
+            assert totals['hits'] == 1
+            assert totals['misses'] == 3
+        finally:
+            shutil.rmtree(cachedir)
+
+
     def test_caching_of_dictionaries(self):
         """test_caching_of_dictionaries
         
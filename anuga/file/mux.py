@@ -118,3 +118,281 @@ def read_mux2_py(filenames,
 
 
 
+
+
+################################################################################
+# STREAM MUX2 FILES
+################################################################################
+
+# Value used in the mux2 format for a gauge which has stopped recording
+NODATA = 99.0
+
+# Header record of each station in a mux2 file (struct tgsrwg in structure.h)
+mux2_station_dtype = num.dtype([('geolat', num.float32),
+                                ('geolon', num.float32),
+                                ('mcolat', num.float32),
+                                ('mcolon', num.float32),
+                                ('ig', num.int32),
+                                ('ilon', num.int32),
+                                ('ilat', num.int32),
+                                ('z', num.float32),
+                                ('center_lat', num.float32),
+                                ('center_lon', num.float32),
+                                ('offset', num.float32),
+                                ('az', num.float32),
+                                ('baz', num.float32),
+                                ('dt', num.float32),
+                                ('nt', num.int32),
+                                ('id', 'S16')])
+
+# Number of station values read together by Mux2_reader
+default_mux2_block_values = 2**20
+
+
+def isdata(x):
+    """Return True where x is not the NODATA value, as in urs_ext.c"""
+
+    x = num.asarray(x, num.float)
+    return num.logical_not((x < NODATA + 0.00001) & (NODATA < x + 0.00001))
+
+
+class Mux2_source:
+    """Memory mapped mux2 file of one source.
+
+    The data block holds, for each output step, a time record followed by
+    the values of the stations recording at that step. Only the values
+    of the selected stations are read, one output step after the other.
+    """
+
+    def __init__(self, filename):
+
+        fid = open(filename, 'rb')
+        try:
+            nsta = int(num.fromfile(fid, num.int32, 1)[0])
+            self.stations = num.fromfile(fid, mux2_station_dtype, nsta)
+            self.fros = num.fromfile(fid, num.int32, nsta)  # First output step
+            self.lros = num.fromfile(fid, num.int32, nsta)  # Last output step
+            offset = fid.tell()
+            fid.seek(0, 2)
+            size = fid.tell()
+        finally:
+            fid.close()
+
+        msg = 'Header of mux2 file %s is incomplete' % filename
+        assert len(self.lros) == nsta, msg
+
+        self.filename = filename
+        self.number_of_stations = nsta
+
+        if size > offset:
+            self.data = num.memmap(filename, dtype=num.float32, mode='r',
+                                   offset=offset,
+                                   shape=((size-offset)/4,))
+        else:
+            self.data = num.zeros(0, num.float32)
+
+
+    def select(self, permutation, ig):
+        """Start reading the stations in permutation from the first output
+        step. Stations where ig is -1 are outside all grids and read as
+        zero.
+        """
+
+        self.permutation = permutation
+        self.outside = (ig[permutation] == -1) | \
+                       (self.fros[permutation] == -1)
+        self.T = 0
+
+        # Output steps from which each station is counted as started and
+        # as stopped, ordered by step and then by station
+        ids = num.flatnonzero(self.fros <= self.lros)
+        start = num.maximum(self.fros[ids], 1)
+        stop = num.maximum(self.lros[ids] + 1, 1)
+
+        order = num.argsort(start, kind='mergesort')
+        self.start_ids = ids[order]
+        self.start_steps = start[order]
+
+        order = num.argsort(stop, kind='mergesort')
+        self.stop_ids = ids[order]
+        self.stop_steps = stop[order]
+
+        # Number of stations recording at the current step, and of those
+        # before each selected station
+        self.count = 0
+        self.rank = num.zeros(len(permutation), num.int)
+
+        # Position of the time record of the current step
+        self.position = 0
+
+
+    def read_step(self, values):
+        """Read the next output step into values, as fillDataArray in
+        urs_ext.c: zero before a station starts recording and NODATA
+        after it stopped.
+        """
+
+        # Skip the time record and the values of the previous step
+        if self.T > 0:
+            self.position += 1 + self.count
+
+        self.T = T = self.T + 1
+        P = self.permutation
+
+        # Stations starting and stopping at this step
+        lo, hi = num.searchsorted(self.start_steps, [T, T+1])
+        self.rank += num.searchsorted(self.start_ids[lo:hi], P)
+        self.count += hi - lo
+        lo, hi = num.searchsorted(self.stop_steps, [T, T+1])
+        self.rank -= num.searchsorted(self.stop_ids[lo:hi], P)
+        self.count -= hi - lo
+
+        fros = self.fros[P]
+        lros = self.lros[P]
+
+        values[:] = 0.0
+        values[T > lros] = NODATA
+
+        recording = num.flatnonzero((T >= fros) & (T <= lros))
+        values[recording] = \
+            self.data[self.position + 1 + self.rank[recording]]
+
+        values[self.outside] = 0.0
+
+
+class Mux2_reader:
+    """Read the weighted sum of the gauge data of several mux2 files.
+
+    Gives the same values as read_mux2_py without loading all stations:
+    the files are memory mapped and only the stations in permutation are
+    read, block by block in time, with the weighted sum accumulated in
+    place.
+
+    Attributes times, latitudes, longitudes, elevation and starttime are
+    those returned by read_mux2_py. The values are returned by
+    read_blocks.
+    """
+
+    def __init__(self, filenames, weights=None, permutation=None,
+                 verbose=False):
+
+        self.sources = [Mux2_source(filename) for filename in filenames]
+        self.verbose = verbose
+
+        if weights is None:
+            weights = num.ones(len(filenames), num.float)
+        msg = 'Must specify one weight for each filename'
+        assert len(weights) == len(filenames), msg
+        self.weights = num.array(weights, num.float32)
+
+        first = self.sources[0]
+        stations = first.stations
+        nsta = first.number_of_stations
+
+        msg = 'Must have at least one station'
+        assert nsta > 0, msg
+
+        for source in self.sources[1:]:
+            if source.number_of_stations != nsta:
+                msg = '%s has different number of stations to %s' \
+                      % (source.filename, first.filename)
+                raise Exception, msg
+            if num.any(source.stations['dt'] != stations['dt']):
+                msg = '%s has different sampling rate to %s' \
+                      % (source.filename, first.filename)
+                raise Exception, msg
+            if num.any(source.stations['nt'] != stations['nt']):
+                msg = '%s has different series length to %s' \
+                      % (source.filename, first.filename)
+                raise Exception, msg
+
+        if permutation is None or len(permutation) == 0:
+            permutation = num.arange(nsta)
+        self.permutation = permutation = \
+            ensure_numeric(permutation, num.int)
+
+        self.dt = float(stations['dt'][0])
+        self.nt = int(stations['nt'][0])
+
+        msg = 'Must have a postive timestep'
+        assert self.dt > 0, msg
+        msg = 'Must have at least one gauge value'
+        assert self.nt > 0, msg
+
+        self.latitudes = stations['geolat'][permutation].astype(num.float)
+        self.longitudes = stations['geolon'][permutation].astype(num.float)
+        self.elevation = -stations['z'][permutation].astype(num.float)
+
+        # First and last output steps of each station over all sources
+        self.first_step = first.fros[permutation]
+        self.last_step = first.lros[permutation]
+        for source in self.sources[1:]:
+            self.first_step = num.minimum(self.first_step,
+                                          source.fros[permutation])
+            self.last_step = num.maximum(self.last_step,
+                                         source.lros[permutation])
+
+        self.start_tstep = min(self.nt + 1, self.first_step.min())
+        self.finish_tstep = max(-1, self.last_step.max())
+
+        if self.start_tstep > self.nt or self.finish_tstep < 0:
+            msg = 'Gauge data has incorrect start and finish times'
+            raise ValueError, msg
+
+        if self.start_tstep >= self.finish_tstep:
+            msg = 'Gauge data has non-postive length'
+            raise ValueError, msg
+
+        number_of_times = self.finish_tstep - self.start_tstep + 1
+        self.times = self.dt * num.arange(number_of_times)
+        self.starttime = min(1e16, (self.dt*self.first_step).min())
+
+
+    def read_blocks(self, block_size=None):
+        """Generate (j, values) where values[k,i] is the value of the
+        selected station i at times[j+k], for blocks of at most
+        block_size times.
+        """
+
+        m = len(self.permutation)
+        if block_size is None:
+            block_size = max(1, default_mux2_block_values/m)
+
+        ig = self.sources[0].stations['ig']
+        for source in self.sources:
+            source.select(self.permutation, ig)
+
+        # Output steps stored as times, a negative start step gives
+        # trailing zeros as in read_mux2
+        first = max(1, self.start_tstep)
+        number_of_times = len(self.times)
+        number_of_steps = self.finish_tstep - first + 1
+
+        values = num.zeros(m, num.float32)
+
+        # Advance to the first step stored
+        for T in range(1, first):
+            for source in self.sources:
+                source.read_step(values)
+
+        for j in range(0, number_of_times, block_size):
+            n = min(block_size, number_of_times - j)
+            block = num.zeros((n, m), num.float32)
+
+            for k in range(n):
+                if j + k >= number_of_steps:
+                    break
+
+                T = first + j + k
+                total = block[k]
+                for source, weight in zip(self.sources, self.weights):
+                    source.read_step(values)
+
+                    valid = isdata(total) & isdata(values)
+                    total[valid] += values[valid]*weight
+                    total[~valid] = NODATA
+
+                # Stations which have stopped recording in all sources
+                total[T > self.last_step] = 0.0
+
+            yield j, block.astype(num.float)
@@ -8,6 +8,11 @@ class NewQuantity(exceptions.Exception): pass
 class DataDomainError(exceptions.Exception): pass
 class DataTimeError(exceptions.Exception): pass
 
+import sys
+import copy
+from threading import Thread
+from Queue import Queue
+
 import numpy
 from anuga.coordinate_transforms.geo_reference import Geo_reference
 from anuga.config import netcdf_mode_r, netcdf_mode_w, netcdf_mode_a
@@ -87,6 +92,29 @@ class SWW_file(Data_format):
         else:
             self.minimum_storable_height = default_minimum_storable_height
 
+        # Number of frames held in memory before writing to file.
+        # 0 means the file is opened and closed at every timestep
+        if hasattr(domain, 'sww_buffer_size'):
+            self.buffer_size = domain.sww_buffer_size
+        else:
+            self.buffer_size = 0
+
+        # Write frames from a background thread, with at most
+        # queue_size frames waiting to be written
+        if hasattr(domain, 'sww_asynchronous'):
+            self.asynchronous = domain.sww_asynchronous
+            self.queue_size = domain.sww_queue_size
+        else:
+            self.asynchronous = False
+            self.queue_size = 1
+
+        self.thread = None
+        self.fid = None
+        self.buffers = None
+        self.time_buffer = None
+        self.buffer_count = 0
+        self.number_of_frames = 0
+
         # Call parent constructor
         Data_format.__init__(self, domain, 'sww', mode)
 
@@ -113,21 +141,29 @@ class SWW_file(Data_format):
                 if self.store_centroids: dynamic_c_quantities.append(q+'_c')
 
 
+        self.writer = Write_sww(static_quantities,
+                                dynamic_quantities,
+                                static_c_quantities,
+                                dynamic_c_quantities)
+
+        self.create_file()
+
+    def create_file(self):
+        """Create the NetCDF file and store the header
+        """
+
+        domain = self.domain
+
         # NetCDF file definition
-        fid = NetCDFFile(self.filename, mode)
-        if mode[0] == 'w':
+        fid = NetCDFFile(self.filename, self.mode)
+        if self.mode[0] == 'w':
             description = 'Output from anuga.file.sww ' \
                           'suitable for plotting'
 
-            self.writer = Write_sww(static_quantities,
-                                    dynamic_quantities,
-                                    static_c_quantities,
-                                    dynamic_c_quantities)
-
             self.writer.store_header(fid,
                                      domain.starttime,
                                      self.number_of_volumes,
-                                     self.domain.number_of_nodes,
+                                     self.number_of_nodes,
                                      description=description,
                                      smoothing=domain.smooth,
                                      order=domain.default_order,
@@ -236,8 +272,22 @@ class SWW_file(Data_format):
 
     def store_timestep(self):
         """Store time and time dependent quantities
+
+        If the domain has a positive sww_buffer_size the file is kept
+        open between calls and frames are written in blocks
+        (see store_timestep_buffered). If the domain is set to store
+        asynchronously frames are written by a background thread
+        (see store_timestep_asynchronous).
         """
 
+        if self.asynchronous:
+            self.store_timestep_asynchronous()
+            return
+
+        if self.buffer_size > 0:
+            self.store_timestep_buffered()
+            return
+
         #import types
         from time import sleep
         from os import stat
@@ -273,145 +323,495 @@ class SWW_file(Data_format):
         file_size = stat(self.filename)[6]
         file_size_increase = file_size / i
         if file_size + file_size_increase > self.max_size * 2**self.recursion:
-            # In order to get the file name and start time correct,
-            # I change the domain.filename and domain.starttime.
-            # This is the only way to do this without changing
-            # other modules (I think).
-
-            # Write a filename addon that won't break the anuga viewers
-            # (10.sww is bad)
-            filename_ext = '_time_%s' % self.domain.time
-            filename_ext = filename_ext.replace('.', '_')
-
-            # Remember the old filename, then give domain a
-            # name with the extension
-            old_domain_filename = self.domain.get_name()
-            if not self.recursion:
-                self.domain.set_name(old_domain_filename + filename_ext)
-
-            # Temporarily change the domain starttime to the current time
-            old_domain_starttime = self.domain.starttime
-            self.domain.starttime = self.domain.get_time()
-
-            # Build a new data_structure.
-            next_data_structure = SWW_file(self.domain, mode=self.mode,
-                                           max_size=self.max_size,
-                                           recursion=self.recursion+1)
-            if not self.recursion:
-                log.critical('    file_size = %s' % file_size)
-                log.critical('    saving file to %s'
-                             % next_data_structure.filename)
-
-            # Set up the new data_structure
-            self.domain.writer = next_data_structure
-
-            # Store connectivity and first timestep
-            next_data_structure.store_connectivity()
-            next_data_structure.store_timestep()
             fid.sync()
             fid.close()
 
-            # Restore the old starttime and filename
-            self.domain.starttime = old_domain_starttime
-            self.domain.set_name(old_domain_filename)
+            self.split_file(file_size)
         else:
             self.recursion = False
-            domain = self.domain
 
-            # Get the variables
-            time = fid.variables['time'][:]
-            i = len(time)
+            # Now store dynamic quantities
+            dynamic_quantities, dynamic_quantities_centroid = \
+                                self.get_dynamic_quantities()
 
+            # Store dynamic quantities
+            slice_index = self.writer.store_quantities(fid,
+                                         time=self.domain.time,
+                                         sww_precision=self.precision,
+                                         **dynamic_quantities)
 
-            if 'stage' in self.writer.dynamic_quantities:
-                # Select only those values for stage,
-                # xmomentum and ymomentum (if stored) where
-                # depth exceeds minimum_storable_height
-                #
-                # In this branch it is assumed that elevation
-                # is also available as a quantity
+            # Store dynamic quantities
+            if self.store_centroids:
+                self.writer.store_quantities_centroid(fid,
+                                                      slice_index= slice_index,
+                                                      sww_precision=self.precision,
+                                                      **dynamic_quantities_centroid)
 
 
-                # Smoothing for the get_vertex_values will be obtained
-                # from the smooth setting in domain
+            # Update extrema if requested
+            self.store_extrema(fid)
 
-                Q = domain.quantities['stage']
-                w, _ = Q.get_vertex_values(xy=False)
+            # Flush and close
+            #fid.sync()
+            fid.close()
 
-                Q = domain.quantities['elevation']
-                z, _ = Q.get_vertex_values(xy=False)
 
-                storable_indices = num.array(w-z >= self.minimum_storable_height)
+    def split_file(self, file_size):
+        """Continue storage in a new sww file once this one has reached
+        max_size. The current timestep is stored in the new file which
+        then replaces this one as domain.writer.
+        """
 
-                #print numpy.sum(storable_indices), len(z), self.minimum_storable_height, numpy.min(w-z)
-            else:
-                # Very unlikely branch
-                storable_indices = None # This means take all
+        # In order to get the file name and start time correct,
+        # I change the domain.filename and domain.starttime.
+        # This is the only way to do this without changing
+        # other modules (I think).
+
+        # Write a filename addon that won't break the anuga viewers
+        # (10.sww is bad)
+        filename_ext = '_time_%s' % self.domain.time
+        filename_ext = filename_ext.replace('.', '_')
+
+        # Remember the old filename, then give domain a
+        # name with the extension
+        old_domain_filename = self.domain.get_name()
+        if not self.recursion:
+            self.domain.set_name(old_domain_filename + filename_ext)
+
+        # Temporarily change the domain starttime to the current time
+        old_domain_starttime = self.domain.starttime
+        self.domain.starttime = self.domain.get_time()
+
+        # Build a new data_structure.
+        next_data_structure = SWW_file(self.domain, mode=self.mode,
+                                       max_size=self.max_size,
+                                       recursion=self.recursion+1)
+        if not self.recursion:
+            log.critical('    file_size = %s' % file_size)
+            log.critical('    saving file to %s'
+                         % next_data_structure.filename)
+
+        # Set up the new data_structure
+        self.domain.writer = next_data_structure
+
+        # Store connectivity and first timestep
+        next_data_structure.store_connectivity()
+        next_data_structure.store_timestep()
+
+        # Restore the old starttime and filename
+        self.domain.starttime = old_domain_starttime
+        self.domain.set_name(old_domain_filename)
+
+
+    def get_dynamic_quantities(self):
+        """Return two dictionaries with the current vertex and centroid
+        values of the dynamic quantities, as they are to be stored.
+        """
 
-            # Now store dynamic quantities
-            dynamic_quantities = {}
-            dynamic_quantities_centroid = {}
+        domain = self.domain
 
-            for name in self.writer.dynamic_quantities:
-                #netcdf_array = fid.variables[name]
+        if 'stage' in self.writer.dynamic_quantities:
+            # Select only those values for stage,
+            # xmomentum and ymomentum (if stored) where
+            # depth exceeds minimum_storable_height
+            #
+            # In this branch it is assumed that elevation
+            # is also available as a quantity
 
-                Q = domain.quantities[name]
-                A, _ = Q.get_vertex_values(xy=False,
-                                           precision=self.precision)
 
-                if storable_indices is not None:
-                    if name == 'stage':
-                        A = num.choose(storable_indices, (z, A))
+            # Smoothing for the get_vertex_values will be obtained
+            # from the smooth setting in domain
 
-                    if name in ['xmomentum', 'ymomentum']:
-                        # Get xmomentum where depth exceeds
-                        # minimum_storable_height
+            Q = domain.quantities['stage']
+            w, _ = Q.get_vertex_values(xy=False)
 
-                        # Define a zero vector of same size and type as A
-                        # for use with momenta
-                        null = num.zeros(num.size(A), A.dtype.char)
-                        A = num.choose(storable_indices, (null, A))
+            Q = domain.quantities['elevation']
+            z, _ = Q.get_vertex_values(xy=False)
 
-                dynamic_quantities[name] = A
+            storable_indices = num.array(w-z >= self.minimum_storable_height)
 
-            for name in self.writer.dynamic_c_quantities:
-                Q = domain.quantities[name[:-2]]
-                dynamic_quantities_centroid[name] = Q.centroid_values
+            #print numpy.sum(storable_indices), len(z), self.minimum_storable_height, numpy.min(w-z)
+        else:
+            # Very unlikely branch
+            storable_indices = None # This means take all
 
+        dynamic_quantities = {}
+        dynamic_quantities_centroid = {}
 
-            # Store dynamic quantities
-            slice_index = self.writer.store_quantities(fid,
-                                         time=self.domain.time,
-                                         sww_precision=self.precision,
-                                         **dynamic_quantities)
+        for name in self.writer.dynamic_quantities:
+            #netcdf_array = fid.variables[name]
 
-            # Store dynamic quantities
-            if self.store_centroids:
-                self.writer.store_quantities_centroid(fid,
-                                                      slice_index= slice_index,
-                                                      sww_precision=self.precision,
-                                                      **dynamic_quantities_centroid)
+            Q = domain.quantities[name]
+            A, _ = Q.get_vertex_values(xy=False,
+                                       precision=self.precision)
 
+            if storable_indices is not None:
+                if name == 'stage':
+                    A = num.choose(storable_indices, (z, A))
 
-            # Update extrema if requested
-            domain = self.domain
-            if domain.quantities_to_be_monitored is not None:
-                for q, info in domain.quantities_to_be_monitored.items():
-                    if info['min'] is not None:
-                        fid.variables[q + '.extrema'][0] = info['min']
-                        fid.variables[q + '.min_location'][:] = \
-                                        info['min_location']
-                        fid.variables[q + '.min_time'][0] = info['min_time']
-
-                    if info['max'] is not None:
-                        fid.variables[q + '.extrema'][1] = info['max']
-                        fid.variables[q + '.max_location'][:] = \
-                                        info['max_location']
-                        fid.variables[q + '.max_time'][0] = info['max_time']
+                if name in ['xmomentum', 'ymomentum']:
+                    # Get xmomentum where depth exceeds
+                    # minimum_storable_height
 
-            # Flush and close
-            #fid.sync()
-            fid.close()
+                    # Define a zero vector of same size and type as A
+                    # for use with momenta
+                    null = num.zeros(num.size(A), A.dtype.char)
+                    A = num.choose(storable_indices, (null, A))
+
+            dynamic_quantities[name] = A
+
+        for name in self.writer.dynamic_c_quantities:
+            Q = domain.quantities[name[:-2]]
+            dynamic_quantities_centroid[name] = Q.centroid_values
+
+        return dynamic_quantities, dynamic_quantities_centroid
+
+
+    def store_extrema(self, fid, quantities_to_be_monitored=None):
+        """Update extrema of monitored quantities, if requested
+
+        By default the extrema are taken from the domain.
+        """
+
+        if quantities_to_be_monitored is None:
+            quantities_to_be_monitored = self.domain.quantities_to_be_monitored
+
+        if quantities_to_be_monitored is not None:
+            for q, info in quantities_to_be_monitored.items():
+                if info['min'] is not None:
+                    fid.variables[q + '.extrema'][0] = info['min']
+                    fid.variables[q + '.min_location'][:] = \
+                                    info['min_location']
+                    fid.variables[q + '.min_time'][0] = info['min_time']
+
+                if info['max'] is not None:
+                    fid.variables[q + '.extrema'][1] = info['max']
+                    fid.variables[q + '.max_location'][:] = \
+                                    info['max_location']
+                    fid.variables[q + '.max_time'][0] = info['max_time']
+
+
+    def open(self):
+        """Open the sww file for append and keep the handle for
+        subsequent calls. The number of stored frames and the file size
+        are read once here and tracked from then on.
+        """
+
+        from os import stat
+
+        if self.fid is not None:
+            return self.fid
+
+        try:
+            fid = NetCDFFile(self.filename, netcdf_mode_a)
+        except IOError:
+            msg = 'File %s could not be opened for append' % self.filename
+            raise DataFileNotOpenError, msg
+
+        self.fid = fid
+        self.file_times = num.array(fid.variables['time'][:], num.float)
+        self.number_of_frames = len(self.file_times)
+        self.file_size = stat(self.filename)[6]
+
+        # Bytes added to the file by each frame
+        itemsize = num.dtype(self.precision).itemsize
+        frame_size = num.dtype(netcdf_float).itemsize
+        for name in self.writer.dynamic_quantities + \
+                    self.writer.dynamic_c_quantities:
+            frame_size += fid.variables[name].shape[1]*itemsize
+        self.frame_size = frame_size
+
+        return fid
+
+
+    def rewind_frames(self, time):
+        """Overwrite frames already stored from time onwards, as when
+        restarting from a checkpoint
+        """
+
+        if self.number_of_frames > 0:
+            last_time = self.file_times[self.number_of_frames-1]
+            if time <= last_time:
+                self.number_of_frames = \
+                     int(num.searchsorted(self.file_times, time - 1.0e-14))
+
+
+    def store_timestep_buffered(self):
+        """Copy the current time and dynamic quantities into the
+        frame buffer. The buffer is written to the file once it holds
+        buffer_size frames, on flush or on close.
+        """
+
+        fid = self.open()
+        time = self.domain.time
+
+        if self.buffer_count == 0:
+            self.rewind_frames(time)
+
+        if self.file_size + self.frame_size > \
+                           self.max_size * 2**self.recursion:
+            file_size = self.file_size
+            self.close()
+            self.split_file(file_size)
+            return
+
+        self.recursion = False
+
+        dynamic_quantities, dynamic_quantities_centroid = \
+                            self.get_dynamic_quantities()
+        dynamic_quantities.update(dynamic_quantities_centroid)
+
+        if self.buffers is None:
+            self.time_buffer = num.zeros(self.buffer_size, num.float)
+            self.buffers = {}
+            for name, A in dynamic_quantities.items():
+                self.buffers[name] = num.zeros((self.buffer_size, len(A)),
+                                               self.precision)
+
+        k = self.buffer_count
+        self.time_buffer[k] = time
+        for name, A in dynamic_quantities.items():
+            self.buffers[name][k,:] = A
+
+        self.buffer_count += 1
+        self.file_size += self.frame_size
+
+        if self.buffer_count == self.buffer_size:
+            self.flush()
+
+
+    def flush(self):
+        """Write buffered frames to the file in one block
+        """
+
+        if self.thread is not None:
+            # Wait until the writer thread has written all queued frames
+            self.frame_queue.join()
+            self.check_writer_error()
+            self.fid.sync()
+            return
+
+        if self.buffer_count == 0:
+            return
+
+        fid = self.open()
+
+        n = self.buffer_count
+        start = self.number_of_frames
+
+        quantities = {}
+        for name in self.buffers:
+            quantities[name] = self.buffers[name][:n]
+
+        self.writer.store_quantities_block(fid,
+                                           self.time_buffer[:n],
+                                           slice_index=start,
+                                           sww_precision=self.precision,
+                                           **quantities)
+
+        self.store_extrema(fid)
+        fid.sync()
+
+        # Keep record of stored times for checkpoint restarts
+        self.file_times = num.concatenate((self.file_times[:start],
+                                           self.time_buffer[:n],
+                                           self.file_times[start+n:]))
+        self.number_of_frames = start + n
+        self.buffer_count = 0
+
+
+    def store_timestep_asynchronous(self):
+        """Copy the current time and dynamic quantities into a free
+        snapshot and queue it for the writer thread.
+
+        Blocks if queue_size frames are already waiting to be written.
+        """
+
+        if self.thread is None:
+            self.start_writer_thread()
+
+        self.check_writer_error()
+
+        time = self.domain.time
+        self.rewind_frames(time)
+
+        if self.file_size + self.frame_size > \
+                           self.max_size * 2**self.recursion:
+            file_size = self.file_size
+            self.close()
+            self.split_file(file_size)
+            return
+
+        self.recursion = False
+
+        dynamic_quantities, dynamic_quantities_centroid = \
+                            self.get_dynamic_quantities()
+        dynamic_quantities.update(dynamic_quantities_centroid)
+
+        if self.number_of_snapshots < self.queue_size + 1:
+            # Allocate snapshots until there is one for each
+            # queued frame plus the one being written
+            snapshot = {}
+            for name, A in dynamic_quantities.items():
+                snapshot[name] = num.zeros(len(A), self.precision)
+            self.number_of_snapshots += 1
+        else:
+            snapshot = self.free_snapshots.get()
+
+        for name, A in dynamic_quantities.items():
+            snapshot[name][:] = A
+
+        monitored = self.domain.quantities_to_be_monitored
+        if monitored is not None:
+            monitored = copy.deepcopy(monitored)
+
+        slice_index = self.number_of_frames
+        self.frame_queue.put((slice_index, time, snapshot, monitored))
+
+        self.file_times = num.concatenate((self.file_times[:slice_index],
+                                           [time],
+                                           self.file_times[slice_index+1:]))
+        self.number_of_frames = slice_index + 1
+        self.file_size += self.frame_size
+
+
+    def start_writer_thread(self):
+        """Open the file and start the thread writing queued frames
+        """
+
+        self.open()
+
+        self.frame_queue = Queue()
+        self.free_snapshots = Queue()
+        self.number_of_snapshots = 0
+        self.writer_error = None
+
+        self.thread = Thread(target=self.write_queued_frames)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+
+    def write_queued_frames(self):
+        """Main loop of the writer thread. A None item ends the loop.
+
+        Only the writer thread uses the file while it is running.
+        """
+
+        while True:
+            item = self.frame_queue.get()
+            if item is None:
+                self.frame_queue.task_done()
+                break
+
+            slice_index, time, snapshot, monitored = item
+
+            if self.writer_error is None:
+                try:
+                    self.write_snapshot(slice_index, time, snapshot,
+                                        monitored)
+                except:
+                    self.writer_error = sys.exc_info()
+
+            self.free_snapshots.put(snapshot)
+            self.frame_queue.task_done()
+
+
+    def write_snapshot(self, slice_index, time, snapshot, monitored):
+        """Store one snapshot of the dynamic quantities at slice_index
+        """
+
+        fid = self.fid
+
+        fid.variables['time'][slice_index] = time
+
+        quantities = {}
+        quantities_centroid = {}
+        for name in self.writer.dynamic_quantities:
+            quantities[name] = snapshot[name]
+        for name in self.writer.dynamic_c_quantities:
+            quantities_centroid[name] = snapshot[name]
+
+        self.writer.store_quantities(fid,
+                                     slice_index=slice_index,
+                                     sww_precision=self.precision,
+                                     **quantities)
+
+        if self.store_centroids:
+            self.writer.store_quantities_centroid(fid,
+                                                  slice_index=slice_index,
+                                                  sww_precision=self.precision,
+                                                  **quantities_centroid)
+
+        if monitored is not None:
+            self.store_extrema(fid, monitored)
+
+
+    def check_writer_error(self):
+        """Raise any exception caught in the writer thread
+        """
+
+        if self.thread is not None and self.writer_error is not None:
+            error = self.writer_error
+            self.writer_error = None
+            raise error[0], error[1], error[2]
+
+
+    def stop_writer_thread(self):
+        """Wait for all queued frames to be written and stop the thread
+        """
+
+        if self.thread is None:
+            return
+
+        self.frame_queue.put(None)
+        self.thread.join()
+
+        error = self.writer_error
+        self.thread = None
+        self.frame_queue = None
+        self.free_snapshots = None
+        self.number_of_snapshots = 0
+        self.writer_error = None
+
+        if error is not None:
+            raise error[0], error[1], error[2]
+
+
+    def close(self):
+        """Flush any buffered frames and close the file.
+
+        Storage can continue afterwards, the file is reopened
+        on the next call to store_timestep.
+        """
+
+        if self.fid is None:
+            return
+
+        try:
+            self.stop_writer_thread()
+            self.flush()
+        finally:
+            self.fid.close()
+            self.fid = None
+
+
+    def __getstate__(self):
+        """The open file handle, frame buffers and writer thread are
+        not pickled (e.g. when checkpointing the domain)
+        """
+
+        state = self.__dict__.copy()
+        state['fid'] = None
+        state['buffers'] = None
+        state['time_buffer'] = None
+        state['buffer_count'] = 0
+        state['thread'] = None
+        state['frame_queue'] = None
+        state['free_snapshots'] = None
+        state['number_of_snapshots'] = 0
+        state['writer_error'] = None
+
+        return state
 
 
 class Read_sww:
@@ -1026,6 +1426,61 @@ class Write_sww(Write_sts):
 
 
 
+    def store_quantities_block(self,
+                               outfile,
+                               times,
+                               slice_index,
+                               sww_precision=num.float32,
+                               verbose=False,
+                               **quant):
+        """
+        Write a block of consecutive timesteps in one operation.
+
+        times is the array of the times of the block, which is stored
+        from slice_index onwards.
+
+        **quant must contain 2D arrays (number of times X number of
+        points or volumes) for each of the dynamic quantities and, if
+        centroids are stored, each of the dynamic centroid quantities.
+
+        The ranges of the dynamic quantities are updated as in
+        store_quantities.
+
+        Precondition:
+            store_triangulation and
+            store_header have been called.
+        """
+
+        slice_index = int(slice_index)
+        n = len(times)
+        outfile.variables['time'][slice_index:slice_index+n] = times
+
+        for q in self.dynamic_quantities + self.dynamic_c_quantities:
+            if not quant.has_key(q):
+                msg = 'Values for quantity %s was not specified in ' % q
+                msg += 'store_quantities_block so they cannot be stored.'
+                raise NewQuantity, msg
+
+            q_values = ensure_numeric(quant[q])
+
+            q_retyped = q_values.astype(sww_precision)
+            outfile.variables[q][slice_index:slice_index+n,:] = q_retyped
+
+            if q in self.dynamic_c_quantities:
+                continue
+
+            # This updates the _range values
+            q_range = outfile.variables[q + Write_sww.RANGE][:]
+            q_values_min = num.min(q_values)
+            if q_values_min < q_range[0]:
+                outfile.variables[q + Write_sww.RANGE][0] = q_values_min
+            q_values_max = num.max(q_values)
+            if q_values_max > q_range[1]:
+                outfile.variables[q + Write_sww.RANGE][1] = q_values_max
+
+        return slice_index + n
+
+
     def store_quantities_centroid(self,
                                   outfile,
                                   sww_precision=num.float32,
@@ -15,7 +15,7 @@ from anuga.file.mux import WAVEHEIGHT_MUX_LABEL, EAST_VELOCITY_LABEL, \
 from anuga.file.mux import WAVEHEIGHT_MUX2_LABEL, EAST_VELOCITY_MUX2_LABEL, \
                 NORTH_VELOCITY_MUX2_LABEL
                 
-from anuga.file.mux import read_mux2_py
+from anuga.file.mux import read_mux2_py, Mux2_reader
 from anuga.file_conversion.urs2sts import urs2sts
 from anuga.file.urs import Read_urs
 
@@ -445,6 +445,58 @@ class Test_Mux(unittest.TestCase):
         
 
         
+    def test_mux2_reader(self):
+        """Mux2_reader gives the same values as read_mux2_py for several
+        sources with varying start and finish times
+        """
+
+        time_step_count = 6
+        time_step = 2
+        lat_long_points = [(-21.5,114.5), (-21,114.5), (-21.5,115),
+                           (-21.,115.), (-22.,115.)]
+        n = len(lat_long_points)
+        depth = 20*num.ones(n, num.float)
+
+        files = []
+        for k in range(3):
+            first_tstep = num.ones(n, num.int)
+            first_tstep[k+1] += k+1
+            last_tstep = time_step_count*num.ones(n, num.int)
+            last_tstep[k] -= 2
+            ha = num.arange(n*time_step_count).reshape(n, time_step_count)
+            ha = ha + 0.1*k
+            ha[4,2] = 99.0
+            base_name, source_files = self.write_mux2(lat_long_points,
+                                                      time_step_count,
+                                                      time_step,
+                                                      first_tstep, last_tstep,
+                                                      depth=depth,
+                                                      ha=ha, ua=-ha, va=ha)
+            files.append(source_files[0])
+
+        weights = num.array([0.5, 0.3, 0.2])
+        for permutation in [None, num.array([4, 1, 2, 1])]:
+            times, latitudes, longitudes, elevation, stage, starttime = \
+                   read_mux2_py(files, weights, permutation)
+
+            reader = Mux2_reader(files, weights, permutation)
+            assert num.allclose(reader.times, times)
+            assert num.allclose(reader.latitudes, latitudes)
+            assert num.allclose(reader.longitudes, longitudes)
+            assert num.allclose(reader.elevation, elevation)
+            assert num.allclose(reader.starttime, starttime)
+
+            for block_size in [None, 1, 4]:
+                blocks = []
+                k = 0
+                for j, values in reader.read_blocks(block_size):
+                    assert j == k
+                    k += len(values)
+                    blocks.append(values)
+                assert num.all(num.concatenate(blocks).T == stage)
+
+        self.delete_mux(files)
+
     def test_read_mux_platform_problem1(self):
         """test_read_mux_platform_problem1
         
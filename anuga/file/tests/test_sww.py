@@ -875,6 +875,68 @@ class Test_sww(unittest.TestCase):
                                            new_origin)),points_utm)
         os.remove(filename)
 
+    def test_store_buffered(self):
+        """test_store_buffered(self):
+
+        Buffered and asynchronous storage with the file kept open
+        during evolve should give the same sww file as the default
+        storage.
+        """
+
+        def evolve_domain(name, buffered=False, asynchronous=False):
+            points, vertices, boundary = rectangular(10, 5, 10, 5)
+            domain = Domain(points, vertices, boundary)
+            domain.set_name(name)
+            domain.set_datadir('.')
+            domain.set_quantity('elevation', lambda x,y: -x/10.0)
+            domain.set_quantity('stage', 0.5)
+            if buffered:
+                # Buffer size does not divide the number of frames
+                domain.set_store_buffered(True, buffer_size=4)
+            if asynchronous:
+                domain.set_store_asynchronous(True, queue_size=2)
+
+            Br = Reflective_boundary(domain)
+            Bd = Dirichlet_boundary([1, 0, 0])
+            domain.set_boundary({'left': Bd, 'right': Br,
+                                 'top': Br, 'bottom': Br})
+
+            for t in domain.evolve(yieldstep=0.5, finaltime=5.0):
+                pass
+
+            assert domain.writer.fid is None
+            assert domain.writer.thread is None
+
+            return domain.get_name() + '.sww'
+
+        swwfile = evolve_domain('test_store_unbuffered')
+        swwfile_buffered = evolve_domain('test_store_buffered', buffered=True)
+        swwfile_async = evolve_domain('test_store_async', asynchronous=True)
+
+        fid = NetCDFFile(swwfile)
+
+        for other in [swwfile_buffered, swwfile_async]:
+            fid_other = NetCDFFile(other)
+
+            assert num.allclose(fid.variables['time'][:],
+                                fid_other.variables['time'][:])
+            assert len(fid_other.variables['time'][:]) == 11
+
+            for q in ['stage', 'xmomentum', 'ymomentum',
+                      'stage_c', 'xmomentum_c', 'ymomentum_c']:
+                assert num.allclose(fid.variables[q][:],
+                                    fid_other.variables[q][:])
+
+            for q in ['stage', 'xmomentum', 'ymomentum']:
+                assert num.allclose(fid.variables[q + '_range'][:],
+                                    fid_other.variables[q + '_range'][:])
+
+            fid_other.close()
+            os.remove(other)
+
+        fid.close()
+        os.remove(swwfile)
+
 #################################################################################
 
 if __name__ == "__main__":
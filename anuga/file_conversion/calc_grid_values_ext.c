@@ -291,10 +291,14 @@ void _calc_grid_values( double *x, double *y, double *norms,
 				 double cell_size,
 				 int nrow,
 				 int ncol,
+				 int num_quantities,
 				 double *vertex_val,
-				 double *grid_val )
+				 double *grid_val,
+				 long *tri_ids,
+				 double *sigmas )
 {
-	int i, j, k;
+	int i, j, k, q;
+	int num_grid = nrow*ncol;
 	int x_min, x_max, y_min, y_max, point_index;
 	double x_dist, y_dist, x_base, y_base;
 	double sigma0, sigma1, sigma2;
@@ -394,10 +398,22 @@ void _calc_grid_values( double *x, double *y, double *norms,
 					val2 = point_dot( res, n3 );
 					sigma2 = val2 ? val1/val2 : 0;
 
-						
-					grid_val[point_index] = sigma0*vertex_val[volumes[i*3]] + \
-								sigma1*vertex_val[volumes[i*3+1]] + \
-								sigma2*vertex_val[volumes[i*3+2]];
+
+					// Record the weights if requested
+					if ( tri_ids ) {
+						tri_ids[point_index] = i;
+						sigmas[3*point_index]   = sigma0;
+						sigmas[3*point_index+1] = sigma1;
+						sigmas[3*point_index+2] = sigma2;
+					}
+
+					// Same weights for all quantities
+					for ( q = 0; q < num_quantities; q++ ) {
+						grid_val[q*num_grid + point_index] = \
+							sigma0*vertex_val[q*num_vert + volumes[i*3]] + \
+							sigma1*vertex_val[q*num_vert + volumes[i*3+1]] + \
+							sigma2*vertex_val[q*num_vert + volumes[i*3+2]];
+					}
 				}
 			}
 		}
@@ -409,6 +425,7 @@ void _calc_grid_values( double *x, double *y, double *norms,
 static PyObject *calc_grid_values( PyObject *self, PyObject *args )
 {
 	int i, ok, num_tri, num_vert, ncol, nrow, num_norms, num_grid_val;
+	int num_quantities;
 	long *volumes; 
 	double nodata_val;
     double cell_size;
@@ -455,7 +472,17 @@ static PyObject *calc_grid_values( PyObject *self, PyObject *args )
 	num_tri  = ((PyArrayObject*)pyobj_volumes)->dimensions[0];
 	num_vert = ((PyArrayObject*)pyobj_x)->dimensions[0];
     num_norms = ((PyArrayObject*)pyobj_norms)->dimensions[0];
-    num_grid_val = ((PyArrayObject*)pyobj_grid_val)->dimensions[0];
+    num_grid_val = PyArray_SIZE((PyArrayObject*)pyobj_grid_val);
+
+	// result and grid_val hold one row for each quantity
+	num_quantities = PyArray_SIZE((PyArrayObject*)pyobj_result)/num_vert;
+
+	if ( num_quantities*num_vert != PyArray_SIZE((PyArrayObject*)pyobj_result) ||
+	     num_quantities*nrow*ncol != num_grid_val ) {
+		PyErr_SetString(PyExc_ValueError,
+			"calc_grid_values: result and grid_val must hold the same number of quantities");
+		return NULL;
+	}
 
     //printf("==== %d %d %d %d %d \n",num_norms,num_tri,num_vert,nrow,ncol);
 
@@ -466,21 +493,87 @@ static PyObject *calc_grid_values( PyObject *self, PyObject *args )
 
         //printf("+++ %d\n",nrow*ncol);
 	// evaluate grid
-	for ( i = 0 ; i < nrow*ncol; i++ ) 
+	for ( i = 0 ; i < num_grid_val; i++ ) 
 		grid_val[i] = nodata_val;
 
 
 
 	_calc_grid_values( x,y, norms, num_vert, volumes, num_tri, \
 				    cell_size, nrow, ncol,   	\
-				    result, grid_val );
+				    num_quantities, result, grid_val, NULL, NULL );
+
+
+	return Py_BuildValue("");
+}
+
+/*
+ * Record for each grid point the last triangle containing it and the
+ * weights of the triangle's vertices, as used by calc_grid_values.
+ * tri_ids (nrow*ncol) must be initialised to -1 by the caller,
+ * sigmas holds 3 weights for each grid point.
+ */
+static PyObject *calc_grid_weights( PyObject *self, PyObject *args )
+{
+	int ok, num_tri, num_vert, ncol, nrow;
+	long *volumes;
+	long *tri_ids;
+	double cell_size;
+	double *x, *y;
+	double *norms;
+	double *sigmas;
+	PyObject *pyobj_x;
+	PyObject *pyobj_y;
+	PyObject *pyobj_norms;
+	PyObject *pyobj_volumes;
+	PyObject *pyobj_tri_ids;
+	PyObject *pyobj_sigmas;
+
+	ok = PyArg_ParseTuple( args, "iidOOOOOO",
+				&nrow,
+				&ncol,
+				&cell_size,
+				&pyobj_x,
+				&pyobj_y,
+				&pyobj_norms,
+				&pyobj_volumes,
+				&pyobj_tri_ids,
+				&pyobj_sigmas );
+
+	if( !ok ){
+		PyErr_SetString(PyExc_RuntimeError,
+			"calc_grid_weights: argument parsing error");
+		return NULL;
+	}
+
+	if ( PyArray_SIZE((PyArrayObject*)pyobj_tri_ids) != nrow*ncol ||
+	     PyArray_SIZE((PyArrayObject*)pyobj_sigmas) != 3*nrow*ncol ) {
+		PyErr_SetString(PyExc_ValueError,
+			"calc_grid_weights: tri_ids and sigmas must match the grid");
+		return NULL;
+	}
+
+	x = DDATA( pyobj_x );
+	y = DDATA( pyobj_y );
+	norms   = DDATA( pyobj_norms );
+	sigmas  = DDATA( pyobj_sigmas );
+	volumes = IDATA( pyobj_volumes );
+	tri_ids = IDATA( pyobj_tri_ids );
+
+	num_tri  = ((PyArrayObject*)pyobj_volumes)->dimensions[0];
+	num_vert = ((PyArrayObject*)pyobj_x)->dimensions[0];
 
+	init_norms( x,y, norms, volumes, num_tri );
+
+	_calc_grid_values( x,y, norms, num_vert, volumes, num_tri, \
+				    cell_size, nrow, ncol,   	\
+				    0, NULL, NULL, tri_ids, sigmas );
 
 	return Py_BuildValue("");
 }
 
 static PyMethodDef calc_grid_values_ext_methods[] = {
 	{"calc_grid_values", calc_grid_values, METH_VARARGS},
+	{"calc_grid_weights", calc_grid_weights, METH_VARARGS},
 	{NULL, NULL}
 };
 
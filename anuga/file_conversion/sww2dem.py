@@ -7,7 +7,6 @@ import os
 import numpy as num
 
 # ANUGA modules
-from anuga.abstract_2d_finite_volumes.util import remove_lone_verts     
 from anuga.coordinate_transforms.geo_reference import Geo_reference
 from anuga.utilities.system_tools import get_vars_in_expression
 import anuga.utilities.log as log
@@ -21,13 +20,118 @@ from anuga.utilities.file_utils import get_all_swwfiles
 quantity_formula = {'momentum':'(xmomentum**2 + ymomentum**2)**0.5',
                     'depth':'stage-elevation',
                     'speed': \
- '(xmomentum**2 + ymomentum**2)**0.5/(stage-elevation+1.e-6/(stage-elevation))'}
+ '(xmomentum**2 + ymomentum**2)**0.5/(stage-elevation+1.e-6/(stage-elevation))',
+                    'hazard': \
+ '(stage-elevation)*(xmomentum**2 + ymomentum**2)**0.5/(stage-elevation+1.e-6/(stage-elevation))'}
 
 
 
 # Default block size for sww2dem()
 DEFAULT_BLOCK_SIZE = 10000
 
+# Named reductions over time for sww2dem()
+time_reductions = ['max', 'min', 'mean', 'last', 'time_of_max']
+
+
+def get_reduction_index(reduction, number_of_timesteps):
+    """Return the index of the timestep selected by reduction, or None
+    if the reduction combines all timesteps.
+    """
+
+    if reduction == 'last':
+        return number_of_timesteps - 1
+
+    if isinstance(reduction, (int, long, num.integer)):
+        if reduction < 0:
+            reduction += number_of_timesteps
+        return int(reduction)
+
+    return None
+
+
+def reduce_over_time(values, reduction, times):
+    """Reduce values (number_of_timesteps x number_of_points) over time.
+
+    reduction is one of time_reductions, a builtin such as max or min, or
+    a function reducing an array, e.g. numpy.mean. time_of_max gives the
+    first time the maximum is reached.
+    """
+
+    if reduction in [max, 'max']:
+        return num.max(values, axis=0)
+
+    if reduction in [min, 'min']:
+        return num.min(values, axis=0)
+
+    if reduction == 'mean':
+        return num.mean(values, axis=0)
+
+    if reduction == 'time_of_max':
+        return num.asarray(times)[num.argmax(values, axis=0)]
+
+    if isinstance(reduction, basestring):
+        msg = 'Reduction %s must be one of %s' % (reduction, time_reductions)
+        raise ValueError(msg)
+
+    try:
+        return reduction(values, axis=0)
+    except TypeError:
+        # Functions of a single array, such as the builtin sum
+        return num.apply_along_axis(reduction, 0, values)
+
+
+def calc_grid_weights(x, y, volumes, nrows, ncols, cellsize):
+    """Find the grid points inside the mesh, the vertices of the triangle
+    containing each of them and the interpolation weights of the vertices.
+
+    x, y are relative to the lower left grid point.
+    Returns points, vertices, weights.
+    """
+
+    from calc_grid_values_ext import calc_grid_weights as calc_weights
+
+    x = num.array(x, num.float)
+    y = num.array(y, num.float)
+    volumes = num.array(volumes, num.int)
+
+    norms = num.zeros(6*len(volumes), num.float)
+    tri_ids = -num.ones(nrows*ncols, num.int)
+    sigmas = num.zeros((nrows*ncols, 3), num.float)
+
+    calc_weights(nrows, ncols, cellsize, x, y, norms, volumes, tri_ids, sigmas)
+
+    points = num.flatnonzero(tri_ids >= 0)
+
+    return points, volumes[tri_ids[points]], sigmas[points]
+
+
+def get_grid_weights(x, y, volumes, nrows, ncols, cellsize,
+                     use_cache=False, verbose=False):
+    """Interpolation weights of the grid as given by calc_grid_weights,
+    cached on disk for the mesh and grid if use_cache is True.
+    """
+
+    args = (x, y, volumes, nrows, ncols, cellsize)
+    kwargs = {}
+
+    if use_cache is True:
+        try:
+            from anuga.caching import cache
+        except:
+            msg = 'Caching was requested, but caching module' \
+                  'could not be imported'
+            raise Exception(msg)
+
+        weights = cache(calc_grid_weights,
+                        args, kwargs,
+                        verbose=verbose,
+                        compression=False)
+    else:
+        weights = apply(calc_grid_weights, args, kwargs)
+
+    return weights
+
+
 def sww2dem(name_in, name_out,
             quantity=None, # defaults to elevation
             reduction=None,
@@ -41,7 +145,8 @@ def sww2dem(name_in, name_out,
             verbose=False,
             origin=None,
             datum='WGS84',
-            block_size=None):
+            block_size=None,
+            use_cache=False):
     """Read SWW file and convert to Digitial Elevation model format
     (.asc or .ers)
 
@@ -74,48 +179,74 @@ def sww2dem(name_in, name_out,
 
     The parameter quantity must be the name of an existing quantity or
     an expression involving existing quantities. The default is
-    'elevation'. Quantity is not a list of quantities.
+    'elevation'. Quantity may also be a list of quantities, name_out is
+    then a list of the same length and all grids are computed from one
+    pass over the sww file.
 
     If reduction is given and it's an index, sww2dem will output the quantity at that time-step. 
     If reduction is given and it's a built in function (eg max, min, mean), then that 
     function is used to reduce the quantity over all time-steps. If reduction is not given, 
-    reduction is set to "max" by default.
+    reduction is set to "max" by default. The reductions 'max', 'min', 'mean',
+    'last' and 'time_of_max' can also be given by name. If quantity is a
+    list, reduction may be a list with the reduction of each quantity.
 
     datum
 
     format can be either 'asc' or 'ers'
     block_size - sets the number of slices along the non-time axis to
                  process in one block.
+    use_cache - cache the interpolation weights of the grid on disk, to be
+                reused for sww files with the same mesh and grid.
     """
 
     import sys
-    import types
 
     from anuga.geometry.polygon import inside_polygon, outside_polygon
     from anuga.abstract_2d_finite_volumes.util import \
          apply_expression_to_dictionary
 
+    quantity_in = quantity
+    if isinstance(quantity, (list, tuple)):
+        msg = 'name_out must be a list of one output file for each quantity'
+        assert isinstance(name_out, (list, tuple)), msg
+        assert len(name_out) == len(quantity), msg
+        quantities = list(quantity)
+        names_out = list(name_out)
+    else:
+        quantities = [quantity]
+        names_out = [name_out]
+
     basename_in, in_ext = os.path.splitext(name_in)
-    basename_out, out_ext = os.path.splitext(name_out)
-    out_ext = out_ext.lower()
 
     if in_ext != '.sww':
         raise IOError('Input format for %s must be .sww' % name_in)
 
-    if out_ext not in ['.asc', '.ers']:
-        raise IOError('Format for %s must be either asc or ers.' % name_out)
+    for name in names_out:
+        if os.path.splitext(name)[1].lower() not in ['.asc', '.ers']:
+            raise IOError('Format for %s must be either asc or ers.' % name)
 
     false_easting = 500000
     false_northing = 10000000
 
-    if quantity is None:
-        quantity = 'elevation'
-    
-    if reduction is None:
-        reduction = max
+    for i, quantity in enumerate(quantities):
+        if quantity is None:
+            quantity = 'elevation'
+
+        if quantity_formula.has_key(quantity):
+            quantity = quantity_formula[quantity]
 
-    if quantity_formula.has_key(quantity):
-        quantity = quantity_formula[quantity]
+        quantities[i] = quantity
+
+    if isinstance(reduction, (list, tuple)):
+        msg = 'reduction must be a list of one reduction for each quantity'
+        assert len(reduction) == len(quantities), msg
+        reductions = list(reduction)
+    else:
+        reductions = [reduction]*len(quantities)
+
+    for i, reduction in enumerate(reductions):
+        if reduction is None:
+            reductions[i] = max
 
     if number_of_decimal_places is None:
         number_of_decimal_places = 3
@@ -128,7 +259,8 @@ def sww2dem(name_in, name_out,
     # Read sww file
     if verbose:
         log.critical('Reading from %s' % name_in)
-        log.critical('Output directory is %s' % name_out)
+        for name in names_out:
+            log.critical('Output directory is %s' % name)
 
     from anuga.file.netcdf import NetCDFFile
     fid = NetCDFFile(name_in)
@@ -137,10 +269,7 @@ def sww2dem(name_in, name_out,
     x = num.array(fid.variables['x'][:], num.float)
     y = num.array(fid.variables['y'][:], num.float)
     volumes = num.array(fid.variables['volumes'][:], num.int)
-    if type(reduction) is not types.BuiltinFunctionType:
-        times = fid.variables['time'][reduction]
-    else:
-        times = fid.variables['time'][:]
+    times = num.array(fid.variables['time'][:], num.float)
 
     try: # works with netcdf4
         number_of_timesteps = len(fid.dimensions['number_of_timesteps'])
@@ -149,6 +278,19 @@ def sww2dem(name_in, name_out,
         number_of_timesteps = fid.dimensions['number_of_timesteps']
         number_of_points = fid.dimensions['number_of_points']
 
+    # Only the selected timesteps are read if all reductions are indices
+    indices = [get_reduction_index(reduction, number_of_timesteps)
+               for reduction in reductions]
+    if None in indices:
+        steps = None
+    else:
+        steps = sorted(set(indices))
+
+    if len(set(indices)) == 1:
+        index = indices[0]
+    else:
+        index = None
+
 
 
     if origin is None:
@@ -176,8 +318,8 @@ def sww2dem(name_in, name_out,
         log.critical('  Name: %s' % name_in)
         log.critical('  Reference:')
         log.critical('    Lower left corner: [%f, %f]' % (xllcorner, yllcorner))
-        if type(reduction) is not types.BuiltinFunctionType:
-            log.critical('    Time: %f' % times)
+        if index is not None:
+            log.critical('    Time: %f' % times[index])
         else:
             log.critical('    Start time: %f' % fid.starttime)
         log.critical('  Extent:')
@@ -185,8 +327,8 @@ def sww2dem(name_in, name_out,
                      %(num.min(x), num.max(x), len(x.flat)))
         log.critical('    y [m] in [%f, %f], len(y) == %d'
                      % (num.min(y), num.max(y), len(y.flat)))
-        if type(reduction) is not types.BuiltinFunctionType:
-            log.critical('    t [s] = %f, len(t) == %d' % (times, 1))
+        if index is not None:
+            log.critical('    t [s] = %f, len(t) == %d' % (times[index], 1))
         else:
             log.critical('    t [s] in [%f, %f], len(t) == %d'
                          % (min(times), max(times), len(times)))
@@ -195,8 +337,8 @@ def sww2dem(name_in, name_out,
         # Comment out for reduced memory consumption
         for name in ['stage', 'xmomentum', 'ymomentum']:
             q = fid.variables[name][:].flatten()
-            if type(reduction) is not types.BuiltinFunctionType:
-                q = q[reduction*len(x):(reduction+1)*len(x)]
+            if index is not None:
+                q = q[index*len(x):(index+1)*len(x)]
             if verbose: log.critical('    %s in [%f, %f]'
                                      % (name, min(q), max(q)))
         for name in ['elevation']:
@@ -204,26 +346,31 @@ def sww2dem(name_in, name_out,
             if verbose: log.critical('    %s in [%f, %f]'
                                      % (name, min(q), max(q)))
 
-    # Get the variables in the supplied expression.
+    # Get the variables in the supplied expressions.
     # This may throw a SyntaxError exception.
-    var_list = get_vars_in_expression(quantity)
-
-    # Check that we have the required variables in the SWW file.
-    missing_vars = []
-    for name in var_list:
-        try:
-            _ = fid.variables[name]
-        except KeyError:
-            missing_vars.append(name)
-    if missing_vars:
-        msg = ("In expression '%s', variables %s are not in the SWW file '%s'"
-               % (quantity, str(missing_vars), name_in))
-        raise Exception, msg
-
-    # Create result array and start filling, block by block.
-
-
-    result = num.zeros(number_of_points, num.float)
+    var_list = []
+    for quantity in quantities:
+        vars_in_expression = get_vars_in_expression(quantity)
+
+        # Check that we have the required variables in the SWW file.
+        missing_vars = []
+        for name in vars_in_expression:
+            try:
+                _ = fid.variables[name]
+            except KeyError:
+                missing_vars.append(name)
+        if missing_vars:
+            msg = ("In expression '%s', variables %s are not in the SWW file '%s'"
+                   % (quantity, str(missing_vars), name_in))
+            raise Exception, msg
+
+        for name in vars_in_expression:
+            if name not in var_list:
+                var_list.append(name)
+
+    # Create result array, one row for each quantity, and start
+    # filling, block by block.
+    result = num.zeros((len(quantities), number_of_points), num.float)
 
     if verbose:
         msg = 'Slicing sww file, num points: ' + str(number_of_points)
@@ -239,31 +386,36 @@ def sww2dem(name_in, name_out,
         for name in var_list:
             # check if variable has time axis
             if len(fid.variables[name].shape) == 2:
-                q_dict[name] = fid.variables[name][:,start_slice:end_slice]
+                if steps is not None:
+                    q_dict[name] = fid.variables[name][steps,start_slice:end_slice]
+                else:
+                    q_dict[name] = fid.variables[name][:,start_slice:end_slice]
             else:       # no time axis
                 q_dict[name] = fid.variables[name][start_slice:end_slice]
 
-        # Evaluate expression with quantities found in SWW file
-        res = apply_expression_to_dictionary(quantity, q_dict)
+        # Evaluate each expression once with quantities found in SWW file
+        expressions = {}
+        for quantity in set(quantities):
+            expressions[quantity] = \
+                apply_expression_to_dictionary(quantity, q_dict)
+
+        for i, quantity in enumerate(quantities):
+            res = expressions[quantity]
 
-        if len(res.shape) == 2:
-            new_res = num.zeros(res.shape[1], num.float)
-            for k in xrange(res.shape[1]):
-                if type(reduction) is not types.BuiltinFunctionType:
-                    new_res[k] = res[reduction,k]
+            if len(res.shape) == 2:
+                if steps is not None:
+                    res = res[steps.index(indices[i])]
+                elif indices[i] is not None:
+                    res = res[indices[i]]
                 else:
-                    new_res[k] = reduction(res[:,k])
-            res = new_res
+                    res = reduce_over_time(res, reductions[i], times)
 
-        result[start_slice:end_slice] = res
-                                    
-    # Post condition: Now q has dimension: number_of_points
-    assert len(result.shape) == 1
-    assert result.shape[0] == number_of_points
+            result[i, start_slice:end_slice] = res
 
     if verbose:
-        log.critical('Processed values for %s are in [%f, %f]'
-                     % (quantity, min(result), max(result)))
+        for i, quantity in enumerate(quantities):
+            log.critical('Processed values for %s are in [%f, %f]'
+                         % (quantity, num.min(result[i]), num.max(result[i])))
 
     # Create grid and update xll/yll corner and x,y
     # Relative extent
@@ -307,166 +459,144 @@ def sww2dem(name_in, name_out,
     y = y + yllcorner - newyllcorner
 
 
-    grid_values = num.zeros( (nrows*ncols, ), num.float)
-    #print '---',grid_values.shape
+    # Rasterise all quantities in one scan over the triangles
+    grid_values = num.zeros((len(quantities), nrows*ncols), num.float)
 
-    #-------------------------------------------------------
-    # Calculate grid values using the "standard" interpolation
-    # method (ie quad trees and such)
-    #-------------------------------------------------------
-    def calc_grid_values(nrows, ncols, cellsize, NODATA_value,
-                         x,y, norms, volumes, result, grid_values):
+    if use_cache:
+        points, vertices, weights = \
+                get_grid_weights(x, y, volumes, nrows, ncols, cellsize,
+                                 use_cache=True, verbose=verbose)
 
-        grid_points = num.zeros ((ncols*nrows, 2), num.float)
-        vertex_points = num.concatenate ((x[:,num.newaxis], y[:,num.newaxis]), axis=1)
-        assert len(vertex_points.shape) == 2
+        grid_values[:] = NODATA_value
+        for i in range(len(quantities)):
+            grid_values[i, points] = \
+                num.sum(weights*result[i][vertices], axis=1)
+    else:
+        num_tri =  len(volumes)
+        norms = num.zeros(6*num_tri, num.float)
 
-        for i in xrange(nrows):
-            yg = i * cellsize
-#            if out_ext == '.asc':
-#                yg = i * cellsize
-#            else:
-#                # this will flip the order of the y values for ers
-#                yg = (nrows-i) * cellsize
+        from calc_grid_values_ext import calc_grid_values
 
-            for j in xrange(ncols):
-                xg = j * cellsize
-                k = i*ncols + j
+        calc_grid_values(nrows, ncols, cellsize, NODATA_value,
+                         x,y, norms, volumes, result, grid_values)
 
-                grid_points[k, 0] = xg
-                grid_points[k, 1] = yg
+    fid.close()
 
-        # Interpolate
-        from anuga.fit_interpolate.interpolate import Interpolate
+    files_out = []
+    for quantity, name_out, values in zip(quantities, names_out, grid_values):
 
-        # Remove loners from vertex_points, volumes here
-        vertex_points, volumes = remove_lone_verts(vertex_points, volumes)
-        # export_mesh_file('monkey.tsh',{'vertices':vertex_points, 'triangles':volumes})
+        if verbose:
+            log.critical('Interpolated values are in [%f, %f]'
+                         % (num.min(values), num.max(values)))
+
+        basename_out, out_ext = os.path.splitext(name_out)
+        out_ext = out_ext.lower()
+
+        if out_ext == '.ers':
+            # setup ERS header information
+            values = num.reshape(values, (nrows, ncols))
+            header = {}
+            header['datum'] = '"' + datum + '"'
+            # FIXME The use of hardwired UTM and zone number needs to be made optional
+            # FIXME Also need an automatic test for coordinate type (i.e. EN or LL)
+            header['projection'] = '"UTM-' + str(zone) + '"'
+            header['coordinatetype'] = 'EN'
+            if header['coordinatetype'] == 'LL':
+                header['longitude'] = str(newxllcorner)
+                header['latitude'] = str(newyllcorner)
+            elif header['coordinatetype'] == 'EN':
+                header['eastings'] = str(newxllcorner)
+                header['northings'] = str(newyllcorner)
+            header['nullcellvalue'] = str(NODATA_value)
+            header['xdimension'] = str(cellsize)
+            header['ydimension'] = str(cellsize)
+            header['value'] = '"' + quantity + '"'
+            #header['celltype'] = 'IEEE8ByteReal'  #FIXME: Breaks unit test
+
+            #Write
+            if verbose:
+                log.critical('Writing %s' % name_out)
 
+            import anuga.abstract_2d_finite_volumes.ermapper_grids as ermapper_grids
 
-        interp = Interpolate(vertex_points, volumes, verbose = verbose)
+            # convert grid_values to ers ordering
+            reordered_grid_values = values[::-1,:]
 
-        # Interpolate using quantity values
-        if verbose: log.critical('Interpolating')
-        grid_values[:] = interp.interpolate(result, grid_points,
-                                         NODATA_value= NODATA_value,
-                                         verbose=verbose).flatten()
-        #print grid_values.shape
+            ermapper_grids.write_ermapper_grid(name_out, reordered_grid_values, header)
 
-        return
+            files_out.append(None)
+        else:
+            #Write to Ascii format
+            #Write prj file
+            prjfile = basename_out + '.prj'
 
-    num_tri =  len(volumes)
-    norms = num.zeros(6*num_tri, num.float)
+            if verbose: log.critical('Writing %s' % prjfile)
+            write_prj_file(prjfile, zone, datum, false_easting, false_northing)
 
-    #print norms
-    from calc_grid_values_ext import calc_grid_values
+            if verbose: log.critical('Writing %s' % name_out)
+            write_asc_file(name_out, values, nrows, ncols,
+                           newxllcorner, newyllcorner, cellsize, NODATA_value,
+                           number_of_decimal_places, verbose)
 
-    calc_grid_values(nrows, ncols, cellsize, NODATA_value,
-                     x,y, norms, volumes, result, grid_values)
+            files_out.append(basename_out)
 
+    if isinstance(quantity_in, (list, tuple)):
+        return files_out
+    else:
+        return files_out[0]
 
 
-    #print outside_indices
+def write_prj_file(prjfile, zone, datum='WGS84',
+                   false_easting=500000, false_northing=10000000):
+    """Write the .prj file accompanying an asc grid
+    """
 
-    if verbose:
-        log.critical('Interpolated values are in [%f, %f]'
-                     % (num.min(grid_values), num.max(grid_values)))
-
-    # Assign NODATA_value to all points outside bounding polygon (from interpolation mesh)
-    
-#    P = interp.mesh.get_boundary_polygon()
-#    outside_indices = outside_polygon(grid_points, P, closed=True)
-
-
-
-    if out_ext == '.ers':
-        # setup ERS header information
-        grid_values = num.reshape(grid_values, (nrows, ncols))
-        header = {}
-        header['datum'] = '"' + datum + '"'
-        # FIXME The use of hardwired UTM and zone number needs to be made optional
-        # FIXME Also need an automatic test for coordinate type (i.e. EN or LL)
-        header['projection'] = '"UTM-' + str(zone) + '"'
-        header['coordinatetype'] = 'EN'
-        if header['coordinatetype'] == 'LL':
-            header['longitude'] = str(newxllcorner)
-            header['latitude'] = str(newyllcorner)
-        elif header['coordinatetype'] == 'EN':
-            header['eastings'] = str(newxllcorner)
-            header['northings'] = str(newyllcorner)
-        header['nullcellvalue'] = str(NODATA_value)
-        header['xdimension'] = str(cellsize)
-        header['ydimension'] = str(cellsize)
-        header['value'] = '"' + quantity + '"'
-        #header['celltype'] = 'IEEE8ByteReal'  #FIXME: Breaks unit test
-
-        #Write
-        if verbose:
-            log.critical('Writing %s' % name_out)
+    prjid = open(prjfile, 'w')
+    prjid.write('Projection    %s\n' %'UTM')
+    prjid.write('Zone          %d\n' %zone)
+    prjid.write('Datum         %s\n' %datum)
+    prjid.write('Zunits        NO\n')
+    prjid.write('Units         METERS\n')
+    prjid.write('Spheroid      %s\n' %datum)
+    prjid.write('Xshift        %d\n' %false_easting)
+    prjid.write('Yshift        %d\n' %false_northing)
+    prjid.write('Parameters\n')
+    prjid.close()
+
+
+def write_asc_file(name_out, grid_values, nrows, ncols,
+                   xllcorner, yllcorner, cellsize, NODATA_value=-9999.0,
+                   number_of_decimal_places=3, verbose=False):
+    """Write grid values to an asc file
+
+    grid_values holds nrows*ncols values, row by row starting from
+    the bottom (southern) row.
+    """
 
-        import anuga.abstract_2d_finite_volumes.ermapper_grids as ermapper_grids
+    ascid = open(name_out, 'w')
 
-        # convert grid_values to ers ordering
-        reordered_grid_values = grid_values[::-1,:]
+    ascid.write('ncols         %d\n' %ncols)
+    ascid.write('nrows         %d\n' %nrows)
+    ascid.write('xllcorner     %d\n' %xllcorner)
+    ascid.write('yllcorner     %d\n' %yllcorner)
+    ascid.write('cellsize      %f\n' %cellsize)
+    ascid.write('NODATA_value  %d\n' %NODATA_value)
 
-        ermapper_grids.write_ermapper_grid(name_out, reordered_grid_values, header)
+    grid_values = num.reshape(grid_values, (nrows*ncols,))
 
-        fid.close()
-    else:
-        #Write to Ascii format
-        #Write prj file
-        prjfile = basename_out + '.prj'
-
-        if verbose: log.critical('Writing %s' % prjfile)
-        prjid = open(prjfile, 'w')
-        prjid.write('Projection    %s\n' %'UTM')
-        prjid.write('Zone          %d\n' %zone)
-        prjid.write('Datum         %s\n' %datum)
-        prjid.write('Zunits        NO\n')
-        prjid.write('Units         METERS\n')
-        prjid.write('Spheroid      %s\n' %datum)
-        prjid.write('Xshift        %d\n' %false_easting)
-        prjid.write('Yshift        %d\n' %false_northing)
-        prjid.write('Parameters\n')
-        prjid.close()
-
-        if verbose: log.critical('Writing %s' % name_out)
-
-        ascid = open(name_out, 'w')
-
-        ascid.write('ncols         %d\n' %ncols)
-        ascid.write('nrows         %d\n' %nrows)
-        ascid.write('xllcorner     %d\n' %newxllcorner)
-        ascid.write('yllcorner     %d\n' %newyllcorner)
-        ascid.write('cellsize      %f\n' %cellsize)
-        ascid.write('NODATA_value  %d\n' %NODATA_value)
-
-        #Get bounding polygon from mesh
-        #P = interp.mesh.get_boundary_polygon()
-        #inside_indices = inside_polygon(grid_points, P)
-
-        # change printoptions so that a long string of zeros in not
-        # summarized as [0.0, 0.0, 0.0, ... 0.0, 0.0, 0.0]
-        #printoptions = num.get_printoptions()
-        #num.set_printoptions(threshold=sys.maxint)
-
-        format = '%.'+'%g' % number_of_decimal_places +'e'
-        for i in range(nrows):
-            if verbose and i % ((nrows+10)/10) == 0:
-                log.critical('Doing row %d of %d' % (i, nrows))
-
-            base_index = (nrows-i-1)*ncols
-
-            slice = grid_values[base_index:base_index+ncols]
-
-            num.savetxt(ascid, slice.reshape(1,ncols), format, ' ' )
-            
-        
-        #Close
-        ascid.close()
-        fid.close()
+    format = '%.'+'%g' % number_of_decimal_places +'e'
+    for i in range(nrows):
+        if verbose and i % ((nrows+10)/10) == 0:
+            log.critical('Doing row %d of %d' % (i, nrows))
+
+        base_index = (nrows-i-1)*ncols
+
+        slice = grid_values[base_index:base_index+ncols]
 
-        return basename_out
+        num.savetxt(ascid, slice.reshape(1,ncols), format, ' ' )
+
+    #Close
+    ascid.close()
 
 
 
@@ -483,7 +613,9 @@ def sww2dem_batch(basename_in, extra_name_out=None,
                 verbose=False,
                 origin=None,
                 datum='WGS84',
-                format='ers'):
+                format='ers',
+                block_size=None,
+                use_cache=False):
     """Wrapper for sww2dem.
     See sww2dem to find out what most of the parameters do. Note that since this
     is a batch command, the normal filename naming conventions do not apply.
@@ -494,6 +626,15 @@ def sww2dem_batch(basename_in, extra_name_out=None,
     Quantities is a list of quantities.  Each quantity will be
     calculated for each sww file.
 
+    reduction may be a list of reductions (e.g. [max, 'time_of_max', 10]),
+    each quantity is then also output for each reduction, with the name
+    of the reduction (or t and the index of the timestep) added to the
+    output filename.
+
+    All quantities and reductions of an sww file are computed from one
+    pass over the file. If use_cache is True the interpolation weights of
+    the grid are cached on disk and reused for files with the same mesh.
+
     This returns the basenames of the files returned, which is made up
     of the dir and all of the file name, except the extension.
 
@@ -508,6 +649,13 @@ def sww2dem_batch(basename_in, extra_name_out=None,
     if type(quantities) is str:
             quantities = [quantities]
 
+    if isinstance(reduction, (list, tuple)):
+        reductions = list(reduction)
+        labels = [get_reduction_label(r) for r in reductions]
+    else:
+        reductions = [reduction]
+        labels = [None]
+
     # How many sww files are there?
     dir, base = os.path.split(basename_in)
 
@@ -518,33 +666,58 @@ def sww2dem_batch(basename_in, extra_name_out=None,
 
     files_out = []
     for sww_file in iterate_over:
+        swwin = dir+os.sep+sww_file+'.sww'
+
+        demout = []
+        quantity_out = []
+        reduction_out = []
         for quantity in quantities:
-            if extra_name_out is None:
+            for reduction, label in zip(reductions, labels):
                 basename_out = sww_file + '_' + quantity
-            else:
-                basename_out = sww_file + '_' + quantity + '_' + extra_name_out
+                if label is not None:
+                    basename_out += '_' + label
+                if extra_name_out is not None:
+                    basename_out += '_' + extra_name_out
+
+                demout.append(dir+os.sep+basename_out+'.'+format)
+                quantity_out.append(quantity)
+                reduction_out.append(reduction)
+
+                if verbose:
+                    log.critical('sww2dem: %s => %s' % (swwin, demout[-1]))
+
+        file_out = sww2dem(swwin,
+                           demout,
+                           quantity_out,
+                           reduction_out,
+                           cellsize,
+                           number_of_decimal_places,
+                           NODATA_value,
+                           easting_min,
+                           easting_max,
+                           northing_min,
+                           northing_max,
+                           verbose,
+                           origin,
+                           datum,
+                           block_size,
+                           use_cache)
+
+        files_out.extend(file_out)
+    return files_out
 
-            swwin = dir+os.sep+sww_file+'.sww'
-            demout = dir+os.sep+basename_out+'.'+format
 
-            if verbose:
-                log.critical('sww2dem: %s => %s' % (swwin, demout))
-
-            file_out = sww2dem(swwin,
-                               demout,
-                               quantity,
-                               reduction,
-                               cellsize,
-                               number_of_decimal_places,
-                               NODATA_value,
-                               easting_min,
-                               easting_max,
-                               northing_min,
-                               northing_max,
-                               verbose,
-                               origin,
-                               datum)
-                               
-            files_out.append(file_out)
-    return files_out
+def get_reduction_label(reduction):
+    """Name of a reduction used in output filenames
+    """
+
+    if reduction is None:
+        reduction = max
+
+    if isinstance(reduction, basestring):
+        return reduction
+
+    if isinstance(reduction, (int, long, num.integer)):
+        return 't%d' % reduction
 
+    return reduction.__name__
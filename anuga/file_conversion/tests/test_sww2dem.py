@@ -2272,6 +2272,176 @@ Doing row 4 of 5'''
         except:
             pass
         
+
+    def test_reduce_over_time(self):
+        """Reductions over time of a block of values"""
+
+        from anuga.file_conversion.sww2dem import reduce_over_time, \
+             get_reduction_index
+
+        times = num.array([0.0, 1.0, 2.0])
+        values = num.array([[1.0, 5.0, 2.0],
+                            [3.0, 4.0, 2.0],
+                            [2.0, 6.0, 1.0]])
+
+        assert num.allclose(reduce_over_time(values, max, times), [3, 6, 2])
+        assert num.allclose(reduce_over_time(values, 'max', times), [3, 6, 2])
+        assert num.allclose(reduce_over_time(values, min, times), [1, 4, 1])
+        assert num.allclose(reduce_over_time(values, 'mean', times),
+                            [2, 5, 5.0/3])
+        assert num.allclose(reduce_over_time(values, num.mean, times),
+                            [2, 5, 5.0/3])
+        assert num.allclose(reduce_over_time(values, sum, times), [6, 15, 5])
+
+        # The first time the maximum is reached
+        assert num.allclose(reduce_over_time(values, 'time_of_max', times),
+                            [1, 2, 0])
+
+        self.assertRaises(ValueError, reduce_over_time, values, 'median',
+                          times)
+
+        assert get_reduction_index(max, 3) is None
+        assert get_reduction_index('time_of_max', 3) is None
+        assert get_reduction_index('last', 3) == 2
+        assert get_reduction_index(-1, 3) == 2
+        assert get_reduction_index(1, 3) == 1
+
+    def test_sww2dem_several_quantities(self):
+        """Several quantities from one pass give the same grids as
+        converting each quantity on its own"""
+
+        domain = self.domain
+        domain.set_name('datatest_several')
+        domain.set_datadir('.')
+        domain.set_quantity('elevation', lambda x, y: -x - y)
+
+        swwfile = domain.get_name() + '.sww'
+
+        sww = SWW_file(domain)
+        sww.store_connectivity()
+        for i in range(4):
+            domain.set_time(0.5*i)
+            domain.set_quantity('stage',
+                                lambda x, y: 0.2 + num.sin(3*x + i) - x - y)
+            domain.set_quantity('xmomentum', lambda x, y: num.cos(y + i))
+            sww.store_timestep()
+
+        quantities = ['stage', 'depth', 'momentum']
+        files = []
+        try:
+            for reduction in [max, 'time_of_max', 'mean', 'last', 2]:
+                names = ['datatest_several_%d.asc' % k
+                         for k in range(len(quantities))]
+                files += names
+                files += [name[:-4] + '.prj' for name in names]
+
+                sww2dem(swwfile, names, quantity=quantities,
+                        reduction=reduction, cellsize=0.25,
+                        block_size=3)
+
+                for k, quantity in enumerate(quantities):
+                    name = 'datatest_single.asc'
+                    files += [name, name[:-4] + '.prj']
+                    sww2dem(swwfile, name, quantity=quantity,
+                            reduction=reduction, cellsize=0.25)
+
+                    assert open(names[k]).read() == open(name).read()
+
+            # last is the last timestep
+            sww2dem(swwfile, 'datatest_single.asc', quantity='stage',
+                    reduction='last', cellsize=0.25)
+            sww2dem(swwfile, 'datatest_several_0.asc', quantity='stage',
+                    reduction=-1, cellsize=0.25)
+            assert open('datatest_several_0.asc').read() == \
+                   open('datatest_single.asc').read()
+
+            # Grid values of the time of maximum stage are stored times
+            sww2dem(swwfile, 'datatest_single.asc', quantity='stage',
+                    reduction='time_of_max', cellsize=0.5)
+            grid = num.loadtxt('datatest_single.asc', skiprows=6)
+            assert num.all(grid >= 0.0) and num.all(grid <= 1.5)
+            assert num.max(grid) > 0.0
+        finally:
+            for name in set(files) | set([swwfile]):
+                try:
+                    os.remove(name)
+                except OSError:
+                    pass
+
+
+
+    def test_sww2dem_batch_cached_weights(self):
+        """All quantities and reductions of sww2dem_batch, with the grid
+        weights from the cache, agree with single sww2dem conversions"""
+
+        import tempfile, shutil
+        from anuga.caching import caching
+
+        domain = self.domain
+        domain.set_name('datatest_batch')
+        domain.set_datadir('.')
+        domain.set_quantity('elevation', lambda x, y: -x - y)
+
+        swwfile = domain.get_name() + '.sww'
+
+        sww = SWW_file(domain)
+        sww.store_connectivity()
+        for i in range(4):
+            domain.set_time(0.5*i)
+            domain.set_quantity('stage',
+                                lambda x, y: 0.2 + num.sin(3*x + i) - x - y)
+            domain.set_quantity('xmomentum', lambda x, y: num.cos(y + i))
+            sww.store_timestep()
+
+        cachedir = tempfile.mkdtemp()
+        old_cachedir = caching.options['cachedir']
+        caching.set_option('cachedir', cachedir + os.sep)
+
+        quantities = ['stage', 'depth', 'hazard']
+        reductions = [max, 'time_of_max', 1]
+        files = [swwfile, 'datatest_single.asc', 'datatest_single.prj']
+        try:
+            for k in range(2):
+                # The second time the weights are read from the cache
+                files_out = sww2dem_batch('datatest_batch',
+                                          quantities=quantities,
+                                          reduction=reductions,
+                                          cellsize=0.25,
+                                          format='asc',
+                                          use_cache=True)
+
+                assert len(os.listdir(cachedir)) > 0
+
+                i = 0
+                for quantity in quantities:
+                    for reduction, label in zip(reductions,
+                                                ['max', 'time_of_max', 't1']):
+                        basename = './datatest_batch_%s_%s' % (quantity, label)
+                        assert files_out[i] == basename
+                        files += [basename + '.asc', basename + '.prj']
+                        i += 1
+
+                        sww2dem(swwfile, 'datatest_single.asc',
+                                quantity=quantity, reduction=reduction,
+                                cellsize=0.25)
+
+                        assert open(basename + '.asc').read() == \
+                               open('datatest_single.asc').read()
+
+            # A single reduction keeps the original names
+            files_out = sww2dem_batch('datatest_batch', quantities='stage',
+                                      cellsize=0.25, format='asc')
+            assert files_out == ['./datatest_batch_stage']
+            files += ['datatest_batch_stage.asc', 'datatest_batch_stage.prj']
+        finally:
+            caching.set_option('cachedir', old_cachedir)
+            shutil.rmtree(cachedir)
+            for name in set(files):
+                try:
+                    os.remove(name)
+                except OSError:
+                    pass
+
         
 
 #################################################################################
@@ -10,7 +10,7 @@ from anuga.coordinate_transforms.geo_reference import Geo_reference, \
      write_NetCDF_georeference, ensure_geo_reference
 
 # local modules
-from anuga.file.mux import read_mux2_py
+from anuga.file.mux import Mux2_reader
 from anuga.file.mux import WAVEHEIGHT_MUX2_LABEL, EAST_VELOCITY_MUX2_LABEL, \
                 NORTH_VELOCITY_MUX2_LABEL
 from anuga.file.sts import Write_sts                
@@ -24,7 +24,8 @@ def urs2sts(basename_in, basename_out=None,
             central_meridian=None,            
             mean_stage=0.0,
             zscale=1.0,
-            ordering_filename=None):
+            ordering_filename=None,
+            block_size=None):
     """Convert URS mux2 format for wave propagation to sts format
 
     Also convert latitude and longitude to UTM. All coordinates are
@@ -59,6 +60,10 @@ def urs2sts(basename_in, basename_out=None,
               appear in the mux2 file.
 
 
+    block_size: number of times converted together, by default bounded
+                by the number of gauges. The mux2 files are memory mapped
+                and only the gauges in the ordering file are read.
+
     output:
       basename_out: name of sts file in which mux2 data is stored.
       
@@ -167,11 +172,16 @@ def urs2sts(basename_in, basename_out=None,
     starttime_old = 0.0
     
     for i, quantity in enumerate(quantities):
-        # For each quantity read the associated list of source mux2 file with
+        # For each quantity open the associated list of source mux2 file with
         # extention associated with that quantity
 
-        times, latitudes, longitudes, elevation, mux[quantity], starttime \
-            = read_mux2_py(files_in[i], weights, permutation, verbose=verbose)
+        mux[quantity] = Mux2_reader(files_in[i], weights, permutation,
+                                    verbose=verbose)
+        times = mux[quantity].times
+        latitudes = mux[quantity].latitudes
+        longitudes = mux[quantity].longitudes
+        elevation = mux[quantity].elevation
+        starttime = mux[quantity].starttime
 
         # Check that all quantities have consistent time and space information
         if quantity != quantities[0]:
@@ -286,26 +296,29 @@ def urs2sts(basename_in, basename_out=None,
 
     if verbose: log.critical('Converting quantities')
 
-    for j in range(len(times)):
-        for i in range(number_of_points):
-            ha = mux['HA'][i,j]
-            ua = mux['UA'][i,j]
-            va = mux['VA'][i,j]
-            if ha == NODATA:
-                if verbose:
-                    msg = 'Setting nodata value %d to 0 at time = %f, ' \
-                          'point = %d' % (ha, times[j], i)
-                    log.critical(msg)
-                ha = 0.0
-                ua = 0.0
-                va = 0.0
-
-            w = zscale*ha + mean_stage
-            h = w - elevation[i]
-            stage[j,i] = w
-
-            xmomentum[j,i] = ua * h
-            ymomentum[j,i] = -va * h # South is positive in mux files
+    # Convert and store the frames of each block of times together
+    from itertools import izip
+    blocks = izip(mux['HA'].read_blocks(block_size),
+                  mux['UA'].read_blocks(block_size),
+                  mux['VA'].read_blocks(block_size))
+
+    for (j, ha), (_, ua), (_, va) in blocks:
+        nodata = (ha == NODATA)
+        if verbose:
+            for k, i in zip(*num.nonzero(nodata)):
+                msg = 'Setting nodata value %d to 0 at time = %f, ' \
+                      'point = %d' % (ha[k,i], times[j+k], i)
+                log.critical(msg)
+        ha[nodata] = 0.0
+        ua[nodata] = 0.0
+        va[nodata] = 0.0
+
+        w = zscale*ha + mean_stage
+        h = w - elevation
+        stage[j:j+len(w),:] = w
+
+        xmomentum[j:j+len(w),:] = ua * h
+        ymomentum[j:j+len(w),:] = -va * h # South is positive in mux files
 
 
     outfile.close()
@@ -432,59 +432,63 @@ class Interpolate (FitInterpolate):
             log.critical('WARNING: No points within the mesh!')
 
         m = self.mesh.number_of_nodes  # Nbr of basis functions (1/vertex)
-        n = point_coordinates.shape[0] # Nbr of data points
+        m_points = point_coordinates.shape[0] # Nbr of data points
 
-        if verbose: log.critical('Number of datapoints: %d' % n)
+        if verbose: log.critical('Number of datapoints: %d' % m_points)
         if verbose: log.critical('Number of basis functions: %d' % m)
 
-        A = Sparse(n,m)
-
-        n = len(inside_boundary_indices)
-
-        centroids = []
-        inside_poly_indices = []
-        
         # Compute matrix elements for points inside the mesh
         if verbose: log.critical('Building interpolation matrix from %d points'
-                                 % n)
+                                 % len(inside_boundary_indices))
 
-        for d, i in enumerate(inside_boundary_indices):
-            # For each data_coordinate point
-            if verbose and d%((n+10)/10)==0: log.critical('Doing %d of %d'
-                                                          %(d, n))
+        inside_boundary_indices = num.array(inside_boundary_indices, num.int)
+        triangle_ids, sigmas = \
+            self.root.search_points(point_coordinates[inside_boundary_indices])
 
-            x = point_coordinates[i]
-            element_found, sigma0, sigma1, sigma2, k = self.root.search_fast(x)         
-            # Update interpolation matrix A if necessary
-            if element_found is True:
+        found = triangle_ids >= 0
+        if verbose and not num.all(found):
+            log.critical('Mesh has a hole - moving %d points to outside list'
+                         % num.sum(~found))
 
-                #if verbose:
-                #    print 'Point is within mesh:', d, i
-            
-                inside_poly_indices.append(i)
-                
-                # Assign values to matrix A
-                j0 = self.mesh.triangles[k,0] # Global vertex id for sigma0
-                j1 = self.mesh.triangles[k,1] # Global vertex id for sigma1
-                j2 = self.mesh.triangles[k,2] # Global vertex id for sigma2
-                js = [j0, j1, j2]
-                
-                if output_centroids is False:
-                    # Weight each vertex according to its distance from x
-                    sigmas = {j0:sigma0, j1:sigma1, j2:sigma2}
-                    for j in js:
-                        A[i, j] = sigmas[j]
-                else:
-                    # If centroids are needed, weight all 3 vertices equally
-                    for j in js:
-                        A[i, j] = 1.0/3.0
-                    centroids.append(self.mesh.centroid_coordinates[k])                        
-            else:
-                if verbose:
-                    log.critical('Mesh has a hole - moving this point to outside list')
+        rows = inside_boundary_indices[found]
+        triangle_ids = triangle_ids[found]
 
-                # This is a numpy arrays, so we need to do a slow transfer
-                outside_poly_indices = num.append(outside_poly_indices, [i], axis=0)
+        # Weight each vertex according to its distance from x or, if
+        # centroids are needed, weight all 3 vertices equally
+        if output_centroids is False:
+            sigmas = sigmas[found]
+        else:
+            sigmas = num.ones((len(rows), 3), num.float)/3.0
+
+        # Assemble A directly in compressed row format. Each row holds the
+        # 3 vertices of one triangle, sorted by row and then by column.
+        perm = num.argsort(rows, kind='mergesort')
+        vertex_ids = self.mesh.triangles[triangle_ids[perm]]
+        sigmas = sigmas[perm]
+        order = num.argsort(vertex_ids, axis=1)
+        r = num.arange(len(rows))[:, num.newaxis]
+        colind = vertex_ids[r, order]
+        data = sigmas[r, order]
+
+        row_ptr = num.zeros(m_points+1, num.int)
+        row_ptr[rows+1] = 3
+        row_ptr = num.cumsum(row_ptr)
+
+        A = Sparse_CSR(None,
+                       num.array(data.ravel(), num.float),
+                       num.array(colind.ravel(), num.int),
+                       num.array(row_ptr, num.int),
+                       m_points, m)
+
+        inside_poly_indices = rows.tolist()
+        if output_centroids is False:
+            centroids = []
+        else:
+            centroids = list(self.mesh.centroid_coordinates[triangle_ids])
+
+        outside_poly_indices = \
+            num.concatenate((num.array(outside_poly_indices, num.int),
+                             inside_boundary_indices[~found]))
 
         return A, inside_poly_indices, outside_poly_indices, centroids
 
@@ -672,6 +676,8 @@ class Interpolation_function:
         triangles:            nx3 array of indices into vertex_coordinates (int)
         interpolation_points: Nx2 array of coordinates to be interpolated to
         verbose:              Level of reporting
+        xy_interpolation:     Keep the source values when interpolation_points
+                              are given so that f(t, x=x, y=y) can be used
 
     The quantities returned by the callable object are specified by
     the list quantities which must contain the names of the
@@ -702,7 +708,8 @@ class Interpolation_function:
                  time_thinning=1,
                  verbose=False,
                  gauge_neighbour_id=None,
-                 output_centroids=False):
+                 output_centroids=False,
+                 xy_interpolation=False):
         """Initialise object and build spatial interpolation if required
 
         Time_thinning_number controls how many timesteps to use. Only timesteps
@@ -772,10 +779,22 @@ class Interpolation_function:
         self.vertex_coordinates = vertex_coordinates
         self.interpolation_points = interpolation_points
 
+        self.triangles = triangles
+        self.gauge_neighbour_id = gauge_neighbour_id
+
         self.index = 0    # Initial time index
         self.precomputed_values = {}
         self.centroids = []
 
+        # Values of all quantities in one array, one row per quantity,
+        # so that all quantities can be interpolated at once
+        self.stacked_values = None
+        self.result = None
+
+        # Interpolation matrices for x, y interpolation built on demand
+        self.xy_interpolator = None
+        self.xy_matrices = {}
+
         # Precomputed spatial interpolation if requested
         if interpolation_points is not None:
             #no longer true. sts files have spatial = True but
@@ -867,8 +886,9 @@ class Interpolation_function:
             m = len(self.interpolation_points)
             p = len(self.time)
 
-            for name in quantity_names:
-                self.precomputed_values[name] = num.zeros((p, m), num.float)
+            self.stacked_values = num.zeros((len(quantity_names), p, m), num.float)
+            for i, name in enumerate(quantity_names):
+                self.precomputed_values[name] = self.stacked_values[i]
 
             if verbose is True:
                 log.critical('Build interpolator')
@@ -941,58 +961,118 @@ class Interpolation_function:
             # Report
             if verbose:
                 log.critical(self.statistics())            
+
+            # Only keep the source time series if x, y interpolation
+            # is requested, it is as large as the source file
+            if xy_interpolation:
+                self.vertex_values = quantities
+            else:
+                self.vertex_values = None
         else:
             # Store quantitites as is
             for name in quantity_names:
                 self.precomputed_values[name] = quantities[name]
+            self.vertex_values = self.precomputed_values
+
+            if self.spatial is False:
+                # Time series only, small enough to copy
+                self.stacked_values = \
+                    num.array([quantities[name] for name in quantity_names],
+                              num.float)
 
 #     def __repr__(self):
 #         # return 'Interpolation function (spatio-temporal)'
 #         return self.statistics()
 
     def __call__(self, t, point_id=None, x=None, y=None):
-        """Evaluate f(t) or f(t, point_id)
+        """Evaluate f(t), f(t, point_id) or f(t, x, y)
 
         Inputs:
           t:        time - Model time. Must lie within existing timesteps
-          point_id: index of one of the preprocessed points.
+          point_id: index of one of the preprocessed points, an array of
+                    indices or None for all preprocessed points.
+          x, y:     coordinates (or vectors of coordinates) to interpolate
+                    to instead of the preprocessed points.
+
+          For a single point_id (or scalar x, y) the vector of quantity
+          values is returned. For an array of point_ids, point_id=None or
+          vectors x and y an array with one row per point and one column
+          per quantity is returned. For point_ids this array is reused by
+          the next call, so copy it if it is to be kept.
 
-          If spatial info is present and all of point_id
-          are None an exception is raised
+          If spatial info is present, no preprocessed points are
+          available and x, y are not given an exception is raised.
 
           If no spatial info is present, point_id arguments are ignored
           making f a function of time only.
-
-          FIXME: f(t, x, y) x, y could overrided location, point_id ignored
-          FIXME: point_id could also be a slice
-          FIXME: What if x and y are vectors?
-          FIXME: What about f(x,y) without t?
         """
 
-        from math import pi, cos, sin, sqrt
-
         if self.spatial is True:
-            if point_id is None:
-                if x is None or y is None:
-                    msg = 'Either point_id or x and y must be specified'
+            if x is not None and y is not None:
+                if self.vertex_values is None:
+                    msg = 'Interpolation to x and y requires '
+                    msg += 'xy_interpolation=True when interpolation '
+                    msg += 'points are specified'
                     raise Exception(msg)
-            else:
-                if self.interpolation_points is None:
+                return self.interpolate_xy(t, x, y)
+
+            if self.interpolation_points is None:
+                if point_id is None:
+                    msg = 'Either point_id or x and y must be specified'
+                else:
                     msg = 'Interpolation_function must be instantiated ' + \
                           'with a list of interpolation points before ' + \
                           'parameter point_id can be used'
-                    raise Exception(msg)
+                raise Exception(msg)
+
+            if point_id is not None and num.ndim(point_id) == 0:
+                # Single point
+                return self.evaluate_points(t, [point_id])[0]
+
+            if point_id is None:
+                n = len(self.interpolation_points)
+            else:
+                n = len(point_id)
+
+            nq = len(self.quantity_names)
+            if self.result is None or self.result.shape != (n, nq):
+                self.result = num.zeros((n, nq), num.float)
+
+            return self.evaluate_points(t, point_id, out=self.result)
+
+        q = self.evaluate_points(t)[0]
+
+        # Replicate q according to x and y
+        # This is e.g used for Wind_stress
+        if x is None or y is None:
+            return q
+        else:
+            try:
+                N = len(x)
+            except:
+                return q
+            else:
+                # x is a vector - Create one constant column for each value
+                assert len(y) == N, 'x and y must have same length'
+                res = []
+                for col in q:
+                    res.append(col*num.ones(N, num.float))
+
+            return res
+
+    def find_time_slot(self, t):
+        """Move self.index to the time slot containing t and return the
+        ratio for linear interpolation between time index and index+1
+        """
 
         msg = 'Model time %.16f' % t
         msg += ' is not contained in function domain [%.16f:%.16f].\n' % (self.time[0], self.time[-1])
         if t < self.time[0]: raise Modeltime_too_early(msg)
         if t > self.time[-1]: raise Modeltime_too_late(msg)
 
-        oldindex = self.index #Time index
-
-        # Find current time slot
-        while t > self.time[self.index]: self.index += 1
-        while t < self.time[self.index]: self.index -= 1
+        # Find current time slot, the last time not after t
+        if not (self.time[self.index] <= t < self.time[min(self.index+1, len(self.time)-1)]):
+            self.index = num.searchsorted(self.time, t, side='right') - 1
 
         if t == self.time[self.index]:
             # Protect against case where t == T[-1] (last time)
@@ -1003,59 +1083,148 @@ class Interpolation_function:
             ratio = ((t - self.time[self.index]) /
                          (self.time[self.index+1] - self.time[self.index]))
 
-        # Compute interpolated values
-        q = num.zeros(len(self.quantity_names), num.float)
-        for i, name in enumerate(self.quantity_names):
-            Q = self.precomputed_values[name]
+        return ratio
 
-            if self.spatial is False:
-                # If there is no spatial info
-                assert len(Q.shape) == 1
+    def evaluate_points(self, t, point_ids=None, out=None):
+        """Evaluate f(t) at many of the precomputed points in one call
 
-                Q0 = Q[self.index]
-                if ratio > 0: Q1 = Q[self.index+1]
-            else:
-                if x is not None and y is not None:
-                    # Interpolate to x, y
-                    raise Exception('x,y interpolation not yet implemented')
-                else:
-                    # Use precomputed point
-                    Q0 = Q[self.index, point_id]
-                    if ratio > 0:
-                        Q1 = Q[self.index+1, point_id]
+        Inputs:
+          t:         time - Model time. Must lie within existing timesteps
+          point_ids: indices of the preprocessed points. If None, all
+                     preprocessed points are used.
+          out:       optional array to store the result in
+
+        Returns an array with one row per point and one column per
+        quantity, i.e. row k is the same as f(t, point_id=point_ids[k]).
+        If no spatial info is present the values of f(t) are repeated
+        for each point.
+        """
 
-            # Linear temporal interpolation
-            if ratio > 0:
-                if Q0 == NAN and Q1 == NAN:
-                    q[i] = Q0
-                else:
-                    q[i] = Q0 + ratio*(Q1 - Q0)
+        if self.spatial is True and self.interpolation_points is None:
+            msg = 'Interpolation_function must be instantiated ' + \
+                  'with a list of interpolation points before ' + \
+                  'evaluate_points can be used'
+            raise Exception(msg)
+
+        if point_ids is None:
+            if self.spatial is True:
+                n = len(self.interpolation_points)
+                point_ids = slice(None)
             else:
-                q[i] = Q0
+                n = 1
+        else:
+            point_ids = num.asarray(point_ids, num.int)
+            n = len(point_ids)
+
+        if out is None:
+            out = num.zeros((n, len(self.quantity_names)), num.float)
+
+        ratio = self.find_time_slot(t)
 
-        # Return vector of interpolated values
-        # FIXME:
         if self.spatial is True:
-            return q
+            Q0 = self.stacked_values[:, self.index, point_ids]
         else:
-            # Replicate q according to x and y
-            # This is e.g used for Wind_stress
-            if x is None or y is None:
-                return q
+            Q0 = self.stacked_values[:, self.index:self.index+1]
+
+        if ratio > 0:
+            # Linear temporal interpolation
+            if self.spatial is True:
+                Q1 = self.stacked_values[:, self.index+1, point_ids]
             else:
-                try:
-                    N = len(x)
-                except:
-                    return q
+                Q1 = self.stacked_values[:, self.index+1:self.index+2]
+
+            err = num.seterr(invalid='ignore')
+            try:
+                out[:] = num.where((Q0 == NAN) & (Q1 == NAN), Q0,
+                                   Q0 + ratio*(Q1 - Q0)).T
+            finally:
+                num.seterr(**err)
+        else:
+            out[:] = Q0.T
+
+        return out
+
+    def interpolate_xy(self, t, x, y):
+        """Interpolate f(t) to the points x, y of the source mesh
+
+        For scalar x and y the vector of quantity values is returned,
+        otherwise an array with one row per point. Points outside the
+        mesh get the value NAN. The interpolation matrices of recently
+        used points are kept for reuse.
+        """
+
+        scalar = num.ndim(x) == 0
+        points = num.zeros((num.size(x), 2), num.float)
+        points[:,0] = num.ravel(x)
+        points[:,1] = num.ravel(y)
+
+        ratio = self.find_time_slot(t)
+
+        times = [self.index]
+        if ratio > 0:
+            times.append(self.index+1)
+
+        values = []
+        for i in times:
+            # Vertex values of all quantities at time index i
+            f = num.zeros((len(self.vertex_coordinates),
+                           len(self.quantity_names)), num.float)
+            for j, name in enumerate(self.quantity_names):
+                Q = self.vertex_values[name]
+                if len(Q.shape) == 2:
+                    f[:,j] = Q[i,:]
                 else:
-                    # x is a vector - Create one constant column for each value
-                    N = len(x)
-                    assert len(y) == N, 'x and y must have same length'
-                    res = []
-                    for col in q:
-                        res.append(col*num.ones(N, num.float))
-
-                return res
+                    f[:,j] = Q
+
+            if self.triangles is not None:
+                A, outside = self.get_xy_matrix(points)
+                z = A * f
+                z[outside] = NAN
+            else:
+                # Points along the polyline of an sts file
+                z = num.zeros((len(points), len(self.quantity_names)), num.float)
+                for j in range(len(self.quantity_names)):
+                    z[:,j] = interpolate_polyline(f[:,j],
+                                                  self.vertex_coordinates,
+                                                  self.gauge_neighbour_id,
+                                                  interpolation_points=points)
+            values.append(z)
+
+        if ratio > 0:
+            Q0, Q1 = values
+            err = num.seterr(invalid='ignore')
+            try:
+                q = num.where((Q0 == NAN) & (Q1 == NAN), Q0,
+                              Q0 + ratio*(Q1 - Q0))
+            finally:
+                num.seterr(**err)
+        else:
+            q = values[0]
+
+        if scalar:
+            return q[0]
+        return q
+
+    def get_xy_matrix(self, points):
+        """Return the interpolation matrix from the source mesh to points
+        and the indices of the points outside the mesh
+        """
+
+        key = points.tostring()
+        if key not in self.xy_matrices:
+            if self.xy_interpolator is None:
+                # The quad tree of the mesh is built once
+                self.xy_interpolator = Interpolate(self.vertex_coordinates,
+                                                   self.triangles)
+
+            if len(self.xy_matrices) >= 100:
+                self.xy_matrices.clear()
+
+            A, inside, outside, centroids = \
+                self.xy_interpolator._build_interpolation_matrix_A(points)
+            self.xy_matrices[key] = (A, num.array(outside, num.int))
+
+        return self.xy_matrices[key]
 
     def get_time(self):
         """Return model time as a vector of timesteps
@@ -1232,12 +1232,8 @@ class Test_Interpolate(unittest.TestCase):
                 assert num.allclose(I(t, id), answer[id])
             t += 0.1    
 
-        try:    
-            I(1)
-        except:
-            pass
-        else:
-            raise Exception('Should raise exception')
+        # Without point_id all points are returned
+        assert num.allclose(I(1)[:,0], answer)
 
             
     def test_interpolation_interface(self):
@@ -1291,12 +1287,8 @@ class Test_Interpolate(unittest.TestCase):
                 assert num.allclose(I(t, id), t*answer[id])
             t += 0.1    
 
-        try:    
-            I(1)
-        except:
-            pass
-        else:
-            raise Exception('Should raise exception')
+        # Without point_id all points are returned
+        assert num.allclose(I(1)[:,0], answer)
 
 
 
@@ -1500,14 +1492,157 @@ class Test_Interpolate(unittest.TestCase):
         for j in range(50): #t in [1, 6]
             self.assertTrue(I(t, 5) == NAN, 'Fail!')
             t += 0.1  
+
+        # All points in one call
+        t = time[0]
+        for j in range(50): #t in [1, 6]
+            q = I.evaluate_points(t)
+            assert q.shape == (len(interpolation_points), 1)
+            assert num.allclose(q[:-1,0], t*num.array(answer[:-1]))
+            assert q[-1,0] == NAN
+
+            q = I.evaluate_points(t, [3, 1])
+            assert num.allclose(q, [I(t, 3), I(t, 1)])
+            t += 0.1
             
-        try:    
-            I(1)
-        except:
+        # Without point_id all points are returned
+        q = I(1)
+        assert q.shape == (len(interpolation_points), 1)
+        assert num.allclose(q[:-1,0], answer[:-1])
+
+
+    def test_interpolation_function_many_points(self):
+        # Test evaluation of several points and quantities in one call
+
+        time = [1.0, 5.0, 6.0]
+
+        a = [0.0, 0.0]
+        b = [0.0, 2.0]
+        c = [2.0, 0.0]
+        d = [0.0, 4.0]
+        e = [2.0, 2.0]
+        f = [4.0, 0.0]
+
+        points = [a, b, c, d, e, f]
+        triangles = [[1,0,2], [1,2,4], [4,2,5], [3,1,4]]
+
+        interpolation_points = [[ 0.0, 0.0],
+                                [ 0.5, 0.5],
+                                [ 0.7, 0.7],
+                                [ 1.0, 0.5],
+                                [ 2.0, 0.4],
+                                [ 545354534, 4354354353]] # outside the mesh
+
+        # Two quantities
+        Q1 = num.zeros((3,6), num.float)
+        Q2 = num.zeros((3,6), num.float)
+        for i, t in enumerate(time):
+            Q1[i, :] = t*linear_function(points)
+            Q2[i, :] = -t
+
+        I = Interpolation_function(time, {'stage': Q1, 'depth': Q2},
+                                   quantity_names=['stage', 'depth'],
+                                   vertex_coordinates=points,
+                                   triangles=triangles,
+                                   interpolation_points=interpolation_points,
+                                   verbose=False)
+
+        answer = linear_function(interpolation_points)
+
+        point_ids = num.array([4, 0, 5, 2])
+        for t in [1.0, 1.3, 4.9, 5.0, 5.5, 6.0, 2.2]:
+            q = I(t, point_ids)
+            assert q.shape == (4, 2)
+            for k, id in enumerate(point_ids):
+                assert num.allclose(q[k], I(t, id))
+
+            assert num.allclose(q[[0,1,3],0], t*answer[[4,0,2]])
+            assert num.allclose(q[[0,1,3],1], -t)
+            assert q[2,0] == NAN
+
+            q = I(t)
+            assert q.shape == (6, 2)
+            assert num.allclose(q[:-1,0], t*answer[:-1])
+            assert num.allclose(q[:-1,1], -t)
+
+        # The time slot is found in any order
+        assert num.allclose(I(5.5, 1), [5.5*answer[1], -5.5])
+        assert num.allclose(I(1.0, 1), [answer[1], -1.0])
+        assert num.allclose(I(6.0, 1), [6*answer[1], -6.0])
+
+
+    def test_interpolation_function_xy(self):
+        # Test spatio-temporal interpolation to arbitrary points
+
+        time = [1.0, 5.0, 6.0]
+
+        a = [0.0, 0.0]
+        b = [0.0, 2.0]
+        c = [2.0, 0.0]
+        d = [0.0, 4.0]
+        e = [2.0, 2.0]
+        f = [4.0, 0.0]
+
+        points = [a, b, c, d, e, f]
+        triangles = [[1,0,2], [1,2,4], [4,2,5], [3,1,4]]
+
+        Q = num.zeros((3,6), num.float)
+        for i, t in enumerate(time):
+            Q[i, :] = t*linear_function(points)
+
+        I = Interpolation_function(time, Q,
+                                   vertex_coordinates=points,
+                                   triangles=triangles,
+                                   verbose=False)
+
+        x = num.array([0.0, 0.5, 0.7, 1.0, 2.0, 100.0])
+        y = num.array([0.0, 0.5, 0.7, 0.5, 0.4, 100.0])
+        answer = linear_function(num.transpose([x, y]))
+
+        for t in [1.0, 1.3, 4.9, 5.0, 5.5, 6.0]:
+            q = I(t, x=x, y=y)
+            assert q.shape == (6, 1)
+            assert num.allclose(q[:-1,0], t*answer[:-1])
+            assert q[-1,0] == NAN
+
+            q = I(t, x=0.5, y=0.5)
+            assert num.allclose(q, [t*answer[1]])
+
+        # Point id can not be used without interpolation points
+        try:
+            I(1.0, 1)
+        except Exception:
             pass
         else:
             raise Exception('Should raise exception')
 
+        # With interpolation points the source values are only kept
+        # if x, y interpolation is requested
+        interpolation_points = [[0.5, 0.5], [1.0, 0.5]]
+        I = Interpolation_function(time, Q,
+                                   vertex_coordinates=points,
+                                   triangles=triangles,
+                                   interpolation_points=interpolation_points,
+                                   verbose=False)
+        assert I.vertex_values is None
+        try:
+            I(1.0, x=x, y=y)
+        except Exception:
+            pass
+        else:
+            raise Exception('Should raise exception')
+
+        I = Interpolation_function(time, Q,
+                                   vertex_coordinates=points,
+                                   triangles=triangles,
+                                   interpolation_points=interpolation_points,
+                                   verbose=False,
+                                   xy_interpolation=True)
+        for t in [1.0, 1.3, 5.5]:
+            q = I(t, x=x, y=y)
+            assert num.allclose(q[:-1,0], t*answer[:-1])
+            assert num.allclose(I(t, 0), I(t, x=0.5, y=0.5))
+
 
     def test_interpolation_function_time(self):
         #Test a long time series with an error in it (this did cause an
@@ -137,6 +137,41 @@ class Test_search_functions(unittest.TestCase):
 
         
             if k == 0: return    
+    def test_search_points(self):
+        """test_search_points: Locate an array of points in one call
+        """
+
+        points, vertices, boundary = rectangular(10, 12, 1, 1)
+        mesh = Mesh(points, vertices, boundary)
+
+        root = MeshQuadtree(mesh)
+
+        xs = [[0.6, 0.3], [0.1, 0.2], [0.7,0.7],
+              [0.1,0.9], [0.4,0.6], [0.9,0.1],
+              [10, 3], [-0.2, 10.7], [0, 0]]
+
+        indices, sigmas = root.search_points(xs)
+
+        assert indices.shape == (len(xs),)
+        assert sigmas.shape == (len(xs), 3)
+
+        for i, x in enumerate(xs):
+            found, s0, s1, s2, k = root.search_fast(x)
+
+            if found is True:
+                assert indices[i] == k
+                assert num.allclose(sigmas[i], [s0, s1, s2])
+            else:
+                assert indices[i] == -1
+
+        assert indices[6] == -1
+        assert indices[7] == -1
+
+        # Empty input
+        indices, sigmas = root.search_points(num.zeros((0, 2)))
+        assert indices.shape == (0,)
+        assert sigmas.shape == (0, 3)
+
     # NOTE PADARN: This function is no longer exposed
     # have passed this test - but could expose
     # c function if deemed neccesary.
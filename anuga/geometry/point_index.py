@@ -0,0 +1,162 @@
+"""
+    Uniform grid index of points.
+
+    Points are sorted into the cells of a regular grid so that box,
+    polygon and circle queries only need to look at the points in the
+    cells overlapping the query.
+"""
+
+import numpy as num
+
+from anuga.utilities.numerical_tools import ensure_numeric
+from anuga.geospatial_data.geospatial_data import ensure_absolute
+from anuga.geometry.polygon import separate_points_by_polygon
+
+
+class Point_index(object):
+    """Uniform grid of cells over a set of points.
+
+    points: Nx2 array of (absolute) point coordinates
+    extent: distance from each point within which the object the point
+            represents lies, eg the largest distance from a centroid to the
+            vertices of its triangle. Used by expanded box queries.
+    points_per_cell: average number of points per cell of the grid
+
+    Query results are arrays of point indices in increasing order, so they
+    are the same as the results of the corresponding brute force functions.
+    """
+
+    def __init__(self, points, extent=0.0, points_per_cell=2):
+
+        points = ensure_numeric(points, num.float)
+        if len(points) == 0:
+            points = num.zeros((0, 2), num.float)
+
+        self.points = points
+        self.extent = float(extent)
+
+        N = len(points)
+        if N > 0:
+            self.xmin, self.ymin = points.min(axis=0)
+            self.xmax, self.ymax = points.max(axis=0)
+        else:
+            self.xmin = self.ymin = self.xmax = self.ymax = 0.0
+
+        width = self.xmax - self.xmin
+        height = self.ymax - self.ymin
+        number_of_cells = max(N/points_per_cell, 1)
+
+        if width > 0 and height > 0:
+            cell_size = num.sqrt(width*height/number_of_cells)
+        else:
+            cell_size = max(width, height)/number_of_cells
+        if not cell_size > 0:
+            cell_size = 1.0
+
+        self.cell_size = cell_size
+        self.nx = int(min(width/cell_size + 1, number_of_cells))
+        self.ny = int(min(height/cell_size + 1, number_of_cells))
+
+        # Sort the points by cell and record where each cell starts
+        cells = self._cell_ids(points[:,0], points[:,1])
+        self.order = num.argsort(cells, kind='mergesort')
+        self.cell_start = num.searchsorted(cells[self.order],
+                                           num.arange(self.nx*self.ny + 1))
+
+    def __len__(self):
+        return len(self.points)
+
+    def _columns(self, x):
+        ix = num.floor((x - self.xmin)/self.cell_size).astype(num.int)
+        return num.clip(ix, 0, self.nx - 1)
+
+    def _rows(self, y):
+        iy = num.floor((y - self.ymin)/self.cell_size).astype(num.int)
+        return num.clip(iy, 0, self.ny - 1)
+
+    def _cell_ids(self, x, y):
+        return self._rows(y)*self.nx + self._columns(x)
+
+    def get_points_in_box(self, xmin, ymin, xmax, ymax, expand=False):
+        """Return indices of points in the closed box [xmin,xmax]x[ymin,ymax]
+
+        If expand is True, the box is enlarged by the extent of the points,
+        so the result contains every point whose object may overlap the box.
+        """
+
+        if expand is True:
+            # Allow for rounding in the tests made on the candidates
+            margin = self.extent*(1.0 + 1.0e-6) + 1.0e-10*self.cell_size
+            xmin -= margin
+            ymin -= margin
+            xmax += margin
+            ymax += margin
+
+        if len(self) == 0 or xmax < self.xmin or xmin > self.xmax or \
+               ymax < self.ymin or ymin > self.ymax:
+            return num.zeros(0, num.int)
+
+        ix0, ix1 = self._columns(num.array([xmin, xmax]))
+        iy0, iy1 = self._rows(num.array([ymin, ymax]))
+
+        # The cells ix0..ix1 of each row are contiguous in the sorted order
+        candidates = []
+        for iy in range(iy0, iy1 + 1):
+            start = self.cell_start[iy*self.nx + ix0]
+            stop = self.cell_start[iy*self.nx + ix1 + 1]
+            candidates.append(self.order[start:stop])
+        candidates = num.sort(num.concatenate(candidates))
+
+        x = self.points[candidates,0]
+        y = self.points[candidates,1]
+        in_box = (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
+
+        return candidates[in_box]
+
+    def inside_polygon(self, polygon, closed=True):
+        """Return indices of points inside polygon
+
+        Same as anuga.geometry.polygon.inside_polygon(points, polygon, closed)
+        """
+
+        polygon = ensure_numeric(ensure_absolute(polygon), num.float)
+
+        xmin, ymin = polygon.min(axis=0)
+        xmax, ymax = polygon.max(axis=0)
+        candidates = self.get_points_in_box(xmin, ymin, xmax, ymax)
+        if len(candidates) == 0:
+            return candidates
+
+        indices, count = separate_points_by_polygon(self.points[candidates],
+                                                    polygon,
+                                                    closed=closed,
+                                                    check_input=False)
+
+        return candidates[indices[:count]]
+
+    def inside_polygons(self, polygons, closed=True):
+        """Return a list of the indices of points inside each polygon
+        """
+
+        return [self.inside_polygon(polygon, closed=closed)
+                for polygon in polygons]
+
+    def inside_circle(self, center, radius):
+        """Return indices of points strictly inside circle
+        """
+
+        c = ensure_numeric(center, num.float)
+        r = float(radius)
+
+        # Allow for rounding in the distance test below
+        margin = 1.0e-10*(abs(c).max() + r)
+        candidates = self.get_points_in_box(c[0] - r - margin,
+                                            c[1] - r - margin,
+                                            c[0] + r + margin,
+                                            c[1] + r + margin)
+
+        x = self.points[candidates,0]
+        y = self.points[candidates,1]
+        inside = (x - c[0])**2 + (y - c[1])**2 < r**2
+
+        return candidates[inside]
@@ -7,6 +7,10 @@ import unittest
 
 from anuga.geometry.aabb import AABB
 from anuga.geometry.quad import Cell
+from anuga.geometry.point_index import Point_index
+from anuga.geometry.polygon import inside_polygon
+
+import numpy as num
 
 #-------------------------------------------------------------
 
@@ -101,6 +105,42 @@ class Test_Geometry(unittest.TestCase):
         assert cell.children[0].parent == cell
         assert cell.children[1].parent == cell
 
+    def test_point_index_box(self):
+        """ Test that points in a box are found by the point index. """
+        points = [[0, 0], [1, 0], [2, 0], [0, 1], [1, 1], [2, 1], [5, 5]]
+        index = Point_index(points)
+
+        assert num.alltrue(index.get_points_in_box(0.5, 0, 2, 1) ==
+                           [1, 2, 4, 5])
+        assert num.alltrue(index.get_points_in_box(-1, -1, 10, 10) ==
+                           range(7))
+        assert len(index.get_points_in_box(6, 6, 7, 7)) == 0
+        assert len(index.get_points_in_box(2.5, 2, 4, 4)) == 0
+
+        index = Point_index(points, extent=0.5)
+        assert len(index.get_points_in_box(2.5, 1.2, 4.5, 4.6)) == 0
+        assert num.alltrue(index.get_points_in_box(2.5, 1.2, 4.5, 4.6,
+                                                   expand=True) == [5, 6])
+
+    def test_point_index_polygons(self):
+        """ Test that polygon and circle queries match brute force. """
+        num.random.seed(17)
+        points = num.random.uniform(0, 100, (2000, 2))
+        points[:10] = [10, 10]
+        index = Point_index(points)
+
+        polygons = [[[10, 10], [40, 10], [40, 30], [20, 50]],
+                    [[50, 50], [60, 90], [90, 60]],
+                    [[200, 200], [300, 200], [300, 300]]]
+        for polygon, indices in zip(polygons, index.inside_polygons(polygons)):
+            assert num.alltrue(indices == inside_polygon(points, polygon))
+            assert num.alltrue(index.inside_polygon(polygon, closed=False) ==
+                               inside_polygon(points, polygon, closed=False))
+
+        indices = index.inside_circle([30, 70], 12.5)
+        distances = num.sum((points - [30, 70])**2, axis=1)
+        assert num.alltrue(indices == num.where(distances < 12.5**2)[0])
+
 
 ################################################################################
 
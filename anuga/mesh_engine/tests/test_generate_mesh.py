@@ -9,7 +9,8 @@ level of the code, using the -j flag in triangle.
 import sys
 
 import unittest
-from anuga.mesh_engine.mesh_engine import generate_mesh
+from anuga.mesh_engine.mesh_engine import generate_mesh, \
+     remove_duplicate_points
 
 import numpy as num
 
@@ -462,7 +463,22 @@ class triangTestCase(unittest.TestCase):
         self.assertTrue(num.allclose(data['generatedpointattributelist'].flat, \
                                      correct.flat),
                         'Failed')
-    
+
+
+    def test_remove_duplicate_points(self):
+        points = num.array([[0.0,0.0],[1.0,0.0],[0.0,0.0],[1.0,1.0],
+                            [1.0,0.0],[-0.0,1.0],[0.0,1.0]])
+        pointatts = num.array([[0.],[1.],[2.],[3.],[4.],[5.],[6.]])
+        segments = num.array([[0,1],[2,3],[3,4],[4,6],[5,2]], num.int32)
+
+        points, pointatts, segments = \
+                remove_duplicate_points(points, pointatts, segments)
+
+        assert num.allclose(points, [[0.0,0.0],[1.0,0.0],[1.0,1.0],
+                                     [0.0,1.0]])
+        assert num.allclose(pointatts, [[0.],[1.],[3.],[5.]])
+        assert num.alltrue(segments == [[0,1],[0,2],[2,1],[1,3],[3,0]])
+
 
 if __name__ == "__main__":
     suite = unittest.makeSuite(triangTestCase,'test')
@@ -16,6 +16,16 @@ from anuga import Quantity
 from anuga.parallel import myid
 from anuga.config import velocity_protection
 from anuga.config import max_float
+from anuga.config import netcdf_mode_a, netcdf_float32
+
+from collect_max_quantities_operator_ext import update_max_quantities
+
+
+# Arrays collected by the operator, as stored by export_max_quantities_to_sww
+max_quantity_names = ['max_stage', 'max_depth', 'max_speed', 'max_speedDepth',
+                      'time_of_max_stage', 'time_of_max_depth',
+                      'time_of_max_speed', 'time_of_max_speedDepth',
+                      'arrival_time']
 
 
 class collect_max_quantities_operator(Operator):
@@ -24,9 +34,16 @@ class collect_max_quantities_operator(Operator):
 
     Maxima are updated every update_frequency timesteps [any integer >=1 is
     ok], after t exceeds collection_start_time.
-   
-    In theory this might save time (??), since computing e.g. velocity/momentum etc in python might be expensive
-    
+
+    The time each maximum was first reached is recorded, as is the arrival
+    time, the first time the depth exceeds arrival_depth (defaults to
+    velocity_zero_height). Cells the water has not reached have arrival_time
+    max_float.
+
+    The maxima are updated in place by a C kernel, and can be written to the
+    sww file of the domain or to rasters at the end of the run instead of
+    post processing every timestep of the sww file.
+
     Optionally velocities can be zeroed below velocity_zero_height (defaults to minimum_allowed_height if not required) 
     """
 
@@ -35,6 +52,7 @@ class collect_max_quantities_operator(Operator):
                  update_frequency=1,
                  collection_start_time=0.,
                  velocity_zero_height=None,
+                 arrival_depth=None,
                  description = None,
                  label = None,
                  logging = False,
@@ -53,6 +71,15 @@ class collect_max_quantities_operator(Operator):
         self.max_speed = num.zeros(len(domain.centroid_coordinates[:,0]))
         self.max_speedDepth = num.zeros(len(domain.centroid_coordinates[:,0]))
 
+        #------------------------------------------
+        # Times of the maxima and arrival time
+        #------------------------------------------
+        self.time_of_max_stage = num.zeros(len(domain.centroid_coordinates[:,0]))
+        self.time_of_max_depth = num.zeros(len(domain.centroid_coordinates[:,0]))
+        self.time_of_max_speed = num.zeros(len(domain.centroid_coordinates[:,0]))
+        self.time_of_max_speedDepth = num.zeros(len(domain.centroid_coordinates[:,0]))
+        self.arrival_time = num.zeros(len(domain.centroid_coordinates[:,0])) + max_float
+
         #------------------------------------------
         # Aliases for stage quantity
         #------------------------------------------
@@ -81,6 +108,11 @@ class collect_max_quantities_operator(Operator):
         else:
             self.velocity_zero_height=domain.minimum_allowed_height
 
+        if arrival_depth is not None:
+            self.arrival_depth=arrival_depth
+        else:
+            self.arrival_depth=self.velocity_zero_height
+
 
     def __call__(self):
         """
@@ -91,18 +123,24 @@ class collect_max_quantities_operator(Operator):
             self.counter+=1
 
             if(self.counter==self.update_frequency):
-            
-                self.max_stage=num.maximum(self.max_stage, self.stage.centroid_values)
 
-                momNorm = (self.xmom.centroid_values**2 + self.ymom.centroid_values**2)**0.5
-                self.max_speedDepth=num.maximum(self.max_speedDepth, momNorm)
-                
-                localDepth=num.maximum(self.stage.centroid_values-self.elev.centroid_values, self.domain.minimum_allowed_height) 
-                self.max_depth = num.maximum(self.max_depth,localDepth)
-
-                #velMax=(momNorm/(localDepth+velocity_protection/localDepth))*(localDepth>self.domain.minimum_allowed_height)
-                velMax=(momNorm/localDepth)*(localDepth>self.velocity_zero_height)
-                self.max_speed = num.maximum(self.max_speed, velMax)
+                update_max_quantities(self.domain.time,
+                                      self.domain.minimum_allowed_height,
+                                      self.velocity_zero_height,
+                                      self.arrival_depth,
+                                      self.stage.centroid_values,
+                                      self.elev.centroid_values,
+                                      self.xmom.centroid_values,
+                                      self.ymom.centroid_values,
+                                      self.max_stage,
+                                      self.max_depth,
+                                      self.max_speed,
+                                      self.max_speedDepth,
+                                      self.time_of_max_stage,
+                                      self.time_of_max_depth,
+                                      self.time_of_max_speed,
+                                      self.time_of_max_speedDepth,
+                                      self.arrival_time)
 
                 self.counter=0
 
@@ -141,3 +179,167 @@ class collect_max_quantities_operator(Operator):
         num.savetxt(outname, outArray,delimiter=',')
         return
 
+
+    def get_max_quantity(self, name):
+        """Return the centroid values of one of max_quantity_names
+        """
+
+        msg = 'Unknown max quantity %s, must be one of %s' % (name, max_quantity_names)
+        assert name in max_quantity_names, msg
+
+        return getattr(self, name)
+
+
+    def _get_vertex_values(self, name, smooth=None):
+        """Vertex values of a max quantity with the layout of the vertex
+        values stored in the sww file of the domain
+
+        Values at nodes shared by several triangles are averaged, except
+        the arrival time which is the earliest arrival of the triangles.
+        """
+
+        values = self.get_max_quantity(name)
+
+        Q = Quantity(self.domain)
+        Q.set_values(values, location='centroids')
+        Q.extrapolate_first_order()
+
+        A, V = Q.get_vertex_values(xy=False, smooth=smooth)
+
+        if name == 'arrival_time' and len(A) < 3*len(values):
+            # Smoothed, so take the earliest arrival at each node
+            A[:] = max_float
+            nodes = V.flatten()
+            t = num.repeat(values, 3)
+            full = nodes < len(A)
+            num.minimum.at(A, nodes[full], t[full])
+
+        return A
+
+
+    def export_max_quantities_to_sww(self, filename=None, quantities=None,
+                                     precision=netcdf_float32):
+        """
+
+        Store max-quantities as static quantities in an sww file
+
+        filename defaults to the sww file of the domain, which must have
+        been created by evolve. Each quantity is stored with its vertex
+        values under its own name and its centroid values with the suffix
+        _c, so e.g. sww2dem(swwfile, 'max_depth.asc', quantity='max_depth')
+        rasterises it without reading the timesteps.
+
+        """
+
+        from anuga.file.netcdf import NetCDFFile
+
+        if quantities is None:
+            quantities = max_quantity_names
+
+        if filename is None:
+            msg = 'Domain has no sww file, evolve with store True or give a filename'
+            assert hasattr(self.domain, 'writer'), msg
+            filename = self.domain.writer.filename
+
+        fid = NetCDFFile(filename, netcdf_mode_a)
+
+        for name in quantities:
+            A = self._get_vertex_values(name)
+
+            if name not in fid.variables:
+                fid.createVariable(name, precision, ('number_of_points',))
+                fid.createVariable(name + '_c', precision, ('number_of_volumes',))
+
+            fid.variables[name][:] = A.astype(precision)
+            fid.variables[name + '_c'][:] = self.get_max_quantity(name).astype(precision)
+
+        fid.close()
+
+
+    def export_max_quantities_to_raster(self, filename_start='Max_Quantities_',
+                                        quantities=None,
+                                        cellsize=10.0,
+                                        NODATA_value=-9999.0,
+                                        format='asc',
+                                        number_of_decimal_places=3,
+                                        datum='WGS84',
+                                        EPSG_CODE=None,
+                                        proj4string=None):
+        """
+
+        Export max-quantities to rasters, one file per quantity named
+        filename_start + quantity name + '.asc' or '.tif'
+
+        Raster cells take the value of the triangle containing them, so
+        cells outside the mesh and cells the water never reached (for the
+        arrival time) are NODATA_value. format 'tif' needs gdal and either
+        EPSG_CODE or proj4string.
+
+        In parallel each processor writes the rasters of its own triangles,
+        see export_max_quantities_to_sww to merge them instead.
+
+        """
+
+        if quantities is None:
+            quantities = max_quantity_names
+
+        assert format in ['asc', 'tif'], 'Raster format must be asc or tif'
+
+        fullInds=self.domain.tri_full_flag.nonzero()[0]
+
+        if format == 'tif':
+            from anuga.utilities.plot_utils import Make_Geotif
+            import os
+
+            xy = self.xy[fullInds]
+            for name in quantities:
+                z = self.get_max_quantity(name)[fullInds].copy()
+                z[z >= max_float] = num.nan
+                outArray = num.vstack([xy[:,0]+self.domain.geo_reference.xllcorner,
+                                       xy[:,1]+self.domain.geo_reference.yllcorner,
+                                       z]).transpose()
+
+                Make_Geotif(outArray, output_quantities=[name],
+                            CellSize=cellsize, EPSG_CODE=EPSG_CODE,
+                            proj4string=proj4string, output_dir='.',
+                            k_nearest_neighbours=1)
+
+                os.rename('PointData_' + name + '.tif',
+                          filename_start + name + '.tif')
+            return
+
+        from anuga.file_conversion.calc_grid_values_ext import calc_grid_values
+        from anuga.file_conversion.sww2dem import write_asc_file, write_prj_file
+
+        # Piecewise constant values on unique vertices of the full triangles
+        n = len(fullInds)
+        vertices = self.domain.get_vertex_coordinates().reshape((-1,3,2))[fullInds]
+        x = vertices[:,:,0].flatten()
+        y = vertices[:,:,1].flatten()
+        volumes = num.arange(3*n, dtype=num.int).reshape((n,3))
+
+        geo_ref = self.domain.geo_reference
+        xmin = num.min(x)
+        ymin = num.min(y)
+        ncols = int((num.max(x)-xmin)/cellsize) + 1
+        nrows = int((num.max(y)-ymin)/cellsize) + 1
+
+        xllcorner = xmin + geo_ref.get_xllcorner()
+        yllcorner = ymin + geo_ref.get_yllcorner()
+        x = x - xmin
+        y = y - ymin
+
+        for name in quantities:
+            values = num.repeat(self.get_max_quantity(name)[fullInds], 3)
+            values = num.where(values >= max_float, NODATA_value, values)
+
+            grid_values = num.zeros(nrows*ncols, num.float)
+            norms = num.zeros(6*n, num.float)
+            calc_grid_values(nrows, ncols, cellsize, NODATA_value,
+                             x, y, norms, volumes, values, grid_values)
+
+            write_prj_file(filename_start + name + '.prj',
+                           geo_ref.get_zone(), datum)
+            write_asc_file(filename_start + name + '.asc', grid_values,
+                           nrows, ncols, xllcorner, yllcorner, cellsize,
+                           NODATA_value, number_of_decimal_places)
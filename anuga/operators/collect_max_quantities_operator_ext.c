@@ -0,0 +1,161 @@
+// Python - C extension module for collect_max_quantities_operator.py
+//
+// Fused update of the maxima of stage, depth, speed and momentum and
+// of the times they occur and the arrival time of the water, without
+// full mesh temporaries.
+//
+// See the module collect_max_quantities_operator.py for more
+// documentation on how to use this module
+
+
+#include "Python.h"
+#include "numpy/arrayobject.h"
+#include "math.h"
+#include <stdio.h>
+#include "numpy_shim.h"
+
+// Shared code snippets
+#include "util_ext.h"
+
+
+
+void _update_max_quantities(long N, double time,
+        double minimum_allowed_height,
+        double velocity_zero_height,
+        double arrival_depth,
+        double* stage, double* elev, double* xmom, double* ymom,
+        double* max_stage, double* max_depth,
+        double* max_speed, double* max_speedDepth,
+        double* time_of_max_stage, double* time_of_max_depth,
+        double* time_of_max_speed, double* time_of_max_speedDepth,
+        double* arrival_time) {
+
+    long k;
+    double depth, local_depth, mom_norm, speed;
+
+    for (k = 0; k < N; k++) {
+
+        if (stage[k] > max_stage[k]) {
+            max_stage[k] = stage[k];
+            time_of_max_stage[k] = time;
+        }
+
+        mom_norm = sqrt(xmom[k]*xmom[k] + ymom[k]*ymom[k]);
+        if (mom_norm > max_speedDepth[k]) {
+            max_speedDepth[k] = mom_norm;
+            time_of_max_speedDepth[k] = time;
+        }
+
+        depth = stage[k] - elev[k];
+        local_depth = fmax(depth, minimum_allowed_height);
+        if (local_depth > max_depth[k]) {
+            max_depth[k] = local_depth;
+            time_of_max_depth[k] = time;
+        }
+
+        // Zero velocity in very shallow cells
+        if (local_depth > velocity_zero_height) {
+            speed = mom_norm/local_depth;
+        } else {
+            speed = 0.0;
+        }
+        if (speed > max_speed[k]) {
+            max_speed[k] = speed;
+            time_of_max_speed[k] = time;
+        }
+
+        if (depth > arrival_depth && time < arrival_time[k]) {
+            arrival_time[k] = time;
+        }
+    }
+}
+
+
+//=========================================================================
+// Python Glue
+//=========================================================================
+
+PyObject *update_max_quantities(PyObject *self, PyObject *args) {
+  //
+  // update_max_quantities(time, minimum_allowed_height, velocity_zero_height,
+  //                       arrival_depth, stage, elev, xmom, ymom,
+  //                       max_stage, max_depth, max_speed, max_speedDepth,
+  //                       time_of_max_stage, time_of_max_depth,
+  //                       time_of_max_speed, time_of_max_speedDepth,
+  //                       arrival_time)
+  //
+
+
+  PyArrayObject *stage, *elev, *xmom, *ymom;
+  PyArrayObject *max_stage, *max_depth, *max_speed, *max_speedDepth;
+  PyArrayObject *time_of_max_stage, *time_of_max_depth;
+  PyArrayObject *time_of_max_speed, *time_of_max_speedDepth;
+  PyArrayObject *arrival_time;
+  long N;
+  double time, minimum_allowed_height, velocity_zero_height, arrival_depth;
+
+  if (!PyArg_ParseTuple(args, "ddddOOOOOOOOOOOOO",
+            &time, &minimum_allowed_height, &velocity_zero_height,
+            &arrival_depth, &stage, &elev, &xmom, &ymom,
+            &max_stage, &max_depth, &max_speed, &max_speedDepth,
+            &time_of_max_stage, &time_of_max_depth,
+            &time_of_max_speed, &time_of_max_speedDepth,
+            &arrival_time)) {
+      report_python_error(AT, "could not parse input arguments");
+      return NULL;
+  }
+
+  // check that numpy array objects arrays are C contiguous memory
+  CHECK_C_CONTIG(stage);
+  CHECK_C_CONTIG(elev);
+  CHECK_C_CONTIG(xmom);
+  CHECK_C_CONTIG(ymom);
+  CHECK_C_CONTIG(max_stage);
+  CHECK_C_CONTIG(max_depth);
+  CHECK_C_CONTIG(max_speed);
+  CHECK_C_CONTIG(max_speedDepth);
+  CHECK_C_CONTIG(time_of_max_stage);
+  CHECK_C_CONTIG(time_of_max_depth);
+  CHECK_C_CONTIG(time_of_max_speed);
+  CHECK_C_CONTIG(time_of_max_speedDepth);
+  CHECK_C_CONTIG(arrival_time);
+
+  N = stage -> dimensions[0];
+
+  _update_max_quantities(N, time,
+            minimum_allowed_height,
+            velocity_zero_height,
+            arrival_depth,
+            (double*) stage -> data,
+            (double*) elev -> data,
+            (double*) xmom -> data,
+            (double*) ymom -> data,
+            (double*) max_stage -> data,
+            (double*) max_depth -> data,
+            (double*) max_speed -> data,
+            (double*) max_speedDepth -> data,
+            (double*) time_of_max_stage -> data,
+            (double*) time_of_max_depth -> data,
+            (double*) time_of_max_speed -> data,
+            (double*) time_of_max_speedDepth -> data,
+            (double*) arrival_time -> data);
+
+  return Py_BuildValue("");
+}
+
+
+
+//-------------------------------
+// Method table for python module
+//-------------------------------
+static struct PyMethodDef MethodTable[] = {
+  {"update_max_quantities", update_max_quantities, METH_VARARGS, "Print out"},
+  {NULL, NULL}
+};
+
+// Module initialisation
+void initcollect_max_quantities_operator_ext(void){
+  Py_InitModule("collect_max_quantities_operator_ext", MethodTable);
+
+  import_array(); // Necessary for handling of NumPY structures
+}
@@ -0,0 +1,427 @@
+"""
+Record time series at gauges during a run
+
+The barycentric weights of each gauge are computed once when the operator
+is created. Samples are stored in preallocated buffers which are written
+to csv or netcdf files in bulk, so gauge time series do not need a pass
+over the sww file after the run (see sww2csv_gauges).
+"""
+
+import os
+from csv import reader, writer
+
+import numpy as num
+
+from anuga.config import indent
+from anuga.config import netcdf_mode_r, netcdf_mode_w, netcdf_float
+from anuga.operators.base_operator import Operator
+import anuga.utilities.log as log
+
+
+# Quantities that can be recorded, as in sww2csv_gauges
+gauge_quantities = ['stage', 'elevation', 'xmomentum', 'ymomentum',
+                    'depth', 'momentum', 'speed']
+
+
+def read_gauge_file(gauge_file):
+    """Read names and absolute coordinates of gauges from a csv file
+    with the format used by sww2csv_gauges
+
+        name, easting, northing, elevation
+        point1, 100.3, 50.2, 10.0
+        point2, 10.3, 70.3, 78.0
+    """
+
+    try:
+        point_reader = reader(file(gauge_file))
+    except Exception, e:
+        msg = 'File "%s" could not be opened: Error="%s"' % (gauge_file, e)
+        raise Exception(msg)
+
+    points = []
+    names = []
+    for i, row in enumerate(point_reader):
+        # read header and determine the column numbers to read correctly.
+        if i == 0:
+            for j, value in enumerate(row):
+                if value.strip() == 'easting': easting = j
+                if value.strip() == 'northing': northing = j
+                if value.strip() == 'name': name = j
+        else:
+            points.append([float(row[easting]), float(row[northing])])
+            names.append(row[name].strip())
+
+    return names, num.array(points, num.float)
+
+
+class Gauge_operator(Operator):
+    """
+    Record stage, depth, momentum etc at gauge locations during a run.
+
+    gauges is either the name of a gauge file (see read_gauge_file) or a list
+    of absolute [easting, northing] points, with names defaulting to their
+    index. The quantities are sampled every update_frequency timesteps, or
+    if update_frequency is None only when record() is called, e.g. at each
+    yieldstep of the evolve loop.
+
+    Values are interpolated from the vertex values, i.e. from the last
+    extrapolation, or taken from the centroid of the triangle holding the
+    gauge if use_centroids is True.
+
+    Buffers of buffer_size samples are written to one csv file per gauge
+    named out_name + name + '.csv', with the same columns as sww2csv_gauges,
+    or to the netcdf file out_name + 'gauges.nc' if format is 'nc'. Call
+    close() after evolve to write the remaining samples.
+
+    In parallel each gauge is recorded by the processor owning the full
+    triangle holding it. The netcdf files of the processors are gathered
+    into one file by processor 0 in close().
+    """
+
+    def __init__(self,
+                 domain,
+                 gauges,
+                 names=None,
+                 quantities=['stage', 'depth', 'elevation',
+                             'xmomentum', 'ymomentum'],
+                 update_frequency=1,
+                 buffer_size=1000,
+                 out_name='gauge_',
+                 format='csv',
+                 use_centroids=False,
+                 description = None,
+                 label = None,
+                 logging = False,
+                 verbose = False):
+
+
+        Operator.__init__(self, domain, description, label, logging, verbose)
+
+        #------------------------------------------
+        # Gauge locations
+        #------------------------------------------
+        if isinstance(gauges, basestring):
+            names, points = read_gauge_file(gauges)
+        else:
+            points = num.array(gauges, num.float).reshape((-1,2))
+            if names is None:
+                names = [str(i) for i in range(len(points))]
+
+        msg = 'Need one name for each gauge'
+        assert len(names) == len(points), msg
+
+        for quantity in quantities:
+            msg = 'Unknown gauge quantity %s, must be one of %s' \
+                  % (quantity, gauge_quantities)
+            assert quantity in gauge_quantities, msg
+
+        assert format in ['csv', 'nc'], 'Gauge format must be csv or nc'
+        assert update_frequency is None or update_frequency > 0, \
+               'Update frequency must be None or >=1'
+        assert buffer_size > 0, 'Buffer size must be >=1'
+
+        self.names = list(names)
+        self.points = points
+        self.quantities = list(quantities)
+        self.update_frequency = update_frequency
+        self.buffer_size = buffer_size
+        self.out_name = out_name
+        self.format = format
+        self.use_centroids = use_centroids
+
+        self.processor = domain.processor
+        self.numproc = domain.numproc
+
+        #------------------------------------------
+        # Triangles and barycentric weights
+        #------------------------------------------
+        self._locate_gauges()
+
+        #------------------------------------------
+        # Sample buffers
+        #------------------------------------------
+        n = len(self.gauge_ids)
+        self.time_buffer = num.zeros(buffer_size, num.float)
+        self.value_buffer = num.zeros((buffer_size, n, len(self.quantities)), num.float)
+        self.buffer_index = 0
+        self.number_of_samples = 0
+        self.counter = 0
+
+        self._create_output()
+
+
+    def _locate_gauges(self):
+        """Find the triangle and barycentric weights of the gauges owned
+        by this processor
+        """
+
+        from anuga.pmesh.mesh_quadtree import MeshQuadtree
+
+        domain = self.domain
+
+        # Gauge points are absolute, search them relative to the domain origin
+        points = domain.geo_reference.get_relative(self.points)
+
+        root = MeshQuadtree(domain.mesh, absolute=False)
+        triangle_ids, sigmas = root.search_points(points)
+
+        found = triangle_ids >= 0
+        found[found] = domain.tri_full_flag[triangle_ids[found]] == 1
+
+        if self.numproc > 1:
+            owner = self._gather_owners(found)
+        else:
+            owner = num.where(found, 0, -1)
+
+            if self.verbose and not num.all(found):
+                for i in num.where(~found)[0]:
+                    log.critical('Gauge %s falls off the mesh' % self.names[i])
+
+        self.gauge_ids = num.where(owner == self.processor)[0]
+        self.triangle_ids = triangle_ids[self.gauge_ids]
+        self.sigmas = sigmas[self.gauge_ids]
+
+
+    def _gather_owners(self, found):
+        """Gauges on the boundary between processors are given to the
+        processor with the lowest id
+        """
+
+        import anuga.utilities.parallel_abstraction as pypar
+
+        if self.processor == 0:
+            owner = num.where(found, 0, -1)
+            for p in range(1, self.numproc):
+                found_p = pypar.receive(p)
+                owner = num.where((owner == -1) & found_p, p, owner)
+
+            for p in range(1, self.numproc):
+                pypar.send(owner, p)
+        else:
+            pypar.send(found, 0)
+            owner = pypar.receive(0)
+
+        return owner
+
+
+    def _create_output(self):
+        """Create the csv files with headers or the netcdf file"""
+
+        if self.format == 'csv':
+            heading = ['time', 'hours'] + self.quantities
+            for gauge_id in self.gauge_ids:
+                fid = open(self._csv_filename(gauge_id), 'wb')
+                writer(fid).writerow(heading)
+                fid.close()
+        else:
+            from anuga.file.netcdf import NetCDFFile
+
+            fid = NetCDFFile(self._nc_filename(self.numproc > 1), netcdf_mode_w)
+            self._create_nc_variables(fid, self.gauge_ids)
+            fid.close()
+
+
+    def _create_nc_variables(self, fid, gauge_ids):
+
+        fid.institution = 'Geoscience Australia'
+        fid.description = 'Gauge time series'
+        fid.gauge_names = ','.join([self.names[i] for i in gauge_ids])
+
+        fid.createDimension('number_of_timesteps', None)
+        fid.createDimension('number_of_gauges', len(gauge_ids))
+
+        fid.createVariable('time', netcdf_float, ('number_of_timesteps',))
+        fid.createVariable('gauge_ids', 'i', ('number_of_gauges',))
+        fid.createVariable('x', netcdf_float, ('number_of_gauges',))
+        fid.createVariable('y', netcdf_float, ('number_of_gauges',))
+        for quantity in self.quantities:
+            fid.createVariable(quantity, netcdf_float,
+                               ('number_of_timesteps', 'number_of_gauges'))
+
+        if len(gauge_ids) > 0:
+            fid.variables['gauge_ids'][:] = gauge_ids
+            fid.variables['x'][:] = self.points[gauge_ids,0]
+            fid.variables['y'][:] = self.points[gauge_ids,1]
+
+
+    def _csv_filename(self, gauge_id):
+
+        return self.out_name + self.names[gauge_id] + '.csv'
+
+
+    def _nc_filename(self, part=False):
+
+        if part:
+            return self.out_name + 'gauges_P%d.nc' % self.processor
+
+        return self.out_name + 'gauges.nc'
+
+
+    def __call__(self):
+        """
+        Record the gauges every 'update_frequency' timesteps
+        """
+
+        if self.update_frequency is None:
+            return
+
+        self.counter += 1
+
+        if self.counter == self.update_frequency:
+            self.record()
+            self.counter = 0
+
+
+    def record(self):
+        """Store the current values at the gauges in the buffer, and
+        write the buffer out once full
+        """
+
+        i = self.buffer_index
+
+        self.time_buffer[i] = self.domain.get_time(relative_time=False)
+        self._sample(self.value_buffer[i])
+
+        self.buffer_index += 1
+        self.number_of_samples += 1
+
+        if self.buffer_index == self.buffer_size:
+            self.flush()
+
+
+    def _interpolate(self, name):
+
+        Q = self.domain.quantities[name]
+
+        if self.use_centroids:
+            return Q.centroid_values[self.triangle_ids]
+
+        return num.sum(Q.vertex_values[self.triangle_ids]*self.sigmas, axis=1)
+
+
+    def _sample(self, out):
+        """Compute the gauge quantities into out (gauges x quantities)"""
+
+        if len(self.gauge_ids) == 0:
+            return
+
+        w = self._interpolate('stage')
+        z = self._interpolate('elevation')
+        uh = self._interpolate('xmomentum')
+        vh = self._interpolate('ymomentum')
+
+        for j, quantity in enumerate(self.quantities):
+            if quantity == 'stage':
+                out[:,j] = w
+            elif quantity == 'elevation':
+                out[:,j] = z
+            elif quantity == 'xmomentum':
+                out[:,j] = uh
+            elif quantity == 'ymomentum':
+                out[:,j] = vh
+            elif quantity == 'depth':
+                out[:,j] = w - z
+            elif quantity == 'momentum':
+                out[:,j] = num.sqrt(uh**2 + vh**2)
+            elif quantity == 'speed':
+                # if depth is less than 0.001 then speed = 0.0
+                h = w - z
+                wet = (h >= 0.001) & (uh < 1.0e6)
+                out[:,j] = num.where(wet, num.sqrt(uh**2 + vh**2)/num.where(wet, h, 1.0), 0.0)
+
+
+    def flush(self):
+        """Write the buffered samples to the output files"""
+
+        n = self.buffer_index
+        if n == 0:
+            return
+
+        times = self.time_buffer[:n]
+        values = self.value_buffer[:n]
+
+        if self.format == 'csv':
+            for j, gauge_id in enumerate(self.gauge_ids):
+                rows = num.column_stack([times, times/3600., values[:,j,:]])
+                fid = open(self._csv_filename(gauge_id), 'ab')
+                writer(fid).writerows(rows.tolist())
+                fid.close()
+        else:
+            from anuga.file.netcdf import NetCDFFile
+            from anuga.config import netcdf_mode_a
+
+            fid = NetCDFFile(self._nc_filename(self.numproc > 1), netcdf_mode_a)
+            start = len(fid.variables['time'])
+            fid.variables['time'][start:start+n] = times
+            if len(self.gauge_ids) > 0:
+                for j, quantity in enumerate(self.quantities):
+                    fid.variables[quantity][start:start+n,:] = values[:,:,j]
+            fid.close()
+
+        self.buffer_index = 0
+
+
+    def close(self):
+        """Write the remaining samples. In parallel the netcdf files of
+        all processors are gathered into one by processor 0.
+        """
+
+        self.flush()
+
+        if self.format == 'nc' and self.numproc > 1:
+            import anuga.utilities.parallel_abstraction as pypar
+
+            pypar.barrier()
+            if self.processor == 0:
+                self._merge_nc_files()
+            pypar.barrier()
+
+
+    def _merge_nc_files(self):
+
+        from anuga.file.netcdf import NetCDFFile
+
+        fido = NetCDFFile(self._nc_filename(), netcdf_mode_w)
+        self._create_nc_variables(fido, num.arange(len(self.names)))
+
+        for p in range(self.numproc):
+            filename = self.out_name + 'gauges_P%d.nc' % p
+            fid = NetCDFFile(filename, netcdf_mode_r)
+
+            if p == 0:
+                fido.variables['time'][:] = fid.variables['time'][:]
+
+            gauge_ids = fid.variables['gauge_ids'][:]
+            if len(gauge_ids) > 0:
+                for quantity in self.quantities:
+                    fido.variables[quantity][:,gauge_ids] = fid.variables[quantity][:]
+
+            fid.close()
+            os.remove(filename)
+
+        fido.close()
+
+
+    def get_gauge_ids(self):
+        """Ids of the gauges recorded by this processor"""
+
+        return self.gauge_ids
+
+
+    def parallel_safe(self):
+        """Each gauge is recorded by one processor
+        """
+        return True
+
+    def statistics(self):
+
+        message = self.label + ': Gauge_operator recording %d gauges' \
+                  % len(self.gauge_ids)
+        return message
+
+
+    def timestepping_statistics(self):
+
+        message  = indent + self.label + ': Recorded %d samples' \
+                   % self.number_of_samples
+        return message
@@ -25,6 +25,10 @@ def configuration(parent_package='',top_path=None):
                          sources=['kinematic_viscosity_operator_ext.c'],
                          include_dirs=[util_dir])
 
+    config.add_extension('collect_max_quantities_operator_ext',
+                         sources=['collect_max_quantities_operator_ext.c'],
+                         include_dirs=[util_dir])
+
     
     return config
     
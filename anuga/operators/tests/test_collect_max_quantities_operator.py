@@ -0,0 +1,131 @@
+import unittest
+import anuga
+import numpy as num
+import os
+
+from anuga.operators.collect_max_quantities_operator import \
+     collect_max_quantities_operator
+from anuga.config import max_float
+
+verbose=False
+
+class Test_collect_max_quantities_operator(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        for filename in ['test_collect_max.sww', 'test_collect_max_depth.asc',
+                         'test_collect_max_depth.prj',
+                         'Max_Quantities_max_depth.asc',
+                         'Max_Quantities_max_depth.prj',
+                         'Max_Quantities_arrival_time.asc',
+                         'Max_Quantities_arrival_time.prj']:
+            try:
+                os.remove(filename)
+            except:
+                pass
+
+    def create_domain(self):
+
+        domain = anuga.rectangular_cross_domain(10, 10, len1=100., len2=100.)
+        domain.set_flow_algorithm('DE1')
+        domain.set_name('test_collect_max')
+        domain.set_quantity('elevation', lambda x,y: -x/200.0)
+        domain.set_quantity('stage', lambda x,y: num.where(x < 30., 0.5, -1.0))
+        Br = anuga.Reflective_boundary(domain)
+        domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+        return domain
+
+    def test_collect_max_quantities(self):
+
+        domain = self.create_domain()
+        operator = collect_max_quantities_operator(domain,
+                                                   velocity_zero_height=0.01,
+                                                   arrival_depth=0.05)
+
+        stage = domain.quantities['stage'].centroid_values
+        elev = domain.quantities['elevation'].centroid_values
+        xmom = domain.quantities['xmomentum'].centroid_values
+        ymom = domain.quantities['ymomentum'].centroid_values
+        h0 = domain.minimum_allowed_height
+
+        N = len(domain)
+        max_stage = num.zeros(N) - max_float
+        max_depth = num.zeros(N)
+        max_speed = num.zeros(N)
+        max_speedDepth = num.zeros(N)
+        time_of_max_depth = num.zeros(N)
+        arrival_time = num.zeros(N) + max_float
+
+        for t in range(1, 4):
+            domain.set_time(float(t))
+            stage[:] = elev + num.random.uniform(-0.1, 0.2, N)
+            xmom[:] = num.random.uniform(-0.1, 0.1, N)
+            ymom[:] = num.random.uniform(-0.1, 0.1, N)
+
+            operator()
+
+            # Reference values as computed by the python version
+            max_stage = num.maximum(max_stage, stage)
+            momNorm = (xmom**2 + ymom**2)**0.5
+            max_speedDepth = num.maximum(max_speedDepth, momNorm)
+            localDepth = num.maximum(stage - elev, h0)
+            time_of_max_depth = num.where(localDepth > max_depth, t, time_of_max_depth)
+            max_depth = num.maximum(max_depth, localDepth)
+            velMax = (momNorm/localDepth)*(localDepth > 0.01)
+            max_speed = num.maximum(max_speed, velMax)
+            arrival_time = num.where((stage - elev > 0.05) & (arrival_time == max_float),
+                                     t, arrival_time)
+
+        assert num.allclose(operator.max_stage, max_stage)
+        assert num.allclose(operator.max_depth, max_depth)
+        assert num.allclose(operator.max_speed, max_speed)
+        assert num.allclose(operator.max_speedDepth, max_speedDepth)
+        assert num.allclose(operator.time_of_max_depth, time_of_max_depth)
+        assert num.allclose(operator.arrival_time, arrival_time)
+
+    def test_export_max_quantities(self):
+
+        from anuga.file.netcdf import NetCDFFile
+        from anuga import sww2dem
+
+        domain = self.create_domain()
+        operator = collect_max_quantities_operator(domain)
+
+        for t in domain.evolve(yieldstep=1.0, finaltime=5.0):
+            pass
+
+        # Water has not reached the far side
+        assert num.any(operator.arrival_time == max_float)
+        assert num.all(operator.arrival_time[operator.max_depth > 0.01] <= 5.0)
+
+        operator.export_max_quantities_to_sww()
+
+        fid = NetCDFFile('test_collect_max.sww')
+        assert num.allclose(fid.variables['max_depth_c'][:], operator.max_depth)
+        assert num.allclose(fid.variables['arrival_time_c'][:], operator.arrival_time)
+        assert fid.variables['max_depth'].shape == fid.variables['elevation'].shape
+        fid.close()
+
+        # The static max depth can be rasterised directly
+        sww2dem('test_collect_max.sww', 'test_collect_max_depth.asc',
+                quantity='max_depth', cellsize=5.0)
+        grid_sww = num.loadtxt('test_collect_max_depth.asc', skiprows=6)
+
+        operator.export_max_quantities_to_raster(
+            quantities=['max_depth', 'arrival_time'], cellsize=5.0)
+        grid = num.loadtxt('Max_Quantities_max_depth.asc', skiprows=6)
+
+        assert grid.shape == grid_sww.shape
+        assert num.allclose(grid.max(), operator.max_depth.max(), rtol=1.0e-3)
+
+        grid = num.loadtxt('Max_Quantities_arrival_time.asc', skiprows=6)
+        assert num.any(grid == -9999.0)
+        assert num.all(grid[grid != -9999.0] <= 5.0)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_collect_max_quantities_operator, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -0,0 +1,179 @@
+import unittest
+import anuga
+import numpy as num
+import os
+
+from anuga.operators.gauge_operator import Gauge_operator
+
+verbose=False
+
+class Test_gauge_operator(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        for filename in ['test_gauge_operator.sww', 'gauge_points.csv',
+                         'gauge_g1.csv', 'gauge_g2.csv', 'gauge_g3.csv',
+                         'op_gauge_g1.csv', 'op_gauge_g2.csv',
+                         'op_gauge_g3.csv', 'gauge_gauges.nc',
+                         'gauge_0.csv', 'gauge_1.csv', 'gauge_2.csv']:
+            try:
+                os.remove(filename)
+            except:
+                pass
+
+    def create_domain(self):
+
+        domain = anuga.rectangular_cross_domain(10, 10, len1=100., len2=100.)
+        domain.set_flow_algorithm('DE1')
+        domain.set_name('test_gauge_operator')
+        domain.set_quantity('elevation', lambda x,y: -x/200.0)
+        domain.set_quantity('stage', lambda x,y: num.where(x < 30., 0.5, -1.0))
+        Br = anuga.Reflective_boundary(domain)
+        domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+        return domain
+
+    def test_gauge_operator_vs_sww2csv_gauges(self):
+
+        domain = self.create_domain()
+
+        # The operator interpolates the vertex values of each triangle
+        domain.set_store_vertices_uniquely(True)
+
+        fid = open('gauge_points.csv', 'w')
+        fid.write('name, easting, northing, elevation\n')
+        fid.write('g1, 12.3, 45.6, 0.0\n')
+        fid.write('g2, 25.0, 25.0, 0.0\n')
+        fid.write('g3, 300.0, 25.0, 0.0\n')
+        fid.close()
+
+        quantities = ['stage', 'depth', 'elevation', 'xmomentum',
+                      'ymomentum', 'momentum', 'speed']
+        operator = Gauge_operator(domain, 'gauge_points.csv',
+                                  quantities=quantities,
+                                  update_frequency=None,
+                                  buffer_size=3,
+                                  out_name='op_gauge_')
+
+        # g3 is off the mesh
+        assert num.allclose(operator.get_gauge_ids(), [0, 1])
+
+        for t in domain.evolve(yieldstep=1.0, finaltime=10.0):
+            operator.record()
+        operator.close()
+
+        assert operator.number_of_samples == 11
+        assert not os.path.exists('op_gauge_g3.csv')
+
+        # Compare against interpolation from the sww file
+        from anuga.abstract_2d_finite_volumes.util import sww2csv_gauges
+        sww2csv_gauges('test_gauge_operator.sww', 'gauge_points.csv',
+                       quantities=quantities, verbose=verbose)
+
+        for name in ['g1', 'g2']:
+            ref = num.loadtxt('gauge_%s.csv' % name, delimiter=',', skiprows=1)
+            new = num.loadtxt('op_gauge_%s.csv' % name, delimiter=',', skiprows=1)
+
+            assert new.shape == (11, 2 + len(quantities))
+            assert num.allclose(new[:,0], ref[:,0])
+            # stage and momenta agree up to the single precision of the sww
+            for j in [0, 3, 4, 5]:
+                assert num.allclose(new[:,2+j], ref[:,2+j], atol=1.0e-5)
+
+            # The DE algorithms extrapolate the elevation, whereas the
+            # sww file stores the initial elevation
+            assert num.allclose(new[0,4], ref[0,4], atol=1.0e-5)
+            assert num.allclose(new[:,3], new[:,2] - new[:,4])
+            assert num.allclose(new[:,8], new[:,7]/new[:,3])
+
+    def test_gauge_operator_every_timestep(self):
+
+        from anuga.file.netcdf import NetCDFFile
+
+        domain = self.create_domain()
+
+        points = [[12.3, 45.6], [55.0, 25.0]]
+        operator = Gauge_operator(domain, points,
+                                  quantities=['stage', 'depth'],
+                                  buffer_size=4,
+                                  format='nc',
+                                  use_centroids=True)
+
+        stage = domain.quantities['stage']
+        elev = domain.quantities['elevation']
+        tri_ids = [domain.get_triangle_containing_point(p) for p in points]
+
+        number_of_steps = 0
+        for t in domain.evolve(yieldstep=1.0, finaltime=2.0):
+            number_of_steps += domain.number_of_steps
+        operator.close()
+
+        fid = NetCDFFile('gauge_gauges.nc')
+        assert fid.gauge_names == '0,1'
+        assert len(fid.variables['time']) == operator.number_of_samples
+        assert operator.number_of_samples == number_of_steps
+        assert num.allclose(fid.variables['x'][:], [12.3, 55.0])
+        assert num.allclose(fid.variables['stage'][-1],
+                            stage.centroid_values[tri_ids])
+        assert num.allclose(fid.variables['depth'][-1],
+                            stage.centroid_values[tri_ids]
+                            - elev.centroid_values[tri_ids])
+        assert num.all(num.diff(fid.variables['time'][:]) > 0.0)
+        fid.close()
+
+    def test_gauge_operator_georeferenced(self):
+
+        from anuga.coordinate_transforms.geo_reference import Geo_reference
+
+        # Same domain as create_domain, with the origin at (1000, 2000)
+        points, vertices, boundary = anuga.rectangular_cross(10, 10,
+                                                             len1=100.,
+                                                             len2=100.)
+        domain = anuga.Domain(points, vertices, boundary,
+                              geo_reference=Geo_reference(56, 1000.0, 2000.0))
+        domain.set_quantity('elevation', lambda x,y: -x/200.0)
+        domain.set_quantity('stage', lambda x,y: num.where(x < 30., 0.5, -1.0))
+
+        # Gauges are given in absolute coordinates
+        operator = Gauge_operator(domain, [[1012.3, 2045.6], [1055.0, 2025.0],
+                                           [12.3, 45.6]],
+                                  quantities=['stage'],
+                                  update_frequency=None,
+                                  use_centroids=True)
+        operator.record()
+
+        reference = Gauge_operator(self.create_domain(),
+                                   [[12.3, 45.6], [55.0, 25.0]],
+                                   quantities=['stage'],
+                                   update_frequency=None,
+                                   use_centroids=True)
+        reference.record()
+
+        # The relative point (12.3, 45.6) is off the georeferenced mesh
+        assert num.allclose(operator.get_gauge_ids(), [0, 1])
+        assert num.allclose(operator.triangle_ids, reference.triangle_ids)
+        assert num.allclose(operator.sigmas, reference.sigmas)
+        operator.close()
+
+        # Domain georeferenced after it was created
+        domain = self.create_domain()
+        domain.geo_reference = Geo_reference(56, 1000.0, 2000.0)
+        operator = Gauge_operator(domain, [[1012.3, 2045.6], [1055.0, 2025.0],
+                                           [12.3, 45.6]],
+                                  quantities=['stage'],
+                                  update_frequency=None,
+                                  use_centroids=True)
+
+        assert num.allclose(operator.get_gauge_ids(), [0, 1])
+        assert num.allclose(operator.triangle_ids, reference.triangle_ids)
+        assert num.allclose(operator.sigmas, reference.sigmas)
+
+        operator.close()
+        reference.close()
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_gauge_operator, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
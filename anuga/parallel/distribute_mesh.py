@@ -36,6 +36,43 @@ except:
 
 verbose = False
 
+#########################################################
+#
+# Distance of each triangle of a local mesh from the
+# ghost layer, measured in steps through neighbouring
+# triangles.
+#
+# *) neighbours is the array of neighbouring triangles
+# (negative values denote boundary edges)
+# *) tri_full_flag[i] is 1 if triangle i is full and 0
+# if it is a ghost
+#
+# -------------------------------------------------------
+#
+# *) Ghost triangles have distance 0, full triangles
+# adjacent to a ghost have distance 1 and so on. The
+# distance is capped at max_distance.
+#
+#########################################################
+
+def ghost_layer_distance(neighbours, tri_full_flag, max_distance=4):
+
+    neighbours = num.asarray(neighbours)
+    tri_full_flag = num.asarray(tri_full_flag)
+
+    distance = num.where(tri_full_flag == 1, max_distance, 0).astype(num.int)
+
+    boundary = neighbours < 0
+    neighbours = num.where(boundary, 0, neighbours)
+
+    for level in range(1, max_distance):
+        neighbour_distance = num.where(boundary, max_distance,
+                                       distance[neighbours])
+        distance = num.minimum(distance, neighbour_distance.min(axis=1) + 1)
+
+    return distance
+
+
 #########################################################
 #
 # If the triangles list is reordered, the quantities
@@ -315,6 +352,19 @@ def submesh_full(mesh, triangles_per_proc):
 
     #print node_range
     #print nodes
+    # Split the boundary edges between the processors in one pass
+
+    for p in xrange(nproc):
+        boundary_list.append({})
+
+    keys = boundary.keys()
+    if len(keys) > 0:
+        proc_upper = num.cumsum(triangles_per_proc)
+        key_ids = num.array([k[0] for k in keys], num.int)
+        key_procs = num.searchsorted(proc_upper, key_ids, side='right')
+        for k, p in zip(keys, key_procs):
+            boundary_list[p][k] = boundary[k]
+
     # Loop over processors
 
     for p in xrange(nproc):
@@ -325,14 +375,6 @@ def submesh_full(mesh, triangles_per_proc):
         subtriangles = triangles[tlower:tupper]
         triangle_list.append(subtriangles)
 
-        # Find the boundary edges on processor p
-
-        subboundary = {}
-        for k in boundary:
-            if (k[0] >=tlower and k[0] < tupper):
-                subboundary[k]=boundary[k]
-        boundary_list.append(subboundary)
-
         # Find nodes in processor p
 
 #        nodemap = num.zeros(nnodes, 'i')
@@ -1017,6 +1059,223 @@ def build_submesh(nodes, triangles, boundary, quantities,
     submesh["boundary_polygon"] = boundary_polygon
     return submesh
 
+#########################################################
+#
+# Build the grid partition on each processor.
+#
+#  *) Processor 0 partitions the mesh and stores the
+# reordered nodes, triangles, neighbours, boundary and
+# quantities in a directory shared by all processors,
+# see save_partitioned_mesh.
+#
+#  *) Each processor memory maps the files and builds its
+# own full triangles and ghost layer, see
+# build_local_submesh. Only the partition vector
+# triangles_per_proc needs to be sent.
+#
+#  *) The full communication pattern of a processor is
+# given by the ghost triangles the other processors need
+# from it, see exchange_ghost_commun.
+#
+#########################################################
+
+# Arrays of the partitioned mesh that are memory mapped on loading
+partitioned_mesh_arrays = ['nodes', 'triangles', 'neighbours',
+                           'boundary_ids', 'p2s_map']
+
+
+def save_partitioned_mesh(path, nodes, triangles, boundary, quantities,
+                          triangles_per_proc, p2s_map=None):
+    """Store the mesh reordered by the partition in directory path
+
+    quantities holds the vertex values of each quantity, ordered as
+    the triangles. p2s_map maps the reordered triangles to the original
+    triangle ids.
+    """
+
+    import os
+
+    mesh = Mesh(nodes, triangles, boundary)
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    def save(name, x):
+        num.save(os.path.join(path, name + '.npy'), x)
+
+    # Sort the boundary edges by triangle id so the full boundary
+    # of each processor is a slice
+    keys = sorted(boundary.keys())
+
+    save('nodes', num.array(nodes, num.float))
+    save('triangles', num.array(triangles, num.int))
+    save('neighbours', num.array(mesh.neighbours, num.int))
+    save('boundary_ids', num.array(keys, num.int).reshape((-1, 2)))
+    save('boundary_tags', num.array([boundary[k] for k in keys], num.str))
+    save('triangles_per_proc', num.array(triangles_per_proc, num.int))
+
+    if p2s_map is None or len(p2s_map) == 0:
+        p2s_map = num.arange(len(triangles))
+    save('p2s_map', num.array(p2s_map, num.int))
+
+    names = sorted(quantities.keys())
+    save('quantity_names', num.array(names, num.str))
+    for k in names:
+        save('quantity_' + k, num.array(quantities[k], num.float))
+
+
+class Partitioned_mesh:
+    """Mesh stored by save_partitioned_mesh
+
+    The arrays are memory mapped, so a processor only reads the
+    nodes and triangles of its own submesh.
+    """
+
+    def __init__(self, path, mmap_mode='r'):
+
+        import os
+
+        def load(name, mmap_mode=None):
+            return num.load(os.path.join(path, name + '.npy'),
+                            mmap_mode=mmap_mode)
+
+        for name in partitioned_mesh_arrays:
+            setattr(self, name, load(name, mmap_mode))
+
+        self.triangles_per_proc = load('triangles_per_proc')
+        self.number_of_nodes = len(self.nodes)
+        self.number_of_triangles = len(self.triangles)
+
+        self.boundary = {}
+        boundary_tags = load('boundary_tags')
+        for (k, e), tag in zip(self.boundary_ids, boundary_tags):
+            self.boundary[int(k), int(e)] = str(tag)
+
+        self.quantities = {}
+        for k in load('quantity_names'):
+            self.quantities[str(k)] = load('quantity_' + k, mmap_mode)
+
+
+    def get_boundary(self, tlower, tupper):
+        """Return the boundary edges of triangles tlower to tupper-1
+        """
+
+        ids = self.boundary_ids[:,0]
+        lower = num.searchsorted(ids, tlower)
+        upper = num.searchsorted(ids, tupper)
+
+        subboundary = {}
+        for k, e in self.boundary_ids[lower:upper]:
+            subboundary[int(k), int(e)] = self.boundary[int(k), int(e)]
+
+        return subboundary
+
+
+def build_local_submesh(mesh, triangles_per_proc, p, parameters=None):
+    """Build the full triangles, ghost layer and ghost communication
+    pattern of processor p from a Partitioned_mesh
+
+    Returns a dictionary in the form used by build_local_mesh, without
+    the full communication pattern.
+    """
+
+    proc_sum = num.zeros(len(triangles_per_proc)+1, num.int)
+    proc_sum[1:] = num.cumsum(triangles_per_proc)
+    tlower = proc_sum[p]
+    tupper = proc_sum[p+1]
+
+    # Full triangles, nodes and boundary
+
+    full_triangles = num.array(mesh.triangles[tlower:tupper])
+    ids = num.unique(full_triangles.flat)
+    full_nodes = num.concatenate((num.reshape(ids, (-1,1)), mesh.nodes[ids]), 1)
+
+    submesh = {}
+    submesh["full_nodes"] = {p: full_nodes}
+    submesh["full_triangles"] = full_triangles
+    submesh["full_boundary"] = mesh.get_boundary(tlower, tupper)
+
+    # Ghost layer and its communication pattern
+
+    [ghost_nodes, ghost_triangles, layer_width] = \
+        ghost_layer(submesh, mesh, p, tupper, tlower, parameters)
+
+    submesh["full_nodes"] = full_nodes
+    submesh["ghost_nodes"] = ghost_nodes
+    submesh["ghost_triangles"] = ghost_triangles
+    submesh["ghost_layer_width"] = layer_width
+    submesh["ghost_boundary"] = \
+        ghost_bnd_layer(ghost_triangles, tlower, tupper, mesh, p)
+    submesh["ghost_commun"] = \
+        ghost_commun_pattern(ghost_triangles, p, proc_sum[1:]-1)
+
+    # Quantities of the full and ghost triangles
+
+    submesh["full_quan"] = {}
+    submesh["ghost_quan"] = {}
+    for k in mesh.quantities:
+        submesh["full_quan"][k] = num.array(mesh.quantities[k][tlower:tupper])
+        submesh["ghost_quan"][k] = mesh.quantities[k][ghost_triangles[:,0]]
+
+    return submesh
+
+
+def ghost_requests(ghost_commun, nproc):
+    """Return the global ids of the ghost triangles needed from each
+    processor, given the ghost communication pattern
+    """
+
+    requests = {}
+    for q in xrange(nproc):
+        requests[q] = num.compress(ghost_commun[:,1] == q, ghost_commun[:,0])
+
+    return requests
+
+
+def full_commun_from_requests(requests):
+    """Build the full communication pattern of a processor from the
+    global ids of the ghost triangles each processor needs from it
+    """
+
+    full_commun = {}
+    for q in sorted(requests.keys()):
+        for global_id in requests[q]:
+            if not full_commun.has_key(global_id):
+                full_commun[global_id] = []
+            full_commun[global_id].append(q)
+
+    return full_commun
+
+
+def exchange_ghost_commun(ghost_commun, p, nproc):
+    """Send each processor the ghost triangles processor p needs from it
+    and receive the ghost triangles the other processors need from p
+
+    Every pair of processors exchanges one message. The pairs are
+    visited in the same order on all processors, the lower processor
+    sending first, so the blocking sends can not deadlock.
+    """
+
+    import pypar
+
+    requests = ghost_requests(ghost_commun, nproc)
+
+    received = {}
+    for q in xrange(nproc):
+        if q == p:
+            continue
+
+        x = num.array(requests[q], num.int)
+        if p < q:
+            pypar.send(x, q)
+            received[q] = pypar.receive(q)
+        else:
+            received[q] = pypar.receive(q)
+            pypar.send(x, q)
+
+    return received
+
+
 #########################################################
 #
 #  Given the subdivision of the grid assigned to the
@@ -1627,6 +1886,13 @@ def extract_submesh(submesh, triangles_per_proc, p2s_map=None, p=0):
         submesh_cell["full_quan"][k] = submesh["full_quan"][k][p]
         submesh_cell["ghost_quan"][k] = submesh["ghost_quan"][k][p]
 
+    return extract_local_submesh(submesh_cell, triangles_per_proc, p2s_map, p)
+
+
+def extract_local_submesh(submesh_cell, triangles_per_proc, p2s_map=None, p=0):
+    """Convert the submesh of processor p to the local numbering used
+    by the parallel domain
+    """
 
     # FIXME SR: I think there is already a structure with this info in the mesh
     lower_t = 0
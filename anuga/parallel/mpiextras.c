@@ -597,8 +597,264 @@ static PyObject *send_recv_via_dicts(PyObject *self, PyObject *args) {
   return (Py_None);
 }
 
+/*************************************************************/
+/* Split phase version of send_recv_via_dicts.               */
+/* start_send_recv_via_dicts posts the irecvs and isends and */
+/* returns immediately, wait_send_recv_via_dicts completes   */
+/* them. Computation which does not depend on the receive    */
+/* buffers can be done between the two calls.                */
+/*************************************************************/
+static MPI_Request pending_requests[40];
+static MPI_Status pending_statuses[40];
+static int num_pending = 0;
+
+static PyObject *start_send_recv_via_dicts(PyObject *self, PyObject *args) {
+
+  PyObject *send_dict;
+  PyObject *recv_dict;
+  PyArrayObject *X;
+
+  int k, lenx;
+  int ierr;
+
+  Py_ssize_t pos = 0;
+  PyObject *key, *value;
+
+  /* process the parameters */
+  if (!PyArg_ParseTuple(args, "OO", &send_dict, &recv_dict)) {
+    PyErr_SetString(PyExc_RuntimeError,
+		    "mpiextras.c (start_send_recv_via_dicts): could not parse input");
+    return NULL;
+  }
+
+  if (num_pending > 0) {
+    PyErr_SetString(PyExc_RuntimeError,
+		    "mpiextras.c (start_send_recv_via_dicts): previous communication not completed");
+    return NULL;
+  }
+
+  if (PyDict_Size(recv_dict)>20 || PyDict_Size(send_dict)>20) {
+    PyErr_SetString(PyExc_RuntimeError,
+		    "mpiextras.c; Number of communication buffers > 20");
+    return NULL;
+  }
+
+  //----------------------------------------------------------------------------
+  // Post the recvs first
+  //----------------------------------------------------------------------------
+  pos = 0;
+  k = 0;
+  while (PyDict_Next(recv_dict, &pos, &key, &value)) {
+    int i = PyInt_AS_LONG(key);
+
+    X   = (PyArrayObject *) PyList_GetItem(value, 2);
+    lenx = X->dimensions[0]*X->dimensions[1];
+
+    ierr = MPI_Irecv(X->data, lenx, MPI_DOUBLE, i, 123, MPI_COMM_WORLD, &pending_requests[k]);
+    if (ierr>0) {
+        MPI_Waitall(k,pending_requests,pending_statuses);
+        PyErr_SetString(PyExc_RuntimeError,
+    		    "mpiextras.c; error from MPI_Irecv");
+        return NULL;
+      }
+    k++;
+  }
+
+  //----------------------------------------------------------------------------
+  // Then the sends
+  //----------------------------------------------------------------------------
+  pos = 0;
+  while (PyDict_Next(send_dict, &pos, &key, &value)) {
+    int i = PyInt_AS_LONG(key);
+
+    X   = (PyArrayObject *) PyList_GetItem(value, 2);
+    lenx = X->dimensions[0]*X->dimensions[1];
+
+    ierr = MPI_Isend(X->data, lenx, MPI_DOUBLE, i, 123, MPI_COMM_WORLD, &pending_requests[k]);
+    if (ierr>0) {
+        MPI_Waitall(k,pending_requests,pending_statuses);
+        PyErr_SetString(PyExc_RuntimeError,
+    		    "mpiextras.c; error from MPI_Isend");
+        return NULL;
+      }
+    k++;
+  }
+
+  num_pending = k;
+
+  Py_INCREF(Py_None);
+  return (Py_None);
+}
+
+
+static PyObject *wait_send_recv_via_dicts(PyObject *self, PyObject *args) {
+
+  int ierr;
+
+  if (!PyArg_ParseTuple(args, "")) {
+    PyErr_SetString(PyExc_RuntimeError,
+		    "mpiextras.c (wait_send_recv_via_dicts): could not parse input");
+    return NULL;
+  }
+
+  if (num_pending > 0) {
+    ierr = MPI_Waitall(num_pending,pending_requests,pending_statuses);
+    num_pending = 0;
+    if (ierr>0) {
+        PyErr_SetString(PyExc_RuntimeError,
+    		    "mpiextras.c; error from MPI_Waitall");
+        return NULL;
+      }
+  }
+
+  Py_INCREF(Py_None);
+  return (Py_None);
+}
+
+
+/*************************************************************/
+/* Non blocking gather of Numpy arrays to a root processor.  */
+/* start_gather_array(x, buffers, root, tag) posts an isend  */
+/* of x to root, or on root an irecv into buffers[p] from    */
+/* each other processor p. wait_gather_array completes them. */
+/* The arrays are held until the wait, x may only be reused  */
+/* after wait_gather_array.                                  */
+/*************************************************************/
+static MPI_Request *gather_requests = NULL;
+static MPI_Status *gather_statuses = NULL;
+static PyObject **gather_arrays = NULL;
+static int gather_capacity = 0;
+static int num_gather_pending = 0;
+
+static int post_gather_request(PyArrayObject *x, int other, int tag, int send) {
+
+  int count, ierr;
+  MPI_Datatype mpi_type;
+
+  if (num_gather_pending == gather_capacity) {
+    gather_capacity = 2*gather_capacity + 8;
+    gather_requests = (MPI_Request *) realloc(gather_requests,
+                        gather_capacity*sizeof(MPI_Request));
+    gather_statuses = (MPI_Status *) realloc(gather_statuses,
+                        gather_capacity*sizeof(MPI_Status));
+    gather_arrays = (PyObject **) realloc(gather_arrays,
+                        gather_capacity*sizeof(PyObject *));
+    if (!gather_requests || !gather_statuses || !gather_arrays) {
+      PyErr_NoMemory();
+      return -1;
+    }
+  }
+
+  if (!PyArray_Check(x) || !PyArray_ISCARRAY(x)) {
+    PyErr_SetString(PyExc_ValueError,
+		    "mpiextras.c (start_gather_array): arrays must be contiguous");
+    return -1;
+  }
+
+  mpi_type = type_map(x, &count);
+  if (!mpi_type) return -1;
+
+  if (send) {
+    ierr = MPI_Isend(x->data, count, mpi_type, other, tag, MPI_COMM_WORLD,
+                     &gather_requests[num_gather_pending]);
+  } else {
+    ierr = MPI_Irecv(x->data, count, mpi_type, other, tag, MPI_COMM_WORLD,
+                     &gather_requests[num_gather_pending]);
+  }
+
+  if (ierr>0) {
+    PyErr_SetString(PyExc_RuntimeError,
+		    "mpiextras.c; error from MPI_Isend or MPI_Irecv");
+    return -1;
+  }
+
+  Py_INCREF(x);
+  gather_arrays[num_gather_pending] = (PyObject *) x;
+  num_gather_pending++;
+
+  return 0;
+}
+
+
+static PyObject *start_gather_array(PyObject *self, PyObject *args) {
+
+  PyObject *x;
+  PyObject *buffers;
+  PyObject *buffer;
+  int root, tag, myid, numprocs, p, error;
+
+  /* process the parameters */
+  if (!PyArg_ParseTuple(args, "OOii", &x, &buffers, &root, &tag)) {
+    PyErr_SetString(PyExc_RuntimeError,
+		    "mpiextras.c (start_gather_array): could not parse input");
+    return NULL;
+  }
+
+  MPI_Comm_rank(MPI_COMM_WORLD, &myid);
+  MPI_Comm_size(MPI_COMM_WORLD, &numprocs);
+
+  if (myid != root) {
+    if (post_gather_request((PyArrayObject *) x, root, tag, 1)) return NULL;
+
+    Py_INCREF(Py_None);
+    return (Py_None);
+  }
+
+  if (!PySequence_Check(buffers) || PySequence_Size(buffers) < numprocs) {
+    PyErr_SetString(PyExc_ValueError,
+		    "mpiextras.c (start_gather_array): need a buffer for each processor");
+    return NULL;
+  }
+
+  for (p=0; p<numprocs; p++) {
+    if (p == root) continue;
+
+    /* PySequence_GetItem returns a new reference */
+    buffer = PySequence_GetItem(buffers, p);
+    if (!buffer) return NULL;
+
+    error = post_gather_request((PyArrayObject *) buffer, p, tag, 0);
+    Py_DECREF(buffer);
+    if (error) return NULL;
+  }
+
+  Py_INCREF(Py_None);
+  return (Py_None);
+}
+
+
+static PyObject *wait_gather_array(PyObject *self, PyObject *args) {
+
+  int ierr, k, n;
+
+  if (!PyArg_ParseTuple(args, "")) {
+    PyErr_SetString(PyExc_RuntimeError,
+		    "mpiextras.c (wait_gather_array): could not parse input");
+    return NULL;
+  }
+
+  n = num_gather_pending;
+  if (n > 0) {
+    ierr = MPI_Waitall(n, gather_requests, gather_statuses);
+    num_gather_pending = 0;
+
+    for (k=0; k<n; k++) {
+      Py_DECREF(gather_arrays[k]);
+    }
+
+    if (ierr>0) {
+        PyErr_SetString(PyExc_RuntimeError,
+    		    "mpiextras.c; error from MPI_Waitall");
+        return NULL;
+      }
+  }
+
+  Py_INCREF(Py_None);
+  return (Py_None);
+}
+
+
 
- 
 /**********************************/
 /* Method table for python module */
 /**********************************/
@@ -608,6 +864,10 @@ static struct PyMethodDef MethodTable[] = {
   {"allreduce_array", allreduce_array, METH_VARARGS},
   {"sendrecv_array", sendrecv_array, METH_VARARGS},
   {"send_recv_via_dicts", send_recv_via_dicts, METH_VARARGS},
+  {"start_send_recv_via_dicts", start_send_recv_via_dicts, METH_VARARGS},
+  {"wait_send_recv_via_dicts", wait_send_recv_via_dicts, METH_VARARGS},
+  {"start_gather_array", start_gather_array, METH_VARARGS},
+  {"wait_gather_array", wait_gather_array, METH_VARARGS},
   {NULL, NULL}
 };
 
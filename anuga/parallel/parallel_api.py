@@ -67,16 +67,44 @@ def collect_value(value):
 
 
 
-def distribute(domain, verbose=False, debug=False, parameters = None):
+def distribute(domain, verbose=False, debug=False, parameters = None,
+               mesh_dir=None):
     """ Distribute the domain to all processes
 
     parameters allows user to change size of ghost layer
+
+    If mesh_dir is given, a directory shared by all processes, processor 0
+    only partitions the mesh and stores it there. Each process then builds
+    its own submesh and ghost layer from the memory mapped mesh files.
     """
 
     if not pypar_available or numprocs == 1 : return domain # Bypass
 
 
-    if myid == 0:
+    if mesh_dir is not None:
+        from sequential_distribute import Sequential_distribute
+
+        if myid == 0:
+            partition = Sequential_distribute(domain, verbose, debug, parameters)
+
+            partition.distribute(numprocs, mesh_dir=mesh_dir)
+
+            # Only the partition vector and domain attributes are sent
+            attributes = partition.get_attributes()
+            for p in range(1, numprocs):
+                send(attributes, p)
+        else:
+            partition = Sequential_distribute(None, verbose, debug, parameters)
+            partition.set_attributes(receive(0))
+
+        kwargs, points, vertices, boundary, quantities, boundary_map, \
+                domain_name, domain_dir, domain_store, domain_store_centroids, \
+                domain_minimum_storable_height, domain_minimum_allowed_height, \
+                domain_flow_algorithm, domain_georef, \
+                domain_quantities_to_be_stored, domain_smooth, domain_low_froude \
+                 = partition.extract_mapped_submesh(myid)
+
+    elif myid == 0:
         from sequential_distribute import Sequential_distribute
         partition = Sequential_distribute(domain, verbose, debug, parameters)
 
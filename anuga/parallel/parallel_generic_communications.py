@@ -200,3 +200,88 @@ def communicate_ghosts_asynchronous(domain, quantities=None):
     domain.communication_time += time.time()-t0
 
 
+
+def communicate_ghosts_start(domain, quantities=None):
+    """Start the exchange of ghost cell data without waiting for it
+    to complete. The send buffers are filled from the full cells and
+    the isends/irecvs are posted. The received data is only copied
+    into the ghost cells by communicate_ghosts_finish, so computation
+    on cells which do not depend on ghost values can be done between
+    the two calls.
+    """
+
+    import time
+    t0 = time.time()
+
+    if quantities is None:
+        quantities = domain.conserved_quantities
+
+    #Setup send buffer arrays for sending full data to other processors
+    for send_proc in domain.full_send_dict:
+        Idf  = domain.full_send_dict[send_proc][0]
+        Xout = domain.full_send_dict[send_proc][2]
+
+        for i, q in enumerate(quantities):
+            Q_cv =  domain.quantities[q].centroid_values
+            Xout[:,i] = num.take(Q_cv, Idf)
+
+    from anuga.parallel import mpiextras
+
+    mpiextras.start_send_recv_via_dicts(domain.full_send_dict,domain.ghost_recv_dict)
+
+    domain.communication_time += time.time()-t0
+
+
+def communicate_ghosts_finish(domain, quantities=None):
+    """Wait for the exchange started by communicate_ghosts_start and
+    copy the received data into the ghost cells
+    """
+
+    import time
+    t0 = time.time()
+
+    if quantities is None:
+        quantities = domain.conserved_quantities
+
+    from anuga.parallel import mpiextras
+
+    mpiextras.wait_send_recv_via_dicts()
+
+    # Now copy data from receive buffers to the domain
+    for recv_proc in domain.ghost_recv_dict:
+        Idg  = domain.ghost_recv_dict[recv_proc][0]
+        X    = domain.ghost_recv_dict[recv_proc][2]
+
+        for i, q in enumerate(quantities):
+            Q_cv =  domain.quantities[q].centroid_values
+            num.put(Q_cv, Idg, X[:,i])
+
+    domain.communication_time += time.time()-t0
+
+
+def communicate_flux_update_levels(domain, levels):
+    """Copy the flux update level of each full cell into its ghost
+    copies on the other processors, so that every processor updates the
+    fluxes across its processor boundary edges on the same timesteps
+    """
+
+    import time
+    t0 = time.time()
+
+    for send_proc in domain.full_send_dict:
+        Idf  = domain.full_send_dict[send_proc][0]
+        Xout = domain.full_send_dict[send_proc][2]
+
+        Xout[:,0] = num.take(levels, Idf)
+
+    from anuga.parallel import mpiextras
+
+    mpiextras.send_recv_via_dicts(domain.full_send_dict,domain.ghost_recv_dict)
+
+    for recv_proc in domain.ghost_recv_dict:
+        Idg  = domain.ghost_recv_dict[recv_proc][0]
+        X    = domain.ghost_recv_dict[recv_proc][2]
+
+        num.put(levels, Idg, X[:,0])
+
+    domain.communication_time += time.time()-t0
@@ -34,6 +34,19 @@ from anuga.parallel.parallel_shallow_water import Parallel_domain
 
 import math
 
+def register_structure(domain, operator):
+    """Register a parallel structure with the structure exchange of the
+    domain, if any. Called on all processors, with operator None where
+    the structure is not allocated, so the slots agree.
+    """
+
+    exchange = domain.get_structure_exchange()
+    if exchange is not None:
+        exchange.register(operator)
+
+    return operator
+
+
 """
 Factory method for Parallel Inlet_operator. All parameters are the same
 as normal Inlet_Operators master_proc coordinates the allocation process,
@@ -252,34 +265,36 @@ def Boyd_box_operator(domain,
         print "========================================================"
 
     if alloc0 or alloc1:
-        return Parallel_Boyd_box_operator(domain=domain,
-                                         losses=losses,
-                                         width=width,
-                                         height=height,
-                                         blockage=blockage,
-                                         barrels=barrels,
-                                         end_points=end_points,
-                                         exchange_lines=exchange_lines,
-                                         enquiry_points=enquiry_points,
-                                         invert_elevations=invert_elevations,
-                                         apron=apron,
-                                         manning=manning,
-                                         enquiry_gap=enquiry_gap,
-                                         smoothing_timescale=smoothing_timescale,
-                                         use_momentum_jet=use_momentum_jet,
-                                         use_velocity_head=use_velocity_head,
-                                         description=description,
-                                         label=label,
-                                         structure_type=structure_type,
-                                         logging=logging,
-                                         verbose=verbose,
-                                         master_proc = inlet0_master_proc,
-                                         procs = structure_procs,
-                                         inlet_master_proc = inlet_master_proc,
-                                         inlet_procs = inlet_procs,
-                                         enquiry_proc = enquiry_proc)
+        operator = Parallel_Boyd_box_operator(domain=domain,
+                                             losses=losses,
+                                             width=width,
+                                             height=height,
+                                             blockage=blockage,
+                                             barrels=barrels,
+                                             end_points=end_points,
+                                             exchange_lines=exchange_lines,
+                                             enquiry_points=enquiry_points,
+                                             invert_elevations=invert_elevations,
+                                             apron=apron,
+                                             manning=manning,
+                                             enquiry_gap=enquiry_gap,
+                                             smoothing_timescale=smoothing_timescale,
+                                             use_momentum_jet=use_momentum_jet,
+                                             use_velocity_head=use_velocity_head,
+                                             description=description,
+                                             label=label,
+                                             structure_type=structure_type,
+                                             logging=logging,
+                                             verbose=verbose,
+                                             master_proc = inlet0_master_proc,
+                                             procs = structure_procs,
+                                             inlet_master_proc = inlet_master_proc,
+                                             inlet_procs = inlet_procs,
+                                             enquiry_proc = enquiry_proc)
     else:
-        return None
+        operator = None
+
+    return register_structure(domain, operator)
 
 
 
@@ -417,33 +432,35 @@ def Boyd_pipe_operator(domain,
         print "========================================================"
 
     if alloc0 or alloc1:
-       return Parallel_Boyd_pipe_operator(domain=domain,
-                                         losses=losses,
-                                         diameter=diameter,
-                                         blockage=blockage,
-                                         barrels=barrels,
-                                         end_points=end_points,
-                                         exchange_lines=exchange_lines,
-                                         enquiry_points=enquiry_points,
-                                         invert_elevations=invert_elevations,
-                                         apron=apron,
-                                         manning=manning,
-                                         enquiry_gap=enquiry_gap,
-                                         smoothing_timescale=smoothing_timescale,
-                                         use_momentum_jet=use_momentum_jet,
-                                         use_velocity_head=use_velocity_head,
-                                         description=description,
-                                         label=label,
-                                         structure_type=structure_type,
-                                         logging=logging,
-                                         verbose=verbose,
-                                         master_proc = inlet0_master_proc,
-                                         procs = structure_procs,
-                                         inlet_master_proc = inlet_master_proc,
-                                         inlet_procs = inlet_procs,
-                                         enquiry_proc = enquiry_proc)
+        operator = Parallel_Boyd_pipe_operator(domain=domain,
+                                             losses=losses,
+                                             diameter=diameter,
+                                             blockage=blockage,
+                                             barrels=barrels,
+                                             end_points=end_points,
+                                             exchange_lines=exchange_lines,
+                                             enquiry_points=enquiry_points,
+                                             invert_elevations=invert_elevations,
+                                             apron=apron,
+                                             manning=manning,
+                                             enquiry_gap=enquiry_gap,
+                                             smoothing_timescale=smoothing_timescale,
+                                             use_momentum_jet=use_momentum_jet,
+                                             use_velocity_head=use_velocity_head,
+                                             description=description,
+                                             label=label,
+                                             structure_type=structure_type,
+                                             logging=logging,
+                                             verbose=verbose,
+                                             master_proc = inlet0_master_proc,
+                                             procs = structure_procs,
+                                             inlet_master_proc = inlet_master_proc,
+                                             inlet_procs = inlet_procs,
+                                             enquiry_proc = enquiry_proc)
     else:
-        return None
+        operator = None
+
+    return register_structure(domain, operator)
 
 
 
@@ -598,37 +615,39 @@ def Weir_orifice_trapezoid_operator(domain,
         print "========================================================"
 
     if alloc0 or alloc1:
-        return Parallel_Weir_orifice_trapezoid_operator(domain=domain,
-                                         losses=losses,
-                                         width=width,
-                                         height=height,
-                                         blockage=blockage,
-                                         barrels=barrels,
-                                         z1=z1,
-                                         z2=z2,
-                                         #culvert_slope=culvert_slope,
-                                         end_points=end_points,
-                                         exchange_lines=exchange_lines,
-                                         enquiry_points=enquiry_points,
-                                         invert_elevations=invert_elevations,
-                                         apron=apron,
-                                         manning=manning,
-                                         enquiry_gap=enquiry_gap,
-                                         smoothing_timescale=smoothing_timescale,
-                                         use_momentum_jet=use_momentum_jet,
-                                         use_velocity_head=use_velocity_head,
-                                         description=description,
-                                         label=label,
-                                         structure_type=structure_type,
-                                         logging=logging,
-                                         verbose=verbose,
-                                         master_proc = inlet0_master_proc,
-                                         procs = structure_procs,
-                                         inlet_master_proc = inlet_master_proc,
-                                         inlet_procs = inlet_procs,
-                                         enquiry_proc = enquiry_proc)
+        operator = Parallel_Weir_orifice_trapezoid_operator(domain=domain,
+                                             losses=losses,
+                                             width=width,
+                                             height=height,
+                                             blockage=blockage,
+                                             barrels=barrels,
+                                             z1=z1,
+                                             z2=z2,
+                                             #culvert_slope=culvert_slope,
+                                             end_points=end_points,
+                                             exchange_lines=exchange_lines,
+                                             enquiry_points=enquiry_points,
+                                             invert_elevations=invert_elevations,
+                                             apron=apron,
+                                             manning=manning,
+                                             enquiry_gap=enquiry_gap,
+                                             smoothing_timescale=smoothing_timescale,
+                                             use_momentum_jet=use_momentum_jet,
+                                             use_velocity_head=use_velocity_head,
+                                             description=description,
+                                             label=label,
+                                             structure_type=structure_type,
+                                             logging=logging,
+                                             verbose=verbose,
+                                             master_proc = inlet0_master_proc,
+                                             procs = structure_procs,
+                                             inlet_master_proc = inlet_master_proc,
+                                             inlet_procs = inlet_procs,
+                                             enquiry_proc = enquiry_proc)
     else:
-        return None
+        operator = None
+
+    return register_structure(domain, operator)
 
 
 """
@@ -770,33 +789,35 @@ def Internal_boundary_operator(domain,
         print "========================================================"
 
     if alloc0 or alloc1:
-        return Parallel_Internal_boundary_operator(domain=domain,
-                                         internal_boundary_function=internal_boundary_function,
-                                         width=width,
-                                         height=height,
-                                         end_points=end_points,
-                                         exchange_lines=exchange_lines,
-                                         enquiry_points=enquiry_points,
-                                         invert_elevation=invert_elevation,
-                                         apron=apron,
-                                         enquiry_gap=enquiry_gap,
-                                         use_velocity_head=use_velocity_head,
-                                         zero_outflow_momentum=zero_outflow_momentum,
-                                         force_constant_inlet_elevations=force_constant_inlet_elevations,
-                                         smoothing_timescale=smoothing_timescale,
-                                         compute_discharge_implicitly=compute_discharge_implicitly,
-                                         description=description,
-                                         label=label,
-                                         structure_type=structure_type,
-                                         logging=logging,
-                                         verbose=verbose,
-                                         master_proc = inlet0_master_proc,
-                                         procs = structure_procs,
-                                         inlet_master_proc = inlet_master_proc,
-                                         inlet_procs = inlet_procs,
-                                         enquiry_proc = enquiry_proc)
+        operator = Parallel_Internal_boundary_operator(domain=domain,
+                                             internal_boundary_function=internal_boundary_function,
+                                             width=width,
+                                             height=height,
+                                             end_points=end_points,
+                                             exchange_lines=exchange_lines,
+                                             enquiry_points=enquiry_points,
+                                             invert_elevation=invert_elevation,
+                                             apron=apron,
+                                             enquiry_gap=enquiry_gap,
+                                             use_velocity_head=use_velocity_head,
+                                             zero_outflow_momentum=zero_outflow_momentum,
+                                             force_constant_inlet_elevations=force_constant_inlet_elevations,
+                                             smoothing_timescale=smoothing_timescale,
+                                             compute_discharge_implicitly=compute_discharge_implicitly,
+                                             description=description,
+                                             label=label,
+                                             structure_type=structure_type,
+                                             logging=logging,
+                                             verbose=verbose,
+                                             master_proc = inlet0_master_proc,
+                                             procs = structure_procs,
+                                             inlet_master_proc = inlet_master_proc,
+                                             inlet_procs = inlet_procs,
+                                             enquiry_proc = enquiry_proc)
     else:
-        return None
+        operator = None
+
+    return register_structure(domain, operator)
 
 
 
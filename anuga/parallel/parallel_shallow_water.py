@@ -20,6 +20,7 @@ import anuga.utilities.parallel_abstraction as pypar
 #from anuga.abstract_2d_finite_volumes.neighbour_mesh import Mesh
 
 import numpy as num
+import os
 from os.path import join
 
 
@@ -106,6 +107,24 @@ class Parallel_domain(Domain):
 
         self.ghost_counter = 0
 
+        # Distance of each triangle from the ghost layer. Triangles far
+        # enough from the ghosts are extrapolated while the ghost
+        # exchange is still in flight.
+        from distribute_mesh import ghost_layer_distance
+        self.ghost_distance = ghost_layer_distance(self.neighbours,
+                                                   self.tri_full_flag)
+        self.ghost_exchange_pending = False
+        self.set_communication_overlap(True)
+
+        self.set_store_collective(False)
+
+        self.structure_exchange = None
+
+        # One OpenMP thread per process unless requested otherwise, so
+        # processes sharing a node do not oversubscribe the cores
+        if 'OMP_NUM_THREADS' not in os.environ:
+            self.set_omp_num_threads(1)
+
 
     def set_name(self, name):
         """Assign name based on processor number 
@@ -125,6 +144,60 @@ class Parallel_domain(Domain):
         return self.global_name
 
 
+    def set_store_collective(self, flag=True):
+        """Set whether all processors store their full triangles in one
+        global sww file written by processor 0, instead of one sww file
+        per processor to be merged after evolve.
+        """
+
+        self.store_collective = flag
+
+
+    def get_store_collective(self):
+
+        return self.store_collective
+
+
+    def initialise_storage(self):
+        """Create and initialise self.writer object for storing data,
+        a single global sww file if the storage is collective.
+        """
+
+        if not self.store_collective:
+            Domain.initialise_storage(self)
+            return
+
+        from anuga.parallel.parallel_sww import Parallel_SWW_file
+
+        self.writer = Parallel_SWW_file(self)
+        self.writer.store_connectivity()
+
+
+    def set_structure_exchange(self, flag=True):
+        """Exchange the inlet data of all parallel structures created
+        afterwards with one allreduce per step, instead of messages
+        between the processors of each structure.
+
+        Must be called on all processors before creating the structures.
+        """
+
+        if flag and self.structure_exchange is None:
+            from parallel_structure_exchange import Parallel_structure_exchange
+            self.structure_exchange = Parallel_structure_exchange(self)
+
+        if not flag and self.structure_exchange is not None:
+            for structure in self.structure_exchange.structures:
+                if structure is not None:
+                    structure.exchange = None
+            self.fractional_step_operators.remove(self.structure_exchange)
+            self.structure_exchange = None
+
+
+    def get_structure_exchange(self):
+
+        return self.structure_exchange
+
+
     def update_timestep(self, yieldstep, finaltime):
         """Calculate local timestep
         """
@@ -135,14 +208,103 @@ class Parallel_domain(Domain):
 
 
 
+    def set_communication_overlap(self, flag=True):
+        """Overlap the exchange of ghost cell data with the extrapolation
+        of the interior triangles (DE algorithms only)
+        """
+
+        self.communication_overlap = flag
+
+
+    def get_communication_overlap(self):
+
+        return self.communication_overlap
+
+
     def update_ghosts(self, quantities=None):
         """We must send the information from the full cells and
         receive the information for the ghost cells
         """
-            
-        generic_comms.communicate_ghosts_asynchronous(self, quantities)
+
+        self.finish_update_ghosts()
+
+        if quantities is None and self.communication_overlap \
+               and self.compute_fluxes_method == 'DE':
+            # Completed in distribute_to_vertices_and_edges
+            generic_comms.communicate_ghosts_start(self)
+            self.ghost_exchange_pending = True
+        else:
+            generic_comms.communicate_ghosts_asynchronous(self, quantities)
         #generic_comms.communicate_ghosts_blocking(self)
 
+
+    def finish_update_ghosts(self):
+        """Complete a ghost exchange started by update_ghosts
+        """
+
+        if self.ghost_exchange_pending:
+            self.ghost_exchange_pending = False
+            generic_comms.communicate_ghosts_finish(self)
+
+
+    def distribute_to_vertices_and_edges(self):
+        """Protect and extrapolate the triangles which do not depend on
+        ghost values while the ghost exchange completes, then do the rest
+        """
+
+        if not self.ghost_exchange_pending:
+            Domain.distribute_to_vertices_and_edges(self)
+            return
+
+        from anuga.shallow_water.swDE1_domain_ext import protect_new_partial
+        from anuga.shallow_water.swDE1_domain_ext import \
+             extrapolate_second_order_edge_sw_partial as extrapol2_partial
+
+        D = self.get_domain_handle()
+
+        mass_error = protect_new_partial(D, self.ghost_distance, 1)
+        extrapol2_partial(D, self.ghost_distance, 1)
+
+        self.finish_update_ghosts()
+
+        mass_error += protect_new_partial(D, self.ghost_distance, 2)
+        extrapol2_partial(D, self.ghost_distance, 2)
+
+        if mass_error > 0.0 and self.verbose :
+            print 'Cumulative mass protection: '+str(mass_error)+' m^3 '
+
+
+    def update_extrema(self):
+
+        if self.quantities_to_be_monitored is not None:
+            self.finish_update_ghosts()
+
+        Domain.update_extrema(self)
+
+
+    def compute_flux_update_frequency(self):
+        """Compute the flux update levels of the full triangles and take
+        the levels of the ghost triangles from the processors which own
+        them before setting which fluxes to update on the next timestep
+        """
+
+        from anuga.shallow_water.swDE1_domain_ext import \
+             compute_flux_update_levels, update_flux_update_flags
+
+        self.finish_update_ghosts()
+
+        compute_flux_update_levels(self.get_domain_handle(), self.timestep)
+
+        # All edges of a triangle share its level
+        fuf = self.flux_update_frequency
+        levels = fuf[0::3].copy()
+        generic_comms.communicate_flux_update_levels(self, levels)
+        for i in range(3):
+            fuf[i::3] = levels
+
+        update_flux_update_flags(self.get_domain_handle())
+
+
     def apply_fractional_steps(self):
 
         for operator in self.fractional_step_operators:
@@ -154,19 +316,41 @@ class Parallel_domain(Domain):
 
 
 
-    def sww_merge(self, verbose=False, delete_old=False):
+    def sww_merge(self, verbose=False, delete_old=False, memory_budget=None,
+                  collective=False):
+        """Merge the sww files of all processors.
+
+        The frames are streamed holding at most memory_budget bytes at a
+        time. If collective is True the frames are merged by all processors,
+        otherwise by processor 0 only.
+
+        Nothing needs to be merged if the global sww file was stored
+        collectively (see set_store_collective).
+        """
 
         # make sure all the computations have finished
 
         pypar.barrier()
 
+        if self.store_collective:
+            pass
+
+        elif collective and self.numproc > 1 and self.store:
+            import anuga.utilities.sww_merge as merge
+
+            global_name = join(self.get_datadir(),self.get_global_name())
+
+            merge.sww_merge_parallel_mpi(global_name,self.numproc,verbose,
+                                         delete_old,memory_budget)
+
         # now on processor 0 pull all the separate sww files together
-        if self.processor == 0 and self.numproc > 1 and self.store :
+        elif self.processor == 0 and self.numproc > 1 and self.store :
             import anuga.utilities.sww_merge as merge
 
             global_name = join(self.get_datadir(),self.get_global_name())
             
-            merge.sww_merge_parallel(global_name,self.numproc,verbose,delete_old)
+            merge.sww_merge_parallel(global_name,self.numproc,verbose,delete_old,
+                                     memory_budget)
 
         # make sure all the merge completes on processor 0 before other
         # processors complete (like when finalize is forgotten in main script)
@@ -0,0 +1,229 @@
+"""Exchange the inlet data of all parallel structures in one step
+
+Each parallel structure operator normally gathers the averages over its
+inlets and the values at its enquiry points to its master processor with
+one message per value, and the master sends the new inlet values back.
+With many structures this costs more per step than the flux computation.
+
+A Parallel_structure_exchange operator instead packs the local sums over
+the inlets and the enquiry values of all registered structures into one
+buffer and reduces it over all processors with a single allreduce at the
+start of the fractional steps. Every processor associated with a
+structure then holds the global values, so it computes the discharge
+itself and updates its own part of the inlets. No values are sent back.
+
+The structures are updated from the values at the start of the step, so
+structures sharing inlet triangles do not see each others updates within
+the step.
+"""
+
+import numpy as num
+
+import anuga
+
+
+# Sums over the triangles of an inlet, the averages are divided by the area
+inlet_fields = ['area', 'volume', 'stage', 'xmom', 'ymom']
+
+# Values at the enquiry point of an inlet
+enquiry_fields = ['enquiry_stage', 'enquiry_depth', 'enquiry_total_energy',
+                  'enquiry_specific_energy']
+
+fields = inlet_fields + enquiry_fields
+
+
+class Parallel_structure_exchange(anuga.Operator):
+    """Gather the inlet reductions of all registered parallel structures
+    with one allreduce per step.
+
+    Must be created on all processors before the structures, so it is
+    applied first. The structure factories register every structure on
+    all processors, with None where the structure is not allocated, so
+    the slots agree.
+    """
+
+    def __init__(self, domain, verbose=False):
+
+        anuga.Operator.__init__(self, domain,
+                                description='Exchange of structure data',
+                                label='structure_exchange',
+                                verbose=verbose)
+
+        self.structures = []
+        self.local_values = num.zeros((0, 2, len(fields)), num.float)
+        self.global_values = num.zeros_like(self.local_values)
+
+
+    def register(self, structure):
+        """Reserve a slot for the next structure. structure is None on the
+        processors it is not allocated to.
+        """
+
+        slot = len(self.structures)
+        self.structures.append(structure)
+
+        shape = (len(self.structures), 2, len(fields))
+        self.local_values = num.zeros(shape, num.float)
+        self.global_values = num.zeros(shape, num.float)
+
+        if structure is not None:
+            structure.set_exchange(self, slot)
+
+        return slot
+
+
+    def __call__(self):
+
+        self.pack_local_values()
+        self.reduce_values()
+
+
+    def pack_local_values(self):
+        """Store the contributions of this processor to the inlet sums and
+        enquiry values of each structure
+        """
+
+        values = self.local_values
+        values[:] = 0.0
+
+        for slot, structure in enumerate(self.structures):
+            if structure is None:
+                continue
+
+            for k, inlet in enumerate(structure.inlets):
+                if inlet is None:
+                    continue
+
+                areas = inlet.get_areas()
+                values[slot, k, 0] = inlet.area
+                values[slot, k, 1] = num.sum(inlet.get_depths()*areas)
+                values[slot, k, 2] = num.sum(inlet.get_stages()*areas)
+                values[slot, k, 3] = num.sum(inlet.get_xmoms()*areas)
+                values[slot, k, 4] = num.sum(inlet.get_ymoms()*areas)
+
+                # Only one processor holds the enquiry point as a full
+                # triangle, the others add zero
+                if inlet.enquiry_index >= 0:
+                    values[slot, k, 5] = inlet.get_enquiry_stage()
+                    values[slot, k, 6] = inlet.get_enquiry_depth()
+                    values[slot, k, 7] = inlet.get_enquiry_total_energy()
+                    values[slot, k, 8] = inlet.get_enquiry_specific_energy()
+
+
+    def reduce_values(self):
+        """Sum the values of all processors, every processor receives
+        the result
+        """
+
+        if self.domain.numproc == 1 or len(self.structures) == 0:
+            self.global_values[:] = self.local_values
+            return
+
+        import anuga.utilities.parallel_abstraction as pypar
+        import anuga.parallel.pypar_ext as par_exts
+
+        par_exts.allreduce(self.local_values, pypar.SUM,
+                           buffer=self.global_values,
+                           bypass=True)
+
+
+    def get_values(self, slot, k):
+        """Return the global values of inlet k of the structure in slot
+        """
+
+        return self.global_values[slot, k]
+
+
+    def parallel_safe(self):
+
+        return True
+
+
+    def statistics(self):
+
+        message = 'Exchange of the data of %d structures' \
+                  % len(self.structures)
+        return message
+
+
+    def timestepping_statistics(self):
+
+        return self.statistics()
+
+
+class Exchanged_inlet:
+    """Inlet of a structure as seen after the exchange.
+
+    The global getters return the values reduced by the exchange and
+    the setters change the part of the inlet on this processor, if any.
+    """
+
+    def __init__(self, exchange, slot, k, inlet, outward_culvert_vector):
+
+        self.exchange = exchange
+        self.slot = slot
+        self.k = k
+        self.inlet = inlet
+        self.outward_culvert_vector = outward_culvert_vector
+
+
+    def get_value(self, name):
+
+        return self.exchange.get_values(self.slot, self.k)[fields.index(name)]
+
+
+    def get_average(self, name):
+
+        area = self.get_value('area')
+        if area > 0.0:
+            return self.get_value(name)/area
+        else:
+            return 0.0
+
+
+    def get_global_area(self):
+        return self.get_value('area')
+
+    def get_global_total_water_volume(self):
+        return self.get_value('volume')
+
+    def get_global_average_depth(self):
+        return self.get_average('volume')
+
+    def get_global_average_stage(self):
+        return self.get_average('stage')
+
+    def get_global_average_xmom(self):
+        return self.get_average('xmom')
+
+    def get_global_average_ymom(self):
+        return self.get_average('ymom')
+
+    def get_enquiry_stage(self):
+        return self.get_value('enquiry_stage')
+
+    def get_enquiry_depth(self):
+        return self.get_value('enquiry_depth')
+
+    def get_enquiry_total_energy(self):
+        return self.get_value('enquiry_total_energy')
+
+    def get_enquiry_specific_energy(self):
+        return self.get_value('enquiry_specific_energy')
+
+
+    def set_depths(self, depth):
+        if self.inlet is not None:
+            self.inlet.set_depths(depth)
+
+    def set_stages(self, stage):
+        if self.inlet is not None:
+            self.inlet.set_stages(stage)
+
+    def set_xmoms(self, xmom):
+        if self.inlet is not None:
+            self.inlet.set_xmoms(xmom)
+
+    def set_ymoms(self, ymom):
+        if self.inlet is not None:
+            self.inlet.set_ymoms(ymom)
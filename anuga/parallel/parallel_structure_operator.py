@@ -249,10 +249,60 @@ class Parallel_Structure_operator(anuga.Operator):
         self.inflow_index = 0
         self.outflow_index = 1
 
+        # Set by set_exchange if the inlet data is exchanged for all
+        # structures at once
+        self.exchange = None
+        self.exchanged_inlets = None
+
         self.set_parallel_logging(logging)
 
+    def set_exchange(self, exchange, slot):
+        """Use the inlet values reduced by a Parallel_structure_exchange
+        instead of gathering them on the master proc
+        """
+
+        from parallel_structure_exchange import Exchanged_inlet
+
+        self.exchange = exchange
+        self.exchanged_inlets = \
+            [Exchanged_inlet(exchange, slot, 0, self.inlets[0], self.culvert_vector),
+             Exchanged_inlet(exchange, slot, 1, self.inlets[1], -self.culvert_vector)]
+
     def __call__(self):
 
+        if self.exchange is None:
+            self.update_structure()
+        else:
+            self.update_structure_exchanged()
+
+    def update_structure_exchanged(self):
+        """Update the structure from the values of the exchange.
+
+        Every proc associated with the structure holds the global inlet
+        and enquiry values, so it acts as the master of the structure and
+        of both inlets and computes the same discharge without any
+        communication.
+        """
+
+        myid = self.myid
+        saved = (self.master_proc, self.procs, self.inlet_master_proc,
+                 self.inlet_procs, self.enquiry_proc, self.inlets)
+
+        self.master_proc = myid
+        self.procs = [myid]
+        self.inlet_master_proc = [myid, myid]
+        self.inlet_procs = [[myid], [myid]]
+        self.enquiry_proc = [myid, myid]
+        self.inlets = self.exchanged_inlets
+
+        try:
+            self.update_structure()
+        finally:
+            self.master_proc, self.procs, self.inlet_master_proc, \
+                self.inlet_procs, self.enquiry_proc, self.inlets = saved
+
+    def update_structure(self):
+
         timestep = self.domain.get_timestep()
 
         Q, barrel_speed, outlet_depth = self.discharge_routine()
@@ -0,0 +1,299 @@
+"""Class Parallel_SWW_file - store the output of all processors of a
+parallel domain in a single sww file.
+
+Processor 0 gathers the values of the full triangles of each processor and
+writes them to the global file, indexed in the same way as the file created
+by sww_merge_parallel. The frames are sent with non blocking sends, so the
+other processors carry on evolving while processor 0 writes.
+"""
+
+import numpy as num
+
+import anuga.utilities.parallel_abstraction as pypar
+
+from anuga.file.sww import SWW_file
+from anuga.file.netcdf import NetCDFFile
+from anuga.config import netcdf_mode_a
+from anuga.utilities.file_utils import create_filename
+
+# Tag of the messages gathering the sww data
+sww_tag = 321
+
+
+class Parallel_SWW_file(SWW_file):
+    """Interface to a single sww file written collectively by all
+    processors of a parallel domain.
+
+    All processors must create the file and call store_connectivity,
+    store_timestep and close together. The global file is not split.
+    """
+
+    def __init__(self, domain, root=0):
+
+        msg = 'Storing a global sww file needs the tri_l2g and node_l2g '
+        msg += 'maps of the parallel domain'
+        assert domain.tri_l2g is not None and domain.node_l2g is not None, msg
+
+        self.root = root
+        self.processor = domain.processor
+        self.numproc = domain.numproc
+        self.frame = None
+        self.receive_buffers = {}
+
+        SWW_file.__init__(self, domain)
+
+        self.max_size = num.inf
+
+
+    def create_file(self):
+        """Set up the global indices of the values stored by this
+        processor. Processor root creates the global file.
+        """
+
+        domain = self.domain
+
+        self.filename = create_filename(domain.get_datadir(),
+                                        domain.get_global_name(), 'sww')
+        self.number_of_volumes = domain.number_of_global_triangles
+        self.number_of_nodes = domain.number_of_global_nodes
+
+        self.setup_maps()
+
+        if self.processor == self.root:
+            SWW_file.create_file(self)
+
+
+    def setup_maps(self):
+        """Find the local and global ids of the vertex and centroid values
+        of the full triangles. Processor root receives the global ids
+        and the global volumes of all processors.
+        """
+
+        domain = self.domain
+
+        Q = domain.quantities.values()[0]
+        _, V = Q.get_vertex_values(xy=False)
+        V = num.array(V, num.int)
+
+        tri_l2g = num.array(domain.tri_l2g, num.int)
+        if domain.smooth:
+            vertex_l2g = num.array(domain.node_l2g, num.int)
+        else:
+            vertex_l2g = (3*tri_l2g.reshape(-1,1) + [0,1,2]).reshape(-1,)
+
+        # Only store the values of full triangles, some of the
+        # ghost values are not consistent
+        self.l_tids = num.flatnonzero(domain.tri_full_flag == 1)
+        self.l_vids = num.unique(V[self.l_tids])
+
+        g_maps = (vertex_l2g[self.l_vids],
+                  tri_l2g[self.l_tids],
+                  vertex_l2g[V[self.l_tids]])
+
+        if self.processor != self.root:
+            pypar.send(g_maps, self.root)
+            return
+
+        if domain.smooth:
+            self.number_of_vertices = self.number_of_nodes
+        else:
+            self.number_of_vertices = 3*self.number_of_volumes
+
+        self.g_vids = [None]*self.numproc
+        self.g_tids = [None]*self.numproc
+        self.g_volumes = num.zeros((self.number_of_volumes, 3), num.int)
+
+        for p in range(self.numproc):
+            if p != self.root:
+                g_maps = pypar.receive(p)
+
+            g_vids, g_tids, g_volumes = g_maps
+            self.g_vids[p] = g_vids
+            self.g_tids[p] = g_tids
+            self.g_volumes[g_tids] = g_volumes
+
+
+    def start_gather(self, x, buffers):
+        """Start sending x to processor root, or on root start receiving
+        the arrays of the other processors into buffers.
+        """
+
+        if self.numproc == 1:
+            return
+
+        try:
+            from anuga.parallel import mpiextras
+        except ImportError:
+            if self.processor == self.root:
+                for p in range(self.numproc):
+                    if p != self.root:
+                        pypar.receive(p, buffer=buffers[p], tag=sww_tag,
+                                      bypass=True)
+            else:
+                pypar.send(x, self.root, tag=sww_tag, bypass=True)
+        else:
+            mpiextras.start_gather_array(x, buffers, self.root, sww_tag)
+
+
+    def wait_gather(self):
+        """Complete the communication started by start_gather
+        """
+
+        if self.numproc == 1:
+            return
+
+        try:
+            from anuga.parallel import mpiextras
+        except ImportError:
+            pass
+        else:
+            mpiextras.wait_gather_array()
+
+
+    def gather_quantities(self, vertex_quantities, centroid_quantities):
+        """Gather the vertex and centroid values of the full triangles of
+        all processors.
+
+        Returns dictionaries of the global values on processor root and
+        None on the other processors, which do not wait for the values
+        to be received.
+        """
+
+        v_names = sorted(vertex_quantities.keys())
+        c_names = sorted(centroid_quantities.keys())
+
+        values = [num.zeros(0, self.precision)]
+        for name in v_names:
+            values.append(vertex_quantities[name][self.l_vids])
+        for name in c_names:
+            values.append(centroid_quantities[name][self.l_tids])
+        x = num.concatenate(values).astype(self.precision)
+
+        if self.processor != self.root:
+            # x is held by the send until the next gather or close
+            self.wait_gather()
+            self.start_gather(x, None)
+            return None
+
+        buffers = [None]*self.numproc
+        for p in range(self.numproc):
+            if p != self.root:
+                size = len(self.g_vids[p])*len(v_names) + \
+                       len(self.g_tids[p])*len(c_names)
+                key = (p, size)
+                if key not in self.receive_buffers:
+                    self.receive_buffers[key] = num.zeros(size,
+                                                          self.precision)
+                buffers[p] = self.receive_buffers[key]
+
+        self.start_gather(x, buffers)
+
+        vertex_values = {}
+        for name in v_names:
+            vertex_values[name] = num.zeros(self.number_of_vertices,
+                                            self.precision)
+
+        centroid_values = {}
+        for name in c_names:
+            centroid_values[name] = num.zeros(self.number_of_volumes,
+                                              self.precision)
+
+        self.wait_gather()
+        buffers[self.root] = x
+
+        # Later processors overwrite the shared nodes, as in sww_merge
+        for p in range(self.numproc):
+            g_vids = self.g_vids[p]
+            g_tids = self.g_tids[p]
+
+            k = 0
+            for name in v_names:
+                vertex_values[name][g_vids] = buffers[p][k:k+len(g_vids)]
+                k += len(g_vids)
+            for name in c_names:
+                centroid_values[name][g_tids] = buffers[p][k:k+len(g_tids)]
+                k += len(g_tids)
+
+        return vertex_values, centroid_values
+
+
+    def store_connectivity(self):
+        """Gather and store the global triangulation and static quantities
+        """
+
+        domain = self.domain
+
+        Q = domain.quantities.values()[0]
+        X,Y,_,_ = Q.get_vertex_values(xy=True, precision=self.precision)
+
+        vertex_quantities = {'x' : X, 'y' : Y}
+        for name in self.writer.static_quantities:
+            Q = domain.quantities[name]
+            A, _ = Q.get_vertex_values(xy=False, precision=self.precision)
+            vertex_quantities[name] = A
+
+        centroid_quantities = {}
+        for name in self.writer.static_c_quantities:
+            Q = domain.quantities[name[:-2]]  # rip off _c from name
+            centroid_quantities[name] = Q.centroid_values
+
+        result = self.gather_quantities(vertex_quantities,
+                                        centroid_quantities)
+
+        if self.processor != self.root:
+            return
+
+        vertex_values, centroid_values = result
+
+        points = num.concatenate((vertex_values.pop('x')[:,num.newaxis],
+                                  vertex_values.pop('y')[:,num.newaxis]),
+                                 axis=1)
+
+        fid = NetCDFFile(self.filename, netcdf_mode_a)
+
+        self.writer.store_triangulation(fid,
+                                        points,
+                                        self.g_volumes,
+                                        points_georeference=\
+                                        domain.geo_reference)
+
+        self.writer.store_static_quantities(fid, **vertex_values)
+        self.writer.store_static_quantities_centroid(fid, **centroid_values)
+
+        fid.close()
+
+
+    def store_timestep(self):
+        """Gather the dynamic quantities to processor root which stores
+        them, buffered or asynchronously as set for the domain.
+        """
+
+        dynamic_quantities, dynamic_quantities_centroid = \
+                            SWW_file.get_dynamic_quantities(self)
+
+        self.frame = self.gather_quantities(dynamic_quantities,
+                                            dynamic_quantities_centroid)
+
+        if self.processor == self.root:
+            try:
+                SWW_file.store_timestep(self)
+            finally:
+                self.frame = None
+
+
+    def get_dynamic_quantities(self):
+        """Return the global values gathered by store_timestep
+        """
+
+        return self.frame
+
+
+    def close(self):
+        """Complete the last send, and on processor root flush and close
+        the file.
+        """
+
+        if self.processor == self.root:
+            SWW_file.close(self)
+        else:
+            self.wait_gather()
@@ -0,0 +1,188 @@
+"""Cache of mesh partitions for sequential_distribute
+
+Partitioning a mesh with metis and building the ghost layers and
+communication patterns is repeated each time the same mesh is
+distributed, e.g. in parameter sweeps. The partition of each processor
+is stored once in a directory named after a hash of the mesh, the
+number of processors and the partition parameters. Every array is saved
+in its own .npy file so that a processor can memory map its own slice
+without reading the others.
+
+The quantities are not cached, they are gathered from the domain with
+the map from local to original triangle ids each time.
+"""
+
+import os
+import shutil
+import hashlib
+
+import numpy as num
+
+
+# Changing the layout of the cache invalidates existing entries
+partition_cache_version = 1
+
+# Arrays of a processor partition that are memory mapped on loading
+mapped_arrays = ['points', 'vertices', 'tri_map', 'node_map',
+                 'tri_l2g', 'node_l2g', 'tri_l2orig']
+
+
+def partition_cache_key(domain, numprocs, parameters=None):
+    """Return a hash identifying the partition of domain into numprocs
+    submeshes with the given parameters
+    """
+
+    # All parameters are part of the key, missing ones take the
+    # defaults of build_submesh
+    all_parameters = {'ghost_layer_width': 2}
+    if parameters is not None:
+        all_parameters.update(parameters)
+
+    nodes = num.ascontiguousarray(domain.get_nodes(), num.float)
+    triangles = num.ascontiguousarray(domain.triangles, num.int)
+
+    h = hashlib.sha1()
+    h.update(nodes.tostring())
+    h.update(triangles.tostring())
+    h.update(repr(sorted(domain.boundary.items())))
+    h.update('%d %d' % (partition_cache_version, numprocs))
+    h.update(repr(sorted(all_parameters.items())))
+
+    return h.hexdigest()
+
+
+def partition_cache_path(domain, numprocs, parameters=None,
+                         partition_cache_dir='.'):
+    """Return the directory holding the cached partition of domain
+    """
+
+    key = partition_cache_key(domain, numprocs, parameters)
+
+    return os.path.join(partition_cache_dir, 'partition_%s' % key)
+
+
+def _processor_dir(path, p):
+
+    return os.path.join(path, 'P_%g' % p)
+
+
+def _flatten_commun(commun):
+    """Store a communication dictionary {proc: [local ids, global ids]}
+    as flat arrays
+    """
+
+    procs = num.array(sorted(commun.keys()), num.int)
+    ptr = num.zeros(len(procs)+1, num.int)
+    ptr[1:] = num.cumsum([len(commun[i][0]) for i in procs])
+
+    if len(procs) > 0:
+        local_ids = num.concatenate([commun[i][0] for i in procs])
+        global_ids = num.concatenate([commun[i][1] for i in procs])
+    else:
+        local_ids = num.zeros(0, num.int)
+        global_ids = num.zeros(0, num.int)
+
+    return procs, ptr, local_ids.astype(num.int), global_ids.astype(num.int)
+
+
+def _build_commun(procs, ptr, local_ids, global_ids):
+
+    commun = {}
+    for i, proc in enumerate(procs):
+        commun[int(proc)] = [num.array(local_ids[ptr[i]:ptr[i+1]]),
+                             num.array(global_ids[ptr[i]:ptr[i+1]])]
+
+    return commun
+
+
+def save_partition(path, partitions):
+    """Save the partition of each processor in directory path
+
+    partitions is a list with one dictionary per processor holding
+    points, vertices, boundary, ghost_recv_dict, full_send_dict, tri_map,
+    node_map, tri_l2g, node_l2g, tri_l2orig, ghost_layer_width,
+    number_of_full_nodes and number_of_full_triangles.
+
+    The files are written to a temporary directory first which is then
+    renamed, so an incomplete cache entry is never seen.
+    """
+
+    tmp_path = path + '.tmp%d' % os.getpid()
+    if os.path.isdir(tmp_path):
+        shutil.rmtree(tmp_path)
+
+    for p, partition in enumerate(partitions):
+        pdir = _processor_dir(tmp_path, p)
+        os.makedirs(pdir)
+
+        def save(name, x):
+            num.save(os.path.join(pdir, name + '.npy'), x)
+
+        for name in mapped_arrays:
+            save(name, num.asarray(partition[name]))
+
+        boundary = partition['boundary']
+        keys = sorted(boundary.keys())
+        save('boundary_ids', num.array(keys, num.int).reshape((-1, 2)))
+        save('boundary_tags', num.array([boundary[k] for k in keys], num.str))
+
+        for name in ['ghost_recv_dict', 'full_send_dict']:
+            procs, ptr, local_ids, global_ids = \
+                   _flatten_commun(partition[name])
+            save(name + '_procs', procs)
+            save(name + '_ptr', ptr)
+            save(name + '_local', local_ids)
+            save(name + '_global', global_ids)
+
+        save('info', num.array([partition['number_of_full_nodes'],
+                                partition['number_of_full_triangles'],
+                                partition['ghost_layer_width'],
+                                len(partitions)], num.int))
+
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Another process stored the same partition first
+        shutil.rmtree(tmp_path)
+
+
+def load_partition(path, p, mmap_mode='r'):
+    """Load the partition of processor p from directory path
+
+    Only the files of processor p are read. The larger arrays are
+    memory mapped unless mmap_mode is None. Returns a dictionary with
+    the same entries as given to save_partition.
+    """
+
+    pdir = _processor_dir(path, p)
+    if not os.path.isdir(pdir):
+        msg = 'No cached partition for processor %d in %s' % (p, path)
+        raise IOError(msg)
+
+    def load(name, mmap_mode=None):
+        return num.load(os.path.join(pdir, name + '.npy'), mmap_mode=mmap_mode)
+
+    partition = {}
+    for name in mapped_arrays:
+        partition[name] = load(name, mmap_mode)
+
+    boundary_ids = load('boundary_ids')
+    boundary_tags = load('boundary_tags')
+    boundary = {}
+    for (k, e), tag in zip(boundary_ids, boundary_tags):
+        boundary[int(k), int(e)] = str(tag)
+    partition['boundary'] = boundary
+
+    for name in ['ghost_recv_dict', 'full_send_dict']:
+        partition[name] = _build_commun(load(name + '_procs'),
+                                        load(name + '_ptr'),
+                                        load(name + '_local'),
+                                        load(name + '_global'))
+
+    info = load('info')
+    partition['number_of_full_nodes'] = int(info[0])
+    partition['number_of_full_triangles'] = int(info[1])
+    partition['ghost_layer_width'] = int(info[2])
+    partition['numprocs'] = int(info[3])
+
+    return partition
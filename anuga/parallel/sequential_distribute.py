@@ -3,6 +3,7 @@
 
 """
 
+import os
 import numpy as num
 
 from anuga import Domain
@@ -14,9 +15,37 @@ from anuga.parallel.distribute_mesh  import extract_submesh
 # Mesh partitioning using Metis
 from anuga.parallel.distribute_mesh import build_submesh
 from anuga.parallel.distribute_mesh import pmesh_divide_metis_with_map
+from anuga.parallel.distribute_mesh import save_partitioned_mesh
+from anuga.parallel.distribute_mesh import Partitioned_mesh
+from anuga.parallel.distribute_mesh import build_local_submesh
+from anuga.parallel.distribute_mesh import extract_local_submesh
+from anuga.parallel.distribute_mesh import exchange_ghost_commun
+from anuga.parallel.distribute_mesh import full_commun_from_requests
 
 from anuga.parallel.parallel_shallow_water import Parallel_domain
 
+from anuga.parallel.partition_cache import partition_cache_path
+from anuga.parallel.partition_cache import save_partition
+from anuga.parallel.partition_cache import load_partition
+
+
+# Attributes sent to the other processors when they extract their own
+# submesh from a partitioned mesh file
+domain_attributes = ['numprocs', 'mesh_dir', 'triangles_per_proc',
+                     'domain_name', 'domain_dir', 'domain_store',
+                     'domain_store_centroids',
+                     'domain_minimum_storable_height',
+                     'domain_flow_algorithm',
+                     'domain_minimum_allowed_height', 'domain_georef',
+                     'domain_quantities_to_be_stored', 'domain_smooth',
+                     'domain_low_froude', 'number_of_global_triangles',
+                     'number_of_global_nodes', 'boundary_map']
+
+# Attributes needed to build a submesh from the partition cache
+cached_attributes = ['numprocs', 'partition_path'] + \
+                    [name for name in domain_attributes
+                     if name not in ['numprocs', 'mesh_dir',
+                                     'triangles_per_proc']]
 
 
 class Sequential_distribute(object):
@@ -30,9 +59,27 @@ class Sequential_distribute(object):
         self.verbose = verbose
         self.debug = debug
         self.parameters = parameters
+        self.partition_path = None
+        self.mesh_dir = None
+
 
+    def distribute(self, numprocs=1, partition_cache_dir=None, mesh_dir=None):
+        """Partition the domain into numprocs submeshes
+
+        If partition_cache_dir is given the partition is read from the
+        cache in that directory if the same mesh has been partitioned
+        before, otherwise it is computed and stored there.
+
+        If mesh_dir is given the partitioned mesh is stored in that
+        directory and the submeshes are not built, each processor
+        builds its own with extract_mapped_submesh. The partition cache
+        does not hold the partitioned mesh, so only one of
+        partition_cache_dir and mesh_dir may be given.
+        """
 
-    def distribute(self, numprocs=1):
+        if partition_cache_dir is not None and mesh_dir is not None:
+            msg = 'Only one of partition_cache_dir and mesh_dir may be specified'
+            raise Exception(msg)
 
         self.numprocs = numprocs
 
@@ -66,6 +113,16 @@ class Sequential_distribute(object):
         self.boundary_map = domain.boundary_map
 
 
+        if partition_cache_dir is not None:
+            self.partition_path = partition_cache_path(domain, numprocs,
+                                        parameters, partition_cache_dir)
+
+            if os.path.isdir(self.partition_path):
+                if verbose: print 'sequential_distribute: Use cached partition %s' \
+                   % self.partition_path
+                return
+
+
         # Subdivide the mesh
         if verbose: print 'sequential_distribute: Subdivide mesh'
 
@@ -74,6 +131,19 @@ class Sequential_distribute(object):
                pmesh_divide_metis_with_map(domain, numprocs)
 
 
+        self.triangles_per_proc = triangles_per_proc
+        self.p2s_map =  p2s_map
+
+        if mesh_dir is not None:
+            if verbose: print 'sequential_distribute: Store partitioned mesh in %s' \
+               % mesh_dir
+
+            save_partitioned_mesh(mesh_dir, new_nodes, new_triangles,
+                                  new_boundary, quantities,
+                                  triangles_per_proc, p2s_map)
+            self.mesh_dir = mesh_dir
+            return
+
         # Build the mesh that should be assigned to each processor,
         # this includes ghost nodes and the communication pattern
         if verbose: print 'sequential_distribute: Build submeshes'
@@ -91,17 +161,98 @@ class Sequential_distribute(object):
 
 
         self.submesh = submesh
-        self.triangles_per_proc = triangles_per_proc
-        self.p2s_map =  p2s_map
 
+        if self.partition_path is not None:
+            if verbose: print 'sequential_distribute: Store partition in %s' \
+               % self.partition_path
 
-    def extract_submesh(self, p=0):
-        """Build the local mesh for processor p
+            save_partition(self.partition_path,
+                           [self.build_partition(p) for p in range(numprocs)])
+
+
+    def get_attributes(self, names=domain_attributes):
+        """Return the attributes needed to extract a submesh from the
+        partitioned mesh file, or with names=cached_attributes from the
+        partition cache
+        """
+
+        attributes = {}
+        for name in names:
+            attributes[name] = getattr(self, name)
+
+        return attributes
+
+
+    def set_attributes(self, attributes):
+        """Set the attributes returned by get_attributes on another
+        processor
+        """
+
+        for name in attributes:
+            setattr(self, name, attributes[name])
+
+
+    def build_partition(self, p=0):
+        """Return the local mesh and communication pattern for processor p
+        as a dictionary
         """
 
         submesh = self.submesh
-        triangles_per_proc = self.triangles_per_proc
-        p2s_map = self.p2s_map
+
+        points, vertices, boundary, quantities, \
+            ghost_recv_dict, full_send_dict, \
+            tri_map, node_map, tri_l2g, node_l2g, ghost_layer_width =\
+              extract_submesh(submesh, self.triangles_per_proc, self.p2s_map, p)
+
+        if self.numprocs > 1:
+            tri_l2orig = tri_l2g
+        else:
+            tri_l2orig = num.arange(len(vertices))
+
+        return {'points': points,
+                'vertices': vertices,
+                'boundary': boundary,
+                'ghost_recv_dict': ghost_recv_dict,
+                'full_send_dict': full_send_dict,
+                'tri_map': tri_map,
+                'node_map': node_map,
+                'tri_l2g': tri_l2g,
+                'node_l2g': node_l2g,
+                'tri_l2orig': tri_l2orig,
+                'ghost_layer_width': ghost_layer_width,
+                'number_of_full_nodes': len(submesh['full_nodes'][p]),
+                'number_of_full_triangles': len(submesh['full_triangles'][p])}
+
+
+    def load_partition(self, p=0, quantities=None):
+        """Return the cached local mesh of processor p with the given
+        local quantities or, if None, the quantities gathered from the domain
+        """
+
+        partition = load_partition(self.partition_path, p)
+
+        if quantities is None:
+            tri_l2orig = partition['tri_l2orig']
+            quantities = {}
+            for k in self.domain.quantities:
+                quantities[k] = \
+                    self.domain.quantities[k].vertex_values[tri_l2orig]
+
+        partition['quantities'] = quantities
+
+        return partition
+
+
+    def extract_submesh(self, p=0, quantities=None):
+        """Build the local mesh for processor p
+
+        With a partition cache the local quantities may be given instead
+        of being gathered from the domain.
+        """
+
+        submesh = getattr(self, 'submesh', None)
+        triangles_per_proc = getattr(self, 'triangles_per_proc', None)
+        p2s_map = getattr(self, 'p2s_map', None)
         verbose = self.verbose
         debug = self.debug
 
@@ -109,14 +260,32 @@ class Sequential_distribute(object):
         assert p<self.numprocs
 
 
-        points, vertices, boundary, quantities, \
-            ghost_recv_dict, full_send_dict, \
-            tri_map, node_map, tri_l2g, node_l2g, ghost_layer_width =\
-              extract_submesh(submesh, triangles_per_proc, p2s_map, p)
+        if self.partition_path is not None:
+            partition = self.load_partition(p, quantities)
+
+            points = partition['points']
+            vertices = partition['vertices']
+            boundary = partition['boundary']
+            quantities = partition['quantities']
+            ghost_recv_dict = partition['ghost_recv_dict']
+            full_send_dict = partition['full_send_dict']
+            tri_map = partition['tri_map']
+            node_map = partition['node_map']
+            tri_l2g = partition['tri_l2g']
+            node_l2g = partition['node_l2g']
+            ghost_layer_width = partition['ghost_layer_width']
+            number_of_full_nodes = partition['number_of_full_nodes']
+            number_of_full_triangles = partition['number_of_full_triangles']
 
+            debug = False
+        else:
+            points, vertices, boundary, quantities, \
+                ghost_recv_dict, full_send_dict, \
+                tri_map, node_map, tri_l2g, node_l2g, ghost_layer_width =\
+                  extract_submesh(submesh, triangles_per_proc, p2s_map, p)
 
-        number_of_full_nodes = len(submesh['full_nodes'][p])
-        number_of_full_triangles = len(submesh['full_triangles'][p])
+            number_of_full_nodes = len(submesh['full_nodes'][p])
+            number_of_full_triangles = len(submesh['full_triangles'][p])
 
 
         if debug:
@@ -158,6 +327,61 @@ class Sequential_distribute(object):
 
         #tri_l2orig = p2s_map[tri_l2g]
 
+        return self.pack_submesh(p, points, vertices, boundary, quantities,
+                                 ghost_recv_dict, full_send_dict,
+                                 tri_l2g, node_l2g, ghost_layer_width,
+                                 number_of_full_nodes,
+                                 number_of_full_triangles)
+
+
+    def extract_mapped_submesh(self, p=0, requests=None):
+        """Build the local mesh for processor p from the partitioned mesh
+        file stored by distribute
+
+        requests holds the global ids of the ghost triangles each
+        processor needs from processor p. If it is None they are
+        exchanged with the other processors, so all processors must
+        call this method together.
+        """
+
+        assert self.mesh_dir is not None
+        assert p>=0
+        assert p<self.numprocs
+
+        mesh = Partitioned_mesh(self.mesh_dir)
+
+        submesh = build_local_submesh(mesh, self.triangles_per_proc, p,
+                                      self.parameters)
+
+        if requests is None:
+            requests = exchange_ghost_commun(submesh["ghost_commun"], p,
+                                             self.numprocs)
+        submesh["full_commun"] = full_commun_from_requests(requests)
+
+        points, vertices, boundary, quantities, \
+            ghost_recv_dict, full_send_dict, \
+            tri_map, node_map, tri_l2g, node_l2g, ghost_layer_width =\
+              extract_local_submesh(submesh, self.triangles_per_proc,
+                                    mesh.p2s_map, p)
+
+        return self.pack_submesh(p, points, vertices, boundary, quantities,
+                                 ghost_recv_dict, full_send_dict,
+                                 num.array(tri_l2g), node_l2g,
+                                 ghost_layer_width,
+                                 len(submesh["full_nodes"]),
+                                 len(submesh["full_triangles"]))
+
+
+    def pack_submesh(self, p, points, vertices, boundary, quantities,
+                     ghost_recv_dict, full_send_dict, tri_l2g, node_l2g,
+                     ghost_layer_width, number_of_full_nodes,
+                     number_of_full_triangles):
+        """Collect the local mesh of processor p and the domain attributes
+        needed to create its parallel domain
+        """
+
+        verbose = self.verbose
+
         s2p_map = None
         p2s_map = None
 
@@ -212,21 +436,27 @@ class Sequential_distribute(object):
 
 
 
-def sequential_distribute_dump(domain, numprocs=1, verbose=False, partition_dir='.', debug=False, parameters = None):
+def sequential_distribute_dump(domain, numprocs=1, verbose=False, partition_dir='.', debug=False, parameters = None,
+                               partition_cache_dir=None):
     """ Distribute the domain, create parallel domain and pickle result
+
+    If partition_cache_dir is given the partition of the mesh is reused
+    from (or stored in) a cache in that directory. Only the quantities
+    of each processor and the domain attributes are then written to
+    partition_dir, sequential_distribute_load reads the mesh of each
+    processor from the cache.
     """
 
     from os.path import join
 
     partition = Sequential_distribute(domain, verbose, debug, parameters)
 
-    partition.distribute(numprocs)
+    partition.distribute(numprocs, partition_cache_dir)
 
     # Make sure the partition_dir exists
     if partition_dir == '.' :
         pass
     else:
-        import os
         import errno
         try:
             os.makedirs(partition_dir)
@@ -235,6 +465,32 @@ def sequential_distribute_dump(domain, numprocs=1, verbose=False, partition_dir=
                 raise
 
     import cPickle
+
+    attributes_name = partition.domain_name + '_P%g.partition' % numprocs
+    attributes_name = join(partition_dir, attributes_name)
+
+    if partition.partition_path is not None:
+        for p in range(0, numprocs):
+            pickle_name = partition.domain_name + '_P%g_%g.pickle'% (numprocs,p)
+            pickle_name = join(partition_dir,pickle_name)
+
+            # Write each quantity to it's own file
+            tri_l2orig = load_partition(partition.partition_path, p)['tri_l2orig']
+            for k in domain.quantities:
+                num.save(pickle_name+".np4."+k,
+                         domain.quantities[k].vertex_values[tri_l2orig])
+
+        f = file(attributes_name, 'wb')
+        cPickle.dump((partition.get_attributes(cached_attributes),
+                      domain.quantities.keys()),
+                     f, protocol=cPickle.HIGHEST_PROTOCOL)
+        f.close()
+        return
+
+    # Remove the attributes of an earlier dump using the partition cache
+    if os.path.isfile(attributes_name):
+        os.remove(attributes_name)
+
     for p in range(0, numprocs):
 
         tostore = partition.extract_submesh(p)
@@ -270,9 +526,39 @@ def sequential_distribute_load(filename = 'domain', partition_dir = '.', verbose
     pickle_name = filename+'_P%g_%g.pickle'% (numprocs,myid)
     pickle_name = join(partition_dir,pickle_name)
 
+    attributes_name = join(partition_dir, filename+'_P%g.partition' % numprocs)
+    if os.path.isfile(attributes_name):
+        return sequential_distribute_load_partition(attributes_name, pickle_name,
+                                                    myid, verbose = verbose)
+
     return sequential_distribute_load_pickle_file(pickle_name, numprocs, verbose = verbose)
 
 
+def sequential_distribute_load_partition(attributes_name, pickle_name, p=0,
+                                         verbose = False):
+    """
+    Create the domain of processor p from the partition cache and the
+    quantity files written by sequential_distribute_dump
+    """
+
+    import cPickle
+
+    f = file(attributes_name, 'rb')
+    attributes, quantity_names = cPickle.load(f)
+    f.close()
+
+    partition = Sequential_distribute(None, verbose)
+    partition.set_attributes(attributes)
+
+    quantities = {}
+    for k in quantity_names:
+        quantities[k] = num.load(pickle_name+".np4."+k+".npy")
+
+    tostore = partition.extract_submesh(p, quantities)
+
+    return create_submesh_domain(tostore, partition.numprocs)
+
+
 def sequential_distribute_load_pickle_file(pickle_name, np=1, verbose = False):
     """
     Open pickle files
@@ -281,18 +567,30 @@ def sequential_distribute_load_pickle_file(pickle_name, np=1, verbose = False):
     f = file(pickle_name, 'rb')
     import cPickle
 
+    tostore = list(cPickle.load(f))
+    f.close()
+
+    quantities = tostore[4]
+    for k in quantities:
+	    quantities[k] = num.load(quantities[k])
+    tostore[1] = num.load(tostore[1])
+    tostore[2] = num.load(tostore[2])
+
+    return create_submesh_domain(tostore, np)
+
+
+def create_submesh_domain(tostore, np=1):
+    """
+    Create the domain (parallel if np>1) of the submesh tuple returned by
+    Sequential_distribute.extract_submesh
+    """
+
     kwargs, points, vertices, boundary, quantities, boundary_map, \
                    domain_name, domain_dir, domain_store, domain_store_centroids, \
                    domain_minimum_storable_height, domain_minimum_allowed_height, \
                    domain_flow_algorithm, domain_georef, \
                    domain_quantities_to_be_stored, domain_smooth, \
-                   domain_low_froude = cPickle.load(f)
-    f.close()
-
-    for k in quantities:
-	    quantities[k] = num.load(quantities[k])
-    points = num.load(points)
-    vertices = num.load(vertices)
+                   domain_low_froude = tostore
 
     #---------------------------------------------------------------------------
     # Create domain (parallel if np>1)
@@ -1517,6 +1517,118 @@ class Test_Distribute_Mesh(unittest.TestCase):
 
         #pprint(submesh_cell_1)
 
+
+    def test_ghost_layer_distance(self):
+
+        from anuga.parallel.distribute_mesh import ghost_layer_distance
+
+        # A strip of triangles 0-1-2-3-4-5-6 with triangle 0 a ghost
+        neighbours = num.array([[ 1, -1, -1],
+                                [ 0,  2, -1],
+                                [ 1,  3, -1],
+                                [ 2,  4, -1],
+                                [ 3,  5, -1],
+                                [ 4,  6, -1],
+                                [ 5, -1, -1]])
+        tri_full_flag = num.array([0, 1, 1, 1, 1, 1, 1])
+
+        distance = ghost_layer_distance(neighbours, tri_full_flag)
+        assert num.allclose(distance, [0, 1, 2, 3, 4, 4, 4])
+
+        distance = ghost_layer_distance(neighbours, tri_full_flag, max_distance=2)
+        assert num.allclose(distance, [0, 1, 2, 2, 2, 2, 2])
+
+        # Ghosts at both ends
+        tri_full_flag = num.array([0, 1, 1, 1, 1, 1, 0])
+        distance = ghost_layer_distance(neighbours, tri_full_flag)
+        assert num.allclose(distance, [0, 1, 2, 3, 2, 1, 0])
+
+        # No ghosts at all
+        distance = ghost_layer_distance(neighbours, num.ones(7, num.int))
+        assert num.allclose(distance, 4)
+
+    def test_build_local_submesh(self):
+        """Each processor builds the same local mesh from the partitioned
+        mesh file as extract_submesh gives from build_submesh
+        """
+
+        import tempfile
+        import shutil
+        from anuga import rectangular_cross_domain
+        from anuga.parallel.distribute_mesh import pmesh_divide_metis_with_map
+        from anuga.parallel.distribute_mesh import save_partitioned_mesh
+        from anuga.parallel.distribute_mesh import Partitioned_mesh
+        from anuga.parallel.distribute_mesh import build_local_submesh
+        from anuga.parallel.distribute_mesh import extract_local_submesh
+        from anuga.parallel.distribute_mesh import ghost_requests
+        from anuga.parallel.distribute_mesh import full_commun_from_requests
+
+        domain = rectangular_cross_domain(6, 5)
+        domain.set_quantity('elevation', topography)
+        domain.set_quantity('stage', xcoord)
+
+        nprocs = 3
+        nodes, triangles, boundary, triangles_per_proc, quantities, \
+               s2p_map, p2s_map = pmesh_divide_metis_with_map(domain, nprocs)
+
+        mesh_dir = tempfile.mkdtemp()
+        try:
+            save_partitioned_mesh(mesh_dir, nodes, triangles, boundary,
+                                  quantities, triangles_per_proc, p2s_map)
+            mesh = Partitioned_mesh(mesh_dir)
+
+            for width in [2, 4]:
+                parameters = {'ghost_layer_width': width}
+                submesh = build_submesh(nodes, triangles, boundary, quantities,
+                                        triangles_per_proc, parameters)
+
+                local = [build_local_submesh(mesh, triangles_per_proc, p,
+                                             parameters)
+                         for p in range(nprocs)]
+
+                for p in range(nprocs):
+                    # Requests the other processors would send to p
+                    requests = {}
+                    for q in range(nprocs):
+                        if q != p:
+                            requests[q] = ghost_requests(
+                                local[q]['ghost_commun'], nprocs)[p]
+                    local[p]['full_commun'] = \
+                                full_commun_from_requests(requests)
+
+                    assert local[p]['full_boundary'] == \
+                           submesh['full_boundary'][p]
+                    assert local[p]['ghost_boundary'] == \
+                           submesh['ghost_boundary'][p]
+
+                    result = extract_local_submesh(local[p], triangles_per_proc,
+                                                   mesh.p2s_map, p)
+                    expected = extract_submesh(submesh, triangles_per_proc,
+                                               p2s_map, p)
+
+                    points, vertices, bnd, quan, ghost_recv, full_send, \
+                            tri_map, node_map, tri_l2g, node_l2g, lw = result
+
+                    assert num.allclose(points, expected[0])
+                    assert num.allclose(vertices, expected[1])
+                    assert bnd == expected[2]
+                    for k in expected[3]:
+                        assert num.allclose(quan[k], expected[3][k])
+                    for commun, true_commun in [(ghost_recv, expected[4]),
+                                                (full_send, expected[5])]:
+                        assert sorted(commun.keys()) == sorted(true_commun.keys())
+                        for q in commun:
+                            assert num.allclose(commun[q][0], true_commun[q][0])
+                            assert num.allclose(commun[q][1], true_commun[q][1])
+                    assert num.allclose(tri_map, expected[6])
+                    assert num.allclose(node_map, expected[7])
+                    assert num.allclose(tri_l2g, expected[8])
+                    assert num.allclose(node_l2g, expected[9])
+                    assert lw == expected[10] == width
+        finally:
+            shutil.rmtree(mesh_dir)
+
+
 #-------------------------------------------------------------
 
 if __name__ == "__main__":
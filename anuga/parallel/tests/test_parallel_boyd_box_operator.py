@@ -102,7 +102,8 @@ Q1 = 5.0
 
 samples = 50
 
-def run_simulation(parallel = False, control_data = None, test_points = None, verbose = False):
+def run_simulation(parallel = False, control_data = None, test_points = None, verbose = False,
+                   structure_exchange = False):
     success = True
 
 ##-----------------------------------------------------------------------
@@ -126,6 +127,9 @@ def run_simulation(parallel = False, control_data = None, test_points = None, ve
     if parallel:
         domain = distribute(domain)
         #domain.dump_triangulation("frac_op_domain.png")
+
+        # Exchange the culvert data with one allreduce per step
+        domain.set_structure_exchange(structure_exchange)
     
 
 ##-----------------------------------------------------------------------
@@ -355,6 +359,11 @@ if __name__=="__main__":
         pypar.barrier()
         _, success = run_simulation(parallel=True, control_data = control_data, test_points = test_points, verbose = verbose)
 
+        pypar.barrier()
+        _, exchange_success = run_simulation(parallel=True, control_data = control_data, test_points = test_points,
+                                             verbose = verbose, structure_exchange = True)
+        success = success and exchange_success
+
 
         #assert(success)
         all_success = True
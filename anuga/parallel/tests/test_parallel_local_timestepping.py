@@ -0,0 +1,147 @@
+"""
+Dam break on a graded mesh using local flux and extrapolation updating
+
+Checks that the parallel run conserves water across the processor
+boundaries and stays close to the sequential run.
+"""
+
+
+#------------------------------------------------------------------------------
+# Import necessary modules
+#------------------------------------------------------------------------------
+import unittest
+import os
+import sys
+import numpy as num
+
+import anuga
+from anuga import Domain
+from anuga import Reflective_boundary
+
+from anuga import distribute, myid, numprocs, barrier, finalize
+
+#--------------------------------------------------------------------------
+# Setup parameters
+#--------------------------------------------------------------------------
+yieldstep = 0.05
+finaltime = 0.2
+nprocs = 3
+nlevels = 3
+verbose = False
+
+###########################################################################
+# Setup Test
+##########################################################################
+def run_simulation(parallel=False, G=None, verbose=False):
+
+    #--------------------------------------------------------------------------
+    # Setup computational domain and quantities, the triangles near
+    # x=0 are much smaller than those near x=1
+    #--------------------------------------------------------------------------
+    points, vertices, boundary = anuga.rectangular_cross(30, 6)
+    points = num.array(points)
+    points[:,0] = points[:,0]**2
+
+    domain = Domain(points, vertices, boundary)
+    domain.set_quantity('elevation', 0.0)
+    domain.set_quantity('friction', 0.0)
+    domain.set_quantity('stage', lambda x,y: 1.0 + 0.5*(x<0.05))
+
+    #--------------------------------------------------------------------------
+    # Create the parallel domain
+    #--------------------------------------------------------------------------
+    if parallel:
+        if myid == 0 and verbose : print 'DISTRIBUTING PARALLEL DOMAIN'
+        domain = distribute(domain, verbose=False)
+
+    #--------------------------------------------------------------------------
+    # Setup domain parameters
+    #--------------------------------------------------------------------------
+    domain.set_name('local_timestepping')
+    domain.set_store(False)
+    domain.set_flow_algorithm('DE1')
+    domain.set_local_extrapolation_and_flux_updating(nlevels=nlevels)
+
+    Br = Reflective_boundary(domain)
+    domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+    #------------------------------------------------------------------------------
+    # Gauges at the centroids of the triangles containing these points
+    #------------------------------------------------------------------------------
+    gauge_points = [[0.05, 0.5], [0.2, 0.5], [0.5, 0.5], [0.9, 0.5]]
+
+    tri_ids = []
+    for point in gauge_points:
+        try:
+            k = domain.get_triangle_containing_point(point)
+            if domain.tri_full_flag[k] == 1:
+                tri_ids.append(k)
+            else:
+                tri_ids.append(-1)
+        except:
+            tri_ids.append(-2)
+
+    #------------------------------------------------------------------------------
+    # Evolve system through time
+    #------------------------------------------------------------------------------
+    volume0 = domain.get_water_volume()
+
+    gauge_values = [[] for point in gauge_points]
+    for t in domain.evolve(yieldstep = yieldstep, finaltime = finaltime):
+        if myid == 0 and verbose : domain.write_time()
+
+        stage = domain.get_quantity('stage')
+        for i, k in enumerate(tri_ids):
+            if k > -1:
+                gauge_values[i].append(stage.centroid_values[k])
+
+    volume = domain.get_water_volume()
+    assert_(num.allclose(volume, volume0, rtol=1.0e-12),
+            'Volume changed from %g to %g' % (volume0, volume))
+
+    if not parallel:
+        G = gauge_values
+
+    for i, k in enumerate(tri_ids):
+        if k > -1:
+            assert_(num.allclose(gauge_values[i], G[i], atol=0.01))
+
+    return G
+
+# Test an nprocs-way run with local timestepping against the
+# sequential code.
+
+class Test_parallel_local_timestepping(unittest.TestCase):
+    def test_parallel_local_timestepping(self):
+        if verbose : print "Expect this test to fail if not run from the parallel directory."
+
+        abs_script_name = os.path.abspath(__file__)
+        cmd = "mpirun -np %d python %s" % (nprocs, abs_script_name)
+        result = os.system(cmd)
+
+        assert_(result == 0)
+
+# Because we are doing assertions outside of the TestCase class
+# the PyUnit defined assert_ function can't be used.
+def assert_(condition, msg="Assertion Failed"):
+    if condition == False:
+        raise AssertionError, msg
+
+if __name__=="__main__":
+    if numprocs == 1:
+        runner = unittest.TextTestRunner()
+        suite = unittest.makeSuite(Test_parallel_local_timestepping, 'test')
+        runner.run(suite)
+    else:
+
+        barrier()
+        if myid == 0 and verbose: print 'SEQUENTIAL START'
+
+        G = run_simulation(parallel=False, verbose=verbose)
+
+        barrier()
+        if myid ==0 and verbose: print 'PARALLEL START'
+
+        run_simulation(parallel=True, G=G, verbose=verbose)
+
+        finalize()
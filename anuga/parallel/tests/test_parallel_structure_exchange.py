@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+import unittest
+
+import numpy as num
+
+import anuga
+from anuga.structures.inlet_enquiry import Inlet_enquiry
+from anuga.parallel.parallel_structure_exchange import \
+     Parallel_structure_exchange
+
+
+class Dummy_structure:
+    """Has the attributes of a parallel structure used by the exchange
+    """
+
+    def __init__(self, inlets, culvert_vector):
+
+        self.myid = 0
+        self.inlets = inlets
+        self.culvert_vector = culvert_vector
+        self.exchange = None
+
+    def set_exchange(self, exchange, slot):
+
+        from anuga.parallel.parallel_structure_exchange import Exchanged_inlet
+
+        self.exchange = exchange
+        self.slot = slot
+        self.exchanged_inlets = \
+            [Exchanged_inlet(exchange, slot, 0, self.inlets[0], self.culvert_vector),
+             Exchanged_inlet(exchange, slot, 1, self.inlets[1], -self.culvert_vector)]
+
+
+class Test_parallel_structure_exchange(unittest.TestCase):
+
+    def create_domain(self):
+
+        domain = anuga.rectangular_cross_domain(10, 5, len1=10.0, len2=5.0)
+        domain.set_quantity('elevation', lambda x,y: -x/10.0)
+        domain.set_quantity('stage', lambda x,y: 0.5 + y/10.0)
+        domain.set_quantity('xmomentum', lambda x,y: x/5.0)
+        domain.set_quantity('ymomentum', lambda x,y: -y/5.0)
+
+        return domain
+
+
+    def test_exchanged_inlets(self):
+
+        domain = self.create_domain()
+        exchange = Parallel_structure_exchange(domain)
+
+        line0 = [[2.0, 1.0], [2.0, 4.0]]
+        line1 = [[8.0, 1.0], [8.0, 4.0]]
+        inlets = [Inlet_enquiry(domain, line0, [1.0, 2.5]),
+                  Inlet_enquiry(domain, line1, [9.0, 2.5])]
+        structure = Dummy_structure(inlets, num.array([1.0, 0.0]))
+
+        # A structure which is not allocated on this processor
+        assert exchange.register(None) == 0
+        assert exchange.register(structure) == 1
+        assert structure.exchange is exchange
+
+        exchange()
+
+        assert num.allclose(exchange.global_values[0], 0.0)
+
+        for k, inlet in enumerate(inlets):
+            exchanged = structure.exchanged_inlets[k]
+
+            assert num.allclose(exchanged.get_global_area(), inlet.get_area())
+            assert num.allclose(exchanged.get_global_total_water_volume(),
+                                inlet.get_total_water_volume())
+            assert num.allclose(exchanged.get_global_average_depth(),
+                                inlet.get_average_depth())
+            assert num.allclose(exchanged.get_global_average_stage(),
+                                inlet.get_average_stage())
+            assert num.allclose(exchanged.get_global_average_xmom(),
+                                inlet.get_average_xmom())
+            assert num.allclose(exchanged.get_global_average_ymom(),
+                                inlet.get_average_ymom())
+
+            assert num.allclose(exchanged.get_enquiry_stage(),
+                                inlet.get_enquiry_stage())
+            assert num.allclose(exchanged.get_enquiry_depth(),
+                                inlet.get_enquiry_depth())
+            assert num.allclose(exchanged.get_enquiry_total_energy(),
+                                inlet.get_enquiry_total_energy())
+            assert num.allclose(exchanged.get_enquiry_specific_energy(),
+                                inlet.get_enquiry_specific_energy())
+
+        assert num.allclose(structure.exchanged_inlets[1].outward_culvert_vector,
+                            [-1.0, 0.0])
+
+        # Setters change the inlet on this processor, the values seen
+        # through the exchange only change at the next exchange
+        old_depth = inlets[0].get_average_depth()
+        structure.exchanged_inlets[0].set_depths(old_depth + 1.0)
+        assert num.allclose(inlets[0].get_depths(), old_depth + 1.0)
+        assert num.allclose(structure.exchanged_inlets[0].get_global_average_depth(),
+                            old_depth)
+
+        exchange()
+        assert num.allclose(structure.exchanged_inlets[0].get_global_average_depth(),
+                            old_depth + 1.0)
+
+
+    def test_inlet_not_on_processor(self):
+
+        domain = self.create_domain()
+        exchange = Parallel_structure_exchange(domain)
+
+        inlet = Inlet_enquiry(domain, [[2.0, 1.0], [2.0, 4.0]], [1.0, 2.5])
+        structure = Dummy_structure([inlet, None], num.array([1.0, 0.0]))
+        exchange.register(structure)
+
+        exchange()
+
+        # Nothing is contributed for the missing inlet
+        exchanged = structure.exchanged_inlets[1]
+        assert exchanged.get_global_area() == 0.0
+        assert exchanged.get_global_average_stage() == 0.0
+        exchanged.set_depths(1.0)
+
+        assert num.allclose(structure.exchanged_inlets[0].get_global_area(),
+                            inlet.get_area())
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_parallel_structure_exchange, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -0,0 +1,201 @@
+"""Test the global sww file stored collectively by a parallel domain
+against the merge of the sww files of each processor.
+
+Run sequentially the global file is stored by each subdomain on its own,
+run with mpirun it is stored by all processors together.
+"""
+
+import unittest
+import os
+import tempfile
+import shutil
+from os.path import join
+
+import numpy as num
+
+import anuga
+from anuga import myid, numprocs, barrier, finalize, distribute
+from anuga.file.netcdf import NetCDFFile
+from anuga.parallel.parallel_sww import Parallel_SWW_file
+from anuga.parallel.sequential_distribute import \
+     sequential_distribute_dump, sequential_distribute_load_pickle_file
+import anuga.utilities.sww_merge as merge
+
+verbose = False
+nprocs = 3
+
+
+def create_domain(smooth):
+
+    domain = anuga.rectangular_cross_domain(8, 8, len1=10., len2=10.)
+    domain.set_store_vertices_uniquely(not smooth)
+    domain.set_store_centroids(True)
+    domain.set_quantity('elevation', lambda x,y: -x/10.)
+    domain.set_quantities_to_be_stored({'elevation': 1, 'stage': 2,
+                                        'xmomentum': 2, 'ymomentum': 2})
+    return domain
+
+
+def store_frames(domain):
+
+    for i in range(1, 6):
+        domain.set_time(0.1*i)
+        domain.set_quantity('stage', lambda x,y: num.sin(x+i) + y/100.)
+        domain.set_quantity('xmomentum', lambda x,y: num.cos(y*i))
+        domain.store_timestep()
+
+
+def check_global_file(filename, merged, g_vids=None, g_tids=None):
+    """The values stored in filename at the given global ids are the
+    same as in the merged file"""
+
+    fid = NetCDFFile(filename)
+    fidm = NetCDFFile(merged)
+
+    assert num.allclose(fid.variables['time'][:], fidm.variables['time'][:])
+
+    volumes = fid.variables['volumes'][:]
+    if g_tids is None:
+        assert num.all(volumes == fidm.variables['volumes'][:])
+    else:
+        assert num.all(volumes[g_tids] == fidm.variables['volumes'][:][g_tids])
+
+    for name in ['x', 'y', 'elevation', 'stage', 'xmomentum']:
+        A = fid.variables[name][:]
+        B = fidm.variables[name][:]
+        assert A.shape == B.shape
+        if g_vids is not None:
+            A = A[...,g_vids]
+            B = B[...,g_vids]
+        assert num.allclose(A, B)
+
+    for name in ['elevation_c', 'stage_c', 'xmomentum_c']:
+        A = fid.variables[name][:]
+        B = fidm.variables[name][:]
+        assert A.shape == B.shape
+        if g_tids is not None:
+            A = A[...,g_tids]
+            B = B[...,g_tids]
+        assert num.allclose(A, B)
+
+    fid.close()
+    fidm.close()
+
+
+class Test_parallel_sww(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_store_global_sww_sequential(self):
+        """Each subdomain stores its full triangles at the same global
+        indices as sww_merge_parallel"""
+
+        for smooth in [True, False]:
+            domain = create_domain(smooth)
+            domain.set_name('domain')
+            domain.set_datadir(self.work_dir)
+            sequential_distribute_dump(domain, 3, partition_dir=self.work_dir)
+
+            subdomains = []
+            for p in range(3):
+                d = sequential_distribute_load_pickle_file(
+                    join(self.work_dir, 'domain_P3_%d.pickle' % p), np=3)
+                d.processor = p
+                d.set_store_centroids(True)
+                d.initialise_storage()
+                store_frames(d)
+                subdomains.append(d)
+
+            merge.sww_merge_parallel(join(self.work_dir, 'domain'), 3)
+
+            g_vids = []
+            for p, d in enumerate(subdomains):
+                # Store on its own, as the only processor
+                d.set_name('global_%d' % p)
+                d.processor = 0
+                d.numproc = 1
+                d.set_store_buffered(True, buffer_size=2)
+                d.writer = Parallel_SWW_file(d)
+                d.writer.store_connectivity()
+                d.set_time(0.0)
+                store_frames(d)
+                d.writer.close()
+
+                filename = join(self.work_dir, 'global_%d.sww' % p)
+                assert os.path.exists(filename)
+                assert not os.path.exists(join(self.work_dir,
+                                               d.get_name() + '.sww'))
+
+                fid = NetCDFFile(filename)
+                assert len(fid.variables['volumes']) == \
+                       d.number_of_global_triangles
+                fid.close()
+
+                g_vids.append(d.writer.g_vids[0])
+
+            for p, d in enumerate(subdomains):
+                # The merge takes shared nodes from the last processor
+                vids = g_vids[p]
+                for q in range(p+1, 3):
+                    vids = num.setdiff1d(vids, g_vids[q])
+                if not smooth:
+                    assert len(vids) == len(g_vids[p])
+
+                check_global_file(join(self.work_dir, 'global_%d.sww' % p),
+                                  join(self.work_dir, 'domain.sww'),
+                                  vids, d.writer.g_tids[0])
+
+
+def run_parallel(smooth):
+    """Store the global file with all processors and compare with the
+    merged files of the processors"""
+
+    if myid == 0:
+        domain = create_domain(smooth)
+    else:
+        domain = None
+
+    domain = distribute(domain)
+    domain.set_store_centroids(True)
+
+    for name, collective in [('merged', False), ('global', True)]:
+        domain.set_name(name)
+        domain.set_store_collective(collective)
+        domain.set_time(0.0)
+        domain.initialise_storage()
+        store_frames(domain)
+        domain.writer.close()
+        domain.sww_merge(delete_old=True)
+
+    if myid == 0:
+        check_global_file('global.sww', 'merged.sww')
+        os.remove('global.sww')
+        os.remove('merged.sww')
+
+    barrier()
+
+
+class Test_parallel_sww_mpi(unittest.TestCase):
+
+    def test_store_global_sww_parallel(self):
+        abs_script_name = os.path.abspath(__file__)
+        cmd = "mpirun -np %d python %s" % (nprocs, abs_script_name)
+        result = os.system(cmd)
+
+        assert result == 0
+
+
+if __name__ == "__main__":
+    if numprocs == 1:
+        runner = unittest.TextTestRunner()
+        suite = unittest.makeSuite(Test_parallel_sww, 'test')
+        runner.run(suite)
+    else:
+        for smooth in [True, False]:
+            run_parallel(smooth)
+
+        finalize()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+import unittest
+import os
+import shutil
+import tempfile
+
+from anuga import rectangular_cross_domain
+
+from anuga.parallel.sequential_distribute import Sequential_distribute
+from anuga.parallel.sequential_distribute import sequential_distribute_dump
+from anuga.parallel.sequential_distribute import sequential_distribute_load_pickle_file
+from anuga.parallel.sequential_distribute import sequential_distribute_load_partition
+from anuga.parallel.partition_cache import partition_cache_key
+
+import numpy as num
+
+
+def topography(x,y):
+    return -x/2
+
+
+class Test_Partition_Cache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+
+    def create_domain(self):
+
+        domain = rectangular_cross_domain(8, 6)
+        domain.set_quantity('elevation', topography)
+        domain.set_quantity('stage', expression='elevation + 0.1')
+
+        return domain
+
+
+    def check_same_submesh(self, a, b):
+
+        kwargs_a, kwargs_b = a[0], b[0]
+        for key in ['number_of_full_nodes', 'number_of_full_triangles',
+                    'processor', 'numproc', 'ghost_layer_width']:
+            assert kwargs_a[key] == kwargs_b[key]
+
+        assert num.allclose(kwargs_a['tri_l2g'], kwargs_b['tri_l2g'])
+        assert num.allclose(kwargs_a['node_l2g'], kwargs_b['node_l2g'])
+
+        for name in ['full_send_dict', 'ghost_recv_dict']:
+            assert sorted(kwargs_a[name].keys()) == sorted(kwargs_b[name].keys())
+            for proc in kwargs_a[name]:
+                assert num.allclose(kwargs_a[name][proc][0], kwargs_b[name][proc][0])
+                assert num.allclose(kwargs_a[name][proc][1], kwargs_b[name][proc][1])
+
+        assert num.allclose(a[1], b[1])
+        assert num.allclose(a[2], b[2])
+        assert a[3] == b[3]
+
+        assert sorted(a[4].keys()) == sorted(b[4].keys())
+        for k in a[4]:
+            assert num.allclose(a[4][k], b[4][k])
+
+
+    def test_cached_partition(self):
+
+        for numprocs in [1, 3]:
+            domain = self.create_domain()
+            partition = Sequential_distribute(domain)
+            partition.distribute(numprocs)
+            expected = [partition.extract_submesh(p) for p in range(numprocs)]
+
+            # First call stores the partition
+            domain = self.create_domain()
+            partition = Sequential_distribute(domain)
+            partition.distribute(numprocs, partition_cache_dir=self.cache_dir)
+            assert os.path.isdir(partition.partition_path)
+            for p in range(numprocs):
+                self.check_same_submesh(partition.extract_submesh(p), expected[p])
+
+            # Second call reuses it without partitioning
+            domain = self.create_domain()
+            partition = Sequential_distribute(domain)
+            partition.distribute(numprocs, partition_cache_dir=self.cache_dir)
+            assert not hasattr(partition, 'submesh')
+            for p in range(numprocs):
+                self.check_same_submesh(partition.extract_submesh(p), expected[p])
+
+        assert len(os.listdir(self.cache_dir)) == 2
+
+
+    def test_cached_partition_new_quantities(self):
+
+        domain = self.create_domain()
+        partition = Sequential_distribute(domain)
+        partition.distribute(3, partition_cache_dir=self.cache_dir)
+
+        # Same mesh with different quantities uses the same partition
+        domain = self.create_domain()
+        domain.set_quantity('stage', expression='elevation + 0.5')
+        partition = Sequential_distribute(domain)
+        partition.distribute(3, partition_cache_dir=self.cache_dir)
+        assert not hasattr(partition, 'submesh')
+
+        for p in range(3):
+            tostore = partition.extract_submesh(p)
+            tri_l2g = tostore[0]['tri_l2g']
+            stage = tostore[4]['stage']
+            elevation = tostore[4]['elevation']
+            assert num.allclose(stage, elevation + 0.5)
+            assert num.allclose(stage,
+                    domain.quantities['stage'].vertex_values[tri_l2g])
+
+
+    def test_mapped_submesh(self):
+        """Each processor builds its submesh from the partitioned mesh
+        file with only the attributes sent by processor 0
+        """
+
+        import cPickle
+
+        domain = self.create_domain()
+        partition = Sequential_distribute(domain)
+        partition.distribute(3)
+        expected = [partition.extract_submesh(p) for p in range(3)]
+
+        mesh_dir = os.path.join(self.cache_dir, 'mesh')
+        domain = self.create_domain()
+        partition = Sequential_distribute(domain)
+        partition.distribute(3, mesh_dir=mesh_dir)
+        assert not hasattr(partition, 'submesh')
+        attributes = cPickle.loads(cPickle.dumps(partition.get_attributes()))
+
+        for p in range(3):
+            # Ghost triangles the other processors need from p
+            full_send_dict = expected[p][0]['full_send_dict']
+            requests = {}
+            for q in full_send_dict:
+                requests[q] = full_send_dict[q][1]
+
+            local = Sequential_distribute(None)
+            local.set_attributes(attributes)
+            self.check_same_submesh(local.extract_mapped_submesh(p, requests),
+                                    expected[p])
+
+        # A cached partition does not hold the partitioned mesh
+        partition = Sequential_distribute(self.create_domain())
+        try:
+            partition.distribute(3, partition_cache_dir=self.cache_dir,
+                                 mesh_dir=mesh_dir)
+        except Exception:
+            pass
+        else:
+            raise Exception('Should raise exception')
+
+
+    def test_partition_cache_key(self):
+
+        domain = self.create_domain()
+        key = partition_cache_key(domain, 3)
+
+        assert key == partition_cache_key(self.create_domain(), 3)
+        assert key == partition_cache_key(domain, 3, {'ghost_layer_width': 2})
+        assert key != partition_cache_key(domain, 4)
+        assert key != partition_cache_key(domain, 3, {'ghost_layer_width': 3})
+        assert key != partition_cache_key(rectangular_cross_domain(8, 7), 3)
+
+        # Every parameter is part of the key
+        assert key != partition_cache_key(domain, 3, {'ghost_layer_width': 2,
+                                                      'other': 1})
+
+
+    def test_dump_load_cached_partition(self):
+        """Each processor builds its domain from the partition cache and
+        its quantity files
+        """
+
+        plain_dir = os.path.join(self.cache_dir, 'plain')
+        cached_dir = os.path.join(self.cache_dir, 'cached')
+        partition_cache_dir = os.path.join(self.cache_dir, 'cache')
+
+        for numprocs in [1, 3]:
+            domain = self.create_domain()
+            domain.set_name('domain')
+            sequential_distribute_dump(domain, numprocs, partition_dir=plain_dir)
+
+            domain = self.create_domain()
+            domain.set_name('domain')
+            sequential_distribute_dump(domain, numprocs, partition_dir=cached_dir,
+                                       partition_cache_dir=partition_cache_dir)
+
+            attributes_name = os.path.join(cached_dir,
+                                           'domain_P%g.partition' % numprocs)
+            for p in range(numprocs):
+                pickle_name = 'domain_P%g_%g.pickle' % (numprocs, p)
+                assert not os.path.exists(os.path.join(cached_dir, pickle_name))
+
+                a = sequential_distribute_load_pickle_file(
+                        os.path.join(plain_dir, pickle_name), numprocs)
+                b = sequential_distribute_load_partition(attributes_name,
+                        os.path.join(cached_dir, pickle_name), p)
+
+                assert a.number_of_full_triangles == b.number_of_full_triangles
+                assert num.allclose(a.get_nodes(), b.get_nodes())
+                assert num.allclose(a.triangles, b.triangles)
+                assert a.get_name() == b.get_name()
+                for k in a.quantities:
+                    assert num.allclose(a.quantities[k].vertex_values,
+                                        b.quantities[k].vertex_values)
+
+#-------------------------------------------------------------
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_Partition_Cache,'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -439,7 +439,7 @@ class Rigid_triangulation:
             area += abs((bx*ay-ax*by)+(cx*by-bx*cy)+(ax*cy-cx*ay))/2
         return area            
         
-class Mesh:
+class Mesh(object):
     """
     Representation of a 2D triangular mesh.
     User attributes describe the mesh region/segments/vertices/attributes
@@ -447,8 +447,10 @@ class Mesh:
     mesh attributes describe the mesh that is produced eg triangles and
     vertices.
     All point information is relative to the geo_reference passed in
-    
-    
+
+    Outlines added with addVertsSegs are kept as blocks of coordinate,
+    segment index and tag arrays.  The Vertex and Segment objects for
+    them are only created when userVertices or userSegments is used.
     """
 
     def __repr__(self):
@@ -486,6 +488,11 @@ class Mesh:
         
         self.visualise_graph = True
 
+        # Outline blocks of (points, segments, segment tags) arrays
+        self._outline_blocks = []
+        self._userVertices = []
+        self._userSegments = []
+
         if userSegments is None:
             self.userSegments=[]
         else:
@@ -541,6 +548,47 @@ class Mesh:
         
         return (dic.__cmp__(dic_other))
     
+    def __setstate__(self, state):
+        # Meshes pickled before the outline blocks were introduced
+        state.setdefault('_outline_blocks', [])
+        for name in ['userVertices', 'userSegments']:
+            if state.has_key(name):
+                state['_' + name] = state.pop(name)
+        self.__dict__.update(state)
+
+    def _flush_outline(self):
+        """Create the Vertex and Segment objects of the outline blocks."""
+        blocks = self._outline_blocks
+        if len(blocks) == 0:
+            return
+        self._outline_blocks = []
+        for points, segments, tags in blocks:
+            vertices = [Vertex(x, y) for x, y in points.tolist()]
+            self._userVertices.extend(vertices)
+            for (i, j), tag in zip(segments.tolist(), tags):
+                segObject = Segment(vertices[i], vertices[j])
+                segObject.set_tag(tag)
+                self._userSegments.append(segObject)
+
+    def _get_userVertices(self):
+        self._flush_outline()
+        return self._userVertices
+
+    def _set_userVertices(self, userVertices):
+        self._flush_outline()
+        self._userVertices = userVertices
+
+    def _get_userSegments(self):
+        self._flush_outline()
+        return self._userSegments
+
+    def _set_userSegments(self, userSegments):
+        self._flush_outline()
+        self._userSegments = userSegments
+
+    userVertices = property(_get_userVertices, _set_userVertices)
+    userSegments = property(_get_userSegments, _set_userSegments)
+
     def addUserPoint(self, pointType, x,y):
         if pointType == Vertex:
             point = self.addUserVertex(x,y)
@@ -909,25 +957,23 @@ class Mesh:
             outlineDict['segment_tags'] = []
             for i in range(len(outlineDict['segments'])):
                 outlineDict['segment_tags'].append('')
-        #print "outlineDict['segment_tags']",outlineDict['segment_tags']
-        #print "outlineDict['points']",outlineDict['points']
-        #print "outlineDict['segments']",outlineDict['segments']
-        
-        i_offset = len(self.userVertices)
-        #print "self.userVertices",self.userVertices 
-        #print "index_offset",index_offset 
-        for point in outlineDict['points']:
-            v=Vertex(point[0]-self.geo_reference.xllcorner,
-                     point[1]-self.geo_reference.yllcorner)
-            self.userVertices.append(v)
-            
-        for seg,seg_tag in map(None,outlineDict['segments'],
-                       outlineDict['segment_tags']):
-            segObject = Segment(self.userVertices[int(seg[0])+i_offset],
-                           self.userVertices[int(seg[1])+i_offset] )
-            if not seg_tag == '':
-                segObject.set_tag(seg_tag)
-            self.userSegments.append(segObject)
+
+        points = num.array(outlineDict['points'], num.float)
+        if len(points) == 0:
+            points = num.zeros((0, 2), num.float)
+        # Any values after x,y, such as the z of breaklines, are ignored
+        points = points.reshape((len(points), -1))[:,:2]
+        points -= [self.geo_reference.xllcorner, self.geo_reference.yllcorner]
+        segments = num.array(outlineDict['segments']).reshape((-1, 2))
+        segments = segments.astype(num.int)
+        assert num.all(segments[:,0] != segments[:,1])
+        if len(segments) > 0:
+            assert segments.min() >= 0 and segments.max() < len(points)
+        default_tag = Segment.get_default_tag()
+        tags = [tag == '' and default_tag or tag
+                for tag in outlineDict['segment_tags'][:len(segments)]]
+        tags.extend([None]*(len(segments) - len(tags)))
+        self._outline_blocks.append((points, segments, tags))
             
         
     def get_triangle_count(self):
@@ -1075,7 +1121,7 @@ class Mesh:
         if isRegionalMaxAreas:
             self.mode += 'a'
         #print "mesh#generateMesh# self.mode",self.mode  
-        meshDict = self.Mesh2triangList()
+        meshDict = self.Mesh2triangArrays()
 
         #FIXME (DSG-DSG)  move below section into generate_mesh.py
         #                  & 4 functions eg segment_strings2ints
@@ -1149,42 +1195,19 @@ class Mesh:
     def removeDuplicatedVertices(self, Vertices):
         """
         This function will keep the first duplicate, remove all others
-        Precondition: Each vertex has a dupindex, which is the list
-        index.
 
         Note: this removes vertices that have the same x,y values,
         not duplicate instances in the Vertices list.
         """
-        remove = []
-        index = 0
-        for v in Vertices:
-            v.dupindex = index
-            index += 1
-        t = list(Vertices)
-        t.sort(Point.cmp_xy)
-    
-        length = len(t)
-        behind = 0
-        ahead  = 1
+        seen = {}
         counter = 0
-        while ahead < length:
-            b = t[behind]
-            ah = t[ahead]
-            if (b.y == ah.y and b.x == ah.x):
-                remove.append(ah.dupindex) 
-            behind += 1
-            ahead += 1
-
-        # remove the duplicate vertices
-        remove.sort()
-        remove.reverse()
-        for i in remove:
-            Vertices.pop(i)
-            pass
-
-        #Remove the attribute that this function added
+        unique_vertices = []
         for v in Vertices:
-            del v.dupindex
+            key = (v.x, v.y)
+            if not seen.has_key(key):
+                seen[key] = v
+                unique_vertices.append(v)
+        Vertices[:] = unique_vertices
         return Vertices,counter
 
     # FIXME (DSG-DSG) Move this to geospatial
@@ -1328,6 +1351,50 @@ class Mesh:
         #print "*(*("
         return meshDict
                                                 
+    def Mesh2triangArrays(self):
+        """
+        As Mesh2triangList, but the point, point attribute and segment
+        lists are arrays built straight from the outline blocks, without
+        creating Vertex and Segment objects for them.
+
+        Used to produce input to the mesh engine
+        """
+        vertices = self._userVertices
+        blocks = self._outline_blocks
+        meshDict = self.Mesh2triangList(userVertices=[], userSegments=[])
+
+        pointlist = [num.array([(v.x, v.y) for v in vertices],
+                               num.float).reshape((-1, 2))]
+        for index, vertex in enumerate(vertices):
+            vertex.index = index
+        segmentlist = [num.array([(seg.vertices[0].index,
+                                   seg.vertices[1].index)
+                                  for seg in self._userSegments],
+                                 num.int).reshape((-1, 2))]
+        segmenttaglist = [seg.tag for seg in self._userSegments]
+        offset = len(vertices)
+        for points, segments, tags in blocks:
+            pointlist.append(points)
+            segmentlist.append(segments + offset)
+            segmenttaglist.extend(tags)
+            offset += len(points)
+        segmentlist.append(num.array([(seg.vertices[0].index,
+                                       seg.vertices[1].index)
+                                      for seg in self.alphaUserSegments],
+                                     num.int).reshape((-1, 2)))
+        segmenttaglist.extend([seg.tag for seg in self.alphaUserSegments])
+        meshDict['pointlist'] = num.concatenate(pointlist)
+        meshDict['segmentlist'] = num.concatenate(segmentlist)
+        meshDict['segmenttaglist'] = segmenttaglist
+
+        pointattributelist = [v.attributes for v in vertices]
+        if num.any([len(att) > 0 for att in pointattributelist]):
+            pointattributelist.extend([[]]*(offset - len(vertices)))
+        else:
+            pointattributelist = None
+        meshDict['pointattributelist'] = pointattributelist
+        return meshDict
+
     def Mesh2MeshList(self):
         """
         Convert the Mesh to a dictionary of lists describing the
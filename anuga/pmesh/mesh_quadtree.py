@@ -26,6 +26,7 @@ from anuga.geometry.aabb import AABB
 import numpy as num
 from anuga.utilities.numerical_tools import ensure_numeric
 import anuga.fit_interpolate.fitsmooth as fitsmooth
+import anuga.utilities.quad_tree_ext as quad_tree_ext
 
 
 # PADARN NOTE: I don't think much from Cell is used anymore, if
@@ -37,12 +38,18 @@ class MeshQuadtree(Cell):
         It contains optimisations and search patterns specific to meshes.
     """
 
-    def __init__(self, mesh, verbose=False):
+    # Default for trees pickled before the absolute option existed
+    absolute = True
+
+    def __init__(self, mesh, verbose=False, absolute=True):
         """Build quad tree for mesh.
 
         All vertex indices in the mesh are stored in a quadtree.
+        If absolute is False the tree is built, and searched, in
+        coordinates relative to the mesh origin.
         """
         self.mesh = mesh
+        self.absolute = absolute
 
         self.set_extents()
         self.add_quad_tree()
@@ -57,7 +64,7 @@ class MeshQuadtree(Cell):
         return dic
 
     def set_extents(self):
-        extents = AABB(*self.mesh.get_extent(absolute=True))
+        extents = AABB(*self.mesh.get_extent(absolute=self.absolute))
         extents.grow(1.001)  # To avoid round off error
         numextents = [extents.xmin, extents.xmax, extents.ymin, extents.ymax]
         self.extents = num.array(numextents, num.float)
@@ -65,7 +72,7 @@ class MeshQuadtree(Cell):
 
     def add_quad_tree(self):
 
-        V = self.mesh.get_vertex_coordinates(absolute=True)
+        V = self.mesh.get_vertex_coordinates(absolute=self.absolute)
         
         self.set_extents()
         #print self.extents
@@ -125,6 +132,29 @@ class MeshQuadtree(Cell):
 
         return element_found, sigma[0], sigma[1], sigma[2], index
 
+    def search_points(self, points):
+        """
+        Find the triangles (elements) containing each of an array of points.
+
+        Inputs:
+            points:   (n,2) array of points to test
+
+        Return:
+            indices, sigmas
+
+            where
+            indices: Index of triangle containing each point, -1 if not found
+            sigmas: (n,3) array of interpolation weights sigma0, sigma1, sigma2
+        """
+
+        if not hasattr(self, 'root'):
+            self.add_quad_tree()
+
+        points = ensure_numeric(points, num.float)
+        points = num.reshape(points, (-1, 2))
+
+        return quad_tree_ext.search_points(self.root, points)
+
     # PADARN NOTE: Only here to pass unit tests - does nothing.
     def set_last_triangle(self):
         pass
@@ -1214,6 +1214,35 @@ class meshTestCase(unittest.TestCase):
         self.assertTrue(m.userSegments[1].tag =='do-op',
                         'Wrong segment tag.')
         
+    def test_outline_blocks(self):
+        m = Mesh(geo_reference=Geo_reference(56, 10.0, 20.0))
+        v = m.addUserVertex(5.0, 5.0)
+        dict = {}
+        dict['points'] = [[10.0, 20.0], [11.0, 20.0], [11.0, 21.0]]
+        dict['segments'] = [[0, 1], [1, 2], [2, 0]]
+        dict['segment_tags'] = ['a', '', 'b']
+        m.addVertsSegs(dict)
+
+        # The outline is passed to the mesh engine as arrays
+        meshDict = m.Mesh2triangArrays()
+        assert num.allclose(meshDict['pointlist'],
+                            [[5.0, 5.0], [0.0, 0.0], [1.0, 0.0], [1.0, 1.0]])
+        assert num.alltrue(meshDict['segmentlist'] == [[1,2],[2,3],[3,1]])
+        self.assertEqual(meshDict['segmenttaglist'], ['a', '', 'b'])
+        self.assertEqual(meshDict['pointattributelist'], None)
+        self.assertEqual(len(m._userVertices), 1)
+
+        # and the Vertex and Segment objects are made when needed
+        self.assertEqual(len(m.userVertices), 4)
+        self.assertTrue(m.userVertices[0] is v)
+        self.assertEqual(len(m.userSegments), 3)
+        self.assertTrue(m.userSegments[2].vertices[1] is m.userVertices[1])
+        self.assertEqual(m.userSegments[0].tag, 'a')
+        self.assertEqual(m.userVertices[3].x, 1.0)
+        self.assertEqual(m.userVertices[3].y, 1.0)
+        self.assertEqual(m.Mesh2triangList()['segmentlist'],
+                         [(1, 2), (2, 3), (3, 1)])
+
     def test_addVertsSegs2(self):
         geo = Geo_reference(56,5,10)
         m = Mesh(geo_reference=geo)
@@ -0,0 +1,100 @@
+"""Compare the binary checkpoint format with pickling the whole domain.
+
+Reports the time to write a checkpoint, the size of each checkpoint and
+the time to restart from it, for a sequence of mesh sizes.
+
+   python benchmark_checkpoint.py
+"""
+
+import os
+import shutil
+import tempfile
+import time
+
+try:
+    import dill as cPickle
+except:
+    import cPickle
+
+import anuga
+from anuga.shallow_water.checkpoint import save_checkpoint_file, \
+        load_checkpoint_file
+
+
+def create_domain(m, n):
+
+    domain = anuga.rectangular_cross_domain(m, n, len1=1000.0, len2=1000.0)
+    domain.set_name('benchmark_checkpoint')
+    domain.set_store(False)
+    domain.set_quantity('elevation', lambda x,y: -x/100.0)
+    domain.set_quantity('stage', 1.0)
+
+    Br = anuga.Reflective_boundary(domain)
+    domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+    return domain
+
+
+def directory_size(path):
+
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+
+    size = 0
+    for filename in os.listdir(path):
+        size += os.path.getsize(os.path.join(path, filename))
+    return size
+
+
+def benchmark(m, n, checkpoints=5):
+
+    checkpoint_dir = tempfile.mkdtemp()
+
+    domain = create_domain(m, n)
+    name = domain.get_name()
+
+    # Pickle of whole domain at each checkpoint
+    t0 = time.time()
+    for i in range(checkpoints):
+        pickle_name = os.path.join(checkpoint_dir, name)+'_'+str(float(i))+'.pickle'
+        cPickle.dump(domain, open(pickle_name, 'wb'))
+        domain.time = float(i+1)
+    pickle_save = (time.time() - t0)/checkpoints
+    pickle_size = directory_size(pickle_name)
+
+    t0 = time.time()
+    load_checkpoint_file(name, checkpoint_dir)
+    pickle_load = time.time() - t0
+
+    shutil.rmtree(checkpoint_dir)
+    checkpoint_dir = tempfile.mkdtemp()
+
+    # Binary checkpoints, the static part is stored with the first one
+    domain = create_domain(m, n)
+    t0 = time.time()
+    for i in range(checkpoints):
+        domain.time = float(i)
+        dir_name = save_checkpoint_file(domain, checkpoint_dir)
+    binary_save = (time.time() - t0)/checkpoints
+    binary_size = directory_size(dir_name)
+
+    t0 = time.time()
+    load_checkpoint_file(name, checkpoint_dir)
+    binary_load = time.time() - t0
+
+    shutil.rmtree(checkpoint_dir)
+
+    return len(domain), pickle_save, pickle_size, pickle_load, \
+           binary_save, binary_size, binary_load
+
+
+if __name__ == '__main__':
+
+    print '%10s %12s %12s %12s %12s %12s %12s' % \
+          ('triangles', 'pickle save', 'pickle MB', 'pickle load',
+           'binary save', 'binary MB', 'binary load')
+
+    for m in [50, 100, 200, 400]:
+        N, ps, psize, pl, bs, bsize, bl = benchmark(m, m)
+        print '%10d %12.3f %12.2f %12.3f %12.3f %12.2f %12.3f' % \
+              (N, ps, psize/1.0e6, pl, bs, bsize/1.0e6, bl)
@@ -0,0 +1,81 @@
+"""Per-step overhead of passing the domain to the DE kernels.
+
+Times the kernels called on every DE substep (protect, extrapolate and
+compute fluxes) when given the python domain, which is unpacked into a C
+struct on every call, and when given the handle built once per yieldstep
+by evolve. The difference is the Python-C marshalling overhead per
+substep, reported against the number of triangles.
+
+   python benchmark_domain_handle.py
+"""
+
+import time
+
+import numpy as num
+
+import anuga
+
+from anuga.shallow_water.swDE1_domain_ext import domain_handle
+from anuga.shallow_water.swDE1_domain_ext import protect_new
+from anuga.shallow_water.swDE1_domain_ext import extrapolate_second_order_edge_sw
+from anuga.shallow_water.swDE1_domain_ext import compute_fluxes_ext_central
+
+
+def create_domain(n):
+
+    domain = anuga.rectangular_cross_domain(n, n)
+    domain.set_flow_algorithm('DE1')
+    domain.set_store(False)
+
+    domain.set_quantity('elevation', lambda x, y: -x/2.0)
+    domain.set_quantity('stage', lambda x, y: num.where(x < 0.3, 0.1, -0.2))
+
+    Br = anuga.Reflective_boundary(domain)
+    domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+    return domain
+
+
+def time_substep(D, repeats):
+
+    t0 = time.time()
+    for i in xrange(repeats):
+        protect_new(D)
+        extrapolate_second_order_edge_sw(D)
+        compute_fluxes_ext_central(D, 1.0)
+
+    return (time.time() - t0)/repeats
+
+
+def benchmark(n, repeats):
+
+    domain = create_domain(n)
+    handle = domain_handle(domain)
+
+    # Warm up
+    time_substep(domain, 10)
+    time_substep(handle, 10)
+
+    t_domain = time_substep(domain, repeats)
+    t_handle = time_substep(handle, repeats)
+
+    t0 = time.time()
+    for i in xrange(repeats):
+        domain_handle(domain)
+    t_build = (time.time() - t0)/repeats
+
+    return len(domain), t_domain, t_handle, t_build
+
+
+if __name__ == '__main__':
+
+    print '%10s %14s %14s %14s %12s %14s' % \
+          ('triangles', 'domain (us)', 'handle (us)', 'overhead (us)',
+           'overhead', 'build (us)')
+
+    for n in [4, 8, 16, 32, 64, 128]:
+        repeats = max(20, 200000/(4*n*n))
+        N, t_domain, t_handle, t_build = benchmark(n, repeats)
+        print '%10d %14.1f %14.1f %14.1f %11.1f%% %14.1f' % \
+              (N, 1.0e6*t_domain, 1.0e6*t_handle, 1.0e6*(t_domain - t_handle),
+               100*(t_domain - t_handle)/t_domain, 1.0e6*t_build)
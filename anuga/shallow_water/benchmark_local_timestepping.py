@@ -0,0 +1,84 @@
+"""Compare local flux updating with the global timestep on a graded mesh.
+
+A dam break runs over a channel whose mesh is much finer in a central
+strip than elsewhere, so the global CFL timestep is set by the small
+triangles. Reports the run time with global timestepping and with local
+flux and extrapolation updating for several numbers of levels, together
+with the volume error and the difference in the final stage.
+
+   python benchmark_local_timestepping.py
+"""
+
+import time
+
+import numpy as num
+
+import anuga
+
+
+def create_domain(nlevels=0, timestepping_method='rk2'):
+
+    bounding_polygon = [[0.0, 0.0], [2000.0, 0.0], [2000.0, 1000.0], [0.0, 1000.0]]
+    street = [[995.0, 0.0], [1005.0, 0.0], [1005.0, 1000.0], [995.0, 1000.0]]
+
+    domain = anuga.create_domain_from_regions(bounding_polygon,
+                        boundary_tags={'bottom': [0], 'right': [1],
+                                       'top': [2], 'left': [3]},
+                        maximum_triangle_area=100.0,
+                        interior_regions=[[street, 1.0]],
+                        mesh_filename='benchmark_local_timestepping.msh',
+                        use_cache=False, verbose=False)
+
+    domain.set_name('benchmark_local_timestepping')
+    domain.set_store(False)
+    domain.set_flow_algorithm('DE1')
+    domain.set_timestepping_method(timestepping_method)
+
+    domain.set_quantity('elevation', 0.0)
+    domain.set_quantity('friction', 0.03)
+    domain.set_quantity('stage', lambda x, y: num.where(x < 500.0, 2.0, 1.0))
+
+    Br = anuga.Reflective_boundary(domain)
+    domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+    if nlevels > 0:
+        domain.set_local_extrapolation_and_flux_updating(nlevels=nlevels)
+
+    return domain
+
+
+def benchmark(nlevels, finaltime=20.0, timestepping_method='rk2'):
+
+    domain = create_domain(nlevels, timestepping_method)
+    volume0 = domain.get_water_volume()
+
+    t0 = time.time()
+    for t in domain.evolve(yieldstep=finaltime, finaltime=finaltime):
+        pass
+    run_time = time.time() - t0
+
+    volume_error = abs(domain.get_water_volume() - volume0)/volume0
+    stage = domain.quantities['stage'].centroid_values.copy()
+
+    return len(domain), run_time, volume_error, stage
+
+
+if __name__ == '__main__':
+
+    import os
+
+    print '%8s %10s %10s %10s %14s %14s' % \
+          ('levels', 'triangles', 'time (s)', 'speed-up',
+           'volume error', 'max stage diff')
+
+    N, global_time, volume_error, global_stage = benchmark(0)
+    print '%8s %10d %10.2f %10.2f %14.2e %14.2e' % \
+          ('global', N, global_time, 1.0, volume_error, 0.0)
+
+    for nlevels in [1, 2, 3, 4]:
+        N, run_time, volume_error, stage = benchmark(nlevels)
+        print '%8d %10d %10.2f %10.2f %14.2e %14.2e' % \
+              (nlevels, N, run_time, global_time/run_time, volume_error,
+               num.max(num.abs(stage - global_stage)))
+
+    os.remove('benchmark_local_timestepping.msh')
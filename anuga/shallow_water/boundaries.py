@@ -398,6 +398,23 @@ class Transmissive_stage_zero_momentum_boundary(Boundary):
         return q
 
 
+    def evaluate_segment(self, domain, segment_edges):
+        """Apply transmissive stage and zero momentum at all the edges
+        segment_edges in one go
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        q = self.get_segment_edge_values(domain, segment_edges)
+
+        q[:,1] = q[:,2] = 0.0
+
+        self.set_segment_values(domain, segment_edges, q)
+
+
 
 class Time_stage_zero_momentum_boundary(Boundary):
     """Time dependent boundary returns values for stage
@@ -685,6 +702,29 @@ class Dirichlet_discharge_boundary(Boundary):
         q = [self.stage0, -self.wh0*normal[0], -self.wh0*normal[1]]
         return q
 
+    def evaluate_segment(self, domain, segment_edges):
+        """Set discharge in the (inward) normal direction at all the
+        edges segment_edges in one go
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        vol_ids  = domain.boundary_cells[segment_edges]
+        edge_ids = domain.boundary_edges[segment_edges]
+
+        n1 = domain.normals[vol_ids, 2*edge_ids]
+        n2 = domain.normals[vol_ids, 2*edge_ids+1]
+
+        q = num.zeros((len(vol_ids), 3), num.float)
+        q[:,0] = self.stage0
+        q[:,1] = -self.wh0*n1
+        q[:,2] = -self.wh0*n2
+
+        self.set_segment_values(domain, segment_edges, q)
+
         # FIXME: Consider this (taken from File_boundary) to allow
         # spatial variation
         # if vol_id is not None and edge_id is not None:
@@ -728,17 +768,7 @@ class Inflow_boundary(Boundary):
         # First find all segments having the same tag is vol_id, edge_id
         # This will be done the first time evaluate is called.
         if self.tag is None:
-            boundary = self.domain.boundary
-            self.tag = boundary[(vol_id, edge_id)]        
-            
-            # Find total length of boundary with this tag
-            length = 0.0
-            for v_id, e_id in boundary:
-                if self.tag == boundary[(v_id, e_id)]:
-                    length += self.domain.mesh.get_edgelength(v_id, e_id)            
-
-            self.length = length
-            self.average_momentum = self.rate/length
+            self.set_tag(vol_id, edge_id)
             
             
         # Average momentum has now been established across this boundary
@@ -781,6 +811,67 @@ class Inflow_boundary(Boundary):
         return q
 
 
+    def set_tag(self, vol_id, edge_id):
+        """Find the tag of segment vol_id, edge_id and the average momentum
+        across all segments with that tag
+        """
+
+        boundary = self.domain.boundary
+        self.tag = boundary[(vol_id, edge_id)]        
+
+        # Find total length of boundary with this tag
+        length = 0.0
+        for v_id, e_id in boundary:
+            if self.tag == boundary[(v_id, e_id)]:
+                length += self.domain.mesh.get_edgelength(v_id, e_id)            
+
+        self.length = length
+        self.average_momentum = self.rate/length
+
+
+    def evaluate_segment(self, domain, segment_edges):
+        """Apply inflow rate at all the edges segment_edges in one go
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        vol_ids  = domain.boundary_cells[segment_edges]
+        edge_ids = domain.boundary_edges[segment_edges]
+
+        if len(vol_ids) == 0:
+            return
+
+        if self.tag is None:
+            self.set_tag(vol_ids[0], edge_ids[0])
+
+        # Momentum in the inward normal direction
+        xmomentum = -self.average_momentum*domain.normals[vol_ids, 2*edge_ids]
+        ymomentum = -self.average_momentum*domain.normals[vol_ids, 2*edge_ids+1]
+
+        # Depth from Manning's formula, see evaluate
+        slope = 0 # get gradient for this triangle dot normal
+        epsilon = 1.0e-12
+
+        mannings_n = domain.quantities['friction'].edge_values[vol_ids, edge_ids]
+
+        depth = num.ones(len(vol_ids), num.float)
+        if slope > epsilon:
+            wet = mannings_n > epsilon
+            depth[wet] = (self.average_momentum*mannings_n[wet]/num.sqrt(slope))**(3.0/5)
+
+        elevation = domain.quantities['elevation'].edge_values[vol_ids, edge_ids]
+
+        q = num.zeros((len(vol_ids), 3), num.float)
+        q[:,0] = elevation + depth
+        q[:,1] = xmomentum
+        q[:,2] = ymomentum
+
+        self.set_segment_values(domain, segment_edges, q)
+
+
         
     
             
@@ -882,6 +973,27 @@ class Field_boundary(Boundary):
         return q
 
 
+    def evaluate_segment(self, domain, segment_edges):
+        """ Calculate 'field' boundary results at all the edges
+            segment_edges in one go
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        # Evaluate file boundary
+        q = self.file_boundary.get_segment_values(domain, segment_edges)
+
+        # Adjust stage
+        for j, name in enumerate(self.domain.conserved_quantities):
+            if name == 'stage':
+                q[:,j] += self.mean_stage
+
+        self.set_segment_values(domain, segment_edges, q)
+
+
 
 
 
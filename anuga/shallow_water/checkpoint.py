@@ -14,11 +14,103 @@ read in the last stored domain. Do that via
 
 domain = load_last_checkpoint_file(domain_name, checkpoint_dir)
 
+Checkpoints are stored in a binary format by default. The domain is pickled
+to the file <domain_name>_static_<time>.pickle, which holds the mesh,
+boundaries and operators, at the first checkpoint of a run and again
+whenever the boundary conditions or the operators have changed. Each
+checkpoint is then a directory <domain_name>_<time>.checkpoint holding a
+small pickled header, naming its static pickle, and one .npy file per
+evolving array (quantity centroid values, vertex values of quantities which
+are not conserved, and operator arrays). On restart the arrays are memory
+mapped and copied into the domain read from the static pickle.
+
+Older checkpoints, <domain_name>_<time>.pickle, of the whole domain can
+still be read.
 """
 
+import os
+import shutil
+import types
+
+import numpy as num
+
 from anuga import send, receive, myid, numprocs, barrier
+from anuga.anuga_exceptions import ANUGAError
 from time import time as walltime
 
+try:
+    import dill as cPickle
+except:
+    import cPickle
+
+
+# Version of the binary checkpoint format
+checkpoint_format_version = 2
+
+# Types of attributes stored as scalar state of the domain and operators
+scalar_types = (types.BooleanType, types.IntType, types.LongType,
+                types.FloatType, types.StringType, num.number)
+
+# Small domain arrays which evolve and are stored with each checkpoint
+domain_evolving_arrays = ['boundary_flux_sum']
+
+
+def save_checkpoint_file(domain, checkpoint_dir='.'):
+    """Save the evolving state of the domain in the binary checkpoint format.
+
+    The static part of the domain is saved on the first call of each run
+    and whenever the boundary conditions or operators have changed.
+    """
+
+    from os.path import join
+
+    domain_name = domain.get_name()
+    time = domain.get_time()
+
+    objects = _get_static_objects(domain)
+    stored = getattr(domain, 'checkpoint_static_objects', None)
+    if stored is None or _object_ids(stored) != _object_ids(objects):
+        # Keep the objects so that their ids are not reused
+        domain.checkpoint_static_objects = objects
+        domain.checkpoint_static_name = \
+                domain_name+'_static_'+str(time)+'.pickle'
+        cPickle.dump(domain,
+                     open(join(checkpoint_dir, domain.checkpoint_static_name),
+                          'wb'),
+                     protocol=cPickle.HIGHEST_PROTOCOL)
+
+    dir_name = join(checkpoint_dir, domain_name)+'_'+str(time)+'.checkpoint'
+
+    # Write to a temporary directory first so that an interrupted
+    # checkpoint is never mistaken for a complete one
+    tmp_name = dir_name + '.tmp'
+    if os.path.exists(tmp_name):
+        shutil.rmtree(tmp_name)
+    os.mkdir(tmp_name)
+
+    arrays = []
+    for key, A in _get_evolving_arrays(domain):
+        filename = '%s_%s_%s.npy' % key
+        num.save(join(tmp_name, filename), A)
+        arrays.append((key, filename))
+
+    header = {'version' : checkpoint_format_version,
+              'time' : time,
+              'static' : domain.checkpoint_static_name,
+              'boundary' : _get_boundary_classes(domain),
+              'operators' : _get_operator_classes(domain),
+              'arrays' : arrays,
+              'scalars' : _get_scalar_state(domain)}
+
+    cPickle.dump(header, open(join(tmp_name, 'header.pickle'), 'wb'),
+                 protocol=cPickle.HIGHEST_PROTOCOL)
+
+    if os.path.exists(dir_name):
+        shutil.rmtree(dir_name)
+    os.rename(tmp_name, dir_name)
+
+    return dir_name
+
 
 
 def load_checkpoint_file(domain_name = 'domain', checkpoint_dir = '.', time = None):
@@ -43,15 +135,20 @@ def load_checkpoint_file(domain_name = 'domain', checkpoint_dir = '.', time = No
     for time in reversed(times):
 
         pickle_name = join(checkpoint_dir,domain_name)+'_'+str(time)+'.pickle'
+        dir_name = join(checkpoint_dir,domain_name)+'_'+str(time)+'.checkpoint'
         #print pickle_name
 
         try:
-            try:
-                import dill as cPickle
-            except:
-                import cPickle
-            domain = cPickle.load(open(pickle_name, 'rb'))
+            if os.path.isdir(dir_name):
+                domain = _load_binary_checkpoint(domain_name, checkpoint_dir,
+                                                 dir_name)
+            else:
+                domain = cPickle.load(open(pickle_name, 'rb'))
             success = True
+        except ANUGAError:
+            # Checkpoints which do not fit the code or their static
+            # part must not silently be replaced by older ones
+            raise
         except:
             success = False
 
@@ -83,23 +180,23 @@ def load_checkpoint_file(domain_name = 'domain', checkpoint_dir = '.', time = No
 
 def _get_checkpoint_times(domain_name, checkpoint_dir):
 
-    import os
     times = set()
 
-    for (path, directory, filenames) in os.walk(checkpoint_dir):
-        #print filenames
-        #print directory
+    for filename in os.listdir(checkpoint_dir):
+        filebase, ext = os.path.splitext(filename)
+        if ext not in ['.pickle', '.checkpoint']:
+            continue
 
-        if len(filenames) == 0:
-            return None
-        else:
-            for filename in filenames:
-                filebase = os.path.splitext(filename)[0].rpartition("_")
-                time = filebase[-1]
-                domain_name_base = filebase[0]
-                if domain_name_base == domain_name :
-                    #print domain_name_base, time
-                    times.add(float(time))
+        filebase = filebase.rpartition("_")
+        domain_name_base = filebase[0]
+        if domain_name_base == domain_name :
+            try:
+                time = float(filebase[-1])
+            except ValueError:
+                # e.g. the static part of a binary checkpoint
+                continue
+            #print domain_name_base, time
+            times.add(time)
 
 
     #times.sort()
@@ -118,3 +215,174 @@ def _get_checkpoint_times(domain_name, checkpoint_dir):
     #print combined
 
     return combined
+
+
+def _get_evolving_arrays(domain):
+    """Return list of (key, array) of the arrays stored with each checkpoint.
+
+    key is a tuple (kind, name, attribute) identifying the array.
+    """
+
+    arrays = []
+    shared = set()
+
+    for name, Q in domain.quantities.items():
+        arrays.append((('quantity', name, 'centroid_values'),
+                       Q.centroid_values))
+        shared.add(id(Q.centroid_values))
+        shared.add(id(Q.vertex_values))
+        shared.add(id(Q.edge_values))
+
+        # Vertex values of conserved quantities are recomputed
+        # from the centroid values at the start of evolve
+        if name not in domain.conserved_quantities:
+            arrays.append((('quantity', name, 'vertex_values'),
+                           Q.vertex_values))
+
+    for attribute in domain_evolving_arrays:
+        if hasattr(domain, attribute):
+            arrays.append((('domain', 'domain', attribute),
+                           getattr(domain, attribute)))
+
+    # Operators often keep aliases of domain arrays, which need not
+    # be stored again
+    for value in domain.__dict__.values():
+        if isinstance(value, num.ndarray):
+            shared.add(id(value))
+
+    for i, operator in enumerate(domain.fractional_step_operators):
+        for attribute, value in operator.__dict__.items():
+            if not isinstance(value, num.ndarray):
+                continue
+            if id(value) in shared or id(value.base) in shared:
+                continue
+            arrays.append((('operator', str(i), attribute), value))
+
+    return arrays
+
+
+def _get_scalar_state(domain):
+    """Return list of (key, value) of the scalar attributes of the domain
+    and its operators
+    """
+
+    scalars = []
+
+    for attribute, value in domain.__dict__.items():
+        if isinstance(value, scalar_types):
+            scalars.append((('domain', 'domain', attribute), value))
+
+    for i, operator in enumerate(domain.fractional_step_operators):
+        for attribute, value in operator.__dict__.items():
+            if isinstance(value, scalar_types):
+                scalars.append((('operator', str(i), attribute), value))
+
+    return scalars
+
+
+def _get_static_objects(domain):
+    """Return the boundary conditions and operators stored in the static
+    pickle as a list of (tag, object)
+    """
+
+    objects = [(tag, domain.boundary_map[tag])
+               for tag in sorted(domain.boundary_map.keys())]
+    objects += [(None, operator)
+                for operator in domain.fractional_step_operators]
+
+    return objects
+
+
+def _object_ids(objects):
+
+    return [(tag, id(obj)) for tag, obj in objects]
+
+
+def _get_boundary_classes(domain):
+
+    return [(tag, domain.boundary_map[tag].__class__.__name__)
+            for tag in sorted(domain.boundary_map.keys())]
+
+
+def _get_operator_classes(domain):
+
+    return [operator.__class__.__name__
+            for operator in domain.fractional_step_operators]
+
+
+def _get_owner(domain, kind, name):
+
+    if kind == 'quantity':
+        return domain.quantities[name]
+    elif kind == 'operator':
+        return domain.fractional_step_operators[int(name)]
+    else:
+        return domain
+
+
+def _load_binary_checkpoint(domain_name, checkpoint_dir, dir_name):
+    """Read the static pickle of the checkpoint in directory dir_name and
+    restore its state
+    """
+
+    from os.path import join
+
+    header = cPickle.load(open(join(dir_name, 'header.pickle'), 'rb'))
+
+    if header['version'] > checkpoint_format_version:
+        msg = 'Checkpoint %s has format version %d, ' \
+              % (dir_name, header['version'])
+        msg += 'this version of anuga reads up to version %d' \
+              % checkpoint_format_version
+        raise ANUGAError, msg
+
+    if header['version'] == 1:
+        static_name = domain_name+'_static.pickle'
+    else:
+        static_name = header['static']
+
+    domain = cPickle.load(open(join(checkpoint_dir, static_name), 'rb'))
+
+    if header['version'] > 1:
+        if header['boundary'] != _get_boundary_classes(domain) or \
+           header['operators'] != _get_operator_classes(domain):
+            msg = 'Boundary conditions or operators of checkpoint %s ' \
+                  % dir_name
+            msg += 'do not match those stored in %s' % static_name
+            raise ANUGAError, msg
+
+    _restore_checkpoint(domain, dir_name, header)
+
+    return domain
+
+
+def _restore_checkpoint(domain, dir_name, header):
+    """Copy the state stored in the checkpoint directory dir_name, with
+    the given header, into domain, which has been read from the static
+    pickle
+    """
+
+    from os.path import join
+
+    for (kind, name, attribute), value in header['scalars']:
+        owner = _get_owner(domain, kind, name)
+        setattr(owner, attribute, value)
+
+    for (kind, name, attribute), filename in header['arrays']:
+        owner = _get_owner(domain, kind, name)
+        A = num.load(join(dir_name, filename), mmap_mode='r')
+
+        target = getattr(owner, attribute)
+        if isinstance(target, num.ndarray) and target.shape == A.shape:
+            # Copy in place to keep aliases to the array valid
+            target[:] = A
+        else:
+            setattr(owner, attribute, num.array(A))
+
+    for name, Q in domain.quantities.items():
+        if name not in domain.conserved_quantities:
+            Q.interpolate_from_vertices_to_edges()
+
+    # The static part has to be stored again in a restarted run
+    domain.checkpoint_static_objects = None
+    domain.checkpoint_static_name = None
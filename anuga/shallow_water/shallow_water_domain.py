@@ -243,11 +243,20 @@ class Domain(Generic_Domain):
         self.forcing_terms.append(manning_friction_implicit)
 
 
+        #-------------------------------
+        # Take the timesteps of evolve
+        # one at a time in python
+        #-------------------------------
+        self.set_compiled_evolve(False)
+
+
         #-------------------------------
         # Stored output
         #-------------------------------
         self.set_store(True)
         self.set_store_centroids(True)
+        self.set_store_buffered(False)
+        self.set_store_asynchronous(False)
         self.set_store_vertices_uniquely(False)
         self.quantities_to_be_stored = {'elevation': 1,
                                         'friction':1,
@@ -1059,7 +1068,52 @@ class Domain(Generic_Domain):
 
         return self.store_centroids
 
-    def set_checkpointing(self, checkpoint= True, checkpoint_dir = 'CHECKPOINTS', checkpoint_step=10, checkpoint_time = None):
+    def set_store_buffered(self, flag=True, buffer_size=10):
+        """Set whether the sww file is kept open during evolve, with
+        buffer_size frames held in memory and written to file in one block.
+
+        The file is flushed and closed at the end of evolve.
+        """
+
+        if flag:
+            msg = 'buffer_size must be a positive integer'
+            assert buffer_size > 0, msg
+            self.sww_buffer_size = int(buffer_size)
+        else:
+            self.sww_buffer_size = 0
+
+    def get_store_buffered(self):
+        """Get whether data saved to sww file is buffered.
+        """
+
+        return self.sww_buffer_size > 0
+
+    def set_store_asynchronous(self, flag=True, queue_size=1):
+        """Set whether data is written to the sww file by a background
+        thread, so that evolve continues while the file is written.
+
+        The quantities to be stored are copied at each yieldstep. If
+        queue_size frames are still waiting to be written the next
+        yieldstep waits for the writer thread.
+        """
+
+        if flag:
+            msg = 'queue_size must be a positive integer'
+            assert queue_size > 0, msg
+            self.sww_queue_size = int(queue_size)
+        else:
+            self.sww_queue_size = 1
+
+        self.sww_asynchronous = flag
+
+    def get_store_asynchronous(self):
+        """Get whether data is written to sww file asynchronously.
+        """
+
+        return self.sww_asynchronous
+
+    def set_checkpointing(self, checkpoint= True, checkpoint_dir = 'CHECKPOINTS', checkpoint_step=10, checkpoint_time = None,
+                          checkpoint_format = 'binary'):
         """
         Set up checkpointing.
 
@@ -1068,8 +1122,14 @@ class Domain(Generic_Domain):
         @param checkpoint_step: Save checkpoint files after this many yieldsteps
         @param checkpoint_time: If set, over-rides checkpoint_step. save checkpoint files
                         after this amount of walltime
+        @param checkpoint_format: 'binary' (default) stores the domain once and the
+                        evolving arrays at each checkpoint, 'pickle' pickles the
+                        whole domain at each checkpoint
         """
 
+        msg = 'checkpoint_format must be either binary or pickle'
+        assert checkpoint_format in ['binary', 'pickle'], msg
+
 
 
         if checkpoint:
@@ -1086,6 +1146,7 @@ class Domain(Generic_Domain):
                 self.checkpoint_step = 0
             else:
                 self.checkpoint_step = checkpoint_step
+            self.checkpoint_format = checkpoint_format
             self.checkpoint = True
             #print self.checkpoint_dir, self.checkpoint_step
         else:
@@ -1137,14 +1198,18 @@ class Domain(Generic_Domain):
                     domain.set_local_extrapolation_and_flux_updating(nlevels=3)
 
                    (since 2**3==8)
+
+            Fluxes across edges between triangles of different levels are
+            shared by both triangles, so mass is conserved. Supports euler
+            and rk2 timestepping, and parallel domains.
         """
 
         self.max_flux_update_frequency=2**nlevels
 
         if(self.max_flux_update_frequency is not 1):
-            if self.timestepping_method is not 'euler':
-                raise Exception, 'Local extrapolation and flux updating only supported with euler timestepping'
-            if self.compute_fluxes_method is not 'DE':
+            if self.timestepping_method not in ['euler', 'rk2']:
+                raise Exception, 'Local extrapolation and flux updating only supported with euler or rk2 timestepping'
+            if self.compute_fluxes_method != 'DE':
                 raise Exception, 'Local extrapolation and flux updating only supported for discontinuous flow algorithms'
 
 
@@ -1333,6 +1398,117 @@ class Domain(Generic_Domain):
 
         self.low_froude = low_froude
 
+    def set_omp_num_threads(self, num_threads=None):
+        """Set the number of OpenMP threads used by the DE flux,
+        extrapolation and protection kernels. If num_threads is None the
+        OpenMP default (usually the number of cores, or OMP_NUM_THREADS)
+        is used. Has no effect if the extension was built without OpenMP.
+        """
+
+        from swDE1_domain_ext import set_omp_num_threads
+
+        if num_threads is None:
+            import multiprocessing
+            num_threads = int(os.environ.get('OMP_NUM_THREADS',
+                                             multiprocessing.cpu_count()))
+
+        assert num_threads >= 1, 'num_threads must be at least 1'
+
+        set_omp_num_threads(int(num_threads))
+
+    def get_omp_num_threads(self):
+        """Number of OpenMP threads used by the DE kernels
+        """
+
+        from swDE1_domain_ext import get_omp_num_threads
+
+        return get_omp_num_threads()
+
+    def create_domain_handle(self):
+        """Return a handle to the C struct of the domain for the DE
+        kernels, so that the domain attributes are read once per
+        yieldstep instead of on every kernel call
+        """
+
+        if self.compute_fluxes_method != 'DE':
+            return None
+
+        from swDE1_domain_ext import domain_handle
+
+        return domain_handle(self)
+
+    def get_domain_handle(self):
+        """Return the argument for the DE kernels, the handle built by
+        evolve if there is one, otherwise the domain itself
+        """
+
+        if self.domain_handle is None:
+            return self
+
+        return self.domain_handle
+
+    def set_compiled_evolve(self, flag=True):
+        """Take the timesteps between yieldsteps in C instead of python
+        for the DE algorithms.
+
+        Reflective boundaries and manning friction are applied in C,
+        other boundaries, forcing terms, operators and monitored
+        quantities are called back into python. Falls back to python
+        stepping in parallel or when protecting against isolated
+        degenerate timesteps.
+        """
+
+        self.compiled_evolve = flag
+
+    def get_compiled_evolve(self):
+
+        return self.compiled_evolve
+
+    def evolve_to_yieldtime(self, yieldstep, finaltime):
+        """Take all timesteps up to the next yield time or finaltime in
+        C, see set_compiled_evolve. Returns False if not possible.
+        """
+
+        if not self.compiled_evolve or self.domain_handle is None:
+            return False
+
+        if self.numproc > 1 or len(self.full_send_dict) > 0:
+            return False
+
+        if self.protect_against_isolated_degenerate_timesteps:
+            return False
+
+        from anuga.shallow_water.boundaries import Reflective_boundary
+        from anuga.config import epsilon
+        from swDE1_domain_ext import evolve_to_yieldtime
+
+        order = {'euler': 1, 'rk2': 2, 'rk3': 3}[self.get_timestepping_method()]
+
+        reflective_ids = []
+        boundary_callbacks = []
+        for tag in self.tag_boundary_cells:
+            B = self.boundary_map[tag]
+
+            if B is None:
+                continue
+
+            segment_edges = self.tag_boundary_cells[tag]
+
+            if B.__class__ is Reflective_boundary:
+                reflective_ids.extend(segment_edges)
+            else:
+                boundary_callbacks.append((B, segment_edges))
+
+        reflective_ids = num.array(reflective_ids, num.int)
+
+        native_friction = self.forcing_terms == [manning_friction_implicit]
+
+        evolve_to_yieldtime(self, self.domain_handle, order, finaltime,
+                            epsilon, reflective_ids, boundary_callbacks,
+                            int(native_friction))
+
+        return True
+
     def set_use_optimise_dry_cells(self, flag=True):
         """ Try to optimize calculations where region is dry
         """
@@ -1920,7 +2096,7 @@ class Domain(Generic_Domain):
 
             timestep = self.evolve_max_timestep
 
-            flux_timestep = compute_fluxes_ext(self, timestep)
+            flux_timestep = compute_fluxes_ext(self.get_domain_handle(), timestep)
 
             self.flux_timestep = flux_timestep
 
@@ -1998,7 +2174,7 @@ class Domain(Generic_Domain):
             self.protect_against_infinitesimal_and_negative_heights()
             # Do extrapolation step
             from swDE1_domain_ext import extrapolate_second_order_edge_sw as extrapol2
-            extrapol2(self)
+            extrapol2(self.get_domain_handle())
 
         else:
             # Code for original method
@@ -2133,7 +2309,7 @@ class Domain(Generic_Domain):
             from swDE1_domain_ext import protect_new
 
 
-            mass_error = protect_new(self)
+            mass_error = protect_new(self.get_domain_handle())
 
 #             # shortcuts
 #             wc = self.quantities['stage'].centroid_values
@@ -2437,47 +2613,59 @@ class Domain(Generic_Domain):
 
 
         # Call basic machinery from parent class
-        for t in self._evolve_base(yieldstep=yieldstep,
-                                   finaltime=finaltime, duration=duration,
-                                   skip_initial_step=skip_initial_step):
+        try:
+            for t in self._evolve_base(yieldstep=yieldstep,
+                                       finaltime=finaltime, duration=duration,
+                                       skip_initial_step=skip_initial_step):
+
+                self.yieldstep_id += 1
+                walltime = time.time()
 
-            self.yieldstep_id += 1
-            walltime = time.time()
+                #print t , self.get_time()
+                # Store model data, e.g. for subsequent visualisation
+                if self.store is True:
+                    self.store_timestep()
 
-            #print t , self.get_time()
-            # Store model data, e.g. for subsequent visualisation
-            if self.store is True:
-                self.store_timestep()
+                if self.checkpoint:
 
-            if self.checkpoint:
 
+                    save_checkpoint=False
+                    if self.checkpoint_step == 0:
+                        if rank() == 0:
+                            if walltime - self.walltime_prev > self.checkpoint_time:
 
-                save_checkpoint=False
-                if self.checkpoint_step == 0:
-                    if rank() == 0:
-                        if walltime - self.walltime_prev > self.checkpoint_time:
+                                save_checkpoint = True
+                            for cpu in range(size()):
+                                if cpu != rank():
+                                    send(save_checkpoint, cpu)
+                        else:
+                            save_checkpoint = receive(0)
 
+                    elif self.yieldstep_id%self.checkpoint_step == 0:
                             save_checkpoint = True
-                        for cpu in range(size()):
-                            if cpu != rank():
-                                send(save_checkpoint, cpu)
-                    else:
-                        save_checkpoint = receive(0)
 
-                elif self.yieldstep_id%self.checkpoint_step == 0:
-                        save_checkpoint = True
+                    if save_checkpoint:
+                        if self.store is True:
+                            self.writer.flush()
 
-                if save_checkpoint:
-                    pickle_name = os.path.join(self.checkpoint_dir,self.get_name())+'_'+str(self.get_time())+'.pickle'
-                    cPickle.dump(self, open(pickle_name, 'wb'))
+                        if getattr(self, 'checkpoint_format', 'pickle') == 'binary':
+                            from anuga.shallow_water.checkpoint import save_checkpoint_file
+                            save_checkpoint_file(self, self.checkpoint_dir)
+                        else:
+                            pickle_name = os.path.join(self.checkpoint_dir,self.get_name())+'_'+str(self.get_time())+'.pickle'
+                            cPickle.dump(self, open(pickle_name, 'wb'))
 
-                    barrier()
-                    self.walltime_prev = time.time()
+                        barrier()
+                        self.walltime_prev = time.time()
 
-                    #print 'Stored Checkpoint File '+pickle_name
+                        #print 'Stored Checkpoint File '+pickle_name
 
-            # Pass control on to outer loop for more specific actions
-            yield(t)
+                # Pass control on to outer loop for more specific actions
+                yield(t)
+        finally:
+            # Flush and close sww file if kept open
+            if self.store is True and hasattr(self, 'writer'):
+                self.writer.close()
 
 
     def initialise_storage(self):
@@ -2772,7 +2960,7 @@ class Domain(Generic_Domain):
         from swDE1_domain_ext import compute_flux_update_frequency \
                                   as compute_flux_update_frequency_ext
 
-        compute_flux_update_frequency_ext(self, self.timestep)
+        compute_flux_update_frequency_ext(self.get_domain_handle(), self.timestep)
 
     def report_water_volume_statistics(self, verbose=True, returnStats=False):
         """
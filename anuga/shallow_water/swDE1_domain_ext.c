@@ -19,15 +19,27 @@
 #include "numpy/arrayobject.h"
 #include "math.h"
 #include <stdio.h>
+#include <string.h>
 //#include "numpy_shim.h"
 
+#if defined(_OPENMP)
+   #include "omp.h"
+#endif
+
 // Shared code snippets
 #include "util_ext.h"
 #include "sw_domain.h"
+#include "sw_friction.h"
+#include "quantity_update.h"
 
 
 const double pi = 3.14159265358979;
 
+double _protect_new_partial(struct domain *D, long *ghost_distance, int pass);
+int _extrapolate_second_order_edge_sw_partial(struct domain *D,
+                                              long *ghost_distance,
+                                              int pass);
+
 // Trick to compute n modulo d (n%d in python) when d is a power of 2
 unsigned int Mod_of_power_2(unsigned int n, unsigned int d)
 {
@@ -138,8 +150,8 @@ water model for two-dimensional dam-break type. Journal of Computational Physics
   double u_m, h_m, soundspeed_m, s_m;
   double denom, inverse_denominator;
   double uint, t1, t2, t3, min_speed, tmp, local_fr2;
-  // Workspace (allocate once, use many)
-  static double q_left_rotated[3], q_right_rotated[3], flux_right[3], flux_left[3];
+  // Workspace (not static, as the flux loop may be run by several threads)
+  double q_left_rotated[3], q_right_rotated[3], flux_right[3], flux_left[3];
 
 
   // Copy conserved quantities to protect from modification
@@ -317,8 +329,8 @@ int _flux_function_central(double *q_left, double *q_right,
   double s_min, s_max, soundspeed_left, soundspeed_right;
   double denom, inverse_denominator;
   double uint, t1, t2, t3, min_speed, tmp, local_fr, v_right, v_left;
-  // Workspace (allocate once, use many)
-  static double q_left_rotated[3], q_right_rotated[3], flux_right[3], flux_left[3];
+  // Workspace (not static, as the flux loop may be run by several threads)
+  double q_left_rotated[3], q_right_rotated[3], flux_right[3], flux_left[3];
 
   if(h_left==0. && h_right==0.){
     // Quick exit
@@ -485,7 +497,11 @@ int _flux_function_central(double *q_left, double *q_right,
 
 ////////////////////////////////////////////////////////////////
 
-int _compute_flux_update_frequency(struct domain *D, double timestep){
+// Position of the current timestep within the cycle of
+// max_flux_update_frequency timesteps
+static int cyclic_number_of_steps=-1;
+
+int _compute_flux_update_levels(struct domain *D, double timestep){
     // Compute the 'flux_update_frequency' for each edge.
     //
     // This determines how regularly we need
@@ -496,12 +512,14 @@ int _compute_flux_update_frequency(struct domain *D, double timestep){
     // For example, an edge with flux_update_frequency = 4 would
     // only have the flux updated every 4 timesteps
     //
+    // On return all edges of a triangle have the same flux_update_frequency
+    // (the level of the triangle). The update flags are set from the levels
+    // by _update_flux_update_flags.
     //
     // Local variables
     int k, i, k3, ki, m, n, nm, ii, j, ii2;
     long fuf;
     double notSoFast=1.0;
-    static int cyclic_number_of_steps=-1;
 
     // QUICK EXIT
     if(D->max_flux_update_frequency==1){
@@ -606,6 +624,24 @@ int _compute_flux_update_frequency(struct domain *D, double timestep){
 
     }
 
+    return 0;
+}
+
+int _update_flux_update_flags(struct domain *D){
+    // Set update_next_flux and update_extrapolation from the
+    // flux_update_frequency levels computed by _compute_flux_update_levels.
+    //
+    // The flux_update_frequency of an edge only depends on the levels of
+    // the two triangles sharing it, so processes which agree on the levels
+    // of their ghost triangles update the same edges.
+
+    int k, i, ki, m, n, nm;
+
+    // QUICK EXIT
+    if(D->max_flux_update_frequency==1){
+        return 0;
+    }
+
     // Now enforce the same flux_update_frequency on each edge
     // (Could have been broken above when we limited the variation on each triangle)
     // This seems to have nice behaviour. Notice how an edge
@@ -646,6 +682,14 @@ int _compute_flux_update_frequency(struct domain *D, double timestep){
     return 0;
 }
 
+int _compute_flux_update_frequency(struct domain *D, double timestep){
+
+    _compute_flux_update_levels(D, timestep);
+    _update_flux_update_flags(D);
+
+    return 0;
+}
+
 
 double adjust_edgeflux_with_weir(double *edgeflux,
                                  double h_left, double h_right,
@@ -757,14 +801,17 @@ double _compute_fluxes_central(struct domain *D, double timestep){
     double stage_edges[3];//Work array
     double bedslope_work;
     static double local_timestep;
+    double min_timestep, boundary_flux;
     int neighbours_wet[3];//Work array
     long RiverWall_count, substep_count;
     double hle, hre, zc, zc_n, Qfactor, s1, s2, h1, h2;
     double stage_edge_lim, outgoing_mass_edges, pressure_flux, hc, hc_n, tmp, tmp2;
     double h_left_tmp, h_right_tmp;
-    static long call = 0; // Static local variable flagging already computed flux
+    static long call = 0; // Static local variable flagging the substep
     static long timestep_fluxcalls=1;
     static long base_call = 1;
+    static long *riverwall_index = NULL; // Index of each edge into riverwall_elevation
+    static long riverwall_index_size = 0;
     double speed_max_last, vol, weir_height;
 
     call++; // Flag 'id' of flux calculation for this timestep
@@ -781,8 +828,19 @@ double _compute_fluxes_central(struct domain *D, double timestep){
     memset((char*) D->ymom_explicit_update, 0, D->number_of_elements * sizeof (double));
 
 
-    // Counter for riverwall edges
+    // Index of each riverwall edge into riverwall_elevation. The riverwall
+    // edges are numbered in edge order, so this is a running count
+    if (riverwall_index_size < 3*D->number_of_elements) {
+        free(riverwall_index);
+        riverwall_index_size = 3*D->number_of_elements;
+        riverwall_index = malloc(riverwall_index_size*sizeof(long));
+    }
     RiverWall_count=0;
+    for (ki = 0; ki < 3*D->number_of_elements; ki++) {
+        if (D->edge_flux_type[ki] == 1) RiverWall_count += 1;
+        riverwall_index[ki] = RiverWall_count - 1;
+    }
+
     // Which substep of the timestepping method are we on?
     substep_count=(call-base_call)%D->timestep_fluxcalls;
 
@@ -790,13 +848,28 @@ double _compute_fluxes_central(struct domain *D, double timestep){
 
     // Fluxes are not updated every timestep,
     // but all fluxes ARE updated when the following condition holds
-    if(D->allow_timestep_increase[0]==1){
+    // The timestep is only computed on the first substep, so only reset it then
+    if(D->allow_timestep_increase[0]==1 && substep_count==0){
         // We can only increase the timestep if all fluxes are allowed to be updated
         // If this is not done the timestep can't increase (since local_timestep is static)
         local_timestep=1.0e+100;
     }
 
+    min_timestep = local_timestep;
+
     // For all triangles
+    //
+    // The flux across an edge shared by triangles k and n is computed once,
+    // by the triangle with the lower index unless only the other one is due
+    // an update, and written to the edge_flux_work entries of both edges.
+    // Each edge is therefore only written by one triangle and the loop can
+    // be run in parallel.
+    #pragma omp parallel for private(i, m, n, ii, ki, ki2, ki3, nm, nm3, \
+            ql, qr, edgeflux, max_speed_local, length, zl, zr, h_left, h_right, \
+            z_half, bedslope_work, hle, hre, zc, zc_n, Qfactor, s1, s2, h1, h2, \
+            pressure_flux, hc, hc_n, tmp, h_left_tmp, h_right_tmp, \
+            speed_max_last, weir_height, RiverWall_count) \
+            reduction(min:min_timestep)
     for (k = 0; k < D->number_of_elements; k++) {
         speed_max_last = 0.0;
 
@@ -806,14 +879,11 @@ double _compute_fluxes_central(struct domain *D, double timestep){
             ki2 = 2 * ki; //k*6 + i*2
             ki3 = 3*ki;
 
-            if ((D->already_computed_flux[ki] == call) || (D->update_next_flux[ki]!=1)) {
-                // We've already computed the flux across this edge
-                // Check if it is a riverwall
-                if(D->edge_flux_type[ki] == 1){
-                    // Update counter of riverwall edges == index of
-                    // riverwall_elevation + riverwall_rowIndex
-                    RiverWall_count += 1;
-                }
+            if (D->update_next_flux[ki]!=1) continue;
+
+            n = D->neighbours[ki];
+            if (n >= 0 && n < k && D->update_next_flux[3*n + D->neighbour_edges[ki]]==1) {
+                // The flux across this edge is computed by triangle n
                 continue;
             }
 
@@ -828,7 +898,6 @@ double _compute_fluxes_central(struct domain *D, double timestep){
 
             // Get right hand side values either from neighbouring triangle
             // or from boundary array (Quantities at neighbour on nearest face).
-            n = D->neighbours[ki];
             hc_n = hc;
             zc_n = D->bed_centroid_values[k];
             if (n < 0) {
@@ -863,9 +932,9 @@ double _compute_fluxes_central(struct domain *D, double timestep){
                 if( n>=0 && D->edge_flux_type[nm] != 1){
                     printf("Riverwall Error\n");
                 }
-                // Update counter of riverwall edges == index of
+                // Counter of riverwall edges == index of
                 // riverwall_elevation + riverwall_rowIndex
-                RiverWall_count += 1;
+                RiverWall_count = riverwall_index[ki] + 1;
 
                 // Set central bed to riverwall elevation
                 z_half = max(D->riverwall_elevation[RiverWall_count-1], z_half) ;
@@ -971,6 +1040,7 @@ double _compute_fluxes_central(struct domain *D, double timestep){
 
             D->pressuregrad_work[ki] = bedslope_work;
 
+            // Flag the update for _compute_flux_update_levels
             D->already_computed_flux[ki] = call; // #k Done
 
             // Update neighbour n with same flux but reversed sign
@@ -1006,11 +1076,11 @@ double _compute_fluxes_central(struct domain *D, double timestep){
                         // Apply CFL condition for triangles joining this edge (triangle k and triangle n)
 
                         // CFL for triangle k
-                        local_timestep = min(local_timestep, D->edge_timestep[ki]);
+                        min_timestep = min(min_timestep, D->edge_timestep[ki]);
 
                         if (n >= 0) {
                             // Apply CFL condition for neigbour n (which is on the ith edge of triangle k)
-                            local_timestep = min(local_timestep, D->edge_timestep[nm]);
+                            min_timestep = min(min_timestep, D->edge_timestep[nm]);
                         }
                     }
                 }
@@ -1023,6 +1093,8 @@ double _compute_fluxes_central(struct domain *D, double timestep){
 
     } // End triangle k
 
+    local_timestep = min_timestep;
+
     //// Limit edgefluxes, for mass conservation near wet/dry cells
     //// This doesn't seem to be needed anymore
     //for(k=0; k< number_of_elements; k++){
@@ -1078,8 +1150,10 @@ double _compute_fluxes_central(struct domain *D, double timestep){
     // }
 
     // Now add up stage, xmom, ymom explicit updates
+    boundary_flux = 0.0;
+    #pragma omp parallel for private(i, ki, ki2, ki3, n, inv_area) \
+            reduction(+:boundary_flux)
     for(k=0; k < D->number_of_elements; k++){
-        hc = max(D->stage_centroid_values[k] - D->bed_centroid_values[k],0.);
 
         for(i=0;i<3;i++){
             // FIXME: Make use of neighbours to efficiently set things
@@ -1098,7 +1172,7 @@ double _compute_fluxes_central(struct domain *D, double timestep){
             if( (n<0 & D->tri_full_flag[k]==1) | ( n>=0 && (D->tri_full_flag[k]==1 & D->tri_full_flag[n]==0)) ){
                 // boundary_flux_sum is an array with length = timestep_fluxcalls
                 // For each sub-step, we put the boundary flux sum in.
-                D->boundary_flux_sum[substep_count] += D->edge_flux_work[ki3];
+                boundary_flux += D->edge_flux_work[ki3];
             }
 
             D->xmom_explicit_update[k] -= D->normals[ki2]*D->pressuregrad_work[ki];
@@ -1116,6 +1190,8 @@ double _compute_fluxes_central(struct domain *D, double timestep){
 
     }  // end cell k
 
+    D->boundary_flux_sum[substep_count] += boundary_flux;
+
     // Ensure we only update the timestep on the first call within each rk2/rk3 step
     if(substep_count == 0) timestep=local_timestep;
 
@@ -1185,8 +1261,29 @@ double  _protect(int N,
   return mass_error;
 }
 
+// Decide whether cell k is skipped in one pass of a split computation.
+//
+// For parallel domains the protection and extrapolation are split into
+// two passes so that the cells away from the ghost cells can be
+// computed while the ghost values are being communicated. Stage `level'
+// of the computation for cell k only depends on cells within distance
+// `level' of k, so it can be done in the first pass if
+// ghost_distance[k] >= level. The remaining cells are done in the
+// second pass, once the ghost values have been received.
+//
+// pass == 0 (or ghost_distance == NULL) means all cells in one pass.
+int _skip_cell(long *ghost_distance, int pass, int k, int level) {
+  if (pass == 0 || ghost_distance == NULL) return 0;
+  if (pass == 1) return (ghost_distance[k] < level);
+  return (ghost_distance[k] >= level);
+}
+
 // Protect against the water elevation falling below the triangle bed
 double  _protect_new(struct domain *D) {
+  return _protect_new_partial(D, NULL, 0);
+}
+
+double  _protect_new_partial(struct domain *D, long *ghost_distance, int pass) {
 
   int k;
   double hc, bmin, bmax;
@@ -1223,7 +1320,10 @@ double  _protect_new(struct domain *D) {
 
   // Protect against inifintesimal and negative heights
   //if (maximum_allowed_speed < epsilon) {
+    #pragma omp parallel for private(hc, bmin) reduction(+:mass_error)
     for (k=0; k<D->number_of_elements; k++) {
+      if (_skip_cell(ghost_distance, pass, k, 1)) continue;
+
       hc = wc[k] - zc[k];
       if (hc < minimum_allowed_height*1.0 ){
             // Set momentum to zero and ensure h is non negative
@@ -1236,7 +1336,7 @@ double  _protect_new(struct domain *D) {
              // WARNING: ADDING MASS if wc[k]<bmin
              if(wc[k] < bmin){
                  mass_error += (bmin-wc[k])*areas[k];
-                 mass_added = 1; //Flag to warn of added mass
+                 //mass_added = 1; //Flag to warn of added mass
 
                  wc[k] = bmin;
 
@@ -1354,6 +1454,12 @@ int limit_gradient(double *dqv, double qmin, double qmax, double beta_w){
 //                                 double* y_centroid_work,
 //                                 long* update_extrapolation) {
 int _extrapolate_second_order_edge_sw(struct domain *D){
+  return _extrapolate_second_order_edge_sw_partial(D, NULL, 0);
+}
+
+int _extrapolate_second_order_edge_sw_partial(struct domain *D,
+                                              long *ghost_distance,
+                                              int pass){
 
   // Local variables
   double a, b; // Gradient vector used to calculate edge values from centroids
@@ -1363,10 +1469,13 @@ int _extrapolate_second_order_edge_sw(struct domain *D){
   double dqv[3], qmin, qmax, hmin, hmax, bedmax,bedmin, stagemin;
   double hc, h0, h1, h2, beta_tmp, hfactor, xtmp, ytmp, weight, tmp;
   double dk, dk_inv,dv0, dv1, dv2, de[3], demin, dcmax, r0scale, vel_norm, l1, l2, a_tmp, b_tmp, c_tmp,d_tmp;
+  int missing_neighbours = 0;
 
 
-  memset((char*) D->x_centroid_work, 0, D->number_of_elements * sizeof (double));
-  memset((char*) D->y_centroid_work, 0, D->number_of_elements * sizeof (double));
+  if (pass != 2) {
+    memset((char*) D->x_centroid_work, 0, D->number_of_elements * sizeof (double));
+    memset((char*) D->y_centroid_work, 0, D->number_of_elements * sizeof (double));
+  }
 
   // Parameters used to control how the limiter is forced to first-order near
   // wet-dry regions
@@ -1379,7 +1488,9 @@ int _extrapolate_second_order_edge_sw(struct domain *D){
 
       // Replace momentum centroid with velocity centroid to allow velocity
       // extrapolation This will be changed back at the end of the routine
+      #pragma omp parallel for private(dk, dk_inv)
       for (k=0; k< D->number_of_elements; k++){
+          if (_skip_cell(ghost_distance, pass, k, 1)) continue;
 
           D->height_centroid_values[k] = max(D->stage_centroid_values[k] - D->bed_centroid_values[k], 0.);
 
@@ -1405,7 +1516,9 @@ int _extrapolate_second_order_edge_sw(struct domain *D){
   // condition) set its momentum to zero too. This prevents 'pits' of
   // of water being trapped and unable to lose momentum, which can occur in
   // some situations
+  #pragma omp parallel for private(k0, k1, k2, k3)
   for (k=0; k< D->number_of_elements;k++){
+      if (_skip_cell(ghost_distance, pass, k, 2)) continue;
 
       k3=k*3;
       k0 = D->surrogate_neighbours[k3];
@@ -1427,8 +1540,20 @@ int _extrapolate_second_order_edge_sw(struct domain *D){
   }
 
   // Begin extrapolation routine
+  //
+  // Each triangle only writes its own edge and vertex values, so the
+  // triangles can be extrapolated in parallel
+  #pragma omp parallel for private(a, b, k0, k1, k2, k3, k6, coord_index, i, \
+          ii, ktmp, k_wetdry, x, y, x0, y0, x1, y1, x2, y2, xv0, yv0, xv1, yv1, \
+          xv2, yv2, dx1, dx2, dy1, dy2, dxv0, dxv1, dxv2, dyv0, dyv1, dyv2, \
+          dq0, dq1, dq2, area2, inv_area2, dpth, momnorm, dqv, qmin, qmax, \
+          hmin, hmax, bedmax, bedmin, stagemin, hc, h0, h1, h2, beta_tmp, \
+          hfactor, xtmp, ytmp, weight, tmp, dk, dk_inv, dv0, dv1, dv2, de, \
+          demin, dcmax, r0scale, vel_norm, l1, l2) \
+          reduction(+:missing_neighbours)
   for (k = 0; k < D->number_of_elements; k++)
   {
+    if (_skip_cell(ghost_distance, pass, k, 3)) continue;
 
     // Don't update the extrapolation if the flux will not be computed on the
     // next timestep
@@ -1806,9 +1931,10 @@ int _extrapolate_second_order_edge_sw(struct domain *D){
 
       if ((k2 == k3 + 3))
       {
-        // If we didn't find an internal neighbour
-        report_python_error(AT, "Internal neighbour not found");
-        return -1;
+        // If we didn't find an internal neighbour (reported after the loop,
+        // as we can't leave a parallel loop early)
+        missing_neighbours += 1;
+        continue;
       }
 
       k1 = D->surrogate_neighbours[k2];
@@ -1984,9 +2110,17 @@ int _extrapolate_second_order_edge_sw(struct domain *D){
     } // else [number_of_boundaries==2]
   } // for k=0 to number_of_elements-1
 
+  if (missing_neighbours > 0) {
+    report_python_error(AT, "Internal neighbour not found");
+    return -1;
+  }
+
 
   // Compute vertex values of quantities
+  #pragma omp parallel for private(k3, i, dk)
   for (k=0; k< D->number_of_elements; k++){
+      if (_skip_cell(ghost_distance, pass, k, 4)) continue;
+
       if(D->extrapolate_velocity_second_order==1){
           //Convert velocity back to momenta at centroids
           D->xmom_centroid_values[k] = D->x_centroid_work[k];
@@ -2065,7 +2199,7 @@ PyObject *swde1_compute_fluxes_ext_central(PyObject *self, PyObject *args) {
     is converted to a timestep that must not be exceeded. The minimum of
     those is computed as the next overall timestep.
   */
-  struct domain D;
+  struct domain D_data, *D;
   PyObject *domain;
 
 
@@ -2076,9 +2210,12 @@ PyObject *swde1_compute_fluxes_ext_central(PyObject *self, PyObject *args) {
       return NULL;
   }
 
-  get_python_domain(&D,domain);
+  D = get_domain(domain, &D_data);
+  if (D == NULL) {
+      return NULL;
+  }
 
-  timestep=_compute_fluxes_central(&D,timestep);
+  timestep=_compute_fluxes_central(D,timestep);
 
   // Return updated flux timestep
   return Py_BuildValue("d", timestep);
@@ -2214,7 +2351,38 @@ PyObject *swde1_compute_flux_update_frequency(PyObject *self, PyObject *args) {
 
   */
 
-  struct domain D;
+  struct domain D_data, *D;
+  PyObject *domain;
+
+
+  double timestep;
+
+  if (!PyArg_ParseTuple(args, "Od", &domain, &timestep)) {
+      report_python_error(AT, "could not parse input arguments");
+      return NULL;
+  }
+
+  D = get_domain(domain, &D_data);
+  if (D == NULL) {
+      return NULL;
+  }
+
+  _compute_flux_update_frequency(D, timestep);
+
+  // Return
+  return Py_BuildValue("");
+}
+
+
+PyObject *swde1_compute_flux_update_levels(PyObject *self, PyObject *args) {
+  /*
+
+    Compute the flux_update_frequency level of each triangle, without
+    setting the update flags (see update_flux_update_flags)
+
+  */
+
+  struct domain D_data, *D;
   PyObject *domain;
 
 
@@ -2225,9 +2393,40 @@ PyObject *swde1_compute_flux_update_frequency(PyObject *self, PyObject *args) {
       return NULL;
   }
 
-  get_python_domain(&D,domain);
+  D = get_domain(domain, &D_data);
+  if (D == NULL) {
+      return NULL;
+  }
 
-  _compute_flux_update_frequency(&D, timestep);
+  _compute_flux_update_levels(D, timestep);
+
+  // Return
+  return Py_BuildValue("");
+}
+
+
+PyObject *swde1_update_flux_update_flags(PyObject *self, PyObject *args) {
+  /*
+
+    Set update_next_flux and update_extrapolation from the
+    flux_update_frequency levels
+
+  */
+
+  struct domain D_data, *D;
+  PyObject *domain;
+
+  if (!PyArg_ParseTuple(args, "O", &domain)) {
+      report_python_error(AT, "could not parse input arguments");
+      return NULL;
+  }
+
+  D = get_domain(domain, &D_data);
+  if (D == NULL) {
+      return NULL;
+  }
+
+  _update_flux_update_flags(D);
 
   // Return
   return Py_BuildValue("");
@@ -2245,7 +2444,7 @@ PyObject *swde1_extrapolate_second_order_edge_sw(PyObject *self, PyObject *args)
 
   */
 
-  struct domain D;
+  struct domain D_data, *D;
   PyObject *domain;
 
   int e;
@@ -2255,11 +2454,14 @@ PyObject *swde1_extrapolate_second_order_edge_sw(PyObject *self, PyObject *args)
       return NULL;
   }
 
-  get_python_domain(&D, domain);
+  D = get_domain(domain, &D_data);
+  if (D == NULL) {
+      return NULL;
+  }
 
   // Call underlying flux computation routine and update
   // the explicit update arrays
-  e = _extrapolate_second_order_edge_sw(&D);
+  e = _extrapolate_second_order_edge_sw(D);
 
   if (e == -1) {
     // Use error string set inside computational routine
@@ -2271,6 +2473,47 @@ PyObject *swde1_extrapolate_second_order_edge_sw(PyObject *self, PyObject *args)
 
 }// extrapolate_second-order_edge_sw
 
+PyObject *swde1_extrapolate_second_order_edge_sw_partial(PyObject *self, PyObject *args) {
+  /*Compute the edge values in one pass of a split extrapolation
+
+    extrapolate_second_order_edge_sw_partial(domain, ghost_distance, pass)
+
+    pass 1 computes the cells which do not depend on ghost cells,
+    pass 2 the remaining cells. ghost_distance holds the distance of
+    each cell from the nearest ghost cell (capped at 4).
+  */
+
+  struct domain D_data, *D;
+  PyObject *domain;
+  PyArrayObject *ghost_distance;
+
+  int e, pass;
+
+  if (!PyArg_ParseTuple(args, "OOi", &domain, &ghost_distance, &pass)) {
+      report_python_error(AT, "could not parse input arguments");
+      return NULL;
+  }
+
+  CHECK_C_CONTIG(ghost_distance);
+
+  D = get_domain(domain, &D_data);
+  if (D == NULL) {
+      return NULL;
+  }
+
+  e = _extrapolate_second_order_edge_sw_partial(D,
+                                 (long*) ghost_distance->data, pass);
+
+  if (e == -1) {
+    // Use error string set inside computational routine
+    return NULL;
+  }
+
+
+  return Py_BuildValue("");
+
+}// extrapolate_second_order_edge_sw_partial
+
 //========================================================================
 // Protect -- to prevent the water level from falling below the minimum
 // bed_edge_value
@@ -2335,7 +2578,7 @@ PyObject *swde1_protect_new(PyObject *self, PyObject *args) {
   //
   //    protect(minimum_allowed_height, maximum_allowed_speed, wc, zc, xmomc, ymomc)
 
-	struct domain D;
+	struct domain D_data, *D;
 	PyObject *domain;
 
 	double mass_error;
@@ -2346,9 +2589,45 @@ PyObject *swde1_protect_new(PyObject *self, PyObject *args) {
 		return NULL;
 	}
 
-	get_python_domain(&D, domain);
+	D = get_domain(domain, &D_data);
+	if (D == NULL) {
+		return NULL;
+	}
 
-	mass_error = _protect_new(&D);
+	mass_error = _protect_new(D);
+
+	return Py_BuildValue("d", mass_error);
+}
+
+
+PyObject *swde1_protect_new_partial(PyObject *self, PyObject *args) {
+  //
+  //    protect_new_partial(domain, ghost_distance, pass)
+  //
+  // One pass of a split protection step, see
+  // extrapolate_second_order_edge_sw_partial
+
+	struct domain D_data, *D;
+	PyObject *domain;
+	PyArrayObject *ghost_distance;
+
+	double mass_error;
+	int pass;
+
+	// Convert Python arguments to C
+	if (!PyArg_ParseTuple(args, "OOi", &domain, &ghost_distance, &pass)) {
+		report_python_error(AT, "could not parse input arguments");
+		return NULL;
+	}
+
+	CHECK_C_CONTIG(ghost_distance);
+
+	D = get_domain(domain, &D_data);
+	if (D == NULL) {
+		return NULL;
+	}
+
+	mass_error = _protect_new_partial(D, (long*) ghost_distance->data, pass);
 
 	return Py_BuildValue("d", mass_error);
 }
@@ -2370,7 +2649,7 @@ PyObject *swde1_evolve_one_euler_step(PyObject *self, PyObject *args) {
   PyObject* arglist;
   PyObject* result;
 
-  struct domain D;
+  struct domain D_data, *D;
 
   double yieldstep;
   double finaltime;
@@ -2386,7 +2665,10 @@ PyObject *swde1_evolve_one_euler_step(PyObject *self, PyObject *args) {
   }
 
 
-  get_python_domain(&D, domain);
+  D = get_domain(domain, &D_data);
+  if (D == NULL) {
+      return NULL;
+  }
 
   //printf("In C_evolve %f %f \n", yieldstep, finaltime);
 
@@ -2399,9 +2681,9 @@ PyObject *swde1_evolve_one_euler_step(PyObject *self, PyObject *args) {
 //  }
 //  Py_DECREF(result);
 
-  mass_error = _protect_new(&D);
+  mass_error = _protect_new(D);
 
-  e = _extrapolate_second_order_edge_sw(&D);
+  e = _extrapolate_second_order_edge_sw(D);
   if (e == -1) {
     // Use error string set inside computational routine
     return NULL;
@@ -2427,7 +2709,7 @@ PyObject *swde1_evolve_one_euler_step(PyObject *self, PyObject *args) {
 //  Py_DECREF(result);
 
 
-  flux_timestep =_compute_fluxes_central(&D, D.evolve_max_timestep);
+  flux_timestep =_compute_fluxes_central(D, D->evolve_max_timestep);
 
 
   result = PyFloat_FromDouble(flux_timestep);
@@ -2480,6 +2762,689 @@ PyObject *swde1_evolve_one_euler_step(PyObject *self, PyObject *args) {
 
 }// swde1_evolve_one_euler_step
 
+//========================================================================
+// swde1_evolve_to_yieldtime
+//========================================================================
+
+// State of the time stepping loop and the arrays it needs besides
+// those in struct domain
+struct stepper {
+    PyObject *domain;
+
+    int order;                   // 1 euler, 2 rk2, 3 rk3
+    int has_finaltime;
+    double finaltime;
+    double yieldtime;
+    double epsilon;
+
+    double time;
+    double timestep;
+    double flux_timestep;
+
+    double CFL;
+    double evolve_min_timestep;
+    double recorded_min_timestep;
+    double recorded_max_timestep;
+    long smallsteps;
+    long max_smallsteps;
+    long order_;
+    long default_order;
+    long number_of_steps;
+    long number_of_first_order_steps;
+
+    long using_discontinuous_elevation;
+    long native_friction;
+    long use_sloped_mannings;
+    long apply_fractional_steps;
+    long update_extrema;
+
+    double *stage_backup_values;
+    double *xmom_backup_values;
+    double *ymom_backup_values;
+    double *stage_semi_implicit_update;
+    double *xmom_semi_implicit_update;
+    double *ymom_semi_implicit_update;
+    double *friction_centroid_values;
+
+    double *height_boundary_values;
+    double *xvel_edge_values;
+    double *yvel_edge_values;
+    double *xvel_boundary_values;
+    double *yvel_boundary_values;
+
+    long *boundary_cells;
+    long *boundary_edges;
+
+    long number_of_reflective_ids;
+    long *reflective_ids;
+    PyObject *boundary_callbacks;
+};
+
+
+int _set_python_double(PyObject *O, char *name, double x) {
+    PyObject *value;
+    int err;
+
+    value = PyFloat_FromDouble(x);
+    if (value == NULL) return -1;
+    err = PyObject_SetAttrString(O, name, value);
+    Py_DECREF(value);
+
+    return err;
+}
+
+
+int _set_python_integer(PyObject *O, char *name, long x) {
+    PyObject *value;
+    int err;
+
+    value = PyInt_FromLong(x);
+    if (value == NULL) return -1;
+    err = PyObject_SetAttrString(O, name, value);
+    Py_DECREF(value);
+
+    return err;
+}
+
+
+int _sync_time(struct stepper *S) {
+    // Make time and timesteps visible to python callbacks
+
+    if (_set_python_double(S->domain, "time", S->time) == -1) return -1;
+    if (_set_python_double(S->domain, "timestep", S->timestep) == -1) return -1;
+    if (_set_python_double(S->domain, "flux_timestep", S->flux_timestep) == -1) return -1;
+
+    return 0;
+}
+
+
+int _write_back(struct stepper *S) {
+    // Store the state of the loop in the python domain
+
+    if (_sync_time(S) == -1) return -1;
+    if (_set_python_double(S->domain, "recorded_min_timestep", S->recorded_min_timestep) == -1) return -1;
+    if (_set_python_double(S->domain, "recorded_max_timestep", S->recorded_max_timestep) == -1) return -1;
+    if (_set_python_integer(S->domain, "smallsteps", S->smallsteps) == -1) return -1;
+    if (_set_python_integer(S->domain, "_order_", S->order_) == -1) return -1;
+    if (_set_python_integer(S->domain, "number_of_steps", S->number_of_steps) == -1) return -1;
+    if (_set_python_integer(S->domain, "number_of_first_order_steps", S->number_of_first_order_steps) == -1) return -1;
+
+    return 0;
+}
+
+
+int _call_python_method(struct stepper *S, char *name) {
+    PyObject *result;
+
+    if (_sync_time(S) == -1) return -1;
+
+    result = PyObject_CallMethod(S->domain, name, NULL);
+    if (result == NULL) return -1;
+    Py_DECREF(result);
+
+    return 0;
+}
+
+
+int _update_boundary(struct domain *D, struct stepper *S) {
+    // Reflective boundaries natively, all others through their
+    // evaluate_segment method
+
+    long i, j, k, e, ke;
+    double n1, n2, q1, q2, r1, r2;
+    PyObject *item, *result;
+    Py_ssize_t m;
+
+    for (j = 0; j < S->number_of_reflective_ids; j++) {
+        i = S->reflective_ids[j];
+        k = S->boundary_cells[i];
+        e = S->boundary_edges[i];
+        ke = 3*k + e;
+
+        n1 = D->normals[6*k + 2*e];
+        n2 = D->normals[6*k + 2*e + 1];
+
+        D->stage_boundary_values[i] = D->stage_edge_values[ke];
+        D->bed_boundary_values[i] = D->bed_edge_values[ke];
+        S->height_boundary_values[i] = D->height_edge_values[ke];
+
+        // Rotate and negate momentum
+        q1 = D->xmom_edge_values[ke];
+        q2 = D->ymom_edge_values[ke];
+
+        r1 = -q1*n1 - q2*n2;
+        r2 = -q1*n2 + q2*n1;
+
+        D->xmom_boundary_values[i] = n1*r1 - n2*r2;
+        D->ymom_boundary_values[i] = n2*r1 + n1*r2;
+
+        // Rotate and negate velocity
+        q1 = S->xvel_edge_values[ke];
+        q2 = S->yvel_edge_values[ke];
+
+        r1 = q1*n1 + q2*n2;
+        r2 = q1*n2 - q2*n1;
+
+        S->xvel_boundary_values[i] = n1*r1 - n2*r2;
+        S->yvel_boundary_values[i] = n2*r1 + n1*r2;
+    }
+
+    m = PyList_Size(S->boundary_callbacks);
+    if (m > 0 && _sync_time(S) == -1) return -1;
+
+    for (j = 0; j < m; j++) {
+        // (boundary, segment_edges)
+        item = PyList_GetItem(S->boundary_callbacks, j); // Borrowed
+        result = PyObject_CallMethod(PyTuple_GetItem(item, 0), "evaluate_segment",
+                                     "OO", S->domain, PyTuple_GetItem(item, 1));
+        if (result == NULL) return -1;
+        Py_DECREF(result);
+    }
+
+    return 0;
+}
+
+
+int _compute_forcing_terms(struct domain *D, struct stepper *S) {
+    // Manning friction natively, otherwise the python forcing terms
+
+    if (S->native_friction) {
+        if (S->use_sloped_mannings) {
+            _manning_friction_sloped(D->g, D->minimum_allowed_height, D->number_of_elements,
+                    D->vertex_coordinates, D->stage_centroid_values, D->bed_vertex_values,
+                    D->xmom_centroid_values, D->ymom_centroid_values,
+                    S->friction_centroid_values,
+                    S->xmom_semi_implicit_update, S->ymom_semi_implicit_update);
+        } else {
+            _manning_friction_flat(D->g, D->minimum_allowed_height, D->number_of_elements,
+                    D->stage_centroid_values, D->bed_vertex_values,
+                    D->xmom_centroid_values, D->ymom_centroid_values,
+                    S->friction_centroid_values,
+                    S->xmom_semi_implicit_update, S->ymom_semi_implicit_update);
+        }
+        return 0;
+    }
+
+    if (_call_python_method(S, "compute_forcing_terms") == -1) return -1;
+
+    // Forcing terms may reduce the flux timestep
+    S->flux_timestep = get_python_double(S->domain, "flux_timestep");
+    if (PyErr_Occurred()) return -1;
+
+    return 0;
+}
+
+
+int _log_critical(PyObject *message) {
+    // Call anuga.utilities.log.critical(message)
+
+    PyObject *log, *result;
+
+    log = PyImport_ImportModule("anuga.utilities.log");
+    if (log == NULL) return -1;
+
+    result = PyObject_CallMethod(log, "critical", "O", message);
+    Py_DECREF(log);
+    if (result == NULL) return -1;
+    Py_DECREF(result);
+
+    return 0;
+}
+
+
+void _report_too_small_timestep(struct stepper *S, char *msg) {
+    // Log the message and the timestepping statistics and raise msg,
+    // see Generic_Domain.update_timestep
+
+    PyObject *message, *stats;
+
+    message = PyString_FromString(msg);
+    if (message == NULL) return;
+
+    if (_log_critical(message) == 0 && _write_back(S) == 0) {
+        stats = PyObject_CallMethod(S->domain, "timestepping_statistics",
+                                    "O", Py_True);
+        if (stats != NULL) {
+            if (_log_critical(stats) == 0) {
+                PyErr_SetObject(PyExc_Exception, message);
+            }
+            Py_DECREF(stats);
+        }
+    }
+
+    Py_DECREF(message);
+}
+
+
+int _update_timestep(struct domain *D, struct stepper *S) {
+    // See Generic_Domain.update_timestep
+
+    char msg[200];
+    double timestep;
+
+    timestep = fmin(S->CFL*S->flux_timestep, D->evolve_max_timestep);
+
+    S->recorded_max_timestep = fmax(timestep, S->recorded_max_timestep);
+    S->recorded_min_timestep = fmin(timestep, S->recorded_min_timestep);
+
+    if (timestep < S->evolve_min_timestep) {
+        S->smallsteps += 1;
+
+        if (S->smallsteps > S->max_smallsteps) {
+            S->smallsteps = 0;
+
+            if (S->order_ == 1) {
+                snprintf(msg, 200, "WARNING: Too small timestep %.16f reached "
+                         "even after %ld steps of 1 order scheme",
+                         timestep, S->max_smallsteps);
+                _report_too_small_timestep(S, msg);
+                return -1;
+            } else {
+                S->order_ = 1;
+            }
+        }
+    } else {
+        S->smallsteps = 0;
+        if (S->order_ == 1 && S->default_order == 2) {
+            S->order_ = 2;
+        }
+    }
+
+    // Ensure that final time is not exceeded
+    if (S->has_finaltime && S->time + timestep > S->finaltime) {
+        timestep = S->finaltime - S->time;
+    }
+
+    // Ensure that model time is aligned with yieldsteps
+    if (S->time + timestep > S->yieldtime) {
+        timestep = S->yieldtime - S->time;
+    }
+
+    S->timestep = timestep;
+
+    return 0;
+}
+
+
+int _update_conserved_quantities(struct domain *D, struct stepper *S) {
+    // See Domain.update_conserved_quantities
+
+    long k, N, negative;
+
+    N = D->number_of_elements;
+
+    // See _update in quantity_update.h
+    if (_update(N, S->timestep, D->stage_centroid_values,
+            D->stage_explicit_update, S->stage_semi_implicit_update) != 0 ||
+        _update(N, S->timestep, D->xmom_centroid_values,
+            D->xmom_explicit_update, S->xmom_semi_implicit_update) != 0 ||
+        _update(N, S->timestep, D->ymom_centroid_values,
+            D->ymom_explicit_update, S->ymom_semi_implicit_update) != 0) {
+        PyErr_SetString(PyExc_RuntimeError,
+            "quantity_ext.c: update, division by zero in semi implicit update - call Stephen :)");
+        return -1;
+    }
+
+    if (S->using_discontinuous_elevation) {
+        negative = 0;
+        for (k = 0; k < N; k++) {
+            if (D->stage_centroid_values[k] - D->bed_centroid_values[k] < 0.0 &&
+                D->tri_full_flag[k] > 0) {
+                D->stage_centroid_values[k] = D->bed_centroid_values[k];
+                D->xmom_centroid_values[k] = 0.0;
+                D->ymom_centroid_values[k] = 0.0;
+                negative = 1;
+            }
+        }
+
+        if (negative) {
+            if (PyErr_WarnEx(PyExc_UserWarning,
+                    "Negative cells being set to zero depth, possible loss of conservation. \n"
+                    "Consider using domain.report_water_volume_statistics() to check the extent of the problem", 1) == -1) {
+                return -1;
+            }
+        }
+    }
+
+    return 0;
+}
+
+
+void _backup_conserved_quantities(struct domain *D, struct stepper *S) {
+
+    long N = D->number_of_elements;
+
+    memcpy(S->stage_backup_values, D->stage_centroid_values, N*sizeof(double));
+    memcpy(S->xmom_backup_values, D->xmom_centroid_values, N*sizeof(double));
+    memcpy(S->ymom_backup_values, D->ymom_centroid_values, N*sizeof(double));
+}
+
+
+void _saxpy_conserved_quantities(struct domain *D, struct stepper *S, double a, double b) {
+
+    long k, N = D->number_of_elements;
+
+    for (k = 0; k < N; k++) {
+        D->stage_centroid_values[k] = a*D->stage_centroid_values[k] + b*S->stage_backup_values[k];
+        D->xmom_centroid_values[k] = a*D->xmom_centroid_values[k] + b*S->xmom_backup_values[k];
+        D->ymom_centroid_values[k] = a*D->ymom_centroid_values[k] + b*S->ymom_backup_values[k];
+    }
+}
+
+
+int _distribute_to_vertices_and_edges(struct domain *D) {
+
+    _protect_new(D);
+
+    return _extrapolate_second_order_edge_sw(D);
+}
+
+
+int _euler_substep(struct domain *D, struct stepper *S, int first) {
+    // Fluxes, forcing terms and update of the conserved quantities,
+    // assuming edge and boundary values are up to date. The timestep
+    // is only computed on the first substep of a step.
+
+    S->flux_timestep = _compute_fluxes_central(D, D->evolve_max_timestep);
+
+    if (_compute_forcing_terms(D, S) == -1) return -1;
+
+    if (first) {
+        if (_update_timestep(D, S) == -1) return -1;
+
+        if (S->order == 1 && D->max_flux_update_frequency != 1) {
+            _compute_flux_update_frequency(D, S->timestep);
+        }
+    }
+
+    return _update_conserved_quantities(D, S);
+}
+
+
+int _prepare_substep(struct domain *D, struct stepper *S) {
+
+    if (_distribute_to_vertices_and_edges(D) == -1) return -1;
+
+    return _update_boundary(D, S);
+}
+
+
+int _evolve_one_step(struct domain *D, struct stepper *S) {
+    // One euler, rk2 or rk3 step, see Generic_Domain.evolve_one_*_step
+
+    long k, N = D->number_of_elements;
+    double initial_time = S->time;
+
+    if (S->order > 1) _backup_conserved_quantities(D, S);
+
+    if (_prepare_substep(D, S) == -1) return -1;
+    if (_euler_substep(D, S, 1) == -1) return -1;
+
+    if (S->order == 1) return 0;
+
+    // Second euler step
+    S->time = initial_time + S->timestep;
+
+    if (_prepare_substep(D, S) == -1) return -1;
+    if (_euler_substep(D, S, 0) == -1) return -1;
+
+    if (S->order == 2) {
+        _saxpy_conserved_quantities(D, S, 0.5, 0.5);
+
+        if (D->max_flux_update_frequency != 1) {
+            _compute_flux_update_frequency(D, S->timestep);
+        }
+
+        return 0;
+    }
+
+    // Intermediate solution at time t^n + 0.5 h and third euler step
+    _saxpy_conserved_quantities(D, S, 0.25, 0.75);
+
+    S->time = initial_time + S->timestep*0.5;
+
+    if (_prepare_substep(D, S) == -1) return -1;
+    if (_euler_substep(D, S, 0) == -1) return -1;
+
+    _saxpy_conserved_quantities(D, S, 2.0, 1.0);
+    for (k = 0; k < N; k++) {
+        D->stage_centroid_values[k] = D->stage_centroid_values[k]/3.0;
+        D->xmom_centroid_values[k] = D->xmom_centroid_values[k]/3.0;
+        D->ymom_centroid_values[k] = D->ymom_centroid_values[k]/3.0;
+    }
+
+    S->time = initial_time + S->timestep;
+
+    return 0;
+}
+
+
+int _evolve_to_yieldtime(struct domain *D, struct stepper *S) {
+    // Take timesteps until the next yield time or the final time,
+    // see Generic_Domain.evolve
+
+    double initial_time;
+
+    while (1) {
+        initial_time = S->time;
+
+        if (_evolve_one_step(D, S) == -1) return -1;
+
+        // As in Generic_Domain.evolve_one_step the operators see the
+        // time the step left: t for euler, t + h for rk2 and rk3
+        if (S->apply_fractional_steps) {
+            if (_call_python_method(S, "apply_fractional_steps") == -1) return -1;
+        }
+
+        S->time = initial_time + S->timestep;
+
+        if (S->update_extrema) {
+            if (_call_python_method(S, "update_extrema") == -1) return -1;
+        }
+
+        S->number_of_steps += 1;
+        if (S->order_ == 1) S->number_of_first_order_steps += 1;
+
+        if (S->has_finaltime && S->time >= S->finaltime - S->epsilon) break;
+        if (S->time >= S->yieldtime) break;
+    }
+
+    return 0;
+}
+
+
+PyObject *swde1_evolve_to_yieldtime(PyObject *self, PyObject *args) {
+  /*
+   * Take the euler, rk2 or rk3 steps of a DE domain up to its next
+   * yield time (or the final time) in C
+   *
+   * evolve_to_yieldtime(domain, handle, order, finaltime, epsilon,
+   *                     reflective_ids, boundary_callbacks, native_friction)
+   *
+   * finaltime may be None. reflective_ids are the boundary
+   * ids with a Reflective_boundary, which is applied natively, and
+   * boundary_callbacks a list of (boundary, segment_edges) for the other
+   * boundaries. If native_friction is false the python forcing terms are
+   * called. Fractional step operators and update_extrema are called back
+   * into python if needed.
+   */
+
+  PyObject *domain, *handle, *quantities, *finaltime;
+  PyArrayObject *reflective_ids, *boundary_cells, *boundary_edges;
+  PyObject *boundary_callbacks, *operators, *monitored;
+
+  struct domain D_data, *D;
+  struct stepper S;
+
+  int order, e;
+  long native_friction;
+  double epsilon;
+
+  if (!PyArg_ParseTuple(args, "OOiOdOOl", &domain, &handle, &order,
+                        &finaltime, &epsilon, &reflective_ids,
+                        &boundary_callbacks, &native_friction)) {
+      report_python_error(AT, "could not parse input arguments");
+      return NULL;
+  }
+
+  CHECK_C_CONTIG(reflective_ids);
+
+  if (!PyList_Check(boundary_callbacks)) {
+      PyErr_SetString(PyExc_TypeError, "boundary_callbacks must be a list");
+      return NULL;
+  }
+
+  D = get_domain(handle, &D_data);
+  if (D == NULL) {
+      return NULL;
+  }
+
+  S.domain = domain;
+  S.order = order;
+  S.has_finaltime = finaltime != Py_None;
+  S.finaltime = S.has_finaltime ? PyFloat_AsDouble(finaltime) : 0.0;
+  S.epsilon = epsilon;
+  S.native_friction = native_friction;
+
+  S.yieldtime = get_python_double(domain, "yieldtime");
+  S.time = get_python_double(domain, "time");
+  S.timestep = get_python_double(domain, "timestep");
+  S.flux_timestep = get_python_double(domain, "flux_timestep");
+  S.CFL = get_python_double(domain, "CFL");
+  S.evolve_min_timestep = get_python_double(domain, "evolve_min_timestep");
+  S.recorded_min_timestep = get_python_double(domain, "recorded_min_timestep");
+  S.recorded_max_timestep = get_python_double(domain, "recorded_max_timestep");
+  S.smallsteps = get_python_integer(domain, "smallsteps");
+  S.max_smallsteps = get_python_integer(domain, "max_smallsteps");
+  S.order_ = get_python_integer(domain, "_order_");
+  S.default_order = get_python_integer(domain, "default_order");
+  S.number_of_steps = get_python_integer(domain, "number_of_steps");
+  S.number_of_first_order_steps = get_python_integer(domain, "number_of_first_order_steps");
+  S.using_discontinuous_elevation = get_python_integer(domain, "using_discontinuous_elevation");
+  S.use_sloped_mannings = get_python_integer(domain, "use_sloped_mannings");
+  if (PyErr_Occurred()) return NULL;
+
+  operators = get_python_object(domain, "fractional_step_operators");
+  if (operators == NULL) return NULL;
+  S.apply_fractional_steps = PyObject_Size(operators) > 0;
+  Py_DECREF(operators);
+
+  monitored = get_python_object(domain, "quantities_to_be_monitored");
+  if (monitored == NULL) return NULL;
+  S.update_extrema = monitored != Py_None;
+  Py_DECREF(monitored);
+
+  quantities = get_python_object(domain, "quantities");
+  if (quantities == NULL) return NULL;
+
+  S.stage_backup_values = get_python_array_data_from_dict(quantities, "stage", "centroid_backup_values");
+  S.xmom_backup_values = get_python_array_data_from_dict(quantities, "xmomentum", "centroid_backup_values");
+  S.ymom_backup_values = get_python_array_data_from_dict(quantities, "ymomentum", "centroid_backup_values");
+  S.stage_semi_implicit_update = get_python_array_data_from_dict(quantities, "stage", "semi_implicit_update");
+  S.xmom_semi_implicit_update = get_python_array_data_from_dict(quantities, "xmomentum", "semi_implicit_update");
+  S.ymom_semi_implicit_update = get_python_array_data_from_dict(quantities, "ymomentum", "semi_implicit_update");
+  S.friction_centroid_values = get_python_array_data_from_dict(quantities, "friction", "centroid_values");
+  S.height_boundary_values = get_python_array_data_from_dict(quantities, "height", "boundary_values");
+  S.xvel_edge_values = get_python_array_data_from_dict(quantities, "xvelocity", "edge_values");
+  S.yvel_edge_values = get_python_array_data_from_dict(quantities, "yvelocity", "edge_values");
+  S.xvel_boundary_values = get_python_array_data_from_dict(quantities, "xvelocity", "boundary_values");
+  S.yvel_boundary_values = get_python_array_data_from_dict(quantities, "yvelocity", "boundary_values");
+
+  Py_DECREF(quantities);
+  if (PyErr_Occurred()) return NULL;
+
+  boundary_cells = get_consecutive_array(domain, "boundary_cells");
+  boundary_edges = get_consecutive_array(domain, "boundary_edges");
+  if (boundary_cells == NULL || boundary_edges == NULL) return NULL;
+  S.boundary_cells = (long*) boundary_cells->data;
+  S.boundary_edges = (long*) boundary_edges->data;
+
+  S.number_of_reflective_ids = reflective_ids->dimensions[0];
+  S.reflective_ids = (long*) reflective_ids->data;
+  S.boundary_callbacks = boundary_callbacks;
+
+  e = _evolve_to_yieldtime(D, &S);
+
+  Py_DECREF(boundary_cells);
+  Py_DECREF(boundary_edges);
+
+  if (e == -1) {
+      // Keep the error of the failing step, but record how far we got
+      PyObject *type, *value, *traceback;
+      PyErr_Fetch(&type, &value, &traceback);
+      _write_back(&S);
+      PyErr_Restore(type, value, traceback);
+      return NULL;
+  }
+
+  if (_write_back(&S) == -1) return NULL;
+
+  Py_RETURN_NONE;
+}
+
+//========================================================================
+// Domain handle
+//========================================================================
+
+PyObject *swde1_domain_handle(PyObject *self, PyObject *args) {
+  /*
+   * Return a handle to the C struct of the domain, which can be passed
+   * to the kernels instead of the domain (see sw_domain.h)
+  */
+
+  PyObject *domain;
+
+  if (!PyArg_ParseTuple(args, "O", &domain)) {
+      report_python_error(AT, "could not parse input arguments");
+      return NULL;
+  }
+
+  return new_domain_handle(domain);
+}
+
+//========================================================================
+// OpenMP control
+//========================================================================
+
+PyObject *swde1_set_omp_num_threads(PyObject *self, PyObject *args) {
+  //
+  //    set_omp_num_threads(num_threads)
+  //
+  // Set the number of threads used by the kernels in this module. Has no
+  // effect if the module was built without OpenMP
+
+  int num_threads;
+
+  if (!PyArg_ParseTuple(args, "i", &num_threads)) {
+    report_python_error(AT, "could not parse input arguments");
+    return NULL;
+  }
+
+#if defined(_OPENMP)
+  omp_set_num_threads(num_threads);
+#endif
+
+  return Py_BuildValue("");
+}
+
+
+PyObject *swde1_get_omp_num_threads(PyObject *self, PyObject *args) {
+  //
+  //    num_threads = get_omp_num_threads()
+  //
+  // Number of threads the kernels in this module will use (1 if the
+  // module was built without OpenMP)
+
+  int num_threads = 1;
+
+#if defined(_OPENMP)
+  num_threads = omp_get_max_threads();
+#endif
+
+  return Py_BuildValue("i", num_threads);
+}
+
+
 //========================================================================
 // Method table for python module
 //========================================================================
@@ -2495,9 +3460,17 @@ static struct PyMethodDef MethodTable[] = {
   {"flux_function_central", swde1_flux_function_central, METH_VARARGS, "Print out"},
   {"extrapolate_second_order_edge_sw", swde1_extrapolate_second_order_edge_sw, METH_VARARGS, "Print out"},
   {"compute_flux_update_frequency", swde1_compute_flux_update_frequency, METH_VARARGS, "Print out"},
+  {"compute_flux_update_levels", swde1_compute_flux_update_levels, METH_VARARGS, "Print out"},
+  {"update_flux_update_flags", swde1_update_flux_update_flags, METH_VARARGS, "Print out"},
   {"protect",          swde1_protect, METH_VARARGS | METH_KEYWORDS, "Print out"},
   {"protect_new",      swde1_protect_new, METH_VARARGS | METH_KEYWORDS, "Print out"},
+  {"protect_new_partial", swde1_protect_new_partial, METH_VARARGS, "Print out"},
+  {"extrapolate_second_order_edge_sw_partial", swde1_extrapolate_second_order_edge_sw_partial, METH_VARARGS, "Print out"},
   {"evolve_one_euler_step", swde1_evolve_one_euler_step, METH_VARARGS | METH_KEYWORDS, "Print out"},
+  {"domain_handle",    swde1_domain_handle, METH_VARARGS, "Print out"},
+  {"evolve_to_yieldtime", swde1_evolve_to_yieldtime, METH_VARARGS, "Print out"},
+  {"set_omp_num_threads", swde1_set_omp_num_threads, METH_VARARGS, "Print out"},
+  {"get_omp_num_threads", swde1_get_omp_num_threads, METH_VARARGS, "Print out"},
   {NULL, NULL, 0, NULL}
 };
 
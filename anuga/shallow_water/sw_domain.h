@@ -440,3 +440,165 @@ int print_domain_struct(struct domain *D) {
 
     return 0;
 }
+
+
+//-------------------------------------------------------------------------
+// Domain handle
+//
+// The domain struct filled in once by get_python_domain together with
+// references to the arrays it points into. The kernels accept either the
+// python domain or a handle, so that the attribute lookups are done once
+// per yieldstep instead of on every call. A handle must be rebuilt if any
+// of the arrays are reallocated or the domain parameters change.
+//-------------------------------------------------------------------------
+
+#define DOMAIN_HANDLE_NAME "anuga.shallow_water.domain_handle"
+
+struct domain_handle {
+    struct domain D;
+    PyObject *arrays;
+};
+
+
+static char *domain_array_names[] = {
+    "neighbours", "surrogate_neighbours", "neighbour_edges", "normals",
+    "edgelengths", "radii", "areas", "edge_flux_type", "tri_full_flag",
+    "already_computed_flux", "vertex_coordinates", "edge_coordinates",
+    "centroid_coordinates", "max_speed", "number_of_boundaries",
+    "flux_update_frequency", "update_next_flux", "update_extrapolation",
+    "allow_timestep_increase", "edge_timestep", "edge_flux_work",
+    "pressuregrad_work", "x_centroid_work", "y_centroid_work",
+    "boundary_flux_sum", NULL};
+
+static char *quantity_names[] = {
+    "stage", "xmomentum", "ymomentum", "elevation", "height", NULL};
+
+static char *quantity_array_names[] = {
+    "edge_values", "centroid_values", "vertex_values", "boundary_values",
+    "explicit_update", NULL};
+
+static char *riverwall_array_names[] = {
+    "riverwall_elevation", "hydraulic_properties_rowIndex",
+    "hydraulic_properties", NULL};
+
+
+int append_python_attributes(PyObject *list, PyObject *O, char **names) {
+    // Append the attributes names of O to list
+    PyObject *A;
+    int i;
+
+    for (i = 0; names[i] != NULL; i++) {
+        A = PyObject_GetAttrString(O, names[i]); // New Reference
+        if (A == NULL) return -1;
+        if (PyList_Append(list, A) == -1) {
+            Py_DECREF(A);
+            return -1;
+        }
+        Py_DECREF(A);
+    }
+
+    return 0;
+}
+
+
+PyObject* get_python_domain_arrays(PyObject *domain) {
+    // Return a list of the arrays get_python_domain points into
+    PyObject *arrays, *quantities, *riverwallData, *Q;
+    int i, err;
+
+    arrays = PyList_New(0);
+    if (arrays == NULL) return NULL;
+
+    err = append_python_attributes(arrays, domain, domain_array_names);
+
+    quantities = PyObject_GetAttrString(domain, "quantities");
+    if (quantities == NULL) err = -1;
+    for (i = 0; err == 0 && quantity_names[i] != NULL; i++) {
+        Q = PyDict_GetItemString(quantities, quantity_names[i]); // Borrowed
+        if (Q == NULL) {
+            PyErr_SetString(PyExc_KeyError, quantity_names[i]);
+            err = -1;
+        } else {
+            err = append_python_attributes(arrays, Q, quantity_array_names);
+        }
+    }
+    Py_XDECREF(quantities);
+
+    if (err == 0) {
+        riverwallData = PyObject_GetAttrString(domain, "riverwallData");
+        if (riverwallData == NULL) {
+            err = -1;
+        } else {
+            err = append_python_attributes(arrays, riverwallData,
+                                           riverwall_array_names);
+            Py_DECREF(riverwallData);
+        }
+    }
+
+    if (err == -1) {
+        Py_DECREF(arrays);
+        return NULL;
+    }
+
+    return arrays;
+}
+
+
+void free_domain_handle(PyObject *capsule) {
+    struct domain_handle *H;
+
+    H = (struct domain_handle*) PyCapsule_GetPointer(capsule, DOMAIN_HANDLE_NAME);
+    if (H == NULL) return;
+
+    Py_XDECREF(H->arrays);
+    free(H);
+}
+
+
+PyObject* new_domain_handle(PyObject *domain) {
+    // Build a handle holding the domain struct of domain
+    struct domain_handle *H;
+    PyObject *capsule;
+
+    H = (struct domain_handle*) malloc(sizeof(struct domain_handle));
+    if (H == NULL) return PyErr_NoMemory();
+
+    H->arrays = get_python_domain_arrays(domain);
+    if (H->arrays == NULL) {
+        free(H);
+        return NULL;
+    }
+
+    get_python_domain(&(H->D), domain);
+    if (PyErr_Occurred()) {
+        Py_DECREF(H->arrays);
+        free(H);
+        return NULL;
+    }
+
+    capsule = PyCapsule_New((void*) H, DOMAIN_HANDLE_NAME, free_domain_handle);
+    if (capsule == NULL) {
+        Py_DECREF(H->arrays);
+        free(H);
+    }
+
+    return capsule;
+}
+
+
+struct domain* get_domain(PyObject *domain, struct domain *D) {
+    // Return the domain struct of a handle, or fill in D from a
+    // python domain
+    struct domain_handle *H;
+
+    if (PyCapsule_CheckExact(domain)) {
+        H = (struct domain_handle*) PyCapsule_GetPointer(domain, DOMAIN_HANDLE_NAME);
+        if (H == NULL) return NULL;
+        return &(H->D);
+    }
+
+    get_python_domain(D, domain);
+    if (PyErr_Occurred()) return NULL;
+
+    return D;
+}
@@ -103,7 +103,315 @@ class Test_DE1_domain(unittest.TestCase):
         assert num.all(vv<2.0e-02)
 
 
-            
+    def test_split_extrapolation(self):
+        """Protection and extrapolation done in two passes, as used to
+        overlap ghost communication in parallel, should agree with the
+        single pass versions
+        """
+
+        from anuga.shallow_water.swDE1_domain_ext import protect_new
+        from anuga.shallow_water.swDE1_domain_ext import protect_new_partial
+        from anuga.shallow_water.swDE1_domain_ext import \
+             extrapolate_second_order_edge_sw as extrapol2
+        from anuga.shallow_water.swDE1_domain_ext import \
+             extrapolate_second_order_edge_sw_partial as extrapol2_partial
+        from anuga.parallel.distribute_mesh import ghost_layer_distance
+
+        def create_domain():
+            domain = rectangular_cross_domain(10, 10)
+            domain.set_flow_algorithm('DE1')
+            domain.set_quantity('elevation', lambda x,y: -x/2.0 + 0.1*num.sin(10*y))
+            domain.set_quantity('stage', lambda x,y: -0.2 + 0.3*(x<0.3))
+            domain.set_quantity('xmomentum', lambda x,y: 0.1*y)
+            domain.set_quantity('ymomentum', lambda x,y: -0.05*x)
+            return domain
+
+        domain_full = create_domain()
+        domain_split = create_domain()
+
+        # Pretend the triangles along the left side are ghosts
+        xc = domain_split.centroid_coordinates[:,0]
+        tri_full_flag = num.where(xc < 0.15, 0, 1)
+        ghost_distance = ghost_layer_distance(domain_split.neighbours,
+                                              tri_full_flag)
+
+        assert num.any(ghost_distance == 0)
+        assert num.any(ghost_distance == 4)
+
+        mass_error = protect_new(domain_full)
+        extrapol2(domain_full)
+
+        mass_error_split = protect_new_partial(domain_split, ghost_distance, 1)
+        extrapol2_partial(domain_split, ghost_distance, 1)
+        mass_error_split += protect_new_partial(domain_split, ghost_distance, 2)
+        extrapol2_partial(domain_split, ghost_distance, 2)
+
+        assert num.allclose(mass_error, mass_error_split)
+
+        for name in ['stage', 'xmomentum', 'ymomentum', 'elevation', 'height']:
+            Q_full = domain_full.quantities[name]
+            Q_split = domain_split.quantities[name]
+            assert num.allclose(Q_full.centroid_values, Q_split.centroid_values)
+            assert num.allclose(Q_full.edge_values, Q_split.edge_values)
+            assert num.allclose(Q_full.vertex_values, Q_split.vertex_values)
+
+
+    def test_omp_num_threads(self):
+        """The threaded DE kernels should give the same answer whatever
+        the number of threads
+        """
+
+        def evolve_domain(num_threads):
+            domain = rectangular_cross_domain(20, 20)
+            domain.set_flow_algorithm('DE1')
+            domain.set_omp_num_threads(num_threads)
+            domain.set_store(False)
+            domain.set_quantity('elevation', lambda x,y: -x/2.0 + 0.1*num.sin(10*y))
+            domain.set_quantity('stage', lambda x,y: -0.2 + 0.3*(x<0.3))
+            domain.set_boundary({'left': Reflective_boundary(domain),
+                                 'right': Reflective_boundary(domain),
+                                 'top': Reflective_boundary(domain),
+                                 'bottom': Reflective_boundary(domain)})
+
+            for t in domain.evolve(yieldstep=0.05, finaltime=0.2):
+                pass
+
+            return domain
+
+        from anuga.shallow_water.swDE1_domain_ext import get_omp_num_threads
+        from anuga.shallow_water.swDE1_domain_ext import set_omp_num_threads
+        default_num_threads = get_omp_num_threads()
+
+        try:
+            domain_serial = evolve_domain(1)
+            assert domain_serial.get_omp_num_threads() == 1
+
+            domain_threaded = evolve_domain(4)
+            # Only 1 if built without OpenMP
+            assert domain_threaded.get_omp_num_threads() in [1, 4]
+        finally:
+            set_omp_num_threads(default_num_threads)
+
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            Q_serial = domain_serial.quantities[name]
+            Q_threaded = domain_threaded.quantities[name]
+            assert num.allclose(Q_serial.centroid_values, Q_threaded.centroid_values)
+            assert num.allclose(Q_serial.vertex_values, Q_threaded.vertex_values)
+
+        assert num.allclose(domain_serial.get_time(), domain_threaded.get_time())
+
+
+    def test_local_timestepping_rk2(self):
+        """Local flux updating with rk2 timestepping on a graded mesh
+        should conserve mass and stay close to global timestepping
+        """
+
+        def create_domain(nlevels=0):
+            points, vertices, boundary = anuga.rectangular_cross(20, 2)
+            # Triangles near x=0 are much smaller than near x=1
+            points = num.array(points)
+            points[:,0] = points[:,0]**2
+
+            domain = Domain(points, vertices, boundary)
+            domain.set_flow_algorithm('DE1')
+            domain.set_store(False)
+            domain.set_quantity('elevation', 0.0)
+            domain.set_quantity('stage', lambda x,y: 1.0 + 0.5*(x<0.01))
+            Br = Reflective_boundary(domain)
+            domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+            if nlevels > 0:
+                domain.set_local_extrapolation_and_flux_updating(nlevels=nlevels)
+
+            return domain
+
+        domain_global = create_domain()
+        domain_local = create_domain(nlevels=3)
+        assert domain_local.get_timestepping_method() == 'rk2'
+
+        volume0 = domain_local.get_water_volume()
+
+        partial_updates = False
+        for t in domain_local.evolve(yieldstep=0.01, finaltime=0.1):
+            partial_updates = partial_updates or \
+                num.any(domain_local.update_next_flux == 0)
+
+        for t in domain_global.evolve(yieldstep=0.01, finaltime=0.1):
+            pass
+
+        # Some fluxes were not updated on every timestep
+        assert partial_updates
+        assert num.max(domain_local.flux_update_frequency) > 1
+
+        assert num.allclose(domain_local.get_water_volume(), volume0, rtol=1.0e-12)
+
+        stage_local = domain_local.quantities['stage'].centroid_values
+        stage_global = domain_global.quantities['stage'].centroid_values
+        assert num.allclose(stage_local, stage_global, atol=0.02)
+
+        # rk3 is not supported
+        domain = create_domain()
+        domain.set_timestepping_method('rk3')
+        try:
+            domain.set_local_extrapolation_and_flux_updating(nlevels=3)
+        except Exception:
+            pass
+        else:
+            raise Exception('Expected local timestepping with rk3 to fail')
+
+
+    def test_domain_handle(self):
+        """The DE kernels should give the same answer when given the
+        compiled domain handle instead of the domain
+        """
+
+        from anuga.shallow_water.swDE1_domain_ext import domain_handle
+        from anuga.shallow_water.swDE1_domain_ext import compute_fluxes_ext_central
+        from anuga.shallow_water.swDE1_domain_ext import extrapolate_second_order_edge_sw
+        from anuga.shallow_water.swDE1_domain_ext import protect_new
+
+        def create_domain():
+            domain = rectangular_cross_domain(10, 10)
+            domain.set_flow_algorithm('DE1')
+            # One flux call per timestep, so every call computes the timestep
+            domain.set_timestepping_method('euler')
+            domain.set_store(False)
+            domain.set_quantity('elevation', lambda x,y: -x/2.0)
+            domain.set_quantity('stage', lambda x,y: -0.2 + 0.3*(x<0.3))
+            Br = Reflective_boundary(domain)
+            domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+            return domain
+
+        domain_a = create_domain()
+        domain_b = create_domain()
+        handle = domain_handle(domain_b)
+
+        for domain, D in [(domain_a, domain_a), (domain_b, handle)]:
+            protect_new(D)
+            extrapolate_second_order_edge_sw(D)
+            domain.update_boundary()
+            domain.flux_timestep = compute_fluxes_ext_central(D, 1.0)
+
+        assert num.allclose(domain_a.flux_timestep, domain_b.flux_timestep)
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            Q_a = domain_a.quantities[name]
+            Q_b = domain_b.quantities[name]
+            assert num.allclose(Q_a.edge_values, Q_b.edge_values)
+            assert num.allclose(Q_a.explicit_update, Q_b.explicit_update)
+
+        # The handle only exists while evolve is stepping
+        domain = create_domain()
+        assert domain.get_domain_handle() is domain
+        for t in domain.evolve(yieldstep=0.05, finaltime=0.1):
+            assert domain.domain_handle is None
+            assert domain.get_domain_handle() is domain
+
+
+    def test_compiled_evolve(self):
+        """Taking the timesteps between yieldsteps in C should give the
+        same answer as taking them in python
+        """
+
+        def evolve_domain(method, compiled):
+            domain = rectangular_cross_domain(10, 10)
+            domain.set_flow_algorithm('DE1')
+            domain.set_timestepping_method(method)
+            domain.set_compiled_evolve(compiled)
+            domain.set_store(False)
+            domain.set_quantity('elevation', lambda x,y: -x/2.0 + 0.05*num.sin(10*y))
+            domain.set_quantity('stage', lambda x,y: -0.2 + 0.3*(x<0.3))
+            domain.set_quantity('friction', 0.03)
+            Br = Reflective_boundary(domain)
+            Bd = anuga.Dirichlet_boundary([0.1, 0.0, 0.0])
+            domain.set_boundary({'left': Bd, 'right': Br, 'top': Br, 'bottom': Br})
+
+            # Operator recording the times it is called at
+            times = []
+            class Time_recorder(anuga.Operator):
+                def __call__(self):
+                    times.append(self.domain.get_time())
+                def parallel_safe(self):
+                    return True
+                def statistics(self):
+                    return ''
+                def timestepping_statistics(self):
+                    return ''
+            Time_recorder(domain)
+
+            stats = []
+            for t in domain.evolve(yieldstep=0.1, finaltime=0.3):
+                stats.append((t, domain.number_of_steps,
+                              domain.recorded_min_timestep,
+                              domain.recorded_max_timestep))
+
+            return domain, stats, times
+
+        for method in ['euler', 'rk2', 'rk3']:
+            domain_python, stats_python, times_python = evolve_domain(method, False)
+            domain_compiled, stats_compiled, times_compiled = evolve_domain(method, True)
+
+            assert stats_python == stats_compiled
+            assert len(times_python) > 0
+            assert times_python == times_compiled
+            assert domain_python.get_time() == domain_compiled.get_time()
+
+            for name in ['stage', 'xmomentum', 'ymomentum']:
+                Q_python = domain_python.quantities[name]
+                Q_compiled = domain_compiled.quantities[name]
+                assert num.allclose(Q_python.centroid_values, Q_compiled.centroid_values)
+                assert num.allclose(Q_python.vertex_values, Q_compiled.vertex_values)
+
+
+    def test_compiled_evolve_too_small_timestep(self):
+        """The compiled loop should log and raise like the python loop
+        when the timestep stays too small
+        """
+
+        import anuga.utilities.log as log
+
+        def evolve_domain(compiled):
+            # Euler, as an aborted multi-step method leaves the flux
+            # substep count of _compute_fluxes_central out of step
+            domain = rectangular_cross_domain(10, 10)
+            domain.set_flow_algorithm('DE1')
+            domain.set_timestepping_method('euler')
+            domain.set_compiled_evolve(compiled)
+            domain.set_store(False)
+            domain.set_quantity('elevation', lambda x,y: -x/2.0)
+            domain.set_quantity('stage', 0.1)
+            Br = Reflective_boundary(domain)
+            domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+            domain.evolve_min_timestep = 1.0
+            domain.max_smallsteps = 3
+
+            messages = []
+            critical = log.critical
+            log.critical = messages.append
+            try:
+                for t in domain.evolve(yieldstep=0.1, finaltime=0.3):
+                    pass
+            except Exception, e:
+                error = str(e)
+            else:
+                error = None
+            finally:
+                log.critical = critical
+
+            return domain, error, messages
+
+        domain_python, error_python, messages_python = evolve_domain(False)
+        domain_compiled, error_compiled, messages_compiled = evolve_domain(True)
+
+        assert error_python is not None
+        assert error_python.startswith('WARNING: Too small timestep')
+        assert error_compiled == error_python
+
+        # The message and the timestepping statistics are logged
+        assert messages_python[-2] == error_python
+        assert messages_compiled[-2:] == messages_python[-2:]
+        assert domain_compiled.number_of_steps == domain_python.number_of_steps
+
+
 if __name__ == "__main__":
     suite = unittest.makeSuite(Test_DE1_domain, 'test')
     runner = unittest.TextTestRunner(verbosity=1)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+
+import unittest
+import os
+import shutil
+import tempfile
+
+import numpy as num
+
+from anuga.abstract_2d_finite_volumes.mesh_factory import rectangular_cross
+from anuga.shallow_water.shallow_water_domain import Domain
+from anuga.shallow_water.boundaries import Reflective_boundary
+from anuga.abstract_2d_finite_volumes.generic_boundary_conditions \
+        import Dirichlet_boundary
+from anuga.shallow_water.checkpoint import load_checkpoint_file, \
+        checkpoint_format_version
+from anuga.anuga_exceptions import ANUGAError
+from anuga.operators.base_operator import Operator
+
+
+class Stage_rate_operator(Operator):
+    """Raise the stage at a constant rate, an operator which can be
+    pickled without dill
+    """
+
+    def __init__(self, domain, rate=0.0):
+        Operator.__init__(self, domain)
+        self.rate = rate
+
+    def __call__(self):
+        self.stage_c[:] += self.rate*self.domain.get_timestep()
+
+    def parallel_safe(self):
+        return True
+
+    def statistics(self):
+        return 'Stage_rate_operator'
+
+    def timestepping_statistics(self):
+        return 'Stage_rate_operator'
+
+
+class Test_checkpoint(unittest.TestCase):
+    def setUp(self):
+        self.checkpoint_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+
+    def create_domain(self, checkpoint_format):
+
+        points, vertices, boundary = rectangular_cross(10, 5, len1=10.0,
+                                                       len2=5.0)
+        domain = Domain(points, vertices, boundary)
+        domain.set_name('checkpoint_' + checkpoint_format)
+        domain.set_store(False)
+        domain.set_quantity('elevation', lambda x,y: -x/10.0)
+        domain.set_quantity('stage', 0.5)
+
+        Br = Reflective_boundary(domain)
+        Bd = Dirichlet_boundary([1, 0, 0])
+        domain.set_boundary({'left': Bd, 'right': Br, 'top': Br, 'bottom': Br})
+
+        domain.set_checkpointing(checkpoint_dir=self.checkpoint_dir,
+                                 checkpoint_step=2,
+                                 checkpoint_format=checkpoint_format)
+
+        return domain
+
+    def test_binary_checkpoint_files(self):
+
+        domain = self.create_domain('binary')
+
+        for t in domain.evolve(yieldstep=1.0, finaltime=4.0):
+            pass
+
+        files = os.listdir(self.checkpoint_dir)
+
+        assert 'checkpoint_binary_static_0.0.pickle' in files
+        assert 'checkpoint_binary_4.0.checkpoint' in files
+        assert 'checkpoint_binary_2.0.checkpoint' in files
+
+        # Static part of domain only stored once
+        assert len([f for f in files if f.endswith('.pickle')]) == 1
+
+        # No temporary directories left behind
+        assert len([f for f in files if f.endswith('.tmp')]) == 0
+
+    def test_binary_checkpoint_restart(self):
+
+        domain = self.create_domain('binary')
+
+        for t in domain.evolve(yieldstep=1.0, finaltime=4.0):
+            pass
+
+        restored = load_checkpoint_file(domain_name='checkpoint_binary',
+                                        checkpoint_dir=self.checkpoint_dir)
+
+        assert num.allclose(restored.get_time(), 4.0)
+        assert restored.yieldstep_id == domain.yieldstep_id
+
+        for name in domain.quantities:
+            Q = domain.quantities[name]
+            R = restored.quantities[name]
+            assert num.allclose(Q.centroid_values, R.centroid_values)
+
+        # Restarted run follows the original run
+        for t in domain.evolve(yieldstep=1.0, finaltime=6.0):
+            pass
+
+        for t in restored.evolve(yieldstep=1.0, finaltime=6.0):
+            pass
+
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            Q = domain.quantities[name]
+            R = restored.quantities[name]
+            assert num.allclose(Q.centroid_values, R.centroid_values)
+
+    def test_binary_checkpoint_restart_earlier_time(self):
+
+        domain = self.create_domain('binary')
+
+        for t in domain.evolve(yieldstep=1.0, finaltime=2.0):
+            pass
+
+        stage_2 = domain.quantities['stage'].centroid_values.copy()
+
+        for t in domain.evolve(yieldstep=1.0, finaltime=4.0):
+            pass
+
+        restored = load_checkpoint_file(domain_name='checkpoint_binary',
+                                        checkpoint_dir=self.checkpoint_dir,
+                                        time=2.0)
+
+        assert num.allclose(restored.get_time(), 2.0)
+        assert num.allclose(restored.quantities['stage'].centroid_values,
+                            stage_2)
+
+    def test_binary_checkpoint_restart_changed_domain(self):
+        """Boundaries and operators changed after the first checkpoint
+        are restored
+        """
+
+        domain = self.create_domain('binary')
+
+        for t in domain.evolve(yieldstep=1.0, finaltime=2.0):
+            pass
+
+        # Change the boundary and add an operator after the first checkpoint
+        Br = Reflective_boundary(domain)
+        Bd = Dirichlet_boundary([0.2, 0, 0])
+        domain.set_boundary({'left': Br, 'right': Bd})
+        Stage_rate_operator(domain, rate=0.01)
+
+        for t in domain.evolve(yieldstep=1.0, finaltime=4.0):
+            pass
+
+        files = os.listdir(self.checkpoint_dir)
+        assert 'checkpoint_binary_static_0.0.pickle' in files
+        assert 'checkpoint_binary_static_4.0.pickle' in files
+
+        restored = load_checkpoint_file(domain_name='checkpoint_binary',
+                                        checkpoint_dir=self.checkpoint_dir)
+
+        assert num.allclose(restored.get_time(), 4.0)
+        assert isinstance(restored.boundary_map['left'], Reflective_boundary)
+        assert isinstance(restored.boundary_map['right'], Dirichlet_boundary)
+        assert isinstance(restored.fractional_step_operators[-1],
+                          Stage_rate_operator)
+
+        # Earlier checkpoints still use their own static part
+        earlier = load_checkpoint_file(domain_name='checkpoint_binary',
+                                       checkpoint_dir=self.checkpoint_dir,
+                                       time=2.0)
+        assert isinstance(earlier.boundary_map['left'], Dirichlet_boundary)
+        assert len(earlier.fractional_step_operators) == \
+               len(restored.fractional_step_operators) - 1
+
+        # Restarted run follows the original run
+        for t in domain.evolve(yieldstep=1.0, finaltime=6.0):
+            pass
+
+        for t in restored.evolve(yieldstep=1.0, finaltime=6.0):
+            pass
+
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            Q = domain.quantities[name]
+            R = restored.quantities[name]
+            assert num.allclose(Q.centroid_values, R.centroid_values)
+
+    def test_binary_checkpoint_mismatch(self):
+        """A static part which does not match the checkpoint raises
+        instead of falling back to an older checkpoint
+        """
+
+        import cPickle
+        from os.path import join
+
+        domain = self.create_domain('binary')
+
+        for t in domain.evolve(yieldstep=1.0, finaltime=4.0):
+            pass
+
+        header_name = join(self.checkpoint_dir,
+                           'checkpoint_binary_4.0.checkpoint', 'header.pickle')
+        header = cPickle.load(open(header_name, 'rb'))
+        header['operators'] = ['Stage_rate_operator']
+        cPickle.dump(header, open(header_name, 'wb'))
+
+        try:
+            load_checkpoint_file(domain_name='checkpoint_binary',
+                                 checkpoint_dir=self.checkpoint_dir)
+        except ANUGAError:
+            pass
+        else:
+            msg = 'Should have raised exception for mismatching operators'
+            raise Exception, msg
+
+    def test_newer_checkpoint_version(self):
+
+        import cPickle
+        from os.path import join
+
+        domain = self.create_domain('binary')
+
+        for t in domain.evolve(yieldstep=1.0, finaltime=2.0):
+            pass
+
+        for t in domain.evolve(yieldstep=1.0, finaltime=4.0):
+            pass
+
+        header_name = join(self.checkpoint_dir,
+                           'checkpoint_binary_4.0.checkpoint', 'header.pickle')
+        header = cPickle.load(open(header_name, 'rb'))
+        header['version'] = checkpoint_format_version + 1
+        cPickle.dump(header, open(header_name, 'wb'))
+
+        # The error is raised, not hidden by using the older checkpoint
+        try:
+            load_checkpoint_file(domain_name='checkpoint_binary',
+                                 checkpoint_dir=self.checkpoint_dir)
+        except ANUGAError, e:
+            assert 'format version' in str(e)
+        else:
+            msg = 'Should have raised exception for newer format version'
+            raise Exception, msg
+
+    def test_pickle_checkpoint_restart(self):
+
+        domain = self.create_domain('pickle')
+
+        for t in domain.evolve(yieldstep=1.0, finaltime=4.0):
+            pass
+
+        assert 'checkpoint_pickle_4.0.pickle' in \
+               os.listdir(self.checkpoint_dir)
+
+        restored = load_checkpoint_file(domain_name='checkpoint_pickle',
+                                        checkpoint_dir=self.checkpoint_dir)
+
+        assert num.allclose(restored.get_time(), 4.0)
+        assert num.allclose(restored.quantities['stage'].centroid_values,
+                            domain.quantities['stage'].centroid_values)
+
+
+#-------------------------------------------------------------
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_checkpoint, 'test')
+    runner = unittest.TextTestRunner(verbosity=1)
+    runner.run(suite)
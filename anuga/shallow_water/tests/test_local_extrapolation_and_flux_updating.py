@@ -85,25 +85,39 @@ class Test_local_extrapolation_and_flux_updating(unittest.TestCase):
         assert(numpy.allclose(vol,boundaryFluxInt))
         assert(numpy.allclose(vol2,boundaryFluxInt2))
         assert( numpy.all(abs(domain.quantities['stage'].centroid_values-domain2.quantities['stage'].centroid_values) <0.02))
+
+        # Some edges should be updated less often than every timestep
+        assert(domain2.flux_update_frequency.max() > 1)
         
         return
     
     def test_local_extrapolation_and_flux_updating_DE1(self):
         """
 
-        LEAFU should fail for DE1 since we don't have support for rk2 timestepping yet
+        As for DE0, but with the rk2 timestepping used by DE1
 
         """
         
         domain=self.create_domain('DE1')
-        Failed=True
-        try:
-            domain.set_local_extrapolation_and_flux_updating(nlevels=8)
-            Failed=False
-        except:
+        for t in domain.evolve(yieldstep=0.1,finaltime=20.0):
             pass
+        # The domain was initially dry
+        vol=domain.get_water_volume()
+        boundaryFluxInt=domain.get_boundary_flux_integral()
 
-        assert(Failed==True)
+
+        domain2=self.create_domain('DE1')
+        domain2.set_local_extrapolation_and_flux_updating(nlevels=8)
+        for t in domain2.evolve(yieldstep=0.1,finaltime=20.0):
+            pass
+        # The domain was initially dry
+        vol2=domain2.get_water_volume()
+        boundaryFluxInt2=domain2.get_boundary_flux_integral()
+        
+        assert(numpy.allclose(vol,vol2, rtol=0.05))
+        assert(numpy.allclose(vol,boundaryFluxInt))
+        assert(numpy.allclose(vol2,boundaryFluxInt2))
+        assert( numpy.all(abs(domain.quantities['stage'].centroid_values-domain2.quantities['stage'].centroid_values) <0.02))
 
         return
 
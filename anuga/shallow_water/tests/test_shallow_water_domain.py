@@ -6115,6 +6115,74 @@ class Test_Shallow_Water(unittest.TestCase):
         os.remove(domain1.get_name() + '.sww')
         os.remove(domain2.get_name() + '.sww')
 
+    def test_vectorised_evaluate_segment(self):
+        """The array versions of evaluate_segment should give the same
+        boundary values as evaluating each edge in turn
+        """
+
+        from anuga.abstract_2d_finite_volumes.generic_boundary_conditions \
+             import Boundary, File_boundary, AWI_boundary
+        from anuga.shallow_water.boundaries import Field_boundary, \
+             Dirichlet_discharge_boundary, Inflow_boundary, \
+             Transmissive_stage_zero_momentum_boundary
+
+        points, vertices, boundary = rectangular_cross(4, 4)
+
+        # Create source sww file
+        domain1 = Domain(points, vertices, boundary)
+        domain1.set_name('vectorised_boundary_source')
+        domain1.set_datadir('.')
+        domain1.set_quantity('elevation', lambda x,y: -x/4)
+        domain1.set_quantity('stage', 0.1)
+        Bd = Dirichlet_boundary([0.3,0,0])
+        Br = Reflective_boundary(domain1)
+        domain1.set_boundary({'left': Bd, 'top': Br, 'right': Br, 'bottom': Br})
+
+        for t in domain1.evolve(yieldstep=0.5, finaltime=2.0):
+            pass
+
+        swwfile = domain1.get_name() + '.sww'
+
+        # Domain on which to evaluate the boundaries
+        domain2 = Domain(points, vertices, boundary)
+        domain2.set_quantity('elevation', lambda x,y: -x/4)
+        domain2.set_quantity('friction', 0.03)
+        domain2.set_quantity('stage', lambda x,y: 0.1 + x*y)
+        domain2.set_quantity('xmomentum', lambda x,y: 0.1*x)
+        domain2.set_quantity('ymomentum', lambda x,y: -0.2*y)
+        domain2.distribute_to_vertices_and_edges()
+        domain2.set_time(0.7)
+
+        boundaries = [File_boundary(swwfile, domain2),
+                      AWI_boundary(swwfile, domain2),
+                      Field_boundary(swwfile, domain2, mean_stage=0.5),
+                      Dirichlet_discharge_boundary(domain2, 0.2, 1.5),
+                      Inflow_boundary(domain2, rate=2.0),
+                      Transmissive_stage_zero_momentum_boundary(domain2)]
+
+        segment_edges = domain2.tag_boundary_cells['left']
+        assert len(segment_edges) > 1
+
+        for B in boundaries:
+            for name in domain2.evolved_quantities:
+                domain2.quantities[name].boundary_values[:] = 0.0
+
+            B.evaluate_segment(domain2, segment_edges)
+            values = [domain2.quantities[name].boundary_values.copy()
+                      for name in domain2.evolved_quantities]
+
+            for name in domain2.evolved_quantities:
+                domain2.quantities[name].boundary_values[:] = 0.0
+
+            Boundary.evaluate_segment(B, domain2, segment_edges)
+
+            for j, name in enumerate(domain2.evolved_quantities):
+                msg = '%s differs for %s' % (name, B)
+                assert num.allclose(values[j],
+                                    domain2.quantities[name].boundary_values), msg
+
+        os.remove(swwfile)
+
     def test_spatio_temporal_boundary_2(self):
         """Test that boundary values can be read from file and interpolated
         in both time and space.
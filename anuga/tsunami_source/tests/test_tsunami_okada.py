@@ -294,6 +294,40 @@ class Test_eq(unittest.TestCase):
         #print 'hello',stage   
         assert num.allclose(stage,tmp,atol=1.e-3)
 
+    def test_okada_vectorised(self):
+        """The vectorised kernel agrees with the loop over each receiver
+        and subfault, for point, finite and singular sources
+        """
+
+        num.random.seed(17)
+        x = num.random.uniform(0, 40000, 200)
+        y = num.random.uniform(0, 40000, 200)
+
+        # Receivers on the surface trace of the first subfault
+        x[:3] = 5000.0
+        y[:3] = [2000.0, 6000.0, 9000.0]
+        zrec = (x, y, num.zeros(len(x)))
+
+        Ts = Okada_func(ns=4, NSMAX=4,
+                        length=[10.0, 10.0, 0.0, 8.0],
+                        width=[6.0, 6.0, 0.0, 0.0],
+                        dip=[90.0, 15.0, 30.0, 60.0],
+                        x0=num.array([5000.0, 7000.0, 20000.0, 30000.0]),
+                        y0=num.array([0.0, 10000.0, 7000.0, 25000.0]),
+                        strike=[0.0, 20.0, 45.0, 200.0],
+                        depth=[0.0, 15.0, 10.0, 20.0],
+                        slip=[10.0, 10.0, 5.0, 3.0],
+                        rake=[90.0, 90.0, 0.0, 45.0], zrec=zrec)
+
+        z = num.array(Ts.scalar_call(x, y))
+        assert num.allclose(z[:3], 0.0)
+
+        assert num.allclose(Ts(x, y), z, rtol=1.0e-10, atol=1.0e-12)
+
+        Ts.block_size = 30
+        Ts.processes = 2
+        assert num.allclose(Ts(x, y), z, rtol=1.0e-10, atol=1.0e-12)
+
 #-------------------------------------------------------------
 
 if __name__ == "__main__":
@@ -35,7 +35,8 @@ import anuga.utilities.log as log
 
 def earthquake_tsunami(ns, NSMAX, length, width, strike, depth,
                        dip, xi, yi, z0, slip, rake,
-                       domain=None, verbose=False):
+                       domain=None, verbose=False,
+                       block_size=None, processes=None):
 
     from anuga.abstract_2d_finite_volumes.quantity import Quantity
     from math import sin, radians
@@ -83,7 +84,357 @@ def earthquake_tsunami(ns, NSMAX, length, width, strike, depth,
 
     return Okada_func(ns=ns,NSMAX=NSMAX,length=length, width=width, dip=dip, \
                       x0=x0, y0=y0, strike=strike, depth=depth, \
-                      slip=slip, rake=rake, zrec=zrec)
+                      slip=slip, rake=rake, zrec=zrec,
+                      block_size=block_size, processes=processes)
+
+#
+# Vectorised Okada kernel
+#
+
+"""The functions below evaluate the vertical displacement of Okada's
+DC3D and DC3D0 for blocks of receivers against all subfaults at once.
+They follow the scalar methods of Okada_func line by line, keeping only
+the terms needed for UZ. Memory is bounded by the size of a block of
+receivers times the number of subfaults.
+"""
+
+F0 = 0.0
+EPS = 1.0e-6
+PI2 = 6.283185307179586
+
+# Medium constant (LAMBDA+MYU)/(LAMBDA+2*MYU) and derived constants
+ALPHA = 0.5
+ALP1 = (1.0-ALPHA)/2.0
+ALP2 = ALPHA/2.0
+ALP3 = (1.0-ALPHA)/ALPHA
+ALP4 = 1.0-ALPHA
+ALP5 = ALP4   # as used by UA, UB and UC
+
+# Number of receiver-subfault pairs evaluated together
+default_block_values = 200000
+
+
+def _zero_small(A):
+    return num.where(num.abs(A) < EPS, F0, A)
+
+
+def _weight(dislocation, U):
+    """Contribution of a dislocation, zero if the dislocation is zero"""
+
+    return num.where(dislocation != F0, dislocation/PI2*U, F0)
+
+
+def _point_source_uz(X, Y, Z, DEPTH, SD, CD, POT1, POT2):
+    """UZ of DC3D0 for arrays of stations and point sources, POT3 and
+    POT4 are zero. Returns UZ, zero where R is zero.
+    """
+
+    SDCD = SD*CD
+    C2D = CD*CD-SD*SD
+
+    def constants(D):
+        # DCCON1
+        XX = _zero_small(X)
+        YY = _zero_small(Y)
+        DD = _zero_small(D)
+        P = YY*CD+DD*SD
+        Q = YY*SD-DD*CD
+        T = P*CD-Q*SD
+        X2 = XX*XX
+        R2 = X2+YY*YY+DD*DD
+        R = num.sqrt(R2)
+        R3 = R*R2
+        R5 = R3*R2
+        return P, Q, T, XX*YY, X2, R, R2, R3, R5, 1.0-3.0*X2/R2, 3.0*Q/R5
+
+    def UA0(D, P, T, R3, QR):
+        return (_weight(POT1, -ALP1*X/R3*CD +ALP2*X*D*QR) +
+                _weight(POT2, -ALP1*T/R3 +ALP2*D*P*QR))
+
+    D = DEPTH+Z
+    P, Q, T, XY, X2, R_real, R2, R3, R5, A3, QR = constants(D)
+    UA_real = UA0(D, P, T, R3, QR)
+
+    D = DEPTH-Z
+    P, Q, T, XY, X2, R, R2, R3, R5, A3, QR = constants(D)
+    UA_image = UA0(D, P, T, R3, QR)
+
+    # UB0
+    C = D+Z
+    RD = R+D
+    D12 = 1.0/(R*RD*RD)
+    D32 = D12*(2.0*R+D)/R2
+    FI4 = -XY*D32
+    FI5 = 1.0/(R*RD)-X2*D32
+    UB = (_weight(POT1, -C*X*QR -ALP3*FI4*SD) +
+          _weight(POT2, -C*P*QR +ALP3*FI5*SDCD))
+
+    # UC0
+    QR5 = 5.0*Q/R2
+    UC = (_weight(POT1, 3.0*X/R5*(-ALP4*Y*SD +ALP5*C*(CD+D*QR5))) +
+          _weight(POT2, -ALP4*A3/R3*SDCD +ALP5*3.0*C/R5*(T+D*P*QR5)))
+
+    UZ = -UA_real+(UA_image+UB+Z*UC)
+
+    return num.where((R_real == F0) | (R == F0), F0, UZ)
+
+
+def _finite_corner_uz(XI, ET, Q, Z, SD, CD, KXI, KET, DISL1, DISL2, image):
+    """Contribution to UZ of DC3D of one corner of the fault, DISL3 is
+    zero. Returns the rotated component, zero where R is zero.
+    """
+
+    # DCCON2
+    XI2 = XI*XI
+    Q2 = Q*Q
+    R2 = XI2+ET*ET+Q2
+    R = num.sqrt(R2)
+    R3 = R*R2
+    Y = ET*CD+Q*SD
+    D = ET*SD-Q*CD
+    TT = num.where(Q == F0, F0, num.arctan(XI*ET/(Q*R)))
+
+    RXI = R+XI
+    ALX = num.where(KXI, -num.log(R-XI), num.log(RXI))
+    X11 = num.where(KXI, F0, 1.0/(R*RXI))
+    X32 = num.where(KXI, F0, (R+RXI)*X11*X11/R)
+
+    RET = R+ET
+    ALE = num.where(KET, -num.log(R-ET), num.log(RET))
+    Y11 = num.where(KET, F0, 1.0/(R*RET))
+    Y32 = num.where(KET, F0, (R+RET)*Y11*Y11/R)
+
+    QX = Q*X11
+    QY = Q*Y11
+
+    # UA
+    UA1 = (_weight(DISL1, ALP2*Q/R) +
+           _weight(DISL2, TT/2.0 +ALP2*ET*QX))
+    UA2 = (_weight(DISL1, ALP1*ALE -ALP2*Q*QY) +
+           _weight(DISL2, ALP1*ALX -ALP2*Q*QX))
+
+    if not image:
+        DU = -UA1*SD-UA2*CD
+        return num.where(R == F0, F0, DU)
+
+    # UB
+    SDCD = SD*CD
+    CDCD = CD*CD
+    RD = R+D
+    XX = num.sqrt(XI2+Q2)
+    AI4 = num.where(XI == F0, F0,
+                    1.0/CDCD*(XI/RD*SDCD
+                    +2.0*num.arctan((ET*(XX+Q*CD)+XX*(R+XX)*SD)/
+                                    (XI*(R+XX)*CD))))
+    AI3 = (Y*CD/RD-ALE+SD*num.log(RD))/CDCD
+    RD2 = RD*RD
+    AI3 = num.where(CD != F0, AI3, (ET/RD+Y*Q/RD2-ALE)/2.0)
+    AI4 = num.where(CD != F0, AI4, XI*Y/RD2/2.0)
+    AI2 = num.log(RD)+AI3*SD
+
+    UB1 = (_weight(DISL1, -Q/R +ALP3*Y/RD*SD) +
+           _weight(DISL2, -ET*QX-TT -ALP3*XI/RD*SDCD))
+    UB2 = (_weight(DISL1, Q*QY -ALP3*AI2*SD) +
+           _weight(DISL2, Q*QX +ALP3*AI4*SDCD))
+
+    # UC
+    C = D+Z
+    H = Q*CD-Z
+    Z32 = SD/R3-H*Y32
+    UC1 = (_weight(DISL1, ALP4*(CD/R+2.0*QY*SD) -ALP5*C*Q/R3) +
+           _weight(DISL2, ALP4*Y*X11 -ALP5*C*ET*Q*X32))
+    UC2 = (_weight(DISL1, ALP4*QY*CD -ALP5*(C*ET/R3-Z*Y11+XI2*Z32)) +
+           _weight(DISL2, -D*X11-XI*Y11*SD -ALP5*C*(X11-Q2*X32)))
+
+    DU = (UA1+UB1-Z*UC1)*SD+(UA2+UB2-Z*UC2)*CD
+    return num.where(R == F0, F0, DU)
+
+
+def _finite_source_uz(X, Y, Z, DEPTH, SD, CD, AL2, AW1, DISL1, DISL2):
+    """UZ of DC3D for arrays of stations and finite sources with AL1, AW2
+    and DISL3 zero. Returns UZ and the mask of singular stations, where
+    DC3D returns IRET=1.
+    """
+
+    XI = [_zero_small(X), _zero_small(X-AL2)]
+
+    UZ = num.zeros(X.shape, num.float)
+    singular = num.zeros(X.shape, num.bool)
+
+    for image in [False, True]:
+        if image:
+            D = DEPTH-Z
+        else:
+            D = DEPTH+Z
+        P = Y*CD+D*SD
+        Q = _zero_small(Y*SD-D*CD)
+        ET = [_zero_small(P-AW1), _zero_small(P)]
+
+        # Reject singular case on fault edge
+        singular |= (Q == F0) & \
+                    (((XI[0]*XI[1] < F0) & (ET[0]*ET[1] == F0)) |
+                     ((ET[0]*ET[1] < F0) & (XI[0]*XI[1] == F0)))
+
+        # On negative extension of fault edge
+        Q2 = Q*Q
+        R12 = num.sqrt(XI[0]*XI[0]+ET[1]*ET[1]+Q2)
+        R21 = num.sqrt(XI[1]*XI[1]+ET[0]*ET[0]+Q2)
+        R22 = num.sqrt(XI[1]*XI[1]+ET[1]*ET[1]+Q2)
+        KXI = [(XI[0] < F0) & (R21+XI[1] < EPS),
+               (XI[0] < F0) & (R22+XI[1] < EPS)]
+        KET = [(ET[0] < F0) & (R12+ET[1] < EPS),
+               (ET[0] < F0) & (R22+ET[1] < EPS)]
+
+        for K in range(0,2):
+            for J in range(0,2):
+                DU = _finite_corner_uz(XI[J], ET[K], Q, Z, SD, CD,
+                                       KXI[K], KET[J], DISL1, DISL2, image)
+                if (J+K) != 1:
+                    UZ = UZ+DU
+                else:
+                    UZ = UZ-DU
+
+    return num.where(singular, F0, UZ), singular
+
+
+def okada_subfaults(ns, length, width, strike, dip, depth, slip, rake,
+                    xs, ys):
+    """Return a dictionary of the Okada constants of each subfault.
+
+    Parameters are scalars or sequences of length ns. xs, ys is the
+    origin of each subfault in Okada's axes, with x to the north.
+    """
+
+    from math import pi
+
+    def values(v):
+        return num.resize(num.array(v, num.float).ravel(), ns)
+
+    lengths = values(length)
+    widths = values(width)
+    slips = values(slip)
+    rakes = values(rake)*pi/180.0
+    strikes = values(strike)*pi/180.0
+
+    # DCC0N0
+    dips = values(dip)*pi/180.0
+    SD = num.sin(dips)
+    CD = num.cos(dips)
+    vertical = num.abs(CD) < EPS
+    CD[vertical] = F0
+    SD[vertical] = num.sign(SD[vertical])
+
+    point = (lengths == 0) & (widths == 0)
+    DISL1 = slips*num.cos(rakes)
+    DISL2 = slips*num.sin(rakes)
+
+    # Finite sources of zero length or width
+    AL2 = lengths.copy()
+    AW1 = -widths
+    zero_length = (lengths == 0) & ~point
+    zero_width = (widths == 0) & ~point & ~zero_length
+    AL2[zero_length] = widths[zero_length]*EPS
+    AW1[zero_width] = -lengths[zero_width]*EPS
+    scale = num.ones(ns, num.float)
+    scale[zero_length] = AL2[zero_length]
+    scale[zero_width] = -AW1[zero_width]
+
+    return {'xs': values(xs), 'ys': values(ys),
+            'csst': num.cos(strikes), 'ssst': num.sin(strikes),
+            'depth': values(depth), 'SD': SD, 'CD': CD, 'point': point,
+            'AL2': AL2, 'AW1': AW1,
+            'DISL1': DISL1/scale, 'DISL2': DISL2/scale}
+
+
+def okada_block_uz(args):
+    """Return the vertical displacement at a block of receivers.
+
+    args is the tuple (xrec, yrec, Z, subfaults) with the receivers in
+    Okada's axes and subfaults as returned by okada_subfaults. Summing
+    over the subfaults stops at a subfault where Okada's routine is
+    singular for the receiver, as in the scalar loop.
+    """
+
+    xrec, yrec, Z, faults = args
+
+    dx = xrec[:,num.newaxis]-faults['xs']
+    dy = yrec[:,num.newaxis]-faults['ys']
+    csst = faults['csst']
+    ssst = faults['ssst']
+    X = 0.001*(dx*csst+dy*ssst)
+    Y = 0.001*(dx*ssst-dy*csst)
+
+    UZ = num.zeros(X.shape, num.float)
+    singular = num.zeros(X.shape, num.bool)
+
+    point = faults['point']
+    finite = ~point
+
+    err = num.seterr(divide='ignore', invalid='ignore', over='ignore')
+    try:
+        if num.any(point):
+            UZ[:,point] = _point_source_uz(X[:,point], Y[:,point], Z,
+                                           faults['depth'][point],
+                                           faults['SD'][point],
+                                           faults['CD'][point],
+                                           faults['DISL1'][point],
+                                           faults['DISL2'][point])
+        if num.any(finite):
+            UZ[:,finite], singular[:,finite] = \
+                _finite_source_uz(X[:,finite], Y[:,finite], Z,
+                                  faults['depth'][finite],
+                                  faults['SD'][finite],
+                                  faults['CD'][finite],
+                                  faults['AL2'][finite],
+                                  faults['AW1'][finite],
+                                  faults['DISL1'][finite],
+                                  faults['DISL2'][finite])
+    finally:
+        num.seterr(**err)
+
+    if num.any(singular):
+        log.critical('There is a problem in Okada subroutine!')
+
+    valid = num.cumsum(singular, axis=1) == 0
+    return num.sum(num.where(valid, UZ, F0), axis=1)
+
+
+def okada_uz(xrec, yrec, Z, faults, block_size=None, processes=None):
+    """Return the vertical displacement at the receivers xrec, yrec
+    (Okada's axes, in metres) due to the subfaults from okada_subfaults.
+
+    The receivers are evaluated in blocks of block_size, by default
+    bounding the block to default_block_values receiver-subfault pairs.
+    If processes is more than 1 the blocks are spread over a pool of
+    that many processes.
+    """
+
+    xrec = num.array(xrec, num.float)
+    yrec = num.array(yrec, num.float)
+    N = len(xrec)
+
+    if block_size is None:
+        block_size = max(1, default_block_values/len(faults['xs']))
+
+    tasks = [(xrec[k:k+block_size], yrec[k:k+block_size], Z, faults)
+             for k in range(0, N, block_size)]
+
+    if processes is not None and processes > 1 and len(tasks) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(okada_block_uz, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(okada_block_uz, tasks)
+
+    if len(results) == 0:
+        return num.zeros(0, num.float)
+
+    return num.concatenate(results)
+
 
 #
 # Okada class
@@ -112,7 +463,7 @@ Optional
 class Okada_func:
 
     def __init__(self, ns,NSMAX,length, width, dip, x0, y0, strike, \
-                     depth, slip, rake,zrec):
+                     depth, slip, rake,zrec, block_size=None, processes=None):
         self.dip = dip
         self.length = length
         self.width = width
@@ -124,6 +475,8 @@ class Okada_func:
         self.rake = rake
         self.ns=ns
         self.zrec=zrec
+        self.block_size = block_size
+        self.processes = processes
 
     def __call__(self, x, y):
         """Make Okada_func a callable object.
@@ -131,6 +484,39 @@ class Okada_func:
         If called as a function, this object returns z values representing
         the initial 3D distribution of water heights at the points (x,y,z)
         produced by a submarine mass failure.
+
+        All receivers are evaluated against all subfaults in blocks with
+        the vectorised kernel okada_uz, see scalar_call for the loop over
+        each receiver and subfault.
+        """
+
+        N = len(x)
+        assert N == len(y)
+
+        if N == 0:
+            return num.zeros(0, num.float)
+
+        # Okada's axes have x to the north, as in scalar_call
+        zrec = self.zrec
+        match = num.flatnonzero(num.in1d(zrec[0], x) & num.in1d(zrec[1], y))
+        if len(match) == 0:
+            msg = 'No vertex of zrec found at the receivers'
+            raise Exception, msg
+        Z = 0.001*zrec[2][match[0]]
+        if Z > 0: log.critical('** POSITIVE Z WAS GIVEN IN SUB-DC3D')
+
+        faults = okada_subfaults(self.ns, self.length, self.width,
+                                 self.strike, self.dip, self.depth,
+                                 self.slip, self.rake,
+                                 xs=self.y0, ys=self.x0)
+
+        return okada_uz(y, x, Z, faults,
+                        block_size=self.block_size,
+                        processes=self.processes)
+
+    def scalar_call(self, x, y):
+        """Return the z values of __call__ evaluating each receiver
+        against each subfault with the scalar Okada routines below.
         """
         from string import replace,strip
         from math import sin, cos, radians, exp, cosh
@@ -266,6 +266,75 @@ static PyObject *deserialise(PyObject *self, PyObject *args) {
 
 // ------------------------------ PYTHON GLUE ----------------------------------
 
+// Locate a batch of points in a quad tree built by fitsmooth.build_quad_tree.
+// points is an (n,2) array of coordinates. Returns the triangle index of each
+// point (-1 if no triangle contains it) and the (n,3) array of barycentric
+// weights (sigma) of the point with respect to that triangle.
+static PyObject *search_points(PyObject *self, PyObject *args) {
+
+    PyObject *tree;
+    PyObject *points_in;
+    PyArrayObject *points;
+    PyArrayObject *indices;
+    PyArrayObject *sigmas;
+    npy_intp dims[2];
+    long n, i;
+
+    // Convert Python arguments to C
+    if (!PyArg_ParseTuple(args, "OO", &tree, &points_in)) {
+      PyErr_SetString(PyExc_RuntimeError,
+              "quad_tree_ext.search_points: could not parse input");
+      return NULL;
+    }
+
+    #ifdef PYVERSION273
+    quad_tree * quadtree = (quad_tree*) PyCapsule_GetPointer(tree,"quad tree");
+    #else
+    quad_tree * quadtree = (quad_tree*) PyCObject_AsVoidPtr(tree);
+    #endif
+    if (quadtree == NULL) return NULL;
+
+    points = (PyArrayObject*) PyArray_ContiguousFromObject(points_in,
+                                                           PyArray_DOUBLE, 2, 2);
+    if (points == NULL) return NULL;
+    if (points->dimensions[1] != 2) {
+      PyErr_SetString(PyExc_ValueError,
+              "quad_tree_ext.search_points: points must have shape (n,2)");
+      Py_DECREF(points);
+      return NULL;
+    }
+
+    n = (long) points->dimensions[0];
+    dims[0] = n;
+    dims[1] = 3;
+    indices = (PyArrayObject*) PyArray_SimpleNew(1, dims, PyArray_LONG);
+    sigmas = (PyArrayObject*) PyArray_SimpleNew(2, dims, PyArray_DOUBLE);
+
+    double *xy = (double*) points->data;
+    long *index = (long*) indices->data;
+    double *sigma = (double*) sigmas->data;
+
+    for (i = 0; i < n; i++) {
+        double xp = xy[2*i];
+        double yp = xy[2*i+1];
+        triangle * T = search(quadtree, xp, yp);
+        if (T != NULL) {
+            double * s = calculate_sigma(T, xp, yp);
+            sigma[3*i] = s[0];
+            sigma[3*i+1] = s[1];
+            sigma[3*i+2] = s[2];
+            free(s);
+            index[i] = (long) T->index;
+        } else {
+            sigma[3*i] = sigma[3*i+1] = sigma[3*i+2] = -1.0;
+            index[i] = -1;
+        }
+    }
+
+    Py_DECREF(points);
+    return Py_BuildValue("NN", indices, sigmas);
+}
+
 //==============================================================================
 // Structures to allow calling from python
 //==============================================================================
@@ -274,6 +343,7 @@ static PyObject *deserialise(PyObject *self, PyObject *args) {
 static struct PyMethodDef MethodTable[] = {
   //  {"serialise",serialise, METH_VARARGS, "Print out"},
   //  {"deserialise",deserialise, METH_VARARGS, "Print out"},
+	{"search_points", search_points, METH_VARARGS, "Locate an array of points in a quad tree"},
 	{NULL, NULL, 0, NULL}   // sentinel
 };
 
@@ -0,0 +1,61 @@
+// Update of the centroid values of a quantity, shared by
+// quantity_ext.c and the compiled evolve loop of swDE1_domain_ext.c
+
+#ifndef ANUGA_QUANTITY_UPDATE_H
+#define ANUGA_QUANTITY_UPDATE_H
+
+#include <string.h>
+
+
+int _update(long N,
+	    double timestep,
+	    double* centroid_values,
+	    double* explicit_update,
+	    double* semi_implicit_update) {
+	// Update centroid values based on values stored in
+	// explicit_update and semi_implicit_update as well as given timestep
+
+
+	long k;
+	double denominator, x;
+
+
+	// Divide semi_implicit update by conserved quantity
+	for (k=0; k<N; k++) {
+		x = centroid_values[k];
+		if (x == 0.0) {
+			semi_implicit_update[k] = 0.0;
+		} else {
+			semi_implicit_update[k] /= x;
+		}
+	}
+
+
+	// Explicit updates
+	for (k=0; k<N; k++) {
+		centroid_values[k] += timestep*explicit_update[k];
+	}
+
+
+
+	// Semi implicit updates
+	for (k=0; k<N; k++) {
+		denominator = 1.0 - timestep*semi_implicit_update[k];
+		if (denominator <= 0.0) {
+			return -1;
+		} else {
+			//Update conserved_quantities from semi implicit updates
+			centroid_values[k] /= denominator;
+		}
+	}
+
+
+
+	// Reset semi_implicit_update here ready for next time step
+	memset(semi_implicit_update, 0, N*sizeof(double));
+
+	return 0;
+}
+
+
+#endif
@@ -295,6 +295,8 @@ class Sparse_CSR:
         else:
             raise ValueError('Sparse_CSR(A) expects A == Sparse Matrix *or* data==array,colind==array,rowptr==array,m==int,n==int')
 
+        self.shape = (self.M, self.N)
+
     def __repr__(self):
         return '%d X %d sparse matrix:\n' %(self.M, self.N) + 'data '+ `self.data` + '\ncolind ' + \
             `self.colind` + '\nrow_ptr ' + `self.row_ptr`
@@ -19,26 +19,26 @@ def sww_merge(domain_global_name, np, verbose=False):
     _sww_merge(swwfiles, output, verbose)
 
 
-def sww_merge_parallel(domain_global_name, np, verbose=False, delete_old=False):
+def sww_merge_parallel(domain_global_name, np, verbose=False, delete_old=False,
+                       memory_budget=None, processes=1):
+    """Merge the sww files domain_global_name_P<np>_<v>.sww of a parallel
+    run into domain_global_name.sww.
+
+    At most memory_budget bytes (default: default_memory_budget) of frames
+    are held at a time. If processes > 1 the frames are merged by that many
+    worker processes.
+    """
 
     output = domain_global_name+".sww"
     swwfiles = [ domain_global_name+"_P"+str(np)+"_"+str(v)+".sww" for v in range(np)]
 
-    fid = NetCDFFile(swwfiles[0], netcdf_mode_r)
-
-    try: # works with netcdf4
-        number_of_volumes = len(fid.dimensions['number_of_volumes'])
-        number_of_points = len(fid.dimensions['number_of_points'])
-    except: # works with scientific.io.netcdf
-        number_of_volumes = int(fid.dimensions['number_of_volumes'])
-        number_of_points = int(fid.dimensions['number_of_points'])
+    if memory_budget is None:
+        memory_budget = default_memory_budget
 
-    fid.close()
+    smooth = _sww_is_smooth(swwfiles[0])
 
-    if 3*number_of_volumes == number_of_points:
-        _sww_merge_parallel_non_smooth(swwfiles, output, verbose, delete_old)
-    else:
-        _sww_merge_parallel_smooth(swwfiles, output, verbose, delete_old)
+    _sww_merge_parallel(swwfiles, output, smooth, verbose, delete_old,
+                        memory_budget, processes)
         
 
 def _sww_merge(swwfiles, output, verbose=False):
@@ -198,7 +198,18 @@ def _sww_merge(swwfiles, output, verbose=False):
     fido.close()
 
 
-def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=False):
+# Default bound on the memory (bytes) used for the frames held while merging
+default_memory_budget = 2**28
+
+# Bytes of frames left between the frame ranges merged concurrently. The
+# netcdf library writes whole buffered blocks, so processes writing frames
+# closer than a block apart could overwrite each other's values. The frames
+# in between are merged once the concurrent merges have finished.
+concurrent_merge_gap = 2**24
+
+
+def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=False,
+                               memory_budget=default_memory_budget):
     """
         Merge a list of sww files into a single file.
         
@@ -206,496 +217,362 @@ def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=Fals
 
         The sww files to be merged must have exactly the same timesteps.
 
-        It is assumed that the separate sww files have been stored in non_smooth
+        It is assumed that the separate sww files have been stored in smooth
         format.
 
-        Note that some advanced information and custom quantities may not be
-        exported.
-        
-        swwfiles is a list of .sww files to merge.
-        output is the output filename, including .sww extension.
-        verbose True to log output information
+        See _sww_merge_parallel.
     """
 
-    if verbose:
-        print "MERGING SWW Files"
-        
-    
-    first_file = True
-    tri_offset = 0
-    for filename in swwfiles:
-        if verbose:
-            print 'Reading file ', filename, ':'    
-    
-        fid = NetCDFFile(filename, netcdf_mode_r)
-         
-        if first_file:
+    _sww_merge_parallel(swwfiles, output, True, verbose, delete_old,
+                        memory_budget)
 
-            times    = fid.variables['time'][:]
-            n_steps = len(times)
-            #number_of_timesteps = fid.dimensions['number_of_timesteps']
-            #print n_steps, number_of_timesteps
-            starttime = int(fid.starttime)
-            
-            out_s_quantities = {}
-            out_d_quantities = {}
-
-            out_s_c_quantities = {}
-            out_d_c_quantities = {}
-
-
-            xllcorner = fid.xllcorner
-            yllcorner = fid.yllcorner
-
-            number_of_global_triangles = int(fid.number_of_global_triangles)
-            number_of_global_nodes     = int(fid.number_of_global_nodes)
-
-            order      = fid.order
-            xllcorner  = fid.xllcorner;
-            yllcorner  = fid.yllcorner ;
-            zone       = fid.zone;
-            false_easting  = fid.false_easting;
-            false_northing = fid.false_northing;
-            datum      = fid.datum;
-            projection = fid.projection;
-
-            g_volumes = num.zeros((number_of_global_triangles,3),num.int)
-            g_x = num.zeros((number_of_global_nodes,),num.float32)
-            g_y = num.zeros((number_of_global_nodes,),num.float32)
-
-            g_points = num.zeros((number_of_global_nodes,2),num.float32)
 
-            #=====================================
-            # Deal with the vertex based variables
-            #=====================================
-            quantities = set(['elevation', 'friction', 'stage', 'xmomentum',
-                              'ymomentum', 'xvelocity', 'yvelocity', 'height'])
-            variables = set(fid.variables.keys())
-
-            quantities = list(quantities & variables)
-            
-            static_quantities = []
-            dynamic_quantities = []
-
-            for quantity in quantities:
-                # Test if quantity is static
-                if n_steps == fid.variables[quantity].shape[0]:
-                    dynamic_quantities.append(quantity)
-                else:
-                    static_quantities.append(quantity)
-                
-            for quantity in static_quantities:
-                out_s_quantities[quantity] = num.zeros((number_of_global_nodes,),num.float32)
-
-            # Quantities are stored as a 2D array of timesteps x data.
-            for quantity in dynamic_quantities:
-                out_d_quantities[quantity] = \
-                      num.zeros((n_steps,number_of_global_nodes),num.float32)
-
-            #=======================================
-            # Deal with the centroid based variables
-            #=======================================
-            quantities = set(['elevation_c', 'friction_c', 'stage_c', 'xmomentum_c',
-                              'ymomentum_c', 'xvelocity_c', 'yvelocity_c', 'height_c'])
-            variables = set(fid.variables.keys())
+def _sww_merge_parallel_non_smooth(swwfiles, output,  verbose=False, delete_old=False,
+                                   memory_budget=default_memory_budget):
+    """
+        Merge a list of sww files into a single file.
 
-            quantities = list(quantities & variables)
-            
-            static_c_quantities = []
-            dynamic_c_quantities = []
+        Used to merge files created by parallel runs.
 
-            for quantity in quantities:
-                # Test if quantity is static
-                if n_steps == fid.variables[quantity].shape[0]:
-                    dynamic_c_quantities.append(quantity)
-                else:
-                    static_c_quantities.append(quantity)
-                
-            for quantity in static_c_quantities:
-                out_s_c_quantities[quantity] = num.zeros((number_of_global_triangles,),num.float32)
+        The sww files to be merged must have exactly the same timesteps.
 
-            # Quantities are stored as a 2D array of timesteps x data.
-            for quantity in dynamic_c_quantities:
-                out_d_c_quantities[quantity] = \
-                      num.zeros((n_steps,number_of_global_triangles),num.float32)
-                 
-            description = 'merged:' + getattr(fid, 'description')          
-            first_file = False
+        It is assumed that the separate sww files have been stored in non_smooth
+        format.
 
+        See _sww_merge_parallel.
+    """
 
-        # Read in from files and add to global arrays
+    _sww_merge_parallel(swwfiles, output, False, verbose, delete_old,
+                        memory_budget)
 
-        tri_l2g  = fid.variables['tri_l2g'][:]
-        node_l2g = fid.variables['node_l2g'][:]
-        tri_full_flag = fid.variables['tri_full_flag'][:]
-        volumes = num.array(fid.variables['volumes'][:],dtype=num.int)
-        l_volumes = num.zeros_like(volumes)
-        l_old_volumes = num.zeros_like(volumes)
 
+def _sww_merge_parallel(swwfiles, output, smooth, verbose=False, delete_old=False,
+                        memory_budget=default_memory_budget, processes=1):
+    """
+        Merge a list of sww files created by a parallel run into a single
+        file.
 
-        # Change the local node ids to global id in the
-        # volume array
+        The mesh, the static quantities and the times are written first.
+        The dynamic quantities are then streamed from all the input files
+        into the output in chunks of frames, so that at most memory_budget
+        bytes of frames are held at a time, instead of all timesteps.
 
-        # FIXME SR: Surely we can knock up a numpy way of doing this
-        #for i in range(len(l_volumes)):
-        #    g_n0 = node_l2g[volumes[i,0]]
-        #    g_n1 = node_l2g[volumes[i,1]]
-        #    g_n2 = node_l2g[volumes[i,2]]
-        #
-        #    l_old_volumes[i,:] = [g_n0,g_n1,g_n2]
+        If processes > 1 the frames are split into that many ranges which
+        are merged concurrently by a pool of worker processes.
 
-        g_n0 = node_l2g[volumes[:,0]].reshape(-1,1)
-        g_n1 = node_l2g[volumes[:,1]].reshape(-1,1)
-        g_n2 = node_l2g[volumes[:,2]].reshape(-1,1)
+        Note that some advanced information and custom quantities may not be
+        exported.
 
-        #print g_n0.shape
-        l_volumes = num.hstack((g_n0,g_n1,g_n2))
+        swwfiles is a list of .sww files to merge.
+        output is the output filename, including .sww extension.
+        smooth True if the files have been stored in smooth format.
+        verbose True to log output information
+    """
 
-        #assert num.allclose(l_volumes, l_old_volumes)
+    if verbose:
+        print "MERGING SWW Files"
 
-        # Just pick out the full triangles
-        ftri_ids = num.where(tri_full_flag>0)
-        ftri_l2g = num.compress(tri_full_flag, tri_l2g)
-        
-        #f_ids = num.argwhere(tri_full_flag==1).reshape(-1,)
-        #f_gids = tri_l2g[f_ids]
+    n_steps = _sww_merge_create(swwfiles, output, smooth, verbose)
 
-        #print l_volumes
-        #print tri_full_flag
-        #print tri_l2g
-        #print ftri_l2g
-        
-        f_volumes0 = num.compress(tri_full_flag,volumes[:,0])
-        f_volumes1 = num.compress(tri_full_flag,volumes[:,1])
-        f_volumes2 = num.compress(tri_full_flag,volumes[:,2])
-        
-        g_volumes[ftri_l2g,0] = node_l2g[f_volumes0]
-        g_volumes[ftri_l2g,1] = node_l2g[f_volumes1]
-        g_volumes[ftri_l2g,2] = node_l2g[f_volumes2]
+    frames, gaps = _sww_merge_split_frames(output, n_steps, processes)
 
-        #fg_volumes = num.compress(tri_full_flag,l_volumes,axis=0)
-        #g_volumes[ftri_l2g] = fg_volumes
+    if processes > 1:
+        from multiprocessing import Pool
 
+        pool = Pool(processes)
+        results = [pool.apply_async(_sww_merge_frames,
+                                    (swwfiles, output, smooth, start, stop,
+                                     memory_budget, verbose))
+                   for start, stop in frames]
+        ranges = [result.get() for result in results]
+        pool.close()
+        pool.join()
+    else:
+        ranges = [_sww_merge_frames(swwfiles, output, smooth, start, stop,
+                                    memory_budget, verbose)
+                  for start, stop in frames]
 
+    for start, stop in gaps:
+        ranges.append(_sww_merge_frames(swwfiles, output, smooth, start, stop,
+                                        memory_budget, verbose))
 
+    _sww_merge_store_ranges(output, ranges)
 
-        #g_x[node_l2g] = fid.variables['x']
-        #g_y[node_l2g] = fid.variables['y']
+    if delete_old:
+        import os
+        for filename in swwfiles:
 
-        g_points[node_l2g,0] = fid.variables['x'][:]
-        g_points[node_l2g,1] = fid.variables['y'][:]
-        
+            if verbose:
+                print 'Deleting file ', filename, ':'
+            os.remove(filename)
 
-        #print number_of_timesteps
 
+def sww_merge_parallel_mpi(domain_global_name, np, verbose=False,
+                           delete_old=False, memory_budget=None):
+    """
+        Merge the sww files of a parallel run using all MPI processes.
 
-        # FIXME SR: It seems that some of the "ghost" node quantity values
-        # are being storded. We should only store those nodes which are associated with
-        # full triangles. So we need an index array of "full" nodes, ie those in
-        # full triangles
+        Must be called by all processes. Processor 0 writes the mesh and
+        static quantities, then each processor streams its own range of
+        frames into the merged file.
+    """
 
-        #use numpy.compress and numpy.unique to get "full nodes
+    import anuga.utilities.parallel_abstraction as pypar
 
-        f_volumes = num.compress(tri_full_flag,volumes,axis=0)
-        fl_nodes = num.unique(f_volumes)
-        f_node_l2g = node_l2g[fl_nodes]
+    myid = pypar.rank()
+    numprocs = pypar.size()
 
-        #print len(node_l2g)
-        #print len(fl_nodes)
+    if memory_budget is None:
+        memory_budget = default_memory_budget
 
-        # Read in static quantities
-        for quantity in static_quantities:
-            #out_s_quantities[quantity][node_l2g] = \
-            #             num.array(fid.variables[quantity],dtype=num.float32)
-            q = fid.variables[quantity]
-            #print quantity, q.shape
-            out_s_quantities[quantity][f_node_l2g] = \
-                         num.array(q[:],dtype=num.float32)[fl_nodes]
+    output = domain_global_name+".sww"
+    swwfiles = [ domain_global_name+"_P"+str(np)+"_"+str(v)+".sww" for v in range(np)]
 
-        
-        #Collate all dynamic quantities according to their timestep
-        for quantity in dynamic_quantities:
-            q = fid.variables[quantity]
-            #print q.shape
-            for i in range(n_steps):
-                #out_d_quantities[quantity][i][node_l2g] = \
-                #           num.array(q[i],dtype=num.float32)
-                out_d_quantities[quantity][i][f_node_l2g] = \
-                           num.array(q[i],dtype=num.float32)[fl_nodes]
+    smooth = _sww_is_smooth(swwfiles[0])
 
+    if myid == 0:
+        if verbose:
+            print "MERGING SWW Files"
+        n_steps = _sww_merge_create(swwfiles, output, smooth, verbose)
+        for p in range(1, numprocs):
+            pypar.send(n_steps, p)
+    else:
+        n_steps = pypar.receive(0)
 
-        # Read in static c quantities
-        for quantity in static_c_quantities:
-            #out_s_quantities[quantity][node_l2g] = \
-            #             num.array(fid.variables[quantity],dtype=num.float32)
-            q = fid.variables[quantity]
-            out_s_c_quantities[quantity][ftri_l2g] = \
-                         num.array(q).astype(num.float32)[ftri_ids]
+    frames, gaps = _sww_merge_split_frames(output, n_steps, numprocs)
 
-        
-        #Collate all dynamic c quantities according to their timestep
-        for quantity in dynamic_c_quantities:
-            q = fid.variables[quantity]
-            #print q.shape
-            for i in range(n_steps):
-                out_d_c_quantities[quantity][i][ftri_l2g] = \
-                           num.array(q[i]).astype(num.float32)[ftri_ids]
+    start, stop = frames[myid]
+    q_range = _sww_merge_frames(swwfiles, output, smooth, start, stop,
+                                memory_budget, verbose)
 
+    if myid == 0:
+        ranges = [q_range]
+        for p in range(1, numprocs):
+            ranges.append(pypar.receive(p))
 
-        fid.close()
+        for start, stop in gaps:
+            ranges.append(_sww_merge_frames(swwfiles, output, smooth,
+                                            start, stop, memory_budget,
+                                            verbose))
 
+        _sww_merge_store_ranges(output, ranges)
 
-    #---------------------------
-    # Write out the SWW file
-    #---------------------------
-    #print g_points.shape
+        if delete_old:
+            import os
+            for filename in swwfiles:
 
-    #print number_of_global_triangles
-    #print number_of_global_nodes
+                if verbose:
+                    print 'Deleting file ', filename, ':'
+                os.remove(filename)
+    else:
+        pypar.send(q_range, 0)
 
+    pypar.barrier()
 
-    if verbose:
-            print 'Writing file ', output, ':'
-    fido = NetCDFFile(output, netcdf_mode_w)
 
-    sww = Write_sww(static_quantities, dynamic_quantities, static_c_quantities, dynamic_c_quantities)
-    sww.store_header(fido, starttime,
-                             number_of_global_triangles,
-                             number_of_global_nodes,
-                             description=description,
-                             sww_precision=netcdf_float32)
+def split_frames(n_steps, n):
+    """Split the frames 0..n_steps-1 into n contiguous (start, stop) ranges
+    of nearly equal size.
+    """
 
+    bounds = [(i*n_steps)/n for i in range(n+1)]
 
+    return zip(bounds[:-1], bounds[1:])
 
-    from anuga.coordinate_transforms.geo_reference import Geo_reference
-    geo_reference = Geo_reference()
-    
-    sww.store_triangulation(fido, g_points, g_volumes, points_georeference=geo_reference)
 
-    fido.order      = order
-    fido.xllcorner  = xllcorner;
-    fido.yllcorner  = yllcorner ;
-    fido.zone       = zone;
-    fido.false_easting  = false_easting;
-    fido.false_northing = false_northing;
-    fido.datum      = datum;
-    fido.projection = projection;
-       
-    sww.store_static_quantities(fido, verbose=verbose, **out_s_quantities)
-    sww.store_static_quantities_centroid(fido, verbose=verbose, **out_s_c_quantities)
+def _sww_merge_split_frames(output, n_steps, n):
+    """Split the frames of the merged file into n ranges which can be
+    merged concurrently, and the gaps of concurrent_merge_gap bytes at
+    the start of each range which must be merged afterwards.
 
-    # Write out all the dynamic quantities for each timestep
-
-    for i in range(n_steps):
-        fido.variables['time'][i] = times[i]
-
-        
-    for q in dynamic_quantities:
-        q_values = out_d_quantities[q]
-        if verbose:
-            print '  Writing quantity: ',q
-            
-        for i in range(n_steps):
-            fido.variables[q][i] = q_values[i]
-        
-        # This updates the _range values
-        q_range = fido.variables[q + Write_sww.RANGE][:]
-        q_values_min = num.min(q_values)
-        if q_values_min < q_range[0]:
-            fido.variables[q + Write_sww.RANGE][0] = q_values_min
-        q_values_max = num.max(q_values)
-        if q_values_max > q_range[1]:
-            fido.variables[q + Write_sww.RANGE][1] = q_values_max        
-
-    for q in dynamic_c_quantities:
-        if verbose:
-            print '  Writing quantity: ',q
-            
-        q_values = out_d_c_quantities[q]
-        for i in range(n_steps):
-            fido.variables[q][i] = q_values[i]
+    Returns the lists of (start, stop) frames and gaps.
+    """
 
-                                        
-    #print out_s_quantities
-    #print out_d_quantities
-    
-    #print g_x
-    #print g_y
+    frames = split_frames(n_steps, n)
+    if n == 1:
+        return frames, []
+
+    # Bytes per frame of all the variables along the time dimension
+    fid = NetCDFFile(output, netcdf_mode_r)
+    frame_size = 0
+    for name in fid.variables:
+        var = fid.variables[name]
+        if len(var.shape) > 0 and var.dimensions[0] == 'number_of_timesteps':
+            frame_size += int(num.prod(var.shape[1:]))*var.dtype.itemsize
+    fid.close()
 
-    #print g_volumes
+    gap = -(-concurrent_merge_gap/max(1, frame_size))
 
-    fido.close()
-    
-    if delete_old:
-        import os
-        for filename in swwfiles:
+    gaps = []
+    for i in range(1, n):
+        start, stop = frames[i]
+        gap_stop = min(start + gap, stop)
+        gaps.append((start, gap_stop))
+        frames[i] = (gap_stop, stop)
 
-            if verbose:
-                print 'Deleting file ', filename, ':'
-            os.remove(filename)
+    return frames, gaps
 
 
-def _sww_merge_parallel_non_smooth(swwfiles, output,  verbose=False, delete_old=False):
+def _sww_is_smooth(filename):
+    """True if the sww file stores the vertices in smooth format
     """
-        Merge a list of sww files into a single file.
-
-        Used to merge files created by parallel runs.
 
-        The sww files to be merged must have exactly the same timesteps.
+    fid = NetCDFFile(filename, netcdf_mode_r)
 
-        It is assumed that the separate sww files have been stored in non_smooth
-        format.
-
-        Note that some advanced information and custom quantities may not be
-        exported.
-
-        swwfiles is a list of .sww files to merge.
-        output is the output filename, including .sww extension.
-        verbose True to log output information
-    """
+    try: # works with netcdf4
+        number_of_volumes = len(fid.dimensions['number_of_volumes'])
+        number_of_points = len(fid.dimensions['number_of_points'])
+    except: # works with scientific.io.netcdf
+        number_of_volumes = int(fid.dimensions['number_of_volumes'])
+        number_of_points = int(fid.dimensions['number_of_points'])
 
-    if verbose:
-        print "MERGING SWW Files"
+    fid.close()
 
+    return 3*number_of_volumes != number_of_points
 
-    first_file = True
-    tri_offset = 0
-    for filename in swwfiles:
-        if verbose:
-            print 'Reading file ', filename, ':'
 
-        fid = NetCDFFile(filename, netcdf_mode_r)
+def _sww_merge_quantities(fid, n_steps):
+    """Split the vertex and centroid quantities stored in fid into static
+    and dynamic ones.
+    """
 
-        if first_file:
+    variables = set(fid.variables.keys())
 
-            times    = fid.variables['time'][:]
-            n_steps = len(times)
-            number_of_timesteps = fid.dimensions['number_of_timesteps']
-            #print n_steps, number_of_timesteps
-            starttime = int(fid.starttime)
+    quantities = set(['elevation', 'friction', 'stage', 'xmomentum',
+                      'ymomentum', 'xvelocity', 'yvelocity', 'height'])
+    c_quantities = set([q + '_c' for q in quantities])
 
-            out_s_quantities = {}
-            out_d_quantities = {}
+    static_quantities = []
+    dynamic_quantities = []
+    static_c_quantities = []
+    dynamic_c_quantities = []
 
-            out_s_c_quantities = {}
-            out_d_c_quantities = {}
+    for quantity in list(quantities & variables):
+        # Test if quantity is static
+        if n_steps == fid.variables[quantity].shape[0]:
+            dynamic_quantities.append(quantity)
+        else:
+            static_quantities.append(quantity)
 
+    for quantity in list(c_quantities & variables):
+        # Test if quantity is static
+        if n_steps == fid.variables[quantity].shape[0]:
+            dynamic_c_quantities.append(quantity)
+        else:
+            static_c_quantities.append(quantity)
 
-            xllcorner = fid.xllcorner
-            yllcorner = fid.yllcorner
+    return static_quantities, dynamic_quantities, \
+           static_c_quantities, dynamic_c_quantities
 
-            number_of_global_triangles = int(fid.number_of_global_triangles)
-            number_of_global_nodes     = int(fid.number_of_global_nodes)
-            number_of_global_triangle_vertices = 3*number_of_global_triangles
 
+def _sww_merge_maps(fid, smooth):
+    """Local and global ids of the vertex and centroid values of the full
+    triangles stored in fid.
 
-            order      = fid.order
-            xllcorner  = fid.xllcorner;
-            yllcorner  = fid.yllcorner ;
-            zone       = fid.zone;
-            false_easting  = fid.false_easting;
-            false_northing = fid.false_northing;
-            datum      = fid.datum;
-            projection = fid.projection;
+    Returns l_vids, g_vids, l_tids, g_tids.
+    """
 
-            g_volumes = num.arange(number_of_global_triangles*3).reshape(-1,3)
+    tri_l2g  = fid.variables['tri_l2g'][:]
+    node_l2g = fid.variables['node_l2g'][:]
+    tri_full_flag = fid.variables['tri_full_flag'][:]
 
+    # Just pick out the full triangles
+    f_ids = num.argwhere(tri_full_flag==1).reshape(-1,)
+    f_gids = tri_l2g[f_ids]
 
+    if smooth:
+        # Only store the nodes of full triangles, as some of the "ghost"
+        # node values are not consistent
+        volumes = num.array(fid.variables['volumes'][:],dtype=num.int)
+        l_vids = num.unique(volumes[f_ids])
+        g_vids = node_l2g[l_vids]
+    else:
+        g_vids = (3*f_gids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
+        l_vids = (3*f_ids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
 
-            g_x = num.zeros((number_of_global_triangle_vertices,),num.float32)
-            g_y = num.zeros((number_of_global_triangle_vertices,),num.float32)
+    return l_vids, g_vids, f_ids, f_gids
 
-            g_points = num.zeros((number_of_global_triangle_vertices,2),num.float32)
 
-            #=======================================
-            # Deal with the vertex based variables
-            #=======================================
-            quantities = set(['elevation', 'friction', 'stage', 'xmomentum',
-                              'ymomentum', 'xvelocity', 'yvelocity', 'height'])
-            variables = set(fid.variables.keys())
+def _sww_merge_create(swwfiles, output, smooth, verbose=False):
+    """Create the merged sww file with the mesh, static quantities and
+    times. The dynamic quantities are written by _sww_merge_frames.
 
-            quantities = list(quantities & variables)
+    Returns the number of timesteps.
+    """
 
-            static_quantities = []
-            dynamic_quantities = []
+    fid = NetCDFFile(swwfiles[0], netcdf_mode_r)
 
-            for quantity in quantities:
-                # Test if elevation is static
-                if n_steps == fid.variables[quantity].shape[0]:
-                    dynamic_quantities.append(quantity)
-                else:
-                    static_quantities.append(quantity)
+    times    = fid.variables['time'][:]
+    n_steps = len(times)
+    starttime = int(fid.starttime)
 
-            # Static Quantities are stored as a 1D array
-            for quantity in static_quantities:
-                out_s_quantities[quantity] = num.zeros((3*number_of_global_triangles,),num.float32)
+    number_of_global_triangles = int(fid.number_of_global_triangles)
+    number_of_global_nodes     = int(fid.number_of_global_nodes)
 
-            #=======================================
-            # Deal with the centroid based variables
-            #=======================================
-            quantities = set(['elevation_c', 'friction_c', 'stage_c', 'xmomentum_c',
-                              'ymomentum_c', 'xvelocity_c', 'yvelocity_c', 'height_c'])
-            variables = set(fid.variables.keys())
+    order      = fid.order
+    xllcorner  = fid.xllcorner;
+    yllcorner  = fid.yllcorner ;
+    zone       = fid.zone;
+    false_easting  = fid.false_easting;
+    false_northing = fid.false_northing;
+    datum      = fid.datum;
+    projection = fid.projection;
 
-            quantities = list(quantities & variables)
-            
-            static_c_quantities = []
-            dynamic_c_quantities = []
+    static_quantities, dynamic_quantities, \
+    static_c_quantities, dynamic_c_quantities = \
+        _sww_merge_quantities(fid, n_steps)
 
-            for quantity in quantities:
-                # Test if quantity is static
-                if n_steps == fid.variables[quantity].shape[0]:
-                    dynamic_c_quantities.append(quantity)
-                else:
-                    static_c_quantities.append(quantity)
-                
-            for quantity in static_c_quantities:
-                out_s_c_quantities[quantity] = num.zeros((number_of_global_triangles,),num.float32)
+    description = 'merged:' + getattr(fid, 'description')
 
-            description = 'merged:' + getattr(fid, 'description')
-            first_file = False
+    fid.close()
 
+    if smooth:
+        number_of_global_vertices = number_of_global_nodes
+        g_volumes = num.zeros((number_of_global_triangles,3),num.int)
+    else:
+        number_of_global_vertices = 3*number_of_global_triangles
+        g_volumes = num.arange(number_of_global_triangles*3).reshape(-1,3)
 
-        # Read in from files and add to global arrays
+    g_points = num.zeros((number_of_global_vertices,2),num.float32)
 
-        tri_l2g  = fid.variables['tri_l2g'][:]
-        node_l2g = fid.variables['node_l2g'][:]
-        tri_full_flag = fid.variables['tri_full_flag'][:]
+    out_s_quantities = {}
+    for quantity in static_quantities:
+        out_s_quantities[quantity] = \
+              num.zeros((number_of_global_vertices,),num.float32)
 
-        f_ids = num.argwhere(tri_full_flag==1).reshape(-1,)
-        f_gids = tri_l2g[f_ids]
+    out_s_c_quantities = {}
+    for quantity in static_c_quantities:
+        out_s_c_quantities[quantity] = \
+              num.zeros((number_of_global_triangles,),num.float32)
 
-        g_vids = (3*f_gids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
-        l_vids = (3*f_ids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
+    # Read in the mesh and static quantities from the files
+    for filename in swwfiles:
+        if verbose:
+            print 'Reading file ', filename, ':'
 
+        fid = NetCDFFile(filename, netcdf_mode_r)
 
-        l_x = num.array(fid.variables['x'][:],dtype=num.float32)
-        l_y = num.array(fid.variables['y'][:],dtype=num.float32)
+        l_vids, g_vids, l_tids, g_tids = _sww_merge_maps(fid, smooth)
 
-        
-        g_x[g_vids] = l_x[l_vids]
-        g_y[g_vids] = l_y[l_vids]
-
-        g_points[g_vids,0] = g_x[g_vids]
-        g_points[g_vids,1] = g_y[g_vids]
+        if smooth:
+            # Change the local node ids to global id in the volume array
+            node_l2g = fid.variables['node_l2g'][:]
+            volumes = num.array(fid.variables['volumes'][:],dtype=num.int)
+            g_volumes[g_tids] = node_l2g[volumes[l_tids]]
 
+        g_points[g_vids,0] = num.array(fid.variables['x'][:],dtype=num.float32)[l_vids]
+        g_points[g_vids,1] = num.array(fid.variables['y'][:],dtype=num.float32)[l_vids]
 
-        ## Read in static quantities
         for quantity in static_quantities:
             q = fid.variables[quantity]
             out_s_quantities[quantity][g_vids] = \
-                         num.array(q).astype(num.float32)[l_vids]
-                         #num.array(q,dtype=num.float32)[l_vids]
+                         num.array(q[:],dtype=num.float32)[l_vids]
 
-
-        # Read in static c quantities
         for quantity in static_c_quantities:
             q = fid.variables[quantity]
-            out_s_c_quantities[quantity][f_gids] = \
-                         num.array(q).astype(num.float32)[f_ids]
-                         #num.array(q,dtype=num.float32)[f_ids]
+            out_s_c_quantities[quantity][g_tids] = \
+                         num.array(q[:],dtype=num.float32)[l_tids]
 
-        
         fid.close()
 
     #---------------------------
@@ -704,16 +581,15 @@ def _sww_merge_parallel_non_smooth(swwfiles, output,  verbose=False, delete_old=
 
     if verbose:
             print 'Writing file ', output, ':'
-
     fido = NetCDFFile(output, netcdf_mode_w)
+
     sww = Write_sww(static_quantities, dynamic_quantities, static_c_quantities, dynamic_c_quantities)
     sww.store_header(fido, starttime,
                              number_of_global_triangles,
-                             number_of_global_triangles*3,
+                             number_of_global_vertices,
                              description=description,
                              sww_precision=netcdf_float32)
 
-
     from anuga.coordinate_transforms.geo_reference import Geo_reference
     geo_reference = Geo_reference()
 
@@ -730,72 +606,100 @@ def _sww_merge_parallel_non_smooth(swwfiles, output,  verbose=False, delete_old=
 
     sww.store_static_quantities(fido, verbose=verbose, **out_s_quantities)
     sww.store_static_quantities_centroid(fido, verbose=verbose, **out_s_c_quantities)
-    
-    # Write out all the dynamic quantities for each timestep
 
-    for i in range(n_steps):
-        fido.variables['time'][i] = times[i]
+    # Writing all the times allocates the frames of the dynamic quantities,
+    # so that they can then be filled in any order
+    fido.variables['time'][:] = times
+
+    fido.close()
+
+    return n_steps
+
+
+def _sww_merge_frames(swwfiles, output, smooth, start, stop,
+                      memory_budget=default_memory_budget, verbose=False):
+    """Stream the frames start..stop-1 of the dynamic quantities from the
+    sww files into the merged file created by _sww_merge_create.
+
+    Frames are merged in chunks holding at most memory_budget bytes of
+    global values. Several processes may merge frame ranges into the same
+    file concurrently if they are split by _sww_merge_split_frames.
+
+    Returns a dictionary with the (min, max) of each dynamic vertex quantity
+    over the frames merged.
+    """
+
+    q_range = {}
+    if stop <= start:
+        return q_range
+
+    fids = [NetCDFFile(filename, netcdf_mode_r) for filename in swwfiles]
+    maps = [_sww_merge_maps(fid, smooth) for fid in fids]
+
+    fido = NetCDFFile(output, netcdf_mode_a)
+
+    _, dynamic_quantities, _, dynamic_c_quantities = \
+        _sww_merge_quantities(fids[0], len(fido.variables['time']))
+
+    number_of_vertices = fido.variables['x'].shape[0]
+    number_of_triangles = fido.variables['volumes'].shape[0]
 
-    for q in (dynamic_quantities + dynamic_c_quantities):
+    # Frames per chunk such that each chunk of global values is in budget
+    chunk = max(1, int(memory_budget/(4*max(number_of_vertices, number_of_triangles))))
+
+    for i0 in range(start, stop, chunk):
+        i1 = min(i0 + chunk, stop)
 
         if verbose:
-            print '  Writing quantity: ',q
-                    
-        # Initialise q_values with zeros
-        if q in dynamic_quantities:
-            q_values = num.zeros((n_steps, 3*number_of_global_triangles), num.float32)
-        elif q in dynamic_c_quantities:
-            q_values = num.zeros((n_steps, number_of_global_triangles), num.float32)
+            print '  Merging frames %d to %d' % (i0, i1-1)
 
+        for q in (dynamic_quantities + dynamic_c_quantities):
+            if q in dynamic_quantities:
+                q_values = num.zeros((i1-i0, number_of_vertices), num.float32)
+            else:
+                q_values = num.zeros((i1-i0, number_of_triangles), num.float32)
 
-        # Read the quantities one at a time, to reduce memory usage
-        for filename in swwfiles:
-            fid = NetCDFFile(filename, netcdf_mode_r)
+            for fid, (l_vids, g_vids, l_tids, g_tids) in zip(fids, maps):
+                l_values = num.array(fid.variables[q][i0:i1], dtype=num.float32)
 
-            # Index information
-            tri_l2g  = fid.variables['tri_l2g'][:]
-            node_l2g = fid.variables['node_l2g'][:]
-            tri_full_flag = fid.variables['tri_full_flag'][:]
-            f_ids = num.argwhere(tri_full_flag==1).reshape(-1,)
-            f_gids = tri_l2g[f_ids]
-            g_vids = (3*f_gids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
-            l_vids = (3*f_ids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
-            for i in range(n_steps):
                 # Different indices for vertex and centroid quantities
                 if q in dynamic_quantities:
-                    q_values[i][g_vids] = \
-                    num.array(fid.variables[q][i], dtype=num.float32)[l_vids]
-                elif q in dynamic_c_quantities:
-                    q_values[i][f_gids] = \
-                    num.array(fid.variables[q][i], dtype=num.float32)[f_ids]
+                    q_values[:,g_vids] = l_values[:,l_vids]
+                else:
+                    q_values[:,g_tids] = l_values[:,l_tids]
 
-            fid.close()
+            fido.variables[q][i0:i1] = q_values
 
-        # Write to the file
-        for i in range(n_steps):
-            fido.variables[q][i] = q_values[i]
+            if q in dynamic_quantities:
+                q_min, q_max = q_range.get(q, (q_values.min(), q_values.max()))
+                q_range[q] = (min(q_min, q_values.min()),
+                              max(q_max, q_values.max()))
 
-        if q in dynamic_quantities:
+    fido.close()
+    for fid in fids:
+        fid.close()
+
+    return q_range
+
+
+def _sww_merge_store_ranges(output, ranges):
+    """Update the _range values of the merged file from the (min, max)
+    dictionaries returned by _sww_merge_frames.
+    """
+
+    fido = NetCDFFile(output, netcdf_mode_a)
+
+    for q_range in ranges:
+        for q, (q_values_min, q_values_max) in q_range.items():
             # This updates the _range values
-            q_range = fido.variables[q + Write_sww.RANGE][:]
-            q_values_min = num.min(q_values)
-            if q_values_min < q_range[0]:
+            r = fido.variables[q + Write_sww.RANGE][:]
+            if q_values_min < r[0]:
                 fido.variables[q + Write_sww.RANGE][0] = q_values_min
-            q_values_max = num.max(q_values)
-            if q_values_max > q_range[1]:
+            if q_values_max > r[1]:
                 fido.variables[q + Write_sww.RANGE][1] = q_values_max
 
     fido.close()
 
-    if delete_old:
-        import os
-        for filename in swwfiles:
-
-            if verbose:
-                print 'Deleting file ', filename, ':'
-            os.remove(filename)
-
-
 
 
 
@@ -815,16 +719,23 @@ if __name__ == "__main__":
                    help='verbosity')
     parser.add_argument('-delete_old', nargs='?', type=bool, const=True, default=False,
                    help='Flag to delete the input files')
+    parser.add_argument('-memory', type=int, default=default_memory_budget/2**20,
+                   help='memory budget in MB for the frames held while merging')
+    parser.add_argument('-processes', type=int, default=1,
+                   help='number of worker processes merging frames')
     args = parser.parse_args()
 
     np = args.np
     domain_global_name = args.f
     verbose = args.v
     delete_old = args.delete_old
+    memory_budget = args.memory*2**20
+    processes = args.processes
 
 
     try:
-        sww_merge_parallel(domain_global_name, np, verbose, delete_old)
+        sww_merge_parallel(domain_global_name, np, verbose, delete_old,
+                           memory_budget, processes)
     except:
         msg = 'ERROR: When merging sww files %s '% domain_global_name
         print msg
@@ -148,6 +148,94 @@ class Test_FileUtils(unittest.TestCase):
 			os.remove(outfile)      
         
         
+    def create_parallel_swwfiles(self, numprocs, smooth):
+        """Store a few frames from each processor of a partitioned domain"""
+
+        import numpy as num
+        import anuga
+        from anuga.parallel.sequential_distribute import \
+             sequential_distribute_dump, sequential_distribute_load_pickle_file
+
+        domain = anuga.rectangular_cross_domain(8, 8, len1=10., len2=10.)
+        domain.set_name('merge')
+        domain.set_store_vertices_uniquely(not smooth)
+        domain.set_quantity('elevation', lambda x,y: -x/10.)
+        domain.set_quantities_to_be_stored({'elevation': 1, 'stage': 2,
+                                            'xmomentum': 2, 'ymomentum': 2})
+        sequential_distribute_dump(domain, numprocs)
+
+        for p in range(numprocs):
+            d = sequential_distribute_load_pickle_file(
+                'merge_P%d_%d.pickle' % (numprocs, p), np=numprocs)
+            d.processor = p
+            d.initialise_storage()
+            for i in range(1, 8):
+                d.set_time(0.1*i)
+                d.set_quantity('stage', lambda x,y: num.sin(x+i) + y/100.)
+                d.set_quantity('xmomentum', lambda x,y: num.cos(y*i))
+                d.store_timestep()
+
+    def test_sww_merge_parallel_streaming(self):
+        """Merging in chunks of frames and by several processes gives the
+        same file as merging all frames at once"""
+
+        import numpy as num
+        import anuga.utilities.sww_merge as merge
+        from anuga.file.netcdf import NetCDFFile
+
+        cwd = os.getcwd()
+        work_dir = tempfile.mkdtemp()
+        os.chdir(work_dir)
+
+        gap = merge.concurrent_merge_gap
+        try:
+            for smooth in [True, False]:
+                self.create_parallel_swwfiles(3, smooth)
+
+                merge.sww_merge_parallel('merge', 3)
+                os.rename('merge.sww', 'merge_ref.sww')
+
+                # Small enough to merge one frame at a time
+                merge.sww_merge_parallel('merge', 3, memory_budget=100)
+                os.rename('merge.sww', 'merge_chunks.sww')
+
+                merge.concurrent_merge_gap = 1
+                merge.sww_merge_parallel('merge', 3, memory_budget=100,
+                                         processes=2)
+                merge.concurrent_merge_gap = gap
+
+                fid_ref = NetCDFFile('merge_ref.sww')
+
+                # Centroid values of the full triangles of each processor
+                stage_c = fid_ref.variables['stage_c'][:]
+                for p in range(3):
+                    fid = NetCDFFile('merge_P3_%d.sww' % p)
+                    full = fid.variables['tri_full_flag'][:] == 1
+                    tri_l2g = fid.variables['tri_l2g'][:]
+                    assert num.allclose(stage_c[:,tri_l2g[full]],
+                                        fid.variables['stage_c'][:][:,full])
+                    fid.close()
+
+                for filename in ['merge_chunks.sww', 'merge.sww']:
+                    fid = NetCDFFile(filename)
+                    for name in fid_ref.variables:
+                        assert num.all(fid.variables[name][:] ==
+                                       fid_ref.variables[name][:]), name
+                    fid.close()
+
+                fid_ref.close()
+        finally:
+            merge.concurrent_merge_gap = gap
+            os.chdir(cwd)
+            shutil.rmtree(work_dir)
+
+    def test_split_frames(self):
+        from anuga.utilities.sww_merge import split_frames
+
+        assert split_frames(10, 1) == [(0, 10)]
+        assert split_frames(10, 3) == [(0, 3), (3, 6), (6, 10)]
+        assert split_frames(2, 4) == [(0, 0), (0, 1), (1, 1), (1, 2)]
+
 
 #-------------------------------------------------------------
 